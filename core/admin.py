@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Categoria, Produto, MovimentacaoEstoque, Fornecedor, Cliente, FormaPagamento, Venda, ItemVenda
+from .models import (Categoria, Produto, MovimentacaoEstoque, Fornecedor, Cliente, FormaPagamento, Venda, ItemVenda,
+                     RecebimentoEstoque)
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -8,11 +9,19 @@ class CategoriaAdmin(admin.ModelAdmin):
 
 @admin.register(Produto)
 class ProdutoAdmin(admin.ModelAdmin):
-    list_display = ['nome', 'codigo', 'categoria', 'estoque_atual', 'estoque_minimo', 'preco_venda', 'ativo']
+    list_display = ['nome', 'codigo', 'categoria', 'estoque_atual', 'estoque_minimo', 'preco_venda', 'valor_estoque_display', 'ativo']
     list_filter = ['categoria', 'ativo']
     search_fields = ['nome', 'codigo']
     list_editable = ['estoque_atual', 'preco_venda', 'ativo']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).com_valor_estoque()
+
+    def valor_estoque_display(self, obj):
+        return f"R$ {obj.valor_total_estoque:.2f}"
+    valor_estoque_display.short_description = "Valor em Estoque"
+    valor_estoque_display.admin_order_field = 'valor_estoque'
+
 @admin.register(MovimentacaoEstoque)
 class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
     list_display = ['produto', 'tipo', 'quantidade', 'forma_pagamento', 'usuario', 'data_movimentacao']
@@ -20,6 +29,24 @@ class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
     search_fields = ['produto__nome']
     readonly_fields = ['data_movimentacao']
 
+@admin.register(RecebimentoEstoque)
+class RecebimentoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'fornecedor', 'nota_fiscal', 'numero_itens', 'quantidade_itens', 'valor_total', 'status',
+                    'data_recebimento']
+    list_filter = ['status', 'fornecedor']
+    search_fields = ['nota_fiscal', 'fornecedor__nome', 'chave']
+    list_select_related = ['fornecedor']
+
+    # Recebimentos só são gravados/estornados pelo serviço de estoque, que mantém o estoque coerente
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(Fornecedor)
 class FornecedorAdmin(admin.ModelAdmin):
     list_display = ['nome', 'cnpj', 'telefone', 'email', 'ativo']
@@ -55,7 +82,7 @@ class ItemVendaInline(admin.TabularInline):
 
 @admin.register(Venda)
 class VendaAdmin(admin.ModelAdmin):
-    list_display = ['numero_venda', 'data_venda', 'cliente', 'forma_pagamento', 'total_itens', 'valor_total_display', 'status', 'usuario']
+    list_display = ['numero_venda', 'data_venda', 'cliente', 'forma_pagamento', 'total_itens', 'valor_total_display', 'valor_pendente_display', 'status', 'usuario']
     list_filter = ['status', 'forma_pagamento', 'data_venda', 'usuario']
     search_fields = ['numero_venda', 'cliente__nome', 'usuario__username']
     readonly_fields = ['numero_venda', 'data_criacao', 'data_atualizacao', 'valor_total_display']
@@ -80,11 +107,20 @@ class VendaAdmin(admin.ModelAdmin):
     def valor_total_display(self, obj):
         return f"R$ {obj.valor_total:.2f}"
     valor_total_display.short_description = "Valor Total"
-    valor_total_display.admin_order_field = 'valor_total'
+    valor_total_display.admin_order_field = 'valor_itens'
+
+    def valor_pendente_display(self, obj):
+        return f"R$ {obj.valor_pendente:.2f}"
+    valor_pendente_display.short_description = "Pendente"
+    valor_pendente_display.admin_order_field = 'total_pendente'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('cliente', 'forma_pagamento', 'usuario').com_totais()
 
     def total_itens(self, obj):
         return obj.total_itens
     total_itens.short_description = "Itens"
+    total_itens.admin_order_field = 'numero_itens'
 
     def save_model(self, request, obj, form, change):
         if not change:  # Novo objeto
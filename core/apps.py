@@ -4,3 +4,6 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Sistema de Estoque'
+
+    def ready(self):
+        from . import signals  # noqa: F401
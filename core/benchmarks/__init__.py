@@ -0,0 +1,9 @@
+"""
+Benchmark das views de core/urls.py (comando benchmark_views).
+
+- bancos: um banco por tamanho (ex.: 10k, 100k e 1m vendas), populado pela
+  carga em escala e reaproveitado entre execuções;
+- cenarios: as requisições medidas, ao menos uma para cada URL;
+- medicao: p50/p95 de latência, consultas, tempo de SQL e pico de memória;
+- comparacao: compara um resultado com a baseline e lista as regressões.
+"""
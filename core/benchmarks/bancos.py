@@ -0,0 +1,75 @@
+"""
+Bancos do benchmark, um por tamanho ('10k', '100k', '1m' vendas).
+
+Cada banco é criado como um banco de testes do Django (mesmo backend e
+configuração do banco padrão, com as migrações aplicadas) e populado pela
+carga em escala de criar_sistema_completo. Os bancos são mantidos entre
+execuções e só repopulados se o número de vendas não bate com o tamanho:
+popular 1 milhão de vendas leva minutos, medir as views não.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import carga
+from core.estoque import registrar_recebimento
+from core.models import Fornecedor, Produto, Venda
+
+DIRETORIO = os.path.join(tempfile.gettempdir(), 'estoque_agua_benchmarks')
+
+
+def _nome(conexao, rotulo, diretorio):
+    if conexao.vendor == 'sqlite':
+        return os.path.join(diretorio, f'benchmark_{rotulo}.sqlite3')
+    return f"{conexao.settings_dict['NAME']}_benchmark_{rotulo}"
+
+
+def _criar(conexao, recriar):
+    conexao.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=not recriar)
+
+
+def _popular(vendas, seed, saida):
+    call_command('criar_sistema_completo', escala=str(vendas), seed=seed, stdout=saida)
+    # A carga não gera recebimentos em lote: um basta para as telas de recebimento
+    fornecedor = Fornecedor.objects.filter(ativo=True).order_by('pk').first()
+    usuario = User.objects.filter(is_superuser=True).order_by('pk').first()
+    produtos = list(Produto.objects.filter(ativo=True).order_by('pk').values_list('pk', 'preco_custo')[:5])
+    if fornecedor and usuario and produtos:
+        registrar_recebimento('benchmark', fornecedor, [(pk, 50, custo) for pk, custo in produtos], usuario,
+                              nota_fiscal='BENCH')
+
+
+@contextmanager
+def banco(rotulo, diretorio=DIRETORIO, recriar=False, seed=42, saida=None):
+    """
+    Usa, dentro do bloco, o banco do tamanho indicado no lugar do banco padrão.
+
+    Cria e popula o banco na primeira vez (ou com recriar=True); ao sair, a
+    conexão volta ao banco configurado e o banco do benchmark é mantido.
+    """
+    vendas = carga.interpretar_escala(rotulo)
+    conexao = connections[DEFAULT_DB_ALIAS]
+    nome_original = conexao.settings_dict['NAME']
+    teste_original = conexao.settings_dict['TEST']
+    if conexao.vendor == 'sqlite':
+        os.makedirs(diretorio, exist_ok=True)
+
+    conexao.settings_dict['TEST'] = {**teste_original, 'NAME': _nome(conexao, rotulo, diretorio)}
+    try:
+        _criar(conexao, recriar)
+        if Venda.objects.count() != vendas:
+            if not recriar:
+                # Carga interrompida ou de outro tamanho: recomeçar do zero
+                _criar(conexao, recriar=True)
+            _popular(vendas, seed, saida)
+        cache.clear()
+        yield vendas
+    finally:
+        conexao.creation.destroy_test_db(nome_original, verbosity=0, keepdb=True)
+        conexao.settings_dict['TEST'] = teste_original
+        cache.clear()
@@ -0,0 +1,249 @@
+"""
+Cenários medidos pelo benchmark: uma ou mais requisições para cada URL de
+core/urls.py, com os objetos escolhidos como numa loja em uso (a venda mais
+recente, uma venda com saldo a pagar, o produto vendido por último...).
+
+Telas de exclusão são medidas pelo GET da confirmação; o POST que exclui não
+é medido porque apagaria os dados dos cenários seguintes e tem custo
+proporcional ao que apaga, não ao tamanho do banco.
+"""
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (Categoria, Cliente, ContasReceber, FormaPagamento, Fornecedor, ItemVenda,
+                         MovimentacaoEstoque, Pagamento, Produto, RecebimentoEstoque, Venda)
+
+STATUS_PAGAVEIS = ['aberta', 'finalizada', 'parcial']
+
+
+class Cenario:
+    """
+    Uma requisição medida.
+
+    argumentos: função que devolve os argumentos da URL (ou None se o banco não
+    tem o objeto necessário); dados: função que devolve o corpo do POST (ou
+    None, idem). Os POSTs são desfeitos depois de cada amostra.
+    """
+
+    def __init__(self, nome, url_nome, consulta='', metodo='get', argumentos=None, dados=None,
+                 json=False, esperado=None, amostras=None):
+        self.nome = nome
+        self.url_nome = url_nome
+        self.consulta = consulta
+        self.metodo = metodo
+        self.argumentos = argumentos
+        self.dados = dados
+        self.json = json
+        self.esperado = esperado or (200 if metodo == 'get' else 302)
+        # Exportações percorrem a tabela inteira: menos amostras
+        self.amostras = amostras
+
+    def preparar(self):
+        """(url, dados) da requisição, ou None se faltam dados no banco"""
+        argumentos = self.argumentos() if self.argumentos else []
+        if argumentos is None:
+            return None
+        dados = self.dados() if self.dados else None
+        if self.dados and dados is None:
+            return None
+        return reverse(self.url_nome, args=argumentos) + self.consulta, dados
+
+    def enviar(self, cliente, url, dados):
+        if self.metodo == 'get':
+            return cliente.get(url)
+        if self.json:
+            return cliente.post(url, dados, content_type='application/json')
+        return cliente.post(url, dados)
+
+
+def _pk(queryset):
+    return queryset.order_by('-pk').values_list('pk', flat=True).first()
+
+
+def _ultimo(model, **filtros):
+    """Argumentos com o registro mais recente do model (com os filtros)"""
+    def argumentos():
+        pk = _pk(model.objects.filter(**filtros))
+        return None if pk is None else [pk]
+    return argumentos
+
+
+def _venda_pagavel():
+    """Venda mais recente que ainda aceita um pagamento de R$ 1,00"""
+    pk = _pk(Venda.objects.filter(status__in=STATUS_PAGAVEIS, valor_pago__lte=F('valor_itens') - 1))
+    return None if pk is None else [pk]
+
+
+def _produto_vendido():
+    produto = ItemVenda.objects.order_by('-pk').values_list('produto_id', flat=True).first()
+    return None if produto is None else [produto]
+
+
+def _codigo_vendido():
+    codigo = ItemVenda.objects.filter(produto__ativo=True).order_by('-pk').values_list('produto__codigo',
+                                                                                      flat=True).first()
+    return None if codigo is None else [codigo]
+
+
+def _cliente_com_vendas():
+    cliente = Venda.objects.filter(cliente__isnull=False).order_by('-pk').values_list('cliente_id', flat=True).first()
+    return None if cliente is None else [cliente]
+
+
+def _forma_pagamento():
+    return _pk(FormaPagamento.objects.filter(ativo=True))
+
+
+def _dados_venda():
+    produtos = list(Produto.objects.filter(ativo=True, estoque_atual__gte=5)
+                    .order_by('pk').values_list('pk', 'preco_venda')[:2])
+    cliente = _pk(Cliente.objects.filter(ativo=True))
+    forma_pagamento = _forma_pagamento()
+    if not produtos or cliente is None or forma_pagamento is None:
+        return None
+    dados = {
+        'cliente': cliente,
+        'forma_pagamento': forma_pagamento,
+        'data_venda': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+        'status': 'finalizada',
+        'observacao': 'Benchmark',
+        'itens-TOTAL_FORMS': str(len(produtos)),
+        'itens-INITIAL_FORMS': '0',
+        'itens-MIN_NUM_FORMS': '1',
+        'itens-MAX_NUM_FORMS': '1000',
+    }
+    for indice, (produto, preco) in enumerate(produtos):
+        dados[f'itens-{indice}-produto'] = produto
+        dados[f'itens-{indice}-quantidade'] = '2'
+        dados[f'itens-{indice}-preco_unitario'] = str(preco)
+    return dados
+
+
+def _dados_checkout():
+    forma_pagamento = _forma_pagamento()
+    return None if forma_pagamento is None else {'forma_pagamento': [forma_pagamento], 'valor_pagamento': ['1.00']}
+
+
+def _dados_movimentacao():
+    produto = _pk(Produto.objects.filter(ativo=True))
+    if produto is None:
+        return None
+    return {'produto': produto, 'tipo': 'entrada', 'quantidade': '1', 'preco_unitario': '',
+            'forma_pagamento': '', 'observacao': 'Benchmark'}
+
+
+def _dados_recebimento_api():
+    fornecedor = _pk(Fornecedor.objects.filter(ativo=True))
+    produtos = list(Produto.objects.filter(ativo=True).order_by('pk').values_list('pk', flat=True)[:3])
+    if fornecedor is None or not produtos:
+        return None
+    return {'chave': 'benchmark-api', 'fornecedor': fornecedor, 'nota_fiscal': 'BENCH',
+            'itens': [{'produto': produto, 'quantidade': 10} for produto in produtos]}
+
+
+def _crud(prefixo, model):
+    """Listagem, formulário de criação, detalhe, edição e confirmação de exclusão"""
+    argumentos = _ultimo(model)
+    return [
+        Cenario(f'{prefixo}_list', f'{prefixo}_list'),
+        Cenario(f'{prefixo}_create', f'{prefixo}_create'),
+        Cenario(f'{prefixo}_detail', f'{prefixo}_detail', argumentos=argumentos),
+        Cenario(f'{prefixo}_edit', f'{prefixo}_edit', argumentos=argumentos),
+        Cenario(f'{prefixo}_delete', f'{prefixo}_delete', argumentos=argumentos),
+    ]
+
+
+CENARIOS = [
+    Cenario('homepage', 'homepage'),
+    Cenario('dashboard', 'dashboard'),
+
+    # Produtos
+    Cenario('produto_list', 'produto_list'),
+    Cenario('produto_list:busca', 'produto_list', '?search=agua'),
+    Cenario('produto_create', 'produto_create'),
+    Cenario('produto_importar', 'produto_importar'),
+    Cenario('produto_detail', 'produto_detail', argumentos=_produto_vendido),
+    Cenario('produto_edit', 'produto_edit', argumentos=_produto_vendido),
+    Cenario('produto_delete', 'produto_delete', argumentos=_produto_vendido),
+
+    # Movimentações
+    Cenario('movimentacao_list', 'movimentacao_list'),
+    Cenario('movimentacao_list:saidas', 'movimentacao_list', '?tipo=saida'),
+    Cenario('movimentacao_exportar', 'movimentacao_exportar', amostras=1),
+    Cenario('movimentacao_create', 'movimentacao_create'),
+    Cenario('movimentacao_create:post', 'movimentacao_create', metodo='post', dados=_dados_movimentacao),
+    Cenario('movimentacao_detail', 'movimentacao_detail', argumentos=_ultimo(MovimentacaoEstoque)),
+    Cenario('movimentacao_edit', 'movimentacao_edit', argumentos=_ultimo(MovimentacaoEstoque)),
+    Cenario('movimentacao_delete', 'movimentacao_delete', argumentos=_ultimo(MovimentacaoEstoque)),
+
+    # Recebimentos
+    Cenario('recebimento_list', 'recebimento_list'),
+    Cenario('recebimento_create', 'recebimento_create'),
+    Cenario('recebimento_detail', 'recebimento_detail', argumentos=_ultimo(RecebimentoEstoque)),
+    Cenario('recebimento_estornar:post', 'recebimento_estornar', metodo='post',
+            argumentos=_ultimo(RecebimentoEstoque, status='registrado'), dados=dict),
+
+    *_crud('fornecedor', Fornecedor),
+
+    # Clientes
+    Cenario('cliente_list', 'cliente_list'),
+    Cenario('cliente_list:busca', 'cliente_list', '?search=silva'),
+    Cenario('cliente_importar', 'cliente_importar'),
+    Cenario('cliente_create', 'cliente_create'),
+    Cenario('cliente_detail', 'cliente_detail', argumentos=_cliente_com_vendas),
+    Cenario('cliente_edit', 'cliente_edit', argumentos=_cliente_com_vendas),
+    Cenario('cliente_delete', 'cliente_delete', argumentos=_cliente_com_vendas),
+
+    *_crud('categoria', Categoria),
+    *_crud('forma_pagamento', FormaPagamento),
+
+    # Vendas e pagamentos
+    Cenario('venda_list', 'venda_list'),
+    Cenario('venda_list:pagas', 'venda_list', '?status=paga'),
+    Cenario('venda_exportar', 'venda_exportar', amostras=1),
+    Cenario('venda_create', 'venda_create'),
+    Cenario('venda_create:post', 'venda_create', metodo='post', dados=_dados_venda),
+    Cenario('venda_detail', 'venda_detail', argumentos=_ultimo(Venda)),
+    Cenario('venda_edit', 'venda_edit', argumentos=_ultimo(Venda)),
+    Cenario('venda_cancel', 'venda_cancel', argumentos=_ultimo(Venda)),
+    Cenario('venda_checkout', 'venda_checkout', argumentos=_venda_pagavel),
+    Cenario('venda_checkout:post', 'venda_checkout', metodo='post',
+            argumentos=_venda_pagavel, dados=_dados_checkout),
+    Cenario('pagamento_create', 'pagamento_create', argumentos=_venda_pagavel),
+    Cenario('pagamento_delete', 'pagamento_delete', argumentos=_ultimo(Pagamento)),
+
+    # Contas a receber
+    Cenario('contas_receber_list', 'contas_receber_list'),
+    Cenario('contas_receber_list:vencidas', 'contas_receber_list', '?vencidas=sim'),
+    Cenario('contas_receber_exportar', 'contas_receber_exportar', amostras=1),
+    Cenario('contas_receber_create', 'contas_receber_create'),
+    Cenario('conta_receber_detail', 'conta_receber_detail', argumentos=_ultimo(ContasReceber)),
+    Cenario('conta_receber_pagamento', 'conta_receber_pagamento',
+            argumentos=_ultimo(ContasReceber, status__in=['aberto', 'parcial'])),
+
+    # APIs
+    Cenario('produto_preco_api', 'produto_preco_api', argumentos=_produto_vendido),
+    Cenario('produtos_precos_api', 'produtos_precos_api'),
+    Cenario('produtos_precos_api:ids', 'produtos_precos_api', '?ids=1,2,3,4,5'),
+    Cenario('produto_codigo_api', 'produto_codigo_api', argumentos=_codigo_vendido),
+    Cenario('recebimento_api:post', 'recebimento_api', metodo='post', dados=_dados_recebimento_api,
+            json=True, esperado=201),
+    Cenario('recebimento_estornar_api:post', 'recebimento_estornar_api', metodo='post',
+            argumentos=_ultimo(RecebimentoEstoque, status='registrado'), dados=dict, esperado=200),
+]
+
+
+def selecionar(filtros=None):
+    """Cenários cujo nome ou nome de URL está em filtros (todos se vazio)"""
+    if not filtros:
+        return list(CENARIOS)
+    return [cenario for cenario in CENARIOS if cenario.nome in filtros or cenario.url_nome in filtros]
+
+
+def urls_sem_cenario():
+    """Nomes de URL de core/urls.py sem nenhum cenário (devem ser cobertas)"""
+    from core.urls import urlpatterns
+
+    medidas = {cenario.url_nome for cenario in CENARIOS}
+    return sorted(padrao.name for padrao in urlpatterns if padrao.name and padrao.name not in medidas)
@@ -0,0 +1,84 @@
+"""
+Busca de produtos por código (core/codigos.py): dicionário em memória x índice único x API.
+
+Tudo roda num processo só (um worker) e dentro de uma transação desfeita ao
+final, com N produtos temporários e códigos sorteados entre eles:
+
+- dicionario: LeitorCodigos.buscar, com o dicionário já montado;
+- indice: a consulta pelo índice único de Produto.codigo, a cada busca;
+- api: GET em produto_codigo_api pelo cliente de testes (sessão, usuário e
+  resposta JSON incluídos).
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from core import codigos
+from core.estatisticas import percentil
+from core.models import Categoria, Produto
+
+PREFIXO = 'BENCH-COD-'
+
+
+def _popular(produtos):
+    categoria = Categoria.objects.create(nome='Benchmark de códigos')
+    Produto.objects.bulk_create([
+        Produto(nome=f'Produto {i}', categoria=categoria, codigo=f'{PREFIXO}{i:07d}', preco_venda=1, preco_custo=1)
+        for i in range(produtos)
+    ], batch_size=5000)
+
+
+def _medir(nome, buscar, codigos_sorteados):
+    latencias = []
+    inicio = time.perf_counter()
+    for codigo in codigos_sorteados:
+        antes = time.perf_counter()
+        encontrado = buscar(codigo)
+        latencias.append(time.perf_counter() - antes)
+        if not encontrado:
+            raise AssertionError(f'{nome}: código {codigo} não encontrado')
+    duracao = time.perf_counter() - inicio
+    return {
+        'modo': nome,
+        'buscas': len(latencias),
+        'buscas_s': round(len(latencias) / duracao),
+        'p50_us': round(statistics.median(latencias) * 1e6, 1),
+        'p99_us': round(percentil(latencias, 0.99) * 1e6, 1),
+    }
+
+
+def executar(produtos=5000, buscas=100000, consultas=5000, requisicoes=2000, semente=42):
+    """Mede os três modos e retorna a lista de métricas; o banco não é alterado"""
+    aleatorio = random.Random(semente)
+
+    def sortear(quantidade):
+        return [f'{PREFIXO}{aleatorio.randrange(produtos):07d}' for _ in range(quantidade)]
+
+    resultados = []
+    with transaction.atomic():
+        _popular(produtos)
+
+        leitor = codigos.LeitorCodigos()
+        leitor.buscar(f'{PREFIXO}{0:07d}')  # monta o dicionário
+        resultados.append(_medir('dicionario', leitor.buscar, sortear(buscas)))
+
+        indice = codigos.consulta()
+        resultados.append(_medir('indice', lambda codigo: indice.filter(codigo=codigo).first(), sortear(consultas)))
+
+        cliente = Client()
+        cliente.force_login(User.objects.create_user('benchmark_codigos'))
+        codigos.leitor.limpar()
+
+        def requisitar(codigo):
+            return cliente.get(reverse('produto_codigo_api', args=[codigo])).status_code == 200
+
+        requisitar(f'{PREFIXO}{0:07d}')
+        resultados.append(_medir('api', requisitar, sortear(requisicoes)))
+        transaction.set_rollback(True)
+    codigos.leitor.limpar()
+    return resultados
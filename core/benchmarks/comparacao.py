@@ -0,0 +1,77 @@
+"""
+Comparação de um resultado do benchmark com uma baseline gravada.
+
+Tempos e memória variam de uma execução para outra, então só contam como
+regressão quando pioram além da tolerância relativa e de uma folga absoluta
+(uma view de 2 ms que passa a 3 ms não é regressão). O p95 de poucas amostras
+é ruidoso e tem o dobro da tolerância. O número de consultas é determinístico:
+qualquer aumento é regressão, normalmente um N+1 novo.
+"""
+import json
+
+TOLERANCIA = 0.25
+FOLGA_MS = 5
+FOLGA_KB = 256
+
+# Métrica de tempo: multiplicador da tolerância
+METRICAS_TEMPO = {'p50_ms': 1, 'p95_ms': 2, 'sql_ms': 1}
+
+
+class ErroComparacao(Exception):
+    """Arquivo de resultado/baseline inválido"""
+
+
+def carregar(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            resultado = json.load(arquivo)
+    except (OSError, ValueError) as erro:
+        raise ErroComparacao(f'Não foi possível ler {caminho}: {erro}')
+    if not isinstance(resultado, dict) or 'tamanhos' not in resultado:
+        raise ErroComparacao(f'{caminho} não é um resultado do benchmark_views.')
+    return resultado
+
+
+def gravar(resultado, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2, sort_keys=True)
+        arquivo.write('\n')
+
+
+def _piorou(antes, depois, tolerancia, folga):
+    return depois > antes * (1 + tolerancia) + folga
+
+
+def comparar(atual, baseline, tolerancia=TOLERANCIA, folga_ms=FOLGA_MS, folga_kb=FOLGA_KB):
+    """
+    Regressões do resultado atual em relação à baseline, como uma lista de
+    (tamanho, cenário, métrica, valor na baseline, valor atual).
+
+    Só são comparados tamanhos e cenários presentes nos dois resultados.
+    """
+    regressoes = []
+    for tamanho, dados in atual['tamanhos'].items():
+        anteriores = baseline['tamanhos'].get(tamanho)
+        if not anteriores:
+            continue
+        for nome, medida in dados['cenarios'].items():
+            anterior = anteriores['cenarios'].get(nome)
+            if not anterior or 'ignorado' in medida or 'ignorado' in anterior:
+                continue
+            if 'erro' in medida:
+                if 'erro' not in anterior:
+                    regressoes.append((tamanho, nome, 'erro', None, medida['erro']))
+                continue
+            if 'erro' in anterior:
+                continue
+            if medida['status'] != anterior['status']:
+                regressoes.append((tamanho, nome, 'status', anterior['status'], medida['status']))
+            if medida['consultas'] > anterior['consultas']:
+                regressoes.append((tamanho, nome, 'consultas', anterior['consultas'], medida['consultas']))
+            for metrica, peso in METRICAS_TEMPO.items():
+                if _piorou(anterior[metrica], medida[metrica], tolerancia * peso, folga_ms):
+                    regressoes.append((tamanho, nome, metrica, anterior[metrica], medida[metrica]))
+            if _piorou(anterior['memoria_pico_kb'], medida['memoria_pico_kb'], tolerancia, folga_kb):
+                regressoes.append((tamanho, nome, 'memoria_pico_kb',
+                                   anterior['memoria_pico_kb'], medida['memoria_pico_kb']))
+    return regressoes
@@ -0,0 +1,148 @@
+"""
+Escrita concorrente no SQLite: N processos gravando ao mesmo tempo.
+
+Cada processo repete a transação de uma movimentação de estoque (lê e bloqueia
+os produtos, atualiza o estoque e grava as movimentações, como nas telas) sem
+novas tentativas: um "database is locked" conta como erro. Cada modo roda num
+banco novo, criado com as migrações:
+
+- padrao: o SQLite como o Django o deixa (journal em arquivo, BEGIN DEFERRED,
+  espera de 5 s do módulo sqlite3);
+- configurado: as OPTIONS de DATABASES['default'] (pragmas e BEGIN IMMEDIATE).
+"""
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Sum
+
+from core.estatisticas import percentil
+from core.estoque import aplicar_deltas
+from core.models import Categoria, MovimentacaoEstoque, Produto
+
+MODOS = ('padrao', 'configurado')
+ESTOQUE_INICIAL = 1_000_000
+
+
+def opcoes(modo):
+    if modo == 'padrao':
+        return {}
+    return dict(connections[DEFAULT_DB_ALIAS].settings_dict['OPTIONS'])
+
+
+@contextmanager
+def banco_temporario(caminho, opcoes_banco):
+    """Usa, dentro do bloco, um banco SQLite novo em caminho com as OPTIONS indicadas"""
+    conexao = connections[DEFAULT_DB_ALIAS]
+    nome_original = conexao.settings_dict['NAME']
+    teste_original = conexao.settings_dict['TEST']
+    opcoes_originais = conexao.settings_dict['OPTIONS']
+    conexao.settings_dict['TEST'] = {**teste_original, 'NAME': caminho}
+    conexao.settings_dict['OPTIONS'] = opcoes_banco
+    try:
+        conexao.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        yield
+    finally:
+        conexao.creation.destroy_test_db(nome_original, verbosity=0, keepdb=True)
+        conexao.settings_dict['TEST'] = teste_original
+        conexao.settings_dict['OPTIONS'] = opcoes_originais
+        conexao.close()
+        for sufixo in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
+
+
+def _escritor(semente, produto_ids, operacoes, usuario_id):
+    """Grava as movimentações num processo separado; retorna (latências das gravadas, erros, deltas aplicados)"""
+    connections.close_all()
+    aleatorio = random.Random(semente)
+    latencias = []
+    erros = 0
+    aplicado = {}
+    for _ in range(operacoes):
+        escolhidos = aleatorio.sample(produto_ids, k=aleatorio.randint(1, min(3, len(produto_ids))))
+        deltas = {produto_id: aleatorio.choice([-3, -1, 1, 2]) for produto_id in escolhidos}
+        inicio = time.perf_counter()
+        try:
+            with transaction.atomic():
+                aplicar_deltas(deltas)
+                MovimentacaoEstoque.objects.bulk_create([
+                    MovimentacaoEstoque(produto_id=produto_id, tipo='entrada' if delta > 0 else 'saida',
+                                        quantidade=abs(delta), observacao='Benchmark de escrita',
+                                        usuario_id=usuario_id)
+                    for produto_id, delta in deltas.items()
+                ])
+        except OperationalError:
+            erros += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+        for produto_id, delta in deltas.items():
+            aplicado[produto_id] = aplicado.get(produto_id, 0) + delta
+    connections.close_all()
+    return latencias, erros, aplicado
+
+
+def _preparar(produtos):
+    usuario = User.objects.create_user('benchmark_escrita')
+    categoria = Categoria.objects.create(nome='Benchmark de escrita')
+    Produto.objects.bulk_create([
+        Produto(nome=f'Produto {i}', categoria=categoria, codigo=f'ESC-{i}', preco_venda=1, preco_custo=1,
+                estoque_atual=ESTOQUE_INICIAL)
+        for i in range(produtos)
+    ])
+    return usuario.pk, list(Produto.objects.values_list('pk', flat=True))
+
+
+def _divergentes(aplicado):
+    """Produtos cujo estoque não bate com o que os processos gravaram ou com as movimentações"""
+    entradas = dict(MovimentacaoEstoque.objects.filter(tipo='entrada').values_list('produto')
+                    .order_by().annotate(Sum('quantidade')))
+    saidas = dict(MovimentacaoEstoque.objects.filter(tipo='saida').values_list('produto')
+                  .order_by().annotate(Sum('quantidade')))
+    divergentes = 0
+    for produto_id, estoque in Produto.objects.values_list('pk', 'estoque_atual'):
+        pelas_movimentacoes = ESTOQUE_INICIAL + entradas.get(produto_id, 0) - saidas.get(produto_id, 0)
+        if estoque != ESTOQUE_INICIAL + aplicado.get(produto_id, 0) or estoque != pelas_movimentacoes:
+            divergentes += 1
+    return divergentes
+
+
+def executar(modo, diretorio, processos=8, operacoes=200, produtos=10, semente=42):
+    """Roda o modo num banco novo e retorna as métricas"""
+    os.makedirs(diretorio, exist_ok=True)
+    with banco_temporario(os.path.join(diretorio, f'escrita_{modo}.sqlite3'), opcoes(modo)):
+        usuario_id, produto_ids = _preparar(produtos)
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        inicio = time.perf_counter()
+        with contexto.Pool(processos) as pool:
+            resultados = pool.starmap(_escritor, [
+                (semente + i, produto_ids, operacoes, usuario_id) for i in range(processos)
+            ])
+        duracao = time.perf_counter() - inicio
+
+        latencias, erros, aplicado = [], 0, {}
+        for latencias_processo, erros_processo, aplicado_processo in resultados:
+            latencias += latencias_processo
+            erros += erros_processo
+            for produto_id, delta in aplicado_processo.items():
+                aplicado[produto_id] = aplicado.get(produto_id, 0) + delta
+        divergentes = _divergentes(aplicado)
+
+    total = processos * operacoes
+    return {
+        'modo': modo,
+        'gravadas': len(latencias),
+        'erros': erros,
+        'taxa_erros': erros / total,
+        'duracao_s': round(duracao, 3),
+        'gravacoes_s': round(len(latencias) / duracao, 1),
+        'p50_ms': round(statistics.median(latencias) * 1000, 2) if latencias else None,
+        'p95_ms': round(percentil(latencias, 0.95) * 1000, 2) if latencias else None,
+        'divergentes': divergentes,
+    }
@@ -0,0 +1,118 @@
+"""
+Medição dos cenários pelo cliente de testes do Django.
+
+Cada cenário recebe uma requisição de aquecimento (templates, caches) e depois
+N amostras cronometradas. Cada requisição roda num savepoint desfeito ao
+final, então POSTs não alteram o banco nem as amostras seguintes. O pico de
+memória vem de uma requisição extra com tracemalloc ligado, para que o custo
+do rastreamento não entre nas latências. O tempo de SQL é o da execução das
+consultas; a leitura das linhas de uma resposta em streaming entra só na latência.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.estatisticas import percentil
+
+AMOSTRAS = 20
+USUARIO = 'benchmark'
+
+
+class _Contador:
+    """execute_wrapper que conta as consultas e soma o tempo gasto nelas"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+def _requisitar(cliente, cenario, url, dados, alias):
+    """Faz a requisição (consumindo respostas em streaming) e a desfaz; retorna o status"""
+    with transaction.atomic(using=alias):
+        resposta = cenario.enviar(cliente, url, dados)
+        if resposta.streaming:
+            for _ in resposta.streaming_content:
+                pass
+        transaction.set_rollback(True, using=alias)
+    return resposta.status_code
+
+
+def medir(cliente, cenario, amostras=AMOSTRAS, alias=DEFAULT_DB_ALIAS):
+    """Métricas de um cenário: dicionário pronto para o JSON do resultado"""
+    requisicao = cenario.preparar()
+    if requisicao is None:
+        return {'ignorado': 'sem dados para o cenário'}
+    url, dados = requisicao
+    amostras = cenario.amostras or amostras
+    conexao = connections[alias]
+
+    resultado = {'url': url, 'metodo': cenario.metodo.upper(), 'esperado': cenario.esperado}
+    try:
+        resultado['status'] = _requisitar(cliente, cenario, url, dados, alias)
+
+        tempos, consultas, tempos_sql = [], [], []
+        for _ in range(amostras):
+            contador = _Contador()
+            with conexao.execute_wrapper(contador):
+                inicio = time.perf_counter()
+                _requisitar(cliente, cenario, url, dados, alias)
+                tempos.append(time.perf_counter() - inicio)
+            consultas.append(contador.consultas)
+            tempos_sql.append(contador.segundos)
+
+        tracemalloc.start()
+        try:
+            _requisitar(cliente, cenario, url, dados, alias)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    except Exception as erro:
+        resultado['erro'] = f'{type(erro).__name__}: {erro}'
+        return resultado
+
+    resultado.update({
+        'amostras': amostras,
+        'p50_ms': round(statistics.median(tempos) * 1000, 2),
+        'p95_ms': round(percentil(tempos, 0.95) * 1000, 2),
+        'consultas': max(consultas),
+        'sql_ms': round(statistics.median(tempos_sql) * 1000, 2),
+        'memoria_pico_kb': round(pico / 1024),
+    })
+    return resultado
+
+
+def _usuario():
+    usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+    return usuario or User.objects.create_superuser(USUARIO, '', None)
+
+
+def executar(cenarios, amostras=AMOSTRAS, alias=DEFAULT_DB_ALIAS, progresso=None):
+    """
+    Mede os cenários no banco atual e retorna {nome do cenário: métricas}.
+
+    Roda com DEBUG=False (sem o log de consultas do modo debug) e numa
+    transação desfeita ao final: a sessão de login e os POSTs não ficam no banco.
+    """
+    resultados = {}
+    with override_settings(DEBUG=False), transaction.atomic(using=alias):
+        cliente = Client()
+        cliente.force_login(_usuario())
+        for cenario in cenarios:
+            resultados[cenario.nome] = medir(cliente, cenario, amostras, alias)
+            if progresso:
+                progresso(cenario, resultados[cenario.nome])
+        transaction.set_rollback(True, using=alias)
+    return resultados
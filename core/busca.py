@@ -0,0 +1,146 @@
+"""
+Busca de produtos, clientes e fornecedores por nome e código/documento.
+
+No SQLite, cada model tem uma tabela virtual FTS5 (core_busca_<model>) cujo
+rowid é a chave primária do registro, com duas colunas:
+
+- nome: o nome, indexado sem acentos e sem diferenciar maiúsculas;
+- documento: código/CPF/CNPJ como digitado e também só com letras e números,
+  para que "123.456", "123456" ou "456" encontrem o mesmo CPF.
+
+Cada palavra digitada vira uma busca por prefixo ("mar sil" encontra "Maria da
+Silva"), todas obrigatórias. As tabelas são mantidas pelos sinais em
+core/signals.py; operações que não disparam sinais (bulk_create, update())
+devem chamar indexar_pks(), ou o índice deve ser reconstruído com o comando
+reconstruir_indice_busca.
+
+Em outros bancos (ou num SQLite sem FTS5) a busca usa icontains; no
+PostgreSQL a migração 0012 cria índices trigram (pg_trgm) para essas colunas.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Cliente, Fornecedor, Produto
+
+# model: (tabela FTS5, campo do nome, campo do código/documento)
+INDICES = {
+    Produto: ('core_busca_produto', 'nome', 'codigo'),
+    Cliente: ('core_busca_cliente', 'nome', 'cpf_cnpj'),
+    Fornecedor: ('core_busca_fornecedor', 'nome', 'cnpj'),
+}
+
+PONTUACAO_DOCUMENTO = '.-/ '
+DOCUMENTO_RE = re.compile(r'[\d.\-/]*\d[\d.\-/]*')
+PALAVRA_RE = re.compile(r'\w+')
+
+_disponivel = {}
+
+
+def _conexao(model):
+    return connections[router.db_for_write(model)]
+
+
+def disponivel(model):
+    """True se o índice FTS5 do model existe no banco em uso"""
+    conexao = _conexao(model)
+    if conexao.vendor != 'sqlite':
+        return False
+    chave = (conexao.alias, conexao.settings_dict['NAME'], INDICES[model][0])
+    if chave not in _disponivel:
+        _disponivel[chave] = INDICES[model][0] in conexao.introspection.table_names()
+    return _disponivel[chave]
+
+
+def compactar(documento):
+    """Documento sem pontuação: '123.456.789-00' -> '12345678900'"""
+    return ''.join(c for c in documento if c not in PONTUACAO_DOCUMENTO)
+
+
+def expressao_busca(termo):
+    """Converte o texto digitado numa expressão MATCH do FTS5 (prefixo em cada palavra)"""
+    # Aspas evitam que o texto digitado seja interpretado como sintaxe do FTS5
+    partes = []
+    for palavra in termo.split():
+        tokens = PALAVRA_RE.findall(palavra)
+        if DOCUMENTO_RE.fullmatch(palavra) and len(tokens) > 1:
+            # "163.676": o documento compacto começando assim, ou os grupos em sequência (frase)
+            partes.append(f'("{compactar(palavra)}"* OR "{" ".join(tokens)}"*)')
+        else:
+            partes.extend(f'"{token}"*' for token in tokens)
+    return ' '.join(partes)
+
+
+def filtrar(queryset, termo):
+    """Filtra o queryset pelo termo buscado, usando o índice FTS5 quando disponível"""
+    tabela, campo_nome, campo_documento = INDICES[queryset.model]
+    if not disponivel(queryset.model):
+        return queryset.filter(
+            Q(**{f'{campo_nome}__icontains': termo}) | Q(**{f'{campo_documento}__icontains': termo})
+        )
+
+    expressao = expressao_busca(termo)
+    if not expressao:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s', [expressao]))
+
+
+def _linha(nome, documento):
+    documento = documento or ''
+    return nome or '', f'{documento} {compactar(documento)}'
+
+
+def indexar_pks(model, pks):
+    """(Re)indexa os registros informados do model"""
+    if not disponivel(model):
+        return
+    tabela, campo_nome, campo_documento = INDICES[model]
+    # Em ordem crescente de rowid: excluir do FTS5 em ordem decrescente fica muito mais lento
+    pks = sorted(pks)
+    linhas = model.objects.filter(pk__in=pks).order_by('pk').values_list('pk', campo_nome, campo_documento)
+    with _conexao(model).cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {tabela} WHERE rowid = %s', [(pk,) for pk in pks])
+        cursor.executemany(
+            f'INSERT INTO {tabela}(rowid, nome, documento) VALUES (%s, %s, %s)',
+            [(pk, *_linha(nome, documento)) for pk, nome, documento in linhas],
+        )
+
+
+def indexar(instancia):
+    indexar_pks(type(instancia), [instancia.pk])
+
+
+def remover(model, pk):
+    if disponivel(model):
+        with _conexao(model).cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDICES[model][0]} WHERE rowid = %s', [pk])
+
+
+def reconstruir(model, lote=5000):
+    """Recria a tabela FTS5 do model a partir dos registros. Retorna o número de registros indexados."""
+    tabela, campo_nome, campo_documento = INDICES[model]
+    conexao = _conexao(model)
+    with conexao.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {tabela}')
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {tabela} USING fts5('
+            f"nome, documento, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        total = 0
+        registros = model.objects.order_by().values_list('pk', campo_nome, campo_documento)
+        linhas = []
+        for pk, nome, documento in registros.iterator(chunk_size=lote):
+            linhas.append((pk, *_linha(nome, documento)))
+            if len(linhas) >= lote:
+                cursor.executemany(f'INSERT INTO {tabela}(rowid, nome, documento) VALUES (%s, %s, %s)', linhas)
+                total += len(linhas)
+                linhas = []
+        if linhas:
+            cursor.executemany(f'INSERT INTO {tabela}(rowid, nome, documento) VALUES (%s, %s, %s)', linhas)
+            total += len(linhas)
+        cursor.execute(f"INSERT INTO {tabela}({tabela}) VALUES ('optimize')")
+
+    _disponivel.clear()
+    return total
@@ -0,0 +1,154 @@
+"""
+Cache com chaves versionadas por grupo de dados.
+
+Cada grupo (produtos, vendas, movimentações...) tem uma versão guardada no
+próprio cache; a chave de tudo que depende do grupo inclui a versão. Os sinais
+post_save/post_delete dos models de GRUPOS_POR_MODELO trocam a versão, e as
+operações em lote (update(), bulk_create()) chamam invalidar() diretamente.
+Nada é apagado: as entradas antigas deixam de ser lidas e expiram sozinhas.
+
+em_cache() também evita o efeito manada: quando a entrada falta, só um
+processo recalcula (trava com cache.add); os demais esperam o resultado ou,
+se permitido, usam o valor anterior enquanto isso.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .metricas import registrar_cache
+from .models import Categoria, FormaPagamento, ItemVenda, MovimentacaoEstoque, Pagamento, Produto, Venda
+
+PRODUTOS = 'produtos'
+VENDAS = 'vendas'
+PAGAMENTOS = 'pagamentos'
+MOVIMENTACOES = 'movimentacoes'
+FORMAS_PAGAMENTO = 'formas_pagamento'
+CATEGORIAS = 'categorias'
+GRUPOS = (PRODUTOS, VENDAS, PAGAMENTOS, MOVIMENTACOES, FORMAS_PAGAMENTO, CATEGORIAS)
+
+# Quem troca a versão de cada grupo (itens e pagamentos mudam os totais da venda)
+GRUPOS_POR_MODELO = {
+    Produto: (PRODUTOS,),
+    Venda: (VENDAS,),
+    ItemVenda: (VENDAS,),
+    Pagamento: (PAGAMENTOS, VENDAS),
+    MovimentacaoEstoque: (MOVIMENTACOES,),
+    FormaPagamento: (FORMAS_PAGAMENTO,),
+    Categoria: (CATEGORIAS,),
+}
+
+TEMPO_PADRAO = 300
+# Por quanto tempo um cálculo fica travado (se o processo morrer, a trava expira)
+TEMPO_TRAVA = 30
+ESPERA_MAXIMA = 10
+INTERVALO_ESPERA = 0.05
+
+
+def _chave_versao(grupo):
+    return f'versao:{grupo}'
+
+
+def versoes(grupos):
+    """Versões atuais dos grupos, na ordem dada (um grupo sem versão ganha uma agora)"""
+    chaves = [_chave_versao(grupo) for grupo in grupos]
+    atuais = cache.get_many(chaves)
+    faltando = {chave: time.time_ns() for chave in chaves if chave not in atuais}
+    for chave, versao in faltando.items():
+        # add: se outro processo criou a versão ao mesmo tempo, vale a dele
+        if not cache.add(chave, versao, None):
+            faltando[chave] = cache.get(chave, versao)
+    atuais.update(faltando)
+    return [atuais[chave] for chave in chaves]
+
+
+def versao(grupo):
+    return versoes([grupo])[0]
+
+
+def _trocar_versoes(grupos):
+    cache.set_many({_chave_versao(grupo): time.time_ns() for grupo in grupos}, None)
+
+
+def invalidar(*grupos):
+    """
+    Troca a versão dos grupos. Dentro de uma transação troca agora (esta
+    requisição já não lê o cache antigo) e de novo no commit: no meio tempo,
+    outra requisição pode ter guardado, na versão nova, dados sem a alteração.
+    """
+    if not grupos:
+        return
+    _trocar_versoes(grupos)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _trocar_versoes(grupos))
+
+
+def chave(nome, grupos, partes=()):
+    versao_grupos = '.'.join(str(versao_grupo) for versao_grupo in versoes(grupos))
+    return ':'.join([nome, versao_grupos, *(str(parte) for parte in partes)])
+
+
+def em_cache(nome, grupos, calcular, tempo=TEMPO_PADRAO, partes=(), anterior_enquanto_calcula=False):
+    """
+    Resultado de calcular() guardado sob nome + versões dos grupos + partes.
+
+    Se a entrada falta, só quem conseguir a trava calcula. Os outros esperam
+    até ESPERA_MAXIMA segundos pelo resultado (e depois calculam por conta
+    própria) ou, com anterior_enquanto_calcula, devolvem na hora o último
+    valor calculado para as mesmas partes, mesmo de uma versão antiga.
+    """
+    chave_atual = chave(nome, grupos, partes)
+    guardado = cache.get(chave_atual)
+    registrar_cache(nome, guardado is not None)
+    if guardado is not None:
+        return guardado[0]
+
+    chave_anterior = ':'.join([nome, 'anterior', *(str(parte) for parte in partes)])
+    chave_trava = f'{chave_atual}:calculando'
+    dono = uuid.uuid4().hex
+    if not cache.add(chave_trava, dono, TEMPO_TRAVA):
+        if anterior_enquanto_calcula:
+            anterior = cache.get(chave_anterior)
+            if anterior is not None:
+                return anterior[0]
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(INTERVALO_ESPERA)
+            guardado = cache.get(chave_atual)
+            if guardado is not None:
+                return guardado[0]
+            if cache.get(chave_trava) is None:
+                # Quem calculava desistiu (erro): tentar a trava de novo
+                if cache.add(chave_trava, dono, TEMPO_TRAVA):
+                    break
+        else:
+            return calcular()
+
+    try:
+        valor = calcular()
+        # Guardado numa tupla para que um resultado None também fique em cache
+        cache.set_many({chave_atual: (valor,), chave_anterior: (valor,)}, tempo)
+        return valor
+    finally:
+        if cache.get(chave_trava) == dono:
+            cache.delete(chave_trava)
+
+
+def objetos(queryset, grupo, tempo=TEMPO_PADRAO):
+    """Lista dos objetos do queryset (dados de referência), em cache até o grupo mudar"""
+    return em_cache(f'objetos:{queryset.model._meta.label_lower}', [grupo], lambda: list(queryset), tempo,
+                    partes=(hash_consulta(queryset),))
+
+
+def escolhas(campo, grupo, tempo=TEMPO_PADRAO):
+    """Opções de um ModelChoiceField montadas do cache (a validação do valor enviado continua no banco)"""
+    opcoes = [(objeto.pk, campo.label_from_instance(objeto)) for objeto in objetos(campo.queryset, grupo, tempo)]
+    if campo.empty_label is not None:
+        opcoes.insert(0, ('', campo.empty_label))
+    return opcoes
+
+
+def hash_consulta(queryset):
+    return hashlib.md5(str(queryset.query).encode()).hexdigest()
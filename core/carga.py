@@ -0,0 +1,597 @@
+"""
+Carga de dados sintéticos em escala (criar_sistema_completo --escala).
+
+Gera produtos, clientes, vendas com itens, pagamentos, contas a receber e
+movimentações de estoque em volume de produção (milhões de linhas), com
+INSERTs parametrizados (executemany) em lotes, sem passar por save() nem pelos
+sinais. Tudo é determinístico para uma mesma semente: cada dia do período usa
+o seu próprio gerador aleatório, então o resultado não depende de quantos
+processos participam.
+
+As chaves das vendas e a numeração (SequenciaVenda) são reservadas antes da
+geração, de forma que cada dia tem a sua faixa de ids e números e os dias
+podem ser gravados em paralelo por processos diferentes (--processos), o que
+ajuda em bancos com escrita concorrente (PostgreSQL). No SQLite os processos
+apenas se revezam no bloqueio de escrita e cada commit de um invalida o cache
+de páginas dos outros: um processo só é bem mais rápido.
+
+Invariantes mantidos:
+
+- estoque: o estoque_atual de cada produto gerado é exatamente a soma das
+  entradas menos as saídas. Cada janela de 30 dias recebe uma reposição
+  (entrada) com o que foi vendido nela, e a primeira também traz o estoque
+  final, então o saldo nunca fica negativo ao longo do período;
+- pagamentos: valor_pago de cada venda é a soma dos seus Pagamentos, o status
+  segue atualizar_status_pagamento e a conta a receber da venda acompanha o
+  valor pago; nas contas avulsas, valor_pago é a soma dos PagamentoConta.
+
+Os totais desnormalizados das vendas, o resumo diário (ResumoVendaDiario), o
+índice de busca e a versão das movimentações são gravados/atualizados aqui,
+já que os sinais não disparam.
+"""
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import busca, cache_versionado, codigos, indicadores, resumos
+from .models import (
+    Categoria, Cliente, ContasReceber, FormaPagamento, ItemVenda, MovimentacaoEstoque,
+    Pagamento, PagamentoConta, Produto, ResumoVendaDiario, SequenciaVenda, Venda,
+)
+
+TAMANHO_LOTE = 1000  # vendas por INSERT
+DIAS = 365
+DIAS_POR_TAREFA = 7
+JANELA_REPOSICAO = 30  # dias cobertos por cada entrada de reposição
+
+ABERTURA = time(8)
+JORNADA = 12 * 3600  # segundos de loja aberta por dia
+CENTAVO = Decimal('0.01')
+SUFIXOS = {'k': 1_000, 'm': 1_000_000}
+CACHE_SQLITE_KB = 256 * 1024
+ESPERA_BLOQUEIO_MS = 10 * 60 * 1000
+
+MARCAS = ['Cristal', 'Serra Azul', 'Fonte Viva', 'Pureza', 'Nascente', 'Vale Verde', 'Montanha',
+          'Aquarela', 'Bica', 'Límpida', 'São Lourenço', 'Caxambu']
+# (linha, categoria, volumes, faixa de custo)
+LINHAS = [
+    ('Água Mineral', 'Água Mineral', ['300ml', '500ml', '1,5L', '5L'], (0.6, 4)),
+    ('Água com Gás', 'Água com Gás', ['300ml', '500ml', '1,5L'], (0.9, 5)),
+    ('Água Alcalina', 'Água Alcalina', ['500ml', '1,5L'], (1.5, 7)),
+    ('Água Saborizada', 'Água Saborizada', ['300ml', '500ml'], (1.2, 5)),
+    ('Galão', 'Galões', ['10L', '20L'], (6, 18)),
+    ('Copo Descartável', 'Copos Descartáveis', ['200ml', '300ml'], (4, 12)),
+]
+EMBALAGENS = ['', 'Fardo c/ 6', 'Fardo c/ 12', 'Caixa c/ 24']
+NOMES = ['Maria', 'José', 'João', 'Ana', 'Antônio', 'Francisca', 'Luís', 'Conceição', 'Raimundo', 'Júlia',
+         'Sebastião', 'Lúcia', 'Inês', 'Caio', 'Gonçalo', 'Paulo', 'Beatriz', 'Pedro', 'Helena', 'Carlos']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Araújo', 'Conceição', 'Gonçalves', 'Lima', 'Sá',
+              'Brandão', 'Magalhães', 'Assunção', 'Pereira', 'Ribeiro', 'Fontes', 'Carvalho', 'Almeida']
+BAIRROS = ['Centro', 'Jardim América', 'Vila Nova', 'Boa Vista', 'Santa Cruz', 'São José', 'Industrial']
+
+
+class ErroCarga(Exception):
+    """Pré-requisito da carga ausente (usuários, categorias ou formas de pagamento)"""
+
+
+def interpretar_escala(texto):
+    """Número de vendas a partir de '50000', '50k', '1m' ou '2.5m'"""
+    valor = str(texto).strip().lower().replace('_', '')
+    multiplicador = SUFIXOS.get(valor[-1:], 1)
+    if multiplicador > 1:
+        valor = valor[:-1]
+    try:
+        total = int(Decimal(valor) * multiplicador)
+    except (ArithmeticError, ValueError):
+        raise ValueError(f'Escala inválida: {texto!r} (use, por exemplo, 50000, 100k ou 1m).')
+    if total < 1:
+        raise ValueError('A escala deve ser positiva.')
+    return total
+
+
+def dimensoes(vendas):
+    """Quantidades geradas para um número de vendas"""
+    return {
+        'vendas': vendas,
+        'produtos': min(max(vendas // 100, 50), 20_000),
+        'clientes': max(vendas // 10, 100),
+        'contas_avulsas': vendas // 50,
+    }
+
+
+def _primeira_venda(dia, total, dias):
+    """Índice da primeira venda do dia (as vendas são distribuídas por igual entre os dias)"""
+    return -(-dia * total // dias)
+
+
+def _inserir(conexao, model, campos, linhas):
+    """INSERT parametrizado (executemany) das linhas, com os valores na ordem de campos"""
+    if not linhas:
+        return
+    nome = conexao.ops.quote_name
+    colunas = ', '.join(nome(model._meta.get_field(campo).column) for campo in campos)
+    marcadores = ', '.join(['%s'] * len(campos))
+    with conexao.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {nome(model._meta.db_table)} ({colunas}) VALUES ({marcadores})', linhas
+        )
+
+
+def _preparar_conexao(conexao):
+    """
+    No SQLite: cache de páginas maior, já que as inserções mexem em muitos
+    índices ao mesmo tempo, e espera longa pelo bloqueio de escrita, que os
+    processos da carga disputam entre si.
+    """
+    if conexao.vendor == 'sqlite':
+        with conexao.cursor() as cursor:
+            cursor.execute(f'PRAGMA cache_size = -{CACHE_SQLITE_KB}')
+            cursor.execute(f'PRAGMA busy_timeout = {ESPERA_BLOQUEIO_MS}')
+
+
+def _maior_pk(model, alias):
+    return model.objects.using(alias).aggregate(maior=Max('pk'))['maior'] or 0
+
+
+def _reservar_numeros(alias, prefixo, quantidade):
+    """Reserva quantidade números seguidos do prefixo e devolve o primeiro"""
+    with transaction.atomic(using=alias):
+        sequencia, _ = SequenciaVenda.objects.using(alias).select_for_update().get_or_create(prefixo=prefixo)
+        SequenciaVenda.objects.using(alias).filter(pk=sequencia.pk).update(
+            ultimo_numero=F('ultimo_numero') + quantidade
+        )
+        sequencia.refresh_from_db(fields=['ultimo_numero'])
+    return sequencia.ultimo_numero - quantidade + 1
+
+
+def _dividir_pagamento(aleatorio, valor):
+    """Um ou dois pagamentos que somam valor"""
+    if valor > 1 and aleatorio.random() < 0.25:
+        entrada = (valor * Decimal(aleatorio.uniform(0.3, 0.7))).quantize(CENTAVO)
+        return [entrada, valor - entrada]
+    return [valor]
+
+
+def _pagamentos(aleatorio, valor, atraso):
+    """Valores pagos de uma venda/conta a prazo conforme o atraso do vencimento (em dias)"""
+    quitar, parcial = (0.85, 0.95) if atraso > 30 else (0.4, 0.6)
+    sorteio = aleatorio.random()
+    if sorteio < quitar:
+        return _dividir_pagamento(aleatorio, valor)
+    if sorteio < parcial:
+        return [(valor * Decimal(aleatorio.uniform(0.3, 0.8))).quantize(CENTAVO)]
+    return []
+
+
+def _data_pagamento(aleatorio, data_venda, dia_venda, prazo, hoje):
+    limite = max(0, min(prazo, (hoje - dia_venda).days - 1))
+    return data_venda + timedelta(days=aleatorio.randint(0, limite), hours=aleatorio.randint(0, 3))
+
+
+class _Dias:
+    """Gera e grava as vendas de um conjunto de dias, numa transação (no processo principal ou num worker)"""
+
+    def __init__(self, plano):
+        self.plano = plano
+        self.conexao = connections[plano['alias']]
+        _preparar_conexao(self.conexao)
+        self.fuso = timezone.get_current_timezone()
+        self.data_hora = self.conexao.ops.adapt_datetimefield_value
+        self.data = self.conexao.ops.adapt_datefield_value
+        produtos = plano['produtos']
+        # Popularidade desigual: poucos produtos concentram a maior parte das vendas
+        self.pesos = []
+        acumulado = 0
+        for posicao in range(len(produtos)):
+            acumulado += 1 / (posicao + 1) ** 0.8
+            self.pesos.append(acumulado)
+        self.a_vista = [forma for forma in plano['formas'] if forma[1] == 0] or plano['formas']
+        self.contagem = Counter()
+        self.vendido = Counter()  # (produto_id, janela) -> quantidade
+
+    def gravar(self, dias):
+        with transaction.atomic(using=self.plano['alias']):
+            for dia in dias:
+                self.gravar_dia(dia)
+        return self.contagem, self.vendido
+
+    def numero(self, dia, posicao):
+        numeracao = self.plano['numeracao']
+        prefixo, primeiro = numeracao['primeiros'][dia]
+        return f"{prefixo}{primeiro + posicao:0{numeracao['digitos']}d}"
+
+    def gravar_dia(self, dia):
+        plano = self.plano
+        total, dias = plano['vendas'], plano['dias']
+        primeira = _primeira_venda(dia, total, dias)
+        ultima = _primeira_venda(dia + 1, total, dias)
+        if primeira == ultima:
+            return
+        aleatorio = random.Random(f"{plano['seed']}:{dia}")
+        data_local = plano['inicio'] + timedelta(days=dia)
+        abertura = timezone.make_aware(datetime.combine(data_local, ABERTURA), self.fuso)
+        intervalo = JORNADA // (ultima - primeira)
+        janela = dia // JANELA_REPOSICAO
+        resumo = Counter()
+        linhas = {'vendas': [], 'itens': [], 'movimentacoes': [], 'pagamentos': [], 'contas': []}
+
+        for indice in range(primeira, ultima):
+            posicao = indice - primeira
+            venda_id = plano['venda_base'] + indice + 1
+            numero = self.numero(dia, posicao)
+            data_venda = abertura + timedelta(seconds=posicao * intervalo + aleatorio.randrange(max(intervalo, 1)))
+            momento = self.data_hora(data_venda)
+            usuario_id = aleatorio.choice(plano['usuarios'])
+            cliente_id = aleatorio.choice(plano['clientes']) if aleatorio.random() < 0.75 else None
+            forma_id, prazo = aleatorio.choice(plano['formas'] if cliente_id else self.a_vista)
+
+            quantidade_produtos = aleatorio.choices((1, 2, 3, 4, 5), weights=(35, 30, 20, 10, 5))[0]
+            escolhidos = {}
+            for produto_id, preco in aleatorio.choices(plano['produtos'], cum_weights=self.pesos,
+                                                       k=quantidade_produtos):
+                escolhidos[produto_id] = preco
+            valor_itens = Decimal('0')
+            quantidade_itens = 0
+            itens = []
+            for produto_id, preco in escolhidos.items():
+                quantidade = min(10, 1 + int(aleatorio.expovariate(0.6)))
+                itens.append((produto_id, quantidade, preco))
+                valor_itens += quantidade * preco
+                quantidade_itens += quantidade
+
+            pagos = []
+            if cliente_id:
+                vencimento = data_local + timedelta(days=prazo)
+                pagos = _pagamentos(aleatorio, valor_itens, (plano['hoje'] - vencimento).days)
+            valor_pago = sum(pagos, Decimal('0'))
+            if not cliente_id:
+                status = 'finalizada'  # venda de balcão
+            elif valor_pago >= valor_itens:
+                status = 'paga'
+            elif valor_pago > 0:
+                status = 'parcial'
+            else:
+                status = 'aberta'
+
+            linhas['vendas'].append((
+                venda_id, numero, cliente_id, forma_id, momento, usuario_id,
+                'Gerada pela carga de dados', status, momento, momento,
+                valor_itens, valor_pago, quantidade_itens, len(itens),
+            ))
+            chave = (status, forma_id, usuario_id)
+            resumo[chave, None, 'vendas'] += 1
+            resumo[chave, None, 'valor'] += valor_itens
+            for produto_id, quantidade, preco in itens:
+                linhas['itens'].append((venda_id, produto_id, quantidade, preco, momento))
+                linhas['movimentacoes'].append((
+                    produto_id, 'saida', quantidade, preco, forma_id, f'Venda {numero}', usuario_id, momento,
+                ))
+                resumo[chave, produto_id, 'quantidade'] += quantidade
+                resumo[chave, produto_id, 'valor'] += quantidade * preco
+                self.vendido[produto_id, janela] += quantidade
+            for valor in pagos:
+                pago_em = self.data_hora(_data_pagamento(aleatorio, data_venda, data_local, prazo, plano['hoje']))
+                linhas['pagamentos'].append((
+                    venda_id, aleatorio.choice(self.a_vista)[0], valor, pago_em,
+                    f'Pagamento da venda {numero}', usuario_id,
+                ))
+            if cliente_id:
+                if valor_pago >= valor_itens:
+                    status_conta = 'quitado'
+                elif vencimento < plano['hoje']:
+                    status_conta = 'vencido'
+                else:
+                    status_conta = 'parcial' if valor_pago else 'aberto'
+                linhas['contas'].append((
+                    cliente_id, venda_id, valor_itens, valor_pago, self.data(vencimento), momento,
+                    status_conta, f'Venda {numero} - Aguardando pagamento', usuario_id,
+                ))
+
+            if len(linhas['vendas']) >= plano['lote']:
+                self.descarregar(linhas)
+        self.descarregar(linhas)
+        if plano['resumo']:
+            self.gravar_resumo(data_local, resumo)
+
+    def descarregar(self, linhas):
+        conexao = self.conexao
+        _inserir(conexao, Venda, [
+            'id', 'numero_venda', 'cliente', 'forma_pagamento', 'data_venda', 'usuario', 'observacao', 'status',
+            'data_criacao', 'data_atualizacao', 'valor_itens', 'valor_pago', 'quantidade_itens', 'numero_itens',
+        ], linhas['vendas'])
+        _inserir(conexao, ItemVenda, ['venda', 'produto', 'quantidade', 'preco_unitario', 'data_criacao'],
+                 linhas['itens'])
+        _inserir(conexao, MovimentacaoEstoque, [
+            'produto', 'tipo', 'quantidade', 'preco_unitario', 'forma_pagamento', 'observacao', 'usuario',
+            'data_movimentacao',
+        ], linhas['movimentacoes'])
+        _inserir(conexao, Pagamento, ['venda', 'forma_pagamento', 'valor_pago', 'data_pagamento', 'observacao',
+                                      'usuario'], linhas['pagamentos'])
+        _inserir(conexao, ContasReceber, [
+            'cliente', 'venda', 'valor_total', 'valor_pago', 'data_vencimento', 'data_criacao', 'status',
+            'observacao', 'usuario',
+        ], linhas['contas'])
+        for nome in linhas:
+            self.contagem[nome] += len(linhas[nome])
+            linhas[nome] = []
+
+    def gravar_resumo(self, data_local, resumo):
+        """Linhas de ResumoVendaDiario do dia, iguais às de resumos.reconstruir()"""
+        agrupado = {}
+        for (chave, produto_id, medida), valor in resumo.items():
+            agrupado.setdefault((chave, produto_id), {'vendas': 0, 'quantidade': 0, 'valor': 0})[medida] = valor
+        data = self.data(data_local)
+        _inserir(self.conexao, ResumoVendaDiario, [
+            'data', 'status', 'produto', 'forma_pagamento', 'usuario', 'numero_vendas', 'quantidade', 'valor',
+        ], [
+            (data, status, produto_id, forma_id, usuario_id, medidas['vendas'], medidas['quantidade'],
+             medidas['valor'])
+            for ((status, forma_id, usuario_id), produto_id), medidas in agrupado.items()
+        ])
+
+
+def _gravar_dias(plano, dias):
+    return _Dias(plano).gravar(dias)
+
+
+def _gravar_produtos(aleatorio, alias, quantidade, categorias, criacao, lote):
+    """Cria os produtos e devolve [(id, preco_venda, preco_custo, estoque_final)]"""
+    conexao = connections[alias]
+    base = _maior_pk(Produto, alias)
+    momento = conexao.ops.adapt_datetimefield_value(criacao)
+    produtos, linhas = [], []
+    for indice in range(quantidade):
+        produto_id = base + indice + 1
+        linha, categoria, volumes, (custo_minimo, custo_maximo) = aleatorio.choice(LINHAS)
+        embalagem = aleatorio.choice(EMBALAGENS) if linha not in ('Galão', 'Copo Descartável') else ''
+        nome = f'{linha} {aleatorio.choice(MARCAS)} {aleatorio.choice(volumes)} {embalagem}'.strip()
+        fator = {'Fardo c/ 6': 6, 'Fardo c/ 12': 12, 'Caixa c/ 24': 24}.get(embalagem, 1)
+        preco_custo = (Decimal(aleatorio.uniform(custo_minimo, custo_maximo)) * fator * Decimal('0.9')).quantize(
+            CENTAVO)
+        preco_venda = (preco_custo * Decimal(aleatorio.uniform(1.3, 1.9))).quantize(CENTAVO)
+        estoque_minimo = aleatorio.choice((5, 10, 20, 50))
+        estoque_final = aleatorio.randint(0, 4 * estoque_minimo)
+        produtos.append((produto_id, preco_venda, preco_custo, estoque_final))
+        linhas.append((
+            produto_id, nome, categorias.get(categoria) or aleatorio.choice(list(categorias.values())),
+            f'CG{produto_id:07d}', preco_venda, preco_custo, estoque_minimo, estoque_final,
+            'UN' if not fator > 1 else 'FD', True, momento,
+        ))
+    for inicio in range(0, len(linhas), lote):
+        with transaction.atomic(using=alias):
+            _inserir(conexao, Produto, [
+                'id', 'nome', 'categoria', 'codigo', 'preco_venda', 'preco_custo', 'estoque_minimo',
+                'estoque_atual', 'unidade_medida', 'ativo', 'data_criacao',
+            ], linhas[inicio:inicio + lote])
+            busca.indexar_pks(Produto, [linha[0] for linha in linhas[inicio:inicio + lote]])
+    return produtos
+
+
+def _gravar_clientes(aleatorio, alias, quantidade, lote):
+    """Cria os clientes e devolve os ids"""
+    conexao = connections[alias]
+    base = _maior_pk(Cliente, alias)
+    linhas = []
+    for indice in range(quantidade):
+        nome = aleatorio.choice(NOMES)
+        sobrenome = aleatorio.choice(SOBRENOMES)
+        digitos = f'{aleatorio.randrange(10 ** 11):011d}'
+        linhas.append((
+            base + indice + 1,
+            f'{nome} {aleatorio.choice(SOBRENOMES)} {sobrenome}',
+            f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}',
+            f'(11) 9{aleatorio.randrange(10 ** 8):08d}',
+            f'{nome.lower()}.{indice + 1}@exemplo.com.br' if aleatorio.random() < 0.6 else '',
+            f'Rua {aleatorio.choice(SOBRENOMES)}, {aleatorio.randint(1, 2000)} - {aleatorio.choice(BAIRROS)}',
+            aleatorio.random() < 0.97,
+        ))
+    for inicio in range(0, len(linhas), lote):
+        with transaction.atomic(using=alias):
+            _inserir(conexao, Cliente, ['id', 'nome', 'cpf_cnpj', 'telefone', 'email', 'endereco', 'ativo'],
+                     linhas[inicio:inicio + lote])
+            busca.indexar_pks(Cliente, [linha[0] for linha in linhas[inicio:inicio + lote]])
+    return [linha[0] for linha in linhas if linha[-1]]
+
+
+def _gravar_reposicoes(alias, produtos, vendido, inicio, usuario_id, lote):
+    """Entradas que cobrem as vendas de cada janela; a primeira inclui o estoque final"""
+    conexao = connections[alias]
+    fuso = timezone.get_current_timezone()
+    por_produto = {produto_id: (preco_custo, estoque_final) for produto_id, _, preco_custo, estoque_final in produtos}
+    for produto_id, _, _, estoque_final in produtos:
+        vendido[produto_id, 0] += estoque_final
+    linhas = []
+    for (produto_id, janela), quantidade in sorted(vendido.items()):
+        if quantidade <= 0:
+            continue
+        data = timezone.make_aware(
+            datetime.combine(inicio + timedelta(days=janela * JANELA_REPOSICAO), time(7)), fuso
+        )
+        linhas.append((
+            produto_id, 'entrada', quantidade, por_produto[produto_id][0], None,
+            'Reposição (carga de dados)', usuario_id, conexao.ops.adapt_datetimefield_value(data),
+        ))
+    for posicao in range(0, len(linhas), lote):
+        with transaction.atomic(using=alias):
+            _inserir(conexao, MovimentacaoEstoque, [
+                'produto', 'tipo', 'quantidade', 'preco_unitario', 'forma_pagamento', 'observacao', 'usuario',
+                'data_movimentacao',
+            ], linhas[posicao:posicao + lote])
+    return len(linhas)
+
+
+def _gravar_contas_avulsas(aleatorio, alias, quantidade, plano, lote):
+    """Contas a receber sem venda, com os seus PagamentoConta"""
+    conexao = connections[alias]
+    fuso = timezone.get_current_timezone()
+    formas = [forma for forma in plano['formas'] if forma[1] == 0] or plano['formas']
+    base = _maior_pk(ContasReceber, alias)
+    contas, pagamentos = [], []
+    for indice in range(quantidade):
+        conta_id = base + indice + 1
+        dia_criacao = plano['inicio'] + timedelta(days=aleatorio.randrange(plano['dias']))
+        criacao = timezone.make_aware(datetime.combine(dia_criacao, ABERTURA), fuso) + timedelta(
+            seconds=aleatorio.randrange(JORNADA))
+        vencimento = dia_criacao + timedelta(days=30)
+        valor_total = Decimal(aleatorio.uniform(50, 500)).quantize(CENTAVO)
+        pagos = _pagamentos(aleatorio, valor_total, (plano['hoje'] - vencimento).days)
+        valor_pago = sum(pagos, Decimal('0'))
+        if valor_pago >= valor_total:
+            status = 'quitado'
+        elif vencimento < plano['hoje']:
+            status = 'vencido'
+        else:
+            status = 'parcial' if valor_pago else 'aberto'
+        usuario_id = aleatorio.choice(plano['usuarios'])
+        contas.append((
+            conta_id, aleatorio.choice(plano['clientes']), None, valor_total, valor_pago,
+            conexao.ops.adapt_datefield_value(vencimento), conexao.ops.adapt_datetimefield_value(criacao),
+            status, f'Conta avulsa #{indice + 1} - Serviços diversos', usuario_id,
+        ))
+        for valor in pagos:
+            pagamentos.append((
+                conta_id, aleatorio.choice(formas)[0], valor,
+                conexao.ops.adapt_datetimefield_value(
+                    _data_pagamento(aleatorio, criacao, dia_criacao, 30, plano['hoje'])),
+                'Pagamento da conta avulsa', usuario_id,
+            ))
+    with transaction.atomic(using=alias):
+        for posicao in range(0, len(contas), lote):
+            _inserir(conexao, ContasReceber, [
+                'id', 'cliente', 'venda', 'valor_total', 'valor_pago', 'data_vencimento', 'data_criacao', 'status',
+                'observacao', 'usuario',
+            ], contas[posicao:posicao + lote])
+        for posicao in range(0, len(pagamentos), lote):
+            _inserir(conexao, PagamentoConta, [
+                'conta_receber', 'forma_pagamento', 'valor_pago', 'data_pagamento', 'observacao', 'usuario',
+            ], pagamentos[posicao:posicao + lote])
+    return len(contas), len(pagamentos)
+
+
+def _numeracao(alias, vendas, dias, inicio):
+    """
+    Reserva os números de todas as vendas geradas: {dia: (prefixo, primeiro número)}.
+
+    Na numeração global é um único bloco; na diária, um bloco por dia.
+    """
+    fuso = timezone.get_current_timezone()
+    primeiros, blocos = {}, {}
+    for dia in range(dias):
+        quantidade = _primeira_venda(dia + 1, vendas, dias) - _primeira_venda(dia, vendas, dias)
+        if quantidade:
+            data_venda = timezone.make_aware(datetime.combine(inicio + timedelta(days=dia), ABERTURA), fuso)
+            prefixo, digitos = Venda.prefixo_numero(data_venda)
+            blocos.setdefault(prefixo, []).append((dia, quantidade))
+    for prefixo, dias_prefixo in blocos.items():
+        numero = _reservar_numeros(alias, prefixo, sum(quantidade for _, quantidade in dias_prefixo))
+        for dia, quantidade in dias_prefixo:
+            primeiros[dia] = (prefixo, numero)
+            numero += quantidade
+    return {'digitos': digitos, 'primeiros': primeiros}
+
+
+def gerar(vendas, seed=42, dias=DIAS, lote=TAMANHO_LOTE, processos=1, progresso=None):
+    """
+    Gera vendas vendas distribuídas pelos dias anteriores a hoje, com produtos,
+    clientes e contas avulsas proporcionais (ver dimensoes()).
+
+    Com processos > 1 os dias são gravados por um pool de processos. Devolve
+    um Counter com o número de linhas gravadas por tipo.
+    """
+    progresso = progresso or (lambda mensagem: None)
+    alias = router.db_for_write(Venda)
+    _preparar_conexao(connections[alias])
+    tamanhos = dimensoes(vendas)
+    aleatorio = random.Random(f'{seed}:cadastros')
+
+    usuarios = list(User.objects.using(alias).filter(is_active=True).order_by('pk').values_list('pk', flat=True)[:20])
+    categorias = dict(Categoria.objects.using(alias).order_by('-pk').values_list('nome', 'pk'))
+    formas = list(FormaPagamento.objects.using(alias).filter(ativo=True).order_by('pk')
+                  .values_list('pk', 'prazo_recebimento'))
+    if not (usuarios and categorias and formas):
+        raise ErroCarga('Cadastre usuários, categorias e formas de pagamento antes da carga em escala.')
+
+    hoje = timezone.localdate()
+    inicio = hoje - timedelta(days=dias)
+    fuso = timezone.get_current_timezone()
+    resultado = Counter()
+
+    progresso(f'📦 Gerando {tamanhos["produtos"]:,} produtos e {tamanhos["clientes"]:,} clientes...')
+    produtos = _gravar_produtos(aleatorio, alias, tamanhos['produtos'], categorias,
+                                timezone.make_aware(datetime.combine(inicio - timedelta(days=1), ABERTURA), fuso),
+                                lote * 10)
+    clientes = _gravar_clientes(aleatorio, alias, tamanhos['clientes'], lote * 10)
+    resultado.update(produtos=len(produtos), clientes=len(clientes))
+
+    data_inicio = timezone.make_aware(datetime.combine(inicio, time.min), fuso)
+    plano = {
+        'alias': alias,
+        'seed': seed,
+        'vendas': vendas,
+        'dias': dias,
+        'lote': lote,
+        'inicio': inicio,
+        'hoje': hoje,
+        'venda_base': _maior_pk(Venda, alias),
+        'numeracao': _numeracao(alias, vendas, dias, inicio),
+        'usuarios': usuarios,
+        'formas': formas,
+        'clientes': clientes,
+        'produtos': [(produto_id, preco_venda) for produto_id, preco_venda, _, _ in produtos],
+        # Havendo vendas anteriores no período, o resumo é reconstruído no final
+        'resumo': not Venda.objects.using(alias).filter(data_venda__gte=data_inicio).exists(),
+    }
+
+    if processos > 1 and connections[alias].vendor == 'sqlite':
+        progresso('⚠️  No SQLite os processos disputam o mesmo bloqueio de escrita: a carga fica mais lenta.')
+    progresso(f'🛒 Gerando {vendas:,} vendas em {dias} dias ({processos} processo(s))...')
+    tarefas = [range(dia, min(dia + DIAS_POR_TAREFA, dias)) for dia in range(0, dias, DIAS_POR_TAREFA)]
+    vendido = Counter()
+    if processos > 1:
+        # Os processos filhos abrem as suas próprias conexões
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processos, initializer=django.setup) as executor:
+            parciais = executor.map(_gravar_dias, [plano] * len(tarefas), tarefas)
+            for concluidas, (contagem, vendido_tarefa) in enumerate(parciais, 1):
+                resultado.update(contagem)
+                vendido.update(vendido_tarefa)
+                progresso(f'   ✅ {concluidas}/{len(tarefas)} semanas gravadas ({resultado["vendas"]:,} vendas)')
+    else:
+        geracao = _Dias(plano)
+        for concluidas, tarefa in enumerate(tarefas, 1):
+            geracao.gravar(tarefa)
+            progresso(f'   ✅ {concluidas}/{len(tarefas)} semanas gravadas ({geracao.contagem["vendas"]:,} vendas)')
+        resultado.update(geracao.contagem)
+        vendido = geracao.vendido
+
+    progresso('🚚 Gravando reposições de estoque e contas avulsas...')
+    resultado['movimentacoes'] += _gravar_reposicoes(alias, produtos, vendido, inicio, usuarios[0], lote * 10)
+    contas, pagamentos_contas = _gravar_contas_avulsas(aleatorio, alias, tamanhos['contas_avulsas'], plano,
+                                                       lote * 10)
+    resultado.update(contas=contas, pagamentos_contas=pagamentos_contas)
+
+    # Os ids foram gravados explicitamente: ajustar as sequências (PostgreSQL)
+    conexao = connections[alias]
+    comandos = conexao.ops.sequence_reset_sql(no_style(), [Produto, Cliente, Venda, ContasReceber])
+    if comandos:
+        with conexao.cursor() as cursor:
+            for comando in comandos:
+                cursor.execute(comando)
+
+    if not plano['resumo']:
+        progresso('🔎 Reconstruindo o resumo diário do período...')
+        resumos.reconstruir(desde=inicio)
+    indicadores.recalcular()
+    indicadores.somar({indicadores.VERSAO_CATALOGO: 1, indicadores.VERSAO_CODIGOS: 1})
+    cache_versionado.invalidar(*cache_versionado.GRUPOS)
+    codigos.invalidar()
+    return resultado
@@ -0,0 +1,94 @@
+"""
+Busca de produtos pelo código, para os leitores de código de barras dos caixas.
+
+Cada processo guarda os produtos ativos num dicionário {codigo: produto},
+montado com uma consulta no primeiro uso. Quem grava um produto esvazia o
+dicionário do próprio processo no commit (sinais de Produto); os outros
+processos percebem a alteração pela versão dos códigos (indicador
+VERSAO_CODIGOS, no banco), conferida no máximo a cada VERIFICAR_A_CADA
+segundos. Um código que não está no dicionário (produto criado há pouco em
+outro processo) é procurado pelo índice único de Produto.codigo e, se
+encontrado, entra no dicionário.
+
+Estoque não faz parte da resposta (muda a cada venda); para ele há a API de
+preços em lote.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import indicadores
+from .models import Produto
+
+VERIFICAR_A_CADA = getattr(settings, 'CODIGOS_VERIFICAR_A_CADA', 1)
+
+CAMPOS = ('id', 'codigo', 'nome', 'preco_venda', 'unidade_medida')
+ProdutoCodigo = namedtuple('ProdutoCodigo', CAMPOS)
+
+
+def consulta():
+    return Produto.objects.filter(ativo=True).values_list('pk', *CAMPOS[1:])
+
+
+class LeitorCodigos:
+    """Dicionário de produtos ativos por código, de um processo"""
+
+    def __init__(self, verificar_a_cada=VERIFICAR_A_CADA):
+        self.verificar_a_cada = verificar_a_cada
+        self._produtos = None
+        self._versao = None
+        self._verificado_em = float('-inf')
+        self._trava = threading.Lock()
+
+    def _dicionario(self):
+        produtos = self._produtos
+        agora = time.monotonic()
+        if produtos is not None and agora - self._verificado_em < self.verificar_a_cada:
+            return produtos
+        with self._trava:
+            produtos = self._produtos
+            if produtos is None or agora - self._verificado_em >= self.verificar_a_cada:
+                # A versão é lida antes dos produtos: uma alteração gravada entre
+                # as duas leituras só faz o dicionário ser montado de novo
+                versao = indicadores.versao_codigos()
+                if produtos is None or versao != self._versao:
+                    produtos = {linha[1]: ProdutoCodigo(*linha) for linha in consulta()}
+                    self._versao = versao
+                self._verificado_em = agora
+                self._produtos = produtos
+            return produtos
+
+    def buscar(self, codigo):
+        """ProdutoCodigo do produto ativo com o código, ou None"""
+        produtos = self._dicionario()
+        produto = produtos.get(codigo)
+        if produto is None:
+            linha = consulta().filter(codigo=codigo).first()
+            if linha is None:
+                return None
+            produto = produtos[codigo] = ProdutoCodigo(*linha)
+        return produto
+
+    def limpar(self):
+        self._produtos = None
+
+    def __len__(self):
+        return len(self._produtos or ())
+
+
+leitor = LeitorCodigos()
+
+
+def buscar(codigo):
+    return leitor.buscar(codigo.strip())
+
+
+def invalidar():
+    """Esvazia o dicionário deste processo quando a transação atual for gravada"""
+    if connection.in_atomic_block:
+        transaction.on_commit(leitor.limpar)
+    else:
+        leitor.limpar()
@@ -0,0 +1,11 @@
+"""
+Estatísticas simples sobre amostras de tempo, usadas pela instrumentação de
+desempenho (estoque_agua/desempenho.py) e pelos benchmarks (core/benchmarks).
+"""
+import math
+
+
+def percentil(valores, fracao):
+    """Percentil pelo método nearest-rank (p95 de 20 amostras é a segunda maior)"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(fracao * len(ordenados)) - 1)]
@@ -0,0 +1,239 @@
+"""
+Serviço de estoque: toda alteração de Produto.estoque_atual passa por aqui.
+
+As alterações são aplicadas com expressões F() (o banco soma o delta, sem
+ler-modificar-gravar em Python), num único UPDATE para todos os produtos
+(CASE por pk), e as saídas levam a condição de estoque suficiente no WHERE,
+de forma que o estoque nunca fica negativo mesmo com vários caixas gravando
+ao mesmo tempo. Os produtos são bloqueados com select_for_update sempre na
+ordem da chave primária, evitando deadlocks entre transações concorrentes.
+
+Os recebimentos em lote (entregas de fornecedor) gravam todas as entradas com
+bulk_create e o mesmo UPDATE único, numa única transação, e são estornados
+como uma unidade, com saídas que compensam as entradas e apontam para o
+recebimento.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import cache_versionado, indicadores
+from .models import MovimentacaoEstoque, Produto, RecebimentoEstoque
+
+# Produtos por UPDATE em aplicar_deltas: cada um usa até 5 parâmetros, e o
+# SQLite aceita 999 por consulta
+LOTE_ATUALIZACAO = 150
+
+
+class EstoqueInsuficiente(Exception):
+    """Saída maior que o estoque disponível do produto"""
+
+    def __init__(self, produto, solicitado):
+        self.produto = produto
+        self.disponivel = produto.estoque_atual
+        self.solicitado = solicitado
+        super().__init__(
+            f'Estoque insuficiente para {produto.nome}. '
+            f'Disponível: {self.disponivel}, solicitado: {solicitado}'
+        )
+
+
+def delta_movimentacao(tipo, quantidade):
+    """Efeito no estoque de uma movimentação de entrada/saída"""
+    if tipo == 'entrada':
+        return quantidade
+    if tipo == 'saida':
+        return -quantidade
+    return 0
+
+
+def somar_deltas(pares):
+    """Agrupa pares (produto_id, delta) somando os deltas por produto"""
+    deltas = defaultdict(int)
+    for produto_id, delta in pares:
+        deltas[produto_id] += delta
+    return {produto_id: delta for produto_id, delta in deltas.items() if delta}
+
+
+def bloquear_produtos(produto_ids):
+    """Bloqueia os produtos (em ordem de pk) e retorna {pk: Produto}"""
+    produtos = Produto.objects.select_for_update().filter(pk__in=produto_ids).order_by('pk')
+    return {produto.pk: produto for produto in produtos}
+
+
+class _SaidaRecusada(Exception):
+    """O UPDATE recusou uma saída: o estoque mudou sem passar pelo bloqueio"""
+
+    def __init__(self, saidas, produtos):
+        self.saidas = saidas
+        self.produtos = produtos
+        super().__init__()
+
+
+def aplicar_deltas(deltas, produtos=None):
+    """
+    Aplica {produto_id: delta} ao estoque de forma atômica.
+
+    Deltas negativos só são aplicados se houver estoque suficiente; se algum
+    produto não tiver, EstoqueInsuficiente é lançada e nada é alterado.
+    produtos: {pk: Produto} já bloqueados por bloquear_produtos() nesta
+    transação, para não bloquear de novo. Retorna {pk: Produto} com
+    estoque_atual já atualizado em memória.
+    """
+    try:
+        return _aplicar_deltas(deltas, produtos)
+    except _SaidaRecusada as recusa:
+        # A transação de _aplicar_deltas já desfez o UPDATE: o estoque lido agora é o real
+        atuais = dict(Produto.objects.filter(pk__in=recusa.saidas).values_list('pk', 'estoque_atual'))
+        produto_id = next((produto_id for produto_id in sorted(recusa.saidas)
+                           if atuais[produto_id] < recusa.saidas[produto_id]), min(recusa.saidas))
+        produto = recusa.produtos[produto_id]
+        produto.estoque_atual = atuais[produto_id]
+        raise EstoqueInsuficiente(produto, recusa.saidas[produto_id]) from None
+
+
+@transaction.atomic
+def _aplicar_deltas(deltas, produtos):
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+
+    if produtos is None:
+        produtos = bloquear_produtos(deltas)
+    ausentes = set(deltas) - set(produtos)
+    if ausentes:
+        raise Produto.DoesNotExist(f'Produto {min(ausentes)} não existe.')
+    saidas = {produto_id: -delta for produto_id, delta in deltas.items() if delta < 0}
+    # Os produtos foram lidos com o bloqueio, nesta transação: o estoque deles é o que o UPDATE vai ver
+    for produto_id, quantidade in sorted(saidas.items()):
+        if produtos[produto_id].estoque_atual < quantidade:
+            raise EstoqueInsuficiente(produtos[produto_id], quantidade)
+
+    abaixo_antes = indicadores.contar_abaixo_do_minimo(produtos.values())
+    ids = sorted(deltas)
+    atualizados = 0
+    for inicio in range(0, len(ids), LOTE_ATUALIZACAO):
+        lote = ids[inicio:inicio + LOTE_ATUALIZACAO]
+        atualizacao = Produto.objects.filter(pk__in=lote)
+        minimos = [When(pk=produto_id, then=Value(saidas[produto_id])) for produto_id in lote if produto_id in saidas]
+        if minimos:
+            atualizacao = atualizacao.filter(estoque_atual__gte=Case(*minimos, default=Value(0)))
+        atualizados += atualizacao.update(estoque_atual=F('estoque_atual') + Case(
+            *[When(pk=produto_id, then=Value(deltas[produto_id])) for produto_id in lote]))
+    if atualizados < len(ids):
+        raise _SaidaRecusada(saidas, produtos)
+
+    for produto_id, delta in deltas.items():
+        produtos[produto_id].estoque_atual += delta
+
+    # somar() ignora deltas zero: a linha dos produtos abaixo do mínimo só é
+    # gravada quando ele muda; a versão do catálogo, a cada vez, só após o commit
+    indicadores.somar({
+        indicadores.PRODUTOS_ABAIXO_MINIMO: indicadores.contar_abaixo_do_minimo(produtos.values()) - abaixo_antes,
+    })
+    indicadores.somar_no_commit({indicadores.VERSAO_CATALOGO: 1})
+    # update() não dispara os sinais que invalidam o cache
+    cache_versionado.invalidar(cache_versionado.PRODUTOS)
+    return produtos
+
+
+@transaction.atomic
+def definir_estoque(produto_id, quantidade):
+    """Ajuste de inventário: define o estoque absoluto do produto"""
+    produtos = bloquear_produtos([produto_id])
+    Produto.objects.filter(pk=produto_id).update(estoque_atual=quantidade)
+    produto = produtos[produto_id]
+    abaixo_antes = indicadores.abaixo_do_minimo(produto)
+    produto.estoque_atual = quantidade
+    indicadores.somar({indicadores.PRODUTOS_ABAIXO_MINIMO: indicadores.abaixo_do_minimo(produto) - abaixo_antes})
+    indicadores.somar_no_commit({indicadores.VERSAO_CATALOGO: 1})
+    cache_versionado.invalidar(cache_versionado.PRODUTOS)
+    return produto
+
+
+@transaction.atomic
+def registrar_recebimento(chave, fornecedor, itens, usuario, nota_fiscal='', observacao=''):
+    """
+    Registra a entrada em lote de uma entrega do fornecedor.
+
+    itens: lista de (produto_id, quantidade, preco_unitario ou None).
+    Retorna (recebimento, criado). Se a chave já foi usada, retorna o
+    recebimento existente sem alterar o estoque (reenvio do mesmo lote).
+    """
+    existente = RecebimentoEstoque.objects.filter(chave=chave).first()
+    if existente:
+        return existente, False
+
+    try:
+        with transaction.atomic():
+            recebimento = RecebimentoEstoque.objects.create(
+                chave=chave,
+                fornecedor=fornecedor,
+                nota_fiscal=nota_fiscal,
+                observacao=observacao,
+                usuario=usuario,
+                numero_itens=len(itens),
+                quantidade_itens=sum(quantidade for _, quantidade, _ in itens),
+                valor_total=sum((quantidade * preco for _, quantidade, preco in itens if preco), Decimal('0')),
+            )
+    except IntegrityError:
+        # Envio concorrente com a mesma chave: o outro já gravou
+        return RecebimentoEstoque.objects.get(chave=chave), False
+
+    aplicar_deltas(somar_deltas((produto_id, quantidade) for produto_id, quantidade, _ in itens))
+    MovimentacaoEstoque.objects.bulk_create([
+        MovimentacaoEstoque(
+            produto_id=produto_id,
+            tipo='entrada',
+            quantidade=quantidade,
+            preco_unitario=preco,
+            observacao=f'Recebimento {recebimento.pk} - {fornecedor.nome}',
+            usuario=usuario,
+            data_movimentacao=recebimento.data_recebimento,
+            recebimento=recebimento,
+        )
+        for produto_id, quantidade, preco in itens
+    ])
+    # bulk_create não dispara o sinal que invalida o cache
+    cache_versionado.invalidar(cache_versionado.MOVIMENTACOES)
+    return recebimento, True
+
+
+@transaction.atomic
+def estornar_recebimento(recebimento_id, usuario):
+    """
+    Estorna o recebimento inteiro: retira do estoque o que ele deu entrada,
+    registrando uma saída ligada ao recebimento para cada entrada (as entradas
+    ficam no histórico). Lança EstoqueInsuficiente (sem alterar nada) se parte
+    da mercadoria já saiu. Retorna (recebimento, estornado agora).
+    """
+    recebimento = RecebimentoEstoque.objects.select_for_update().select_related('fornecedor').get(pk=recebimento_id)
+    if recebimento.status == 'estornado':
+        return recebimento, False
+
+    entradas = list(recebimento.movimentacoes.filter(tipo='entrada').order_by('pk'))
+    aplicar_deltas(somar_deltas((entrada.produto_id, -entrada.quantidade) for entrada in entradas))
+    agora = timezone.now()
+    MovimentacaoEstoque.objects.bulk_create([
+        MovimentacaoEstoque(
+            produto_id=entrada.produto_id,
+            tipo='saida',
+            quantidade=entrada.quantidade,
+            preco_unitario=entrada.preco_unitario,
+            observacao=f'Estorno do recebimento {recebimento.pk} - {recebimento.fornecedor.nome}',
+            usuario=usuario,
+            data_movimentacao=agora,
+            recebimento=recebimento,
+        )
+        for entrada in entradas
+    ])
+    cache_versionado.invalidar(cache_versionado.MOVIMENTACOES)
+
+    recebimento.status = 'estornado'
+    recebimento.usuario_estorno = usuario
+    recebimento.data_estorno = agora
+    recebimento.save(update_fields=['status', 'usuario_estorno', 'data_estorno'])
+    return recebimento, True
@@ -0,0 +1,213 @@
+"""
+Exportação em CSV/XLSX das movimentações, vendas e contas a receber.
+
+As linhas são lidas com values_list().iterator(chunk_size=...) e escritas
+conforme são geradas, então a memória usada não depende do número de linhas:
+as views respondem com StreamingHttpResponse e o comando exportar grava
+direto no arquivo. O XLSX é montado com zipfile em modo streaming (sem
+dependências extras), com todas as células como texto ou número.
+"""
+import csv
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.utils import timezone
+
+from .filtros import filtrar_contas, filtrar_movimentacoes, filtrar_vendas
+from .models import ContasReceber, MovimentacaoEstoque, Venda
+
+TAMANHO_LOTE = 2000
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def _movimentacoes(parametros):
+    queryset = filtrar_movimentacoes(MovimentacaoEstoque.objects.all(), parametros).annotate(
+        valor=ExpressionWrapper(F('quantidade') * F('preco_unitario'),
+                                output_field=DecimalField(max_digits=14, decimal_places=2))
+    )
+    tipos = dict(MovimentacaoEstoque.TIPO_CHOICES)
+    colunas = [
+        ('Data', 'data_movimentacao'), ('Produto', 'produto__nome'), ('Código', 'produto__codigo'),
+        ('Tipo', 'tipo'), ('Quantidade', 'quantidade'), ('Preço Unitário', 'preco_unitario'),
+        ('Valor Total', 'valor'), ('Forma de Pagamento', 'forma_pagamento__nome'),
+        ('Usuário', 'usuario__username'), ('Observação', 'observacao'),
+    ]
+    return queryset.order_by('-data_movimentacao', '-pk'), colunas, {'tipo': tipos}
+
+
+def _vendas(parametros):
+    queryset = filtrar_vendas(Venda.objects.com_totais(), parametros)
+    colunas = [
+        ('Número', 'numero_venda'), ('Data', 'data_venda'), ('Status', 'status'), ('Cliente', 'cliente__nome'),
+        ('Forma de Pagamento', 'forma_pagamento__nome'), ('Itens', 'numero_itens'),
+        ('Quantidade', 'quantidade_itens'), ('Valor Total', 'valor_itens'), ('Valor Pago', 'valor_pago'),
+        ('Valor Pendente', 'total_pendente'), ('Usuário', 'usuario__username'),
+    ]
+    return queryset.order_by('-data_venda', '-pk'), colunas, {'status': dict(Venda.STATUS_CHOICES)}
+
+
+def _contas(parametros):
+    queryset = filtrar_contas(ContasReceber.objects.all(), parametros).annotate(
+        pendente=ExpressionWrapper(F('valor_total') - F('valor_pago'),
+                                   output_field=DecimalField(max_digits=12, decimal_places=2))
+    )
+    colunas = [
+        ('Cliente', 'cliente__nome'), ('CPF/CNPJ', 'cliente__cpf_cnpj'), ('Venda', 'venda__numero_venda'),
+        ('Valor Total', 'valor_total'), ('Valor Pago', 'valor_pago'), ('Valor Pendente', 'pendente'),
+        ('Vencimento', 'data_vencimento'), ('Status', 'status'), ('Criação', 'data_criacao'),
+    ]
+    return queryset.order_by('-data_criacao', '-pk'), colunas, {'status': dict(ContasReceber.STATUS_CHOICES)}
+
+
+# tipo: (função que monta a consulta, nome do arquivo)
+EXPORTACOES = {
+    'movimentacoes': (_movimentacoes, 'movimentacoes'),
+    'vendas': (_vendas, 'vendas'),
+    'contas': (_contas, 'contas_receber'),
+}
+
+
+def linhas(tipo, parametros):
+    """Cabeçalho e linhas (valores Python) da exportação, lidas do banco em lotes"""
+    queryset, colunas, rotulos = EXPORTACOES[tipo][0](parametros)
+    campos = [campo for _, campo in colunas]
+    traducoes = [(campos.index(campo), valores) for campo, valores in rotulos.items()]
+
+    yield [titulo for titulo, _ in colunas]
+    for linha in queryset.values_list(*campos).iterator(chunk_size=TAMANHO_LOTE):
+        linha = list(linha)
+        for indice, valores in traducoes:
+            linha[indice] = valores.get(linha[indice], linha[indice])
+        yield linha
+
+
+def nome_arquivo(tipo, formato):
+    return f'{EXPORTACOES[tipo][1]}_{timezone.localtime():%Y%m%d_%H%M}.{FORMATOS[formato][1]}'
+
+
+def _texto(valor, fuso):
+    if isinstance(valor, str):
+        return valor
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.astimezone(fuso).strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    return str(valor)
+
+
+class _Buffer:
+    """Arquivo somente-escrita cujo conteúdo é retirado a cada lote"""
+
+    def __init__(self, vazio):
+        self.vazio = vazio
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = self.vazio.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def gerar_csv(linhas, lote=TAMANHO_LOTE):
+    """Gera o CSV em pedaços (bytes). Separador ';' e BOM UTF-8, como o Excel em português espera."""
+    buffer = _Buffer('')
+    escritor = csv.writer(buffer, delimiter=';')
+    fuso = timezone.get_current_timezone()
+    yield '\ufeff'.encode()
+    for numero, linha in enumerate(linhas, 1):
+        escritor.writerow([
+            f'{valor:.2f}'.replace('.', ',') if isinstance(valor, Decimal) else _texto(valor, fuso)
+            for valor in linha
+        ])
+        if numero % lote == 0:
+            yield buffer.retirar().encode()
+    yield buffer.retirar().encode()
+
+
+_XLSX_ARQUIVOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celula_xlsx(valor, fuso):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, Decimal)):
+        return f'<c t="inlineStr"><is><t>{escape(_texto(valor, fuso))}</t></is></c>'
+    if isinstance(valor, Decimal):
+        valor = f'{valor:.2f}'
+    return f'<c><v>{valor}</v></c>'
+
+
+def gerar_xlsx(linhas, lote=TAMANHO_LOTE):
+    """Gera uma planilha XLSX de uma aba, em pedaços (bytes), sem montar o arquivo em memória"""
+    buffer = _Buffer(b'')
+    fuso = timezone.get_current_timezone()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in _XLSX_ARQUIVOS.items():
+            arquivo.writestr(nome, conteudo)
+        yield buffer.retirar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for numero, linha in enumerate(linhas, 1):
+                planilha.write(f'<row>{"".join(_celula_xlsx(valor, fuso) for valor in linha)}</row>'.encode())
+                if numero % lote == 0:
+                    yield buffer.retirar()
+            planilha.write(b'</sheetData></worksheet>')
+    yield buffer.retirar()
+
+
+def gerar(tipo, formato, parametros):
+    """Pedaços (bytes) do arquivo exportado"""
+    gerador = gerar_xlsx if formato == 'xlsx' else gerar_csv
+    return gerador(linhas(tipo, parametros))
@@ -0,0 +1,74 @@
+"""
+Filtros das listagens (query string -> queryset), compartilhados pelas views
+de listagem, pelas exportações e pelo comando exportar.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+
+def inicio_do_dia(data):
+    """Início do dia (fuso local) de uma data ou string 'AAAA-MM-DD'.
+
+    Filtrar por intervalo na coluna, em vez de usar __date, permite que o
+    banco use os índices de data.
+    """
+    if isinstance(data, str):
+        data = datetime.strptime(data, '%Y-%m-%d').date()
+    return timezone.make_aware(datetime.combine(data, datetime.min.time()))
+
+
+def _filtrar_periodo(queryset, campo, data_inicio, data_fim):
+    # Datas inválidas são ignoradas, como nos formulários de filtro
+    if data_inicio:
+        try:
+            queryset = queryset.filter(**{f'{campo}__gte': inicio_do_dia(data_inicio)})
+        except ValueError:
+            pass
+    if data_fim:
+        try:
+            queryset = queryset.filter(**{f'{campo}__lt': inicio_do_dia(data_fim) + timedelta(days=1)})
+        except ValueError:
+            pass
+    return queryset
+
+
+def filtrar_movimentacoes(movimentacoes, parametros):
+    """Filtros tipo, produto, data_inicio e data_fim"""
+    if parametros.get('tipo'):
+        movimentacoes = movimentacoes.filter(tipo=parametros['tipo'])
+    if parametros.get('produto'):
+        movimentacoes = movimentacoes.filter(produto_id=parametros['produto'])
+    return _filtrar_periodo(movimentacoes, 'data_movimentacao',
+                            parametros.get('data_inicio'), parametros.get('data_fim'))
+
+
+def filtrar_vendas(vendas, parametros):
+    """Filtros status, data_inicio, data_fim e cliente (parte do nome)"""
+    if parametros.get('status'):
+        vendas = vendas.filter(status=parametros['status'])
+    vendas = _filtrar_periodo(vendas, 'data_venda', parametros.get('data_inicio'), parametros.get('data_fim'))
+    if parametros.get('cliente'):
+        vendas = vendas.filter(cliente__nome__icontains=parametros['cliente'])
+    return vendas
+
+
+def filtrar_resumo_vendas(resumos, parametros):
+    """
+    Os filtros de filtrar_vendas que o resumo diário atende: status e período
+    (dias inteiros, como no filtro das vendas). Não há filtro por cliente.
+    """
+    if parametros.get('status'):
+        resumos = resumos.filter(status=parametros['status'])
+    return _filtrar_periodo(resumos, 'data', parametros.get('data_inicio'), parametros.get('data_fim'))
+
+
+def filtrar_contas(contas, parametros):
+    """Filtros cliente, status e vencidas=sim"""
+    if parametros.get('cliente'):
+        contas = contas.filter(cliente_id=parametros['cliente'])
+    if parametros.get('status'):
+        contas = contas.filter(status=parametros['status'])
+    if parametros.get('vencidas') == 'sim':
+        contas = contas.vencidas()
+    return contas
@@ -1,10 +1,18 @@
 from django import forms
-from django.forms import inlineformset_factory
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, formset_factory, inlineformset_factory
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column
+from . import cache_versionado
 from .models import (Produto, MovimentacaoEstoque, Fornecedor, Cliente, Categoria, 
                     FormaPagamento, Venda, ItemVenda, Pagamento, ContasReceber)
 
+
+def escolhas_em_cache(form, campo, grupo):
+    """Monta as opções do campo a partir do cache em vez de consultar a cada formulário"""
+    form.fields[campo].choices = cache_versionado.escolhas(form.fields[campo], grupo)
+
+
 class ProdutoForm(forms.ModelForm):
     class Meta:
         model = Produto
@@ -22,6 +30,7 @@ class ProdutoForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        escolhas_em_cache(self, 'categoria', cache_versionado.CATEGORIAS)
         self.helper = FormHelper()
         self.helper.layout = Layout(
             Row(
@@ -60,6 +69,7 @@ class MovimentacaoEstoqueForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        escolhas_em_cache(self, 'forma_pagamento', cache_versionado.FORMAS_PAGAMENTO)
         self.helper = FormHelper()
         self.helper.layout = Layout(
             'produto',
@@ -166,6 +176,7 @@ class VendaForm(forms.ModelForm):
         
         # Filtrar apenas formas de pagamento ativas
         self.fields['forma_pagamento'].queryset = FormaPagamento.objects.filter(ativo=True)
+        escolhas_em_cache(self, 'forma_pagamento', cache_versionado.FORMAS_PAGAMENTO)
         
         self.helper = FormHelper()
         self.helper.layout = Layout(
@@ -219,6 +230,7 @@ class PagamentoForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.venda = kwargs.pop('venda', None)
         super().__init__(*args, **kwargs)
+        escolhas_em_cache(self, 'forma_pagamento', cache_versionado.FORMAS_PAGAMENTO)
         
         # Se temos a venda, calcular valor máximo permitido
         if self.venda:
@@ -278,15 +290,42 @@ class ContasReceberForm(forms.ModelForm):
             Submit('submit', 'Criar Conta a Receber', css_class='btn btn-success')
         )
 
+class EscolhaCarregadaField(forms.ModelChoiceField):
+    """
+    Escolha que procura o valor enviado em carregados ({pk: objeto}, montado
+    pelo formset com uma consulta para todas as linhas) em vez de consultar o
+    banco a cada linha.
+    """
+    carregados = None
+
+    def to_python(self, value):
+        if self.carregados is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.carregados[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                  params={'value': value})
+
+
 class ItemVendaForm(forms.ModelForm):
+    # Fora de Meta.fields: a escolha já confere o produto (na lista ativa, ou
+    # nos carregados pelo formset), então o full_clean do modelo não precisa
+    # consultar a chave estrangeira de novo, linha a linha. clean() o passa à instância.
+    produto = EscolhaCarregadaField(
+        queryset=Produto.objects.filter(ativo=True, estoque_atual__gt=0),
+        label='Produto',
+        widget=forms.Select(attrs={
+            'class': 'form-control',
+            'onchange': 'updatePrice(this)'
+        }),
+    )
+    field_order = ['produto', 'quantidade', 'preco_unitario']
+
     class Meta:
         model = ItemVenda
-        fields = ['produto', 'quantidade', 'preco_unitario']
+        fields = ['quantidade', 'preco_unitario']
         widgets = {
-            'produto': forms.Select(attrs={
-                'class': 'form-control',
-                'onchange': 'updatePrice(this)'
-            }),
             'quantidade': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'min': '1',
@@ -303,6 +342,8 @@ class ItemVendaForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['produto'].queryset = Produto.objects.filter(ativo=True, estoque_atual__gt=0)
         self.fields['produto'].empty_label = "Selecione um produto..."
+        if self.instance.pk:
+            self.initial.setdefault('produto', self.instance.produto_id)
         
         # Definir preço inicial se produto já selecionado
         try:
@@ -312,11 +353,57 @@ class ItemVendaForm(forms.ModelForm):
             # Ignorar se não há produto associado (formulário vazio)
             pass
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('produto') is not None:
+            self.instance.produto = cleaned_data['produto']
+        return cleaned_data
+
+
+class BaseItemVendaFormSet(BaseInlineFormSet):
+    """
+    Carrega os itens com o produto e monta a lista de produtos uma vez para
+    todas as linhas; com dados enviados, os produtos escolhidos em todas as
+    linhas também vêm de uma consulta só, e os itens existentes de cada linha,
+    dos já carregados.
+    """
+
+    def __init__(self, *args, queryset=None, **kwargs):
+        if queryset is None:
+            queryset = ItemVenda.objects.select_related('produto')
+        super().__init__(*args, queryset=queryset, **kwargs)
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # Sem isso, cada linha renderizada consulta de novo a lista de produtos
+        if not hasattr(self, '_escolhas_produtos'):
+            self._escolhas_produtos = list(form.fields['produto'].choices)
+        form.fields['produto'].choices = self._escolhas_produtos
+        if self.is_bound:
+            if not hasattr(self, '_produtos_enviados'):
+                self._produtos_enviados = form.fields['produto'].queryset.in_bulk(self._ids_produtos_enviados())
+                self._itens_carregados = {item.pk: item for item in self.get_queryset()}
+            form.fields['produto'].carregados = self._produtos_enviados
+
+            campo_id = form.fields[self._pk_field.name]
+            form.fields[self._pk_field.name] = EscolhaCarregadaField(
+                campo_id.queryset, initial=campo_id.initial, required=False, widget=campo_id.widget)
+            form.fields[self._pk_field.name].carregados = self._itens_carregados
+
+    def _ids_produtos_enviados(self):
+        ids = set()
+        for indice in range(self.total_form_count()):
+            valor = self.data.get(f'{self.add_prefix(indice)}-produto')
+            if valor and str(valor).isdigit():
+                ids.add(int(valor))
+        return ids
+
 
 # Formset para múltiplos itens da venda
 ItemVendaFormSet = inlineformset_factory(
     Venda, ItemVenda, 
     form=ItemVendaForm,
+    formset=BaseItemVendaFormSet,
     extra=5,  # 5 linhas vazias por padrão
     can_delete=True,
     min_num=1,  # Pelo menos 1 item obrigatório
@@ -356,6 +443,7 @@ class PagamentoContaForm(forms.Form):
     def __init__(self, *args, **kwargs):
         self.conta = kwargs.pop('conta', None)
         super().__init__(*args, **kwargs)
+        escolhas_em_cache(self, 'forma_pagamento', cache_versionado.FORMAS_PAGAMENTO)
         
         if self.conta:
             valor_pendente = self.conta.valor_pendente
@@ -375,3 +463,71 @@ class PagamentoContaForm(forms.Form):
             if valor <= 0:
                 raise forms.ValidationError('Valor deve ser maior que zero')
         return valor
+
+
+class ImportacaoForm(forms.Form):
+    arquivo = forms.FileField(
+        label='Arquivo CSV',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+        help_text='Primeira linha com os nomes das colunas; separador ";" ou ","'
+    )
+    simular = forms.BooleanField(
+        required=False,
+        label='Apenas validar (não gravar nada)'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+
+
+class RecebimentoEstoqueForm(forms.Form):
+    """Cabeçalho do recebimento em lote (os itens vêm de ItemRecebimentoFormSet)"""
+    fornecedor = forms.ModelChoiceField(
+        queryset=Fornecedor.objects.filter(ativo=True),
+        empty_label='Selecione o fornecedor...',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    nota_fiscal = forms.CharField(
+        max_length=50,
+        required=False,
+        label='Nota fiscal',
+        widget=forms.TextInput(attrs={'class': 'form-control'})
+    )
+    observacao = forms.CharField(
+        required=False,
+        label='Observações',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 2})
+    )
+    # Gerada ao abrir a tela: reenviar o formulário não duplica a entrada
+    chave = forms.CharField(max_length=64, widget=forms.HiddenInput)
+
+
+class ItemRecebimentoForm(forms.Form):
+    produto = forms.ModelChoiceField(
+        queryset=Produto.objects.filter(ativo=True),
+        empty_label='Selecione um produto...',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    quantidade = forms.IntegerField(
+        min_value=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': '1'})
+    )
+    preco_unitario = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        min_value=0,
+        required=False,
+        label='Preço unitário',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+    )
+
+
+ItemRecebimentoFormSet = formset_factory(
+    ItemRecebimentoForm,
+    extra=5,
+    can_delete=True,
+    min_num=1,
+    validate_min=True
+)
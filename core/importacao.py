@@ -0,0 +1,316 @@
+"""
+Importação em lote de produtos e clientes a partir de arquivos CSV.
+
+A primeira linha do arquivo traz os nomes das colunas (os mesmos campos de
+ProdutoForm/ClienteForm; em produtos, "categoria" é o nome da categoria, que é
+criada se não existir). Separador ';', ',' ou tabulação, em UTF-8 ou no
+Windows-1252 que o Excel em português grava.
+
+Cada célula é validada pelo campo correspondente do formulário; as linhas com
+erro são ignoradas e informadas no resultado (número da linha e mensagem). As
+linhas válidas são gravadas em lotes, cada lote na sua transação:
+
+- produtos: upsert pelo código com bulk_create(update_conflicts=True);
+- clientes: cpf_cnpj não é único no banco, então os já cadastrados são
+  buscados numa consulta por lote e atualizados com um UPDATE parametrizado
+  (executemany), e os novos criados com bulk_create.
+
+Se o mesmo código/documento aparece mais de uma vez, a última linha prevalece.
+Uma célula vazia numa coluna opcional grava o valor padrão do campo. O estoque
+de um produto já cadastrado não é alterado pela importação (use
+movimentações); estoque_atual só vale para produtos novos.
+"""
+import codecs
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+
+from . import busca, cache_versionado, codigos, indicadores
+from .forms import ClienteForm, ProdutoForm
+from .models import Categoria, Cliente, Produto
+
+TAMANHO_LOTE = 1000
+
+VERDADEIROS = {'1', 's', 'sim', 't', 'true', 'verdadeiro', 'x', 'ativo'}
+FALSOS = {'0', 'n', 'nao', 'não', 'f', 'false', 'falso', 'inativo'}
+
+
+class ErroImportacao(Exception):
+    """Arquivo que não pode ser importado (codificação ou colunas inválidas)"""
+
+
+class ResultadoImportacao:
+    def __init__(self, simulacao=False):
+        self.simulacao = simulacao
+        self.linhas = 0
+        self.criados = 0
+        self.atualizados = 0
+        self.erros = []  # (número da linha no arquivo, mensagem)
+
+    @property
+    def importados(self):
+        return self.criados + self.atualizados
+
+
+class _Importacao:
+    model = None
+    form = None
+    chave = None
+    obrigatorios = []
+    opcionais = []
+    # Campos que não são alterados em registros já cadastrados
+    somente_criacao = []
+
+    def __init__(self, colunas, lote):
+        self.colunas = colunas
+        self.lote = lote
+        self.campos_formulario = self.form.base_fields
+
+    def limpar(self, campo, valor):
+        if campo == 'ativo':
+            if valor.lower() in VERDADEIROS:
+                return True
+            if valor.lower() in FALSOS:
+                return False
+            raise ValidationError('Use sim/não (ou 1/0).')
+        campo_formulario = self.campos_formulario[campo]
+        if hasattr(campo_formulario, 'decimal_places') and ',' in valor:
+            # Formato brasileiro: 1.234,56
+            valor = valor.replace('.', '').replace(',', '.')
+        return campo_formulario.clean(valor)
+
+    def validar(self, dados):
+        """(valores limpos, lista de erros) de uma linha do arquivo"""
+        valores, erros = {}, []
+        for campo in self.colunas:
+            valor = (dados.get(campo) or '').strip()
+            if not valor and campo in self.opcionais:
+                continue
+            try:
+                valores[campo] = self.limpar(campo, valor)
+            except ValidationError as erro:
+                erros.append(f'{campo}: {" ".join(erro.messages)}')
+        return valores, erros
+
+    def existentes(self, chaves):
+        """{chave: pk} dos registros já cadastrados (o mais antigo, se houver repetidos)"""
+        registros = self.model.objects.filter(**{f'{self.chave}__in': chaves}).order_by('-pk')
+        return dict(registros.values_list(self.chave, 'pk'))
+
+    def campos_atualizados(self):
+        return [campo for campo in self.colunas if campo != self.chave and campo not in self.somente_criacao]
+
+    def gravar(self, por_chave, existentes):
+        novos = [self.model(**valores) for chave, valores in por_chave.items() if chave not in existentes]
+        alterados = [self.model(pk=existentes[chave], **{campo: valores[campo] for campo in valores
+                                                       if campo not in self.somente_criacao})
+                     for chave, valores in por_chave.items() if chave in existentes]
+        self.model.objects.bulk_create(novos, batch_size=self.lote)
+        # Colunas opcionais vazias ficam com o padrão do campo (são omitidas ao criar a instância)
+        self.atualizar(alterados, self.campos_atualizados())
+        return [objeto.pk for objeto in novos if objeto.pk] + [objeto.pk for objeto in alterados]
+
+    def atualizar(self, objetos, campos):
+        """
+        Grava os campos dos objetos com um UPDATE parametrizado por linha (executemany).
+
+        Equivale a bulk_update(objetos, campos), mas sem montar um CASE WHEN
+        por campo e objeto, que no Django custa segundos a cada mil linhas.
+        """
+        if not objetos:
+            return
+        conexao = connections[router.db_for_write(self.model)]
+        campos = [self.model._meta.get_field(campo) for campo in campos]
+        atribuicoes = ', '.join(f'{conexao.ops.quote_name(campo.column)} = %s' for campo in campos)
+        sql = (f'UPDATE {conexao.ops.quote_name(self.model._meta.db_table)} SET {atribuicoes} '
+               f'WHERE {conexao.ops.quote_name(self.model._meta.pk.column)} = %s')
+        with conexao.cursor() as cursor:
+            cursor.executemany(sql, [
+                [campo.get_db_prep_save(getattr(objeto, campo.attname), conexao) for campo in campos] + [objeto.pk]
+                for objeto in objetos
+            ])
+
+    def gravar_lote(self, linhas, resultado):
+        por_chave = {}
+        for _, valores in linhas:
+            por_chave[valores[self.chave]] = valores
+        existentes = self.existentes(list(por_chave))
+        resultado.criados += len(por_chave) - len(existentes)
+        resultado.atualizados += len(existentes)
+        if resultado.simulacao:
+            return
+
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            pks = self.gravar(por_chave, existentes)
+            # bulk_create/bulk_update não disparam os sinais que mantêm o índice de busca
+            if len(pks) < len(por_chave):
+                pks = self.existentes(list(por_chave)).values()
+            busca.indexar_pks(self.model, pks)
+
+
+class _ImportacaoProdutos(_Importacao):
+    model = Produto
+    form = ProdutoForm
+    chave = 'codigo'
+    obrigatorios = ['codigo', 'nome', 'categoria', 'preco_venda', 'preco_custo']
+    opcionais = ['estoque_minimo', 'estoque_atual', 'unidade_medida', 'ativo']
+    somente_criacao = ['estoque_atual']
+
+    def limpar(self, campo, valor):
+        if campo == 'categoria':
+            if not valor:
+                raise ValidationError('Este campo é obrigatório.')
+            if len(valor) > Categoria._meta.get_field('nome').max_length:
+                raise ValidationError('Nome de categoria muito longo.')
+            return valor
+        return super().limpar(campo, valor)
+
+    def categorias(self, nomes):
+        """{nome: Categoria}, criando as que ainda não existem"""
+        categorias = {}
+        for categoria in Categoria.objects.filter(nome__in=nomes).order_by('-pk'):
+            categorias[categoria.nome] = categoria
+        novas = [Categoria(nome=nome) for nome in nomes if nome not in categorias]
+        for categoria in Categoria.objects.bulk_create(novas):
+            if categoria.pk is None:
+                categoria = Categoria.objects.filter(nome=categoria.nome).order_by('pk').first()
+            categorias[categoria.nome] = categoria
+        return categorias
+
+    def gravar(self, por_chave, existentes):
+        # O lote não passa pelos sinais: ajustar o indicador pela diferença dos produtos do lote
+        abaixo_do_minimo = Produto.objects.abaixo_do_minimo().filter(codigo__in=list(por_chave))
+        antes = abaixo_do_minimo.count()
+        pks = self.gravar_produtos(por_chave, existentes)
+        indicadores.somar({indicadores.PRODUTOS_ABAIXO_MINIMO: abaixo_do_minimo.count() - antes,
+                           indicadores.VERSAO_CATALOGO: 1, indicadores.VERSAO_CODIGOS: 1})
+        cache_versionado.invalidar(cache_versionado.PRODUTOS, cache_versionado.CATEGORIAS)
+        codigos.invalidar()
+        return pks
+
+    def gravar_produtos(self, por_chave, existentes):
+        categorias = self.categorias({valores['categoria'] for valores in por_chave.values()})
+        for valores in por_chave.values():
+            valores['categoria'] = categorias[valores['categoria']]
+
+        conexao = connections[router.db_for_write(Produto)]
+        if not conexao.features.supports_update_conflicts_with_target:
+            return super().gravar(por_chave, existentes)
+
+        produtos = [Produto(**valores) for valores in por_chave.values()]
+        Produto.objects.bulk_create(
+            produtos, batch_size=self.lote, update_conflicts=True,
+            unique_fields=['codigo'], update_fields=self.campos_atualizados(),
+        )
+        # Com update_conflicts o banco não devolve as chaves: gravar_lote as busca
+        return []
+
+
+class _ImportacaoClientes(_Importacao):
+    model = Cliente
+    form = ClienteForm
+    chave = 'cpf_cnpj'
+    obrigatorios = ['cpf_cnpj', 'nome', 'telefone', 'endereco']
+    opcionais = ['email', 'ativo']
+
+
+IMPORTACOES = {
+    'produtos': _ImportacaoProdutos,
+    'clientes': _ImportacaoClientes,
+}
+
+
+def colunas(tipo):
+    """(obrigatórias, opcionais) aceitas no cabeçalho"""
+    importacao = IMPORTACOES[tipo]
+    return importacao.obrigatorios, importacao.opcionais
+
+
+def _texto(arquivo):
+    """Arquivo binário -> arquivo texto, detectando UTF-8 ou Windows-1252 pelo início"""
+    amostra = arquivo.read(64 * 1024)
+    arquivo.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        codificacao = 'utf-8-sig'
+    except UnicodeDecodeError:
+        codificacao = 'cp1252'
+    return io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+
+
+def _leitor(texto):
+    primeira_linha = texto.readline()
+    texto.seek(0)
+    try:
+        separador = csv.Sniffer().sniff(primeira_linha, delimiters=';,\t').delimiter
+    except csv.Error:
+        separador = ';'
+    return csv.DictReader(texto, delimiter=separador)
+
+
+def _verificar_cabecalho(tipo, cabecalho):
+    obrigatorias, opcionais = colunas(tipo)
+    if not cabecalho:
+        raise ErroImportacao('Arquivo vazio.')
+    cabecalho = [coluna.strip().lower() for coluna in cabecalho]
+    faltando = [coluna for coluna in obrigatorias if coluna not in cabecalho]
+    desconhecidas = [coluna for coluna in cabecalho if coluna not in obrigatorias + opcionais]
+    if faltando or desconhecidas:
+        problemas = []
+        if faltando:
+            problemas.append(f'faltando: {", ".join(faltando)}')
+        if desconhecidas:
+            problemas.append(f'desconhecidas: {", ".join(desconhecidas)}')
+        raise ErroImportacao(
+            f'Colunas inválidas ({"; ".join(problemas)}). '
+            f'Aceitas: {", ".join(obrigatorias + opcionais)}.'
+        )
+    if len(set(cabecalho)) < len(cabecalho):
+        raise ErroImportacao('Há colunas repetidas no cabeçalho.')
+    return cabecalho
+
+
+def importar(tipo, arquivo, lote=TAMANHO_LOTE, simular=False):
+    """
+    Importa o CSV (arquivo binário aberto) de produtos ou clientes.
+
+    Com simular=True apenas valida e conta o que seria criado/atualizado.
+    Lança ErroImportacao se o arquivo não puder ser lido; erros de linha vão
+    para ResultadoImportacao.erros.
+    """
+    texto = _texto(arquivo)
+    try:
+        leitor = _leitor(texto)
+        leitor.fieldnames = _verificar_cabecalho(tipo, leitor.fieldnames)
+        importacao = IMPORTACOES[tipo](leitor.fieldnames, lote)
+        resultado = ResultadoImportacao(simulacao=simular)
+
+        validas = []
+        for dados in leitor:
+            if None in dados:
+                resultado.linhas += 1
+                resultado.erros.append((leitor.line_num, 'Mais colunas que o cabeçalho.'))
+                continue
+            if not any(dados.values()):
+                continue
+            resultado.linhas += 1
+            valores, erros = importacao.validar(dados)
+            if erros:
+                resultado.erros.append((leitor.line_num, '; '.join(erros)))
+                continue
+            validas.append((leitor.line_num, valores))
+            if len(validas) >= lote:
+                importacao.gravar_lote(validas, resultado)
+                validas = []
+        if validas:
+            importacao.gravar_lote(validas, resultado)
+    except UnicodeDecodeError:
+        raise ErroImportacao('Não foi possível ler o arquivo: use CSV em UTF-8 ou Windows-1252.')
+    except csv.Error as erro:
+        raise ErroImportacao(f'CSV inválido: {erro}')
+    finally:
+        # Não fechar o arquivo recebido junto com o wrapper
+        texto.detach()
+    return resultado
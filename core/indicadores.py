@@ -0,0 +1,135 @@
+"""
+Indicadores do negócio mantidos incrementalmente (model Indicador).
+
+Quem altera um dado que muda um indicador soma a diferença na mesma
+transação (UPDATE ... SET valor = valor + delta), e só quando ela não é zero:
+o endpoint de métricas lê todos com uma consulta, sem refazer as agregações
+do dashboard a cada coleta.
+
+- produtos abaixo do mínimo: serviço de estoque (core/estoque.py), sinais de
+  Produto e importação em lote;
+- contas a receber em aberto (número e saldo): sinais de ContasReceber;
+- versão do catálogo: contador que sobe a cada alteração de preço, estoque,
+  unidade ou situação de um produto (mesmos lugares dos produtos abaixo do
+  mínimo); diz à API de preços em lote que o corpo em cache está velho. O
+  serviço de estoque a soma só depois do commit (somar_no_commit): é uma linha
+  só, e somá-la na transação que bloqueia os produtos faria vendas de produtos
+  diferentes esperarem umas pelas outras;
+- versão dos códigos: contador que sobe quando muda código, nome, preço,
+  unidade ou situação de um produto (sinais de Produto, importação e carga);
+  avisa os outros processos que o dicionário da busca por código
+  (core/codigos.py) está velho.
+
+Um indicador que ainda não existe no banco é calculado do zero no primeiro
+uso; a carga em escala, que grava direto no banco, recalcula todos no final.
+O comando recalcular_indicadores corrige qualquer divergência.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import ContasReceber, Indicador, Produto
+
+PRODUTOS_ABAIXO_MINIMO = 'produtos_abaixo_minimo'
+CONTAS_ABERTAS = 'contas_receber_abertas'
+SALDO_CONTAS = 'contas_receber_saldo'
+VERSAO_CATALOGO = 'versao_catalogo'
+VERSAO_CODIGOS = 'versao_codigos'
+
+
+def _saldo_contas():
+    return ContasReceber.objects.estatisticas()['total_em_aberto']
+
+
+CALCULOS = {
+    PRODUTOS_ABAIXO_MINIMO: lambda: Produto.objects.abaixo_do_minimo().count(),
+    CONTAS_ABERTAS: lambda: ContasReceber.objects.pendentes().count(),
+    SALDO_CONTAS: _saldo_contas,
+}
+# Contadores: não se calculam a partir dos dados, só somam (começam do zero)
+CONTADORES = (VERSAO_CATALOGO, VERSAO_CODIGOS)
+
+
+def abaixo_do_minimo(produto):
+    """1 se o produto conta como abaixo do mínimo (mesmo critério de Produto.objects.abaixo_do_minimo())"""
+    return int(bool(produto.ativo and produto.estoque_atual <= produto.estoque_minimo))
+
+
+def contar_abaixo_do_minimo(produtos):
+    return sum(abaixo_do_minimo(produto) for produto in produtos)
+
+
+def conta_em_aberto(status, valor_total, valor_pago):
+    """(1, saldo) para uma conta pendente, (0, 0) para uma quitada"""
+    if status in ContasReceber.STATUS_PENDENTES:
+        return 1, Decimal(str(valor_total)) - Decimal(str(valor_pago))
+    return 0, Decimal('0')
+
+
+def somar(deltas):
+    """
+    Soma {nome: delta} aos indicadores, com um único UPDATE; deve ser chamada
+    depois da alteração já gravada.
+    """
+    deltas = {nome: Decimal(delta) for nome, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    campo = Indicador._meta.get_field('valor')
+    atualizados = Indicador.objects.filter(nome__in=deltas).update(valor=F('valor') + Case(
+        *[When(nome=nome, then=Value(delta, output_field=campo)) for nome, delta in deltas.items()],
+        output_field=campo,
+    ))
+    if atualizados < len(deltas):
+        # Algum ainda não calculado: o cálculo do zero já inclui esta alteração
+        existentes = set(Indicador.objects.filter(nome__in=deltas).values_list('nome', flat=True))
+        faltando = [nome for nome in deltas if nome not in existentes]
+        calculaveis = [nome for nome in faltando if nome in CALCULOS]
+        if calculaveis:
+            recalcular(calculaveis)
+        for nome in faltando:
+            if nome in CONTADORES:
+                _, criado = Indicador.objects.get_or_create(nome=nome, defaults={'valor': deltas[nome]})
+                if not criado:
+                    Indicador.objects.filter(nome=nome).update(valor=F('valor') + deltas[nome])
+
+
+def somar_no_commit(deltas):
+    """somar() quando a transação atual for gravada (ou já, fora de uma), para contadores disputados"""
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: somar(deltas))
+    else:
+        somar(deltas)
+
+
+def recalcular(nomes=None):
+    """Recalcula os indicadores (todos, ou os informados) a partir dos dados; retorna {nome: valor}"""
+    valores = {}
+    for nome in nomes or CALCULOS:
+        valores[nome] = CALCULOS[nome]()
+        Indicador.objects.update_or_create(nome=nome, defaults={'valor': valores[nome]})
+    return valores
+
+
+def valores():
+    """{nome: valor} de todos os indicadores, calculando os que ainda não existem"""
+    gravados = dict(Indicador.objects.filter(nome__in=CALCULOS).values_list('nome', 'valor'))
+    faltando = [nome for nome in CALCULOS if nome not in gravados]
+    if faltando:
+        gravados.update(recalcular(faltando))
+    return gravados
+
+
+def contador(nome):
+    """Valor atual de um contador (0 se ainda não existe)"""
+    return int(Indicador.objects.filter(nome=nome).values_list('valor', flat=True).first() or 0)
+
+
+def versao_catalogo():
+    """Versão atual do catálogo de produtos (muda a cada alteração de preço/estoque/unidade/situação)"""
+    return contador(VERSAO_CATALOGO)
+
+
+def versao_codigos():
+    """Versão atual dos códigos de produto (muda a cada alteração de código/nome/preço/unidade/situação)"""
+    return contador(VERSAO_CODIGOS)
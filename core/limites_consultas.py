@@ -0,0 +1,243 @@
+"""
+Limite de consultas SQL por view (nome da URL).
+
+Cada view tem um número máximo de consultas que não depende do tamanho da
+página nem do volume de dados: uma listagem com 20 linhas faz as mesmas
+consultas que uma com 2. Ultrapassar o limite quase sempre é um N+1 novo
+(uma consulta por linha), e o erro mostra as consultas repetidas com a pilha
+de chamadas de onde saíram.
+
+- Nos testes: `with limitar_consultas('venda_list'): cliente.get(...)`.
+- Em execução: LimiteConsultasMiddleware, ligado pela configuração
+  LIMITE_CONSULTAS ('avisar' registra no log, 'erro' lança a exceção).
+"""
+import linecache
+import logging
+import os
+import sys
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template.base import Node, TokenType
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+# Máximo de consultas por requisição, contando sessão e usuário logado (2
+# consultas) e os savepoints das transações. Medido com 2 e com 6 linhas por
+# tela (LimiteConsultasTestCase): o número não pode variar com o volume. Nos
+# POSTs de venda e de pagamento ele também não varia com as linhas enviadas
+# (itens e formas de pagamento gravados em lote).
+LIMITES = {
+    'homepage': 0,
+    'dashboard': 10,
+
+    'produto_list': 5,
+    'produto_create': 3,
+    'produto_importar': 2,
+    'produto_detail': 7,
+    'produto_edit': 4,
+    'produto_delete': 3,
+
+    'movimentacao_list': 4,
+    'movimentacao_exportar': 3,
+    'movimentacao_create': 12,
+    'movimentacao_detail': 5,
+    'movimentacao_edit': 4,
+    'movimentacao_delete': 4,
+
+    'recebimento_list': 4,
+    'recebimento_create': 9,
+    'recebimento_detail': 4,
+    'recebimento_estornar': 16,
+
+    'fornecedor_list': 4,
+    'fornecedor_create': 2,
+    'fornecedor_detail': 3,
+    'fornecedor_edit': 3,
+    'fornecedor_delete': 3,
+
+    'cliente_list': 4,
+    'cliente_create': 2,
+    'cliente_importar': 2,
+    'cliente_detail': 5,
+    'cliente_edit': 3,
+    'cliente_delete': 3,
+
+    'categoria_list': 3,
+    'categoria_create': 2,
+    'categoria_detail': 6,
+    'categoria_edit': 3,
+    'categoria_delete': 3,
+
+    'forma_pagamento_list': 3,
+    'forma_pagamento_create': 2,
+    'forma_pagamento_detail': 4,
+    'forma_pagamento_edit': 3,
+    'forma_pagamento_delete': 3,
+
+    'venda_list': 3,
+    'venda_exportar': 3,
+    'venda_create': 33,
+    'venda_detail': 5,
+    'venda_edit': 8,
+    'venda_cancel': 4,
+    'venda_checkout': 27,
+    'pagamento_create': 5,
+    'pagamento_delete': 5,
+
+    'contas_receber_list': 5,
+    'contas_receber_exportar': 3,
+    'contas_receber_create': 3,
+    'conta_receber_detail': 4,
+    'conta_receber_pagamento': 5,
+
+    'produto_preco_api': 3,
+    'produtos_precos_api': 4,
+    # Versão dos códigos, dicionário montado de novo e código fora dele (índice único)
+    'produto_codigo_api': 5,
+    'recebimento_api': 20,
+    'recebimento_estornar_api': 16,
+}
+
+# Só chamadas do projeto (não do Django ou de bibliotecas) entram na pilha exibida
+RAIZ_PROJETO = str(settings.BASE_DIR)
+IGNORADOS = ('limites_consultas.py', 'manage.py')
+FRAMES_EXIBIDOS = 8
+
+
+class LimiteConsultasExcedido(AssertionError):
+    """A view fez mais consultas que o seu limite"""
+
+
+class _Registro:
+    """execute_wrapper que guarda cada consulta com a pilha de chamadas do projeto"""
+
+    def __init__(self):
+        self.consultas = []  # (sql, pilha)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas.append((sql, _pilha()))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.consultas)
+
+
+def _pilha():
+    """
+    Chamadas do projeto que levaram à consulta, da mais externa à mais interna.
+    Consultas disparadas por templates mostram também o template e a linha.
+    """
+    chamadas = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        codigo = frame.f_code
+        if codigo.co_name == 'render_annotated' and isinstance(frame.f_locals.get('self'), Node):
+            no = frame.f_locals['self']
+            if getattr(no, 'token', None) and getattr(no, 'origin', None):
+                abre, fecha = ('{{', '}}') if no.token.token_type == TokenType.VAR else ('{%', '%}')
+                chamada = f'{_relativo(no.origin.name)}:{no.token.lineno} (template): {abre} {no.token.contents} {fecha}'
+                if not chamadas or chamadas[-1] != chamada:
+                    chamadas.append(chamada)
+        elif _do_projeto(codigo.co_filename):
+            linha = linecache.getline(codigo.co_filename, frame.f_lineno).strip()
+            chamadas.append(f'{_relativo(codigo.co_filename)}:{frame.f_lineno} em {codigo.co_name}: {linha}')
+        frame = frame.f_back
+    return tuple(reversed(chamadas[:FRAMES_EXIBIDOS]))
+
+
+def _do_projeto(caminho):
+    return (caminho.startswith(RAIZ_PROJETO) and f'{os.sep}site-packages{os.sep}' not in caminho
+            and not caminho.endswith(IGNORADOS))
+
+
+def _relativo(caminho):
+    caminho = str(caminho)
+    return os.path.relpath(caminho, RAIZ_PROJETO) if caminho.startswith(RAIZ_PROJETO) else caminho
+
+
+def repetidas(consultas):
+    """[(vezes, sql, pilhas distintas)] das consultas executadas mais de uma vez, mais repetidas primeiro"""
+    por_sql = defaultdict(list)
+    for sql, pilha in consultas:
+        por_sql[sql].append(pilha)
+    grupos = [(len(pilhas), sql, list(dict.fromkeys(pilhas))) for sql, pilhas in por_sql.items() if len(pilhas) > 1]
+    return sorted(grupos, key=lambda grupo: -grupo[0])
+
+
+def relatorio(nome_url, limite, consultas):
+    linhas = [f'{nome_url}: {len(consultas)} consultas (limite {limite}).']
+    grupos = repetidas(consultas)
+    if not grupos:
+        linhas.append('Nenhuma consulta repetida; consultas executadas:')
+        linhas.extend(f'  {sql}' for sql, _ in consultas)
+    for vezes, sql, pilhas in grupos:
+        linhas.append(f'\n{vezes}x {sql}')
+        for pilha in pilhas[:3]:
+            linhas.append('  ---')
+            linhas.extend(f'  {frame}' for frame in pilha)
+    return '\n'.join(linhas)
+
+
+def limite(nome_url):
+    return LIMITES.get(nome_url)
+
+
+@contextmanager
+def limitar_consultas(nome_url, maximo=None, using=DEFAULT_DB_ALIAS):
+    """
+    Lança LimiteConsultasExcedido se o bloco fizer mais consultas que o limite
+    da URL (ou que maximo). URLs sem limite cadastrado também falham: toda
+    view nova deve declarar o seu.
+    """
+    maximo = maximo if maximo is not None else limite(nome_url)
+    if maximo is None:
+        raise LimiteConsultasExcedido(f'{nome_url} não tem limite de consultas em LIMITES.')
+    registro = _Registro()
+    with connections[using].execute_wrapper(registro):
+        yield registro
+    if len(registro) > maximo:
+        raise LimiteConsultasExcedido(relatorio(nome_url, maximo, registro.consultas))
+
+
+class LimiteConsultasMiddleware:
+    """
+    Confere o limite de consultas de cada requisição em execução
+    (LIMITE_CONSULTAS = 'avisar' ou 'erro'); sem efeito se 'desligado'.
+    Fica antes dos middlewares de sessão e autenticação, para contar as
+    consultas deles como os testes contam.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.modo = getattr(settings, 'LIMITE_CONSULTAS', 'desligado')
+
+    def __call__(self, request):
+        if self.modo == 'desligado':
+            return self.get_response(request)
+        try:
+            nome_url = resolve(request.path_info).url_name
+        except Resolver404:
+            nome_url = None
+        maximo = limite(nome_url)
+        if maximo is None:
+            return self.get_response(request)
+
+        # Todos os bancos: as views de relatório leem da réplica (core/roteamento.py)
+        registro = _Registro()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(registro))
+            resposta = self.get_response(request)
+            if resposta.streaming:
+                # As consultas de uma resposta em streaming acontecem ao enviá-la
+                return resposta
+        if len(registro) > maximo:
+            mensagem = relatorio(nome_url, maximo, registro.consultas)
+            if self.modo == 'erro':
+                raise LimiteConsultasExcedido(mensagem)
+            logger.warning(mensagem)
+        return resposta
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.models import ContasReceber
+
+
+class Command(BaseCommand):
+    help = ('Marca como "vencido" as contas a receber pendentes com vencimento passado '
+            '(agendar diariamente, ex.: cron logo após a meia-noite)')
+
+    def handle(self, *args, **options):
+        marcadas, reabertas = ContasReceber.objects.atualizar_status_vencidas()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {marcadas} conta(s) marcada(s) como vencida(s), {reabertas} reaberta(s).'
+        ))
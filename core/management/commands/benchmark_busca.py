@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import busca
+from core.models import Cliente
+
+NOMES = ['Maria', 'José', 'João', 'Ana', 'Antônio', 'Francisca', 'Luís', 'Conceição', 'Raimundo', 'Júlia',
+         'Sebastião', 'Lúcia', 'Inês', 'Caio', 'Gonçalo']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Araújo', 'Conceição', 'Gonçalves', 'Lima', 'Sá',
+              'Brandão', 'Magalhães', 'Assunção', 'Pereira', 'Ribeiro', 'Fontes']
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca de clientes por icontains e pelo índice FTS5 com N clientes cadastrados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=500000, help='Clientes simulados (padrão: 500.000)')
+        parser.add_argument('--amostras', type=int, default=20, help='Repetições de cada busca (padrão: 20)')
+        parser.add_argument('--lote', type=int, default=10000, help='Tamanho do lote de inserção (padrão: 10.000)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente do gerador aleatório')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('O benchmark compara o índice FTS5, disponível apenas no SQLite.')
+
+        aleatorio = random.Random(options['seed'])
+        # Tudo roda dentro de uma transação desfeita ao final: o banco não é alterado
+        with transaction.atomic():
+            cpf = self.popular(aleatorio, options['clientes'], options['lote'])
+            buscas = ['mar sil', 'joao', 'conceicao araujo', 'gonç', cpf[:7], cpf[4:11]]
+
+            icontains = Cliente.objects.filter(ativo=True)
+            resultados = []
+            for termo in buscas:
+                resultados.append((termo, 'icontains', *self.medir(
+                    lambda: icontains.filter(nome__icontains=termo) | icontains.filter(cpf_cnpj__icontains=termo),
+                    options['amostras'])))
+                resultados.append((termo, 'fts5', *self.medir(
+                    lambda: busca.filtrar(Cliente.objects.filter(ativo=True), termo), options['amostras'])))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'\n📊 Busca com {options["clientes"]:,} clientes ({options["amostras"]} amostras, '
+                          f'primeira página de 20):')
+        for termo, metodo, tempos, encontrados in resultados:
+            tempos_ms = sorted(t * 1000 for t in tempos)
+            p95 = tempos_ms[max(0, int(len(tempos_ms) * 0.95) - 1)]
+            self.stdout.write(
+                f'   {termo!r:<20} {metodo:<9} p50 {statistics.median(tempos_ms):8.2f} ms | '
+                f'p95 {p95:8.2f} ms | {encontrados:,} encontrado(s)'
+            )
+
+    def popular(self, aleatorio, total, lote):
+        self.stdout.write(f'📦 Inserindo {total:,} clientes temporários...')
+        inicio = time.perf_counter()
+        ultimo_cpf = ''
+        for base in range(0, total, lote):
+            clientes = []
+            for _ in range(min(lote, total - base)):
+                digitos = f'{aleatorio.randrange(10 ** 11):011d}'
+                ultimo_cpf = f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+                clientes.append(Cliente(
+                    nome=f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}',
+                    cpf_cnpj=ultimo_cpf, telefone='(00) 0000-0000', endereco='Benchmark',
+                ))
+            Cliente.objects.bulk_create(clientes, batch_size=lote)
+        self.stdout.write(f'   pronto em {time.perf_counter() - inicio:.1f}s; indexando...')
+        inicio = time.perf_counter()
+        busca.reconstruir(Cliente)
+        self.stdout.write(f'   índice reconstruído em {time.perf_counter() - inicio:.1f}s')
+        return ultimo_cpf
+
+    def medir(self, consulta, amostras):
+        tempos = []
+        for _ in range(amostras):
+            inicio = time.perf_counter()
+            queryset = consulta()
+            list(queryset.order_by('nome')[:20])
+            encontrados = queryset.count()
+            tempos.append(time.perf_counter() - inicio)
+        return tempos, encontrados
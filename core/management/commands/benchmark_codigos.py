@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import codigos
+
+
+class Command(BaseCommand):
+    help = ('Mede a busca de produtos por código num worker: dicionário em memória, índice único do banco '
+            'e a API produto_codigo_api, com N produtos temporários (o banco não é alterado)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=5000, help='Produtos temporários (padrão: 5.000)')
+        parser.add_argument('--buscas', type=int, default=100000,
+                            help='Buscas no dicionário (padrão: 100.000)')
+        parser.add_argument('--consultas', type=int, default=5000, help='Buscas pelo índice (padrão: 5.000)')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições à API (padrão: 2.000)')
+        parser.add_argument('--meta', type=int, default=10000,
+                            help='Buscas por segundo esperadas do dicionário (padrão: 10.000)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos códigos sorteados')
+
+    def handle(self, *args, **options):
+        if min(options['produtos'], options['buscas'], options['consultas'], options['requisicoes']) < 1:
+            raise CommandError('--produtos, --buscas, --consultas e --requisicoes devem ser positivos.')
+
+        self.stdout.write(f'🏁 Busca por código com {options["produtos"]:,} produtos, um processo')
+        resultados = codigos.executar(options['produtos'], options['buscas'], options['consultas'],
+                                      options['requisicoes'], options['seed'])
+
+        self.stdout.write(f'\n   {"modo":<12} {"buscas":>9} {"buscas/s":>10} {"p50 µs":>9} {"p99 µs":>9}')
+        for resultado in resultados:
+            self.stdout.write(
+                f'   {resultado["modo"]:<12} {resultado["buscas"]:>9,} {resultado["buscas_s"]:>10,} '
+                f'{resultado["p50_us"]:>9.1f} {resultado["p99_us"]:>9.1f}'
+            )
+
+        dicionario = resultados[0]
+        if dicionario['buscas_s'] < options['meta']:
+            raise CommandError(f'Dicionário abaixo da meta: {dicionario["buscas_s"]:,} buscas/s '
+                               f'(meta {options["meta"]:,}).')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✅ Dicionário: {dicionario["buscas_s"]:,} buscas/s por worker (meta {options["meta"]:,})'))
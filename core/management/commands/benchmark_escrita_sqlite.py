@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.benchmarks import escrita
+
+
+class Command(BaseCommand):
+    help = ('Compara a escrita concorrente no SQLite sem ajustes (padrão do Django) e com as OPTIONS '
+            'configuradas: vazão, latência e taxa de erros "database is locked" com N processos gravando')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=8, help='Processos gravando ao mesmo tempo (padrão: 8)')
+        parser.add_argument('--operacoes', type=int, default=200, help='Gravações por processo (padrão: 200)')
+        parser.add_argument('--produtos', type=int, default=10, help='Produtos disputados (padrão: 10)')
+        parser.add_argument('--modos', default=','.join(escrita.MODOS),
+                            help=f'Modos a comparar, separados por vírgula (padrão: {",".join(escrita.MODOS)})')
+        parser.add_argument('--diretorio', default=os.path.join(tempfile.gettempdir(), 'estoque_agua_benchmarks'),
+                            help='Onde criar os bancos temporários')
+        parser.add_argument('--seed', type=int, default=42, help='Semente das operações')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este benchmark é do SQLite; o banco configurado é outro.')
+        modos = [modo.strip() for modo in options['modos'].split(',')]
+        invalidos = set(modos) - set(escrita.MODOS)
+        if invalidos:
+            raise CommandError(f'Modo(s) desconhecido(s): {", ".join(sorted(invalidos))}.')
+        if options['processos'] < 1 or options['operacoes'] < 1 or options['produtos'] < 1:
+            raise CommandError('--processos, --operacoes e --produtos devem ser positivos.')
+
+        self.stdout.write(f'🏁 {options["processos"]} processos x {options["operacoes"]} gravações '
+                          f'em {options["produtos"]} produtos')
+        resultados = []
+        for modo in modos:
+            self.stdout.write(f'\n📦 {modo}: {escrita.opcoes(modo) or "sem OPTIONS"}')
+            resultado = escrita.executar(modo, options['diretorio'], options['processos'], options['operacoes'],
+                                         options['produtos'], options['seed'])
+            resultados.append(resultado)
+            if resultado['divergentes']:
+                self.stdout.write(self.style.ERROR(f'   ❌ {resultado["divergentes"]} produto(s) com estoque divergente'))
+
+        self.stdout.write(f'\n   {"modo":<12} {"gravadas":>9} {"erros":>7} {"% erros":>8} {"grav/s":>8} '
+                          f'{"p50 ms":>8} {"p95 ms":>8}')
+        for resultado in resultados:
+            self.stdout.write(
+                f'   {resultado["modo"]:<12} {resultado["gravadas"]:>9} {resultado["erros"]:>7} '
+                f'{resultado["taxa_erros"]:>8.1%} {resultado["gravacoes_s"]:>8.1f} '
+                f'{resultado["p50_ms"] or 0:>8.2f} {resultado["p95_ms"] or 0:>8.2f}'
+            )
+        if any(resultado['divergentes'] for resultado in resultados):
+            raise CommandError('Estoque divergente após as gravações concorrentes!')
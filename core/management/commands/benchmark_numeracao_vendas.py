@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.models import SequenciaVenda, Venda
+
+
+def numero_legado():
+    """Algoritmo antigo de Venda.save(): ordena todas as vendas e testa colisões"""
+    ultimo_registro = Venda.objects.filter(numero_venda__startswith='VD').order_by('numero_venda').last()
+    if ultimo_registro:
+        try:
+            ultimo_numero = int(ultimo_registro.numero_venda[2:]) + 1
+        except (ValueError, IndexError):
+            ultimo_numero = 1
+    else:
+        ultimo_numero = 1
+
+    while Venda.objects.filter(numero_venda=f"VD{ultimo_numero:06d}").exists():
+        ultimo_numero += 1
+
+    return f"VD{ultimo_numero:06d}"
+
+
+class Command(BaseCommand):
+    help = 'Compara a latência da numeração de vendas (algoritmo antigo x contador) com N vendas existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendas', type=int, default=1000000, help='Vendas existentes simuladas (padrão: 1.000.000)')
+        parser.add_argument('--amostras', type=int, default=200, help='Números gerados por algoritmo (padrão: 200)')
+        parser.add_argument('--lote', type=int, default=10000, help='Tamanho do lote de inserção (padrão: 10.000)')
+
+    def handle(self, *args, **options):
+        # Tudo roda dentro de uma transação desfeita ao final: o banco não é alterado
+        with transaction.atomic():
+            self.popular(options['vendas'], options['lote'])
+
+            resultados = {
+                'legado': self.medir(numero_legado, options['amostras']),
+                'contador': self.medir(lambda: Venda.gerar_numero(), options['amostras']),
+            }
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'\n📊 Numeração com {options["vendas"]:,} vendas existentes ({options["amostras"]} amostras):')
+        for nome, (tempos, consultas) in resultados.items():
+            tempos_ms = sorted(t * 1000 for t in tempos)
+            p95 = tempos_ms[max(0, int(len(tempos_ms) * 0.95) - 1)]
+            self.stdout.write(
+                f'   {nome:<9} média {statistics.mean(tempos_ms):8.3f} ms | '
+                f'p50 {statistics.median(tempos_ms):8.3f} ms | p95 {p95:8.3f} ms | '
+                f'{consultas / len(tempos):.1f} consulta(s)/número'
+            )
+
+    def popular(self, total, lote):
+        self.stdout.write(f'📦 Inserindo {total:,} vendas temporárias...')
+        usuario = User.objects.order_by('pk').first() or User.objects.create_user(username='benchmark')
+        inicio = time.perf_counter()
+        for base in range(0, total, lote):
+            Venda.objects.bulk_create([
+                Venda(numero_venda=f'VD{numero:06d}', usuario=usuario)
+                for numero in range(base + 1, min(base + lote, total) + 1)
+            ], batch_size=lote)
+        SequenciaVenda.objects.update_or_create(prefixo='VD', defaults={'ultimo_numero': total})
+        self.stdout.write(f'   pronto em {time.perf_counter() - inicio:.1f}s')
+
+    def medir(self, gerar, amostras):
+        tempos = []
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(amostras):
+                inicio = time.perf_counter()
+                gerar()
+                tempos.append(time.perf_counter() - inicio)
+        return tempos, len(consultas)
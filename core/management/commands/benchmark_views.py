@@ -0,0 +1,130 @@
+import platform
+import sys
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core import carga
+from core.benchmarks import bancos, cenarios, comparacao, medicao
+from core.models import Venda
+
+VERSAO = 1
+
+
+class Command(BaseCommand):
+    help = ('Mede cada URL do sistema (p50/p95, consultas, tempo de SQL e pico de memória) em bancos de '
+            'vários tamanhos, grava o resultado em JSON e o compara com uma baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default='10k,100k,1m',
+                            help='Tamanhos dos bancos em vendas, separados por vírgula (padrão: 10k,100k,1m)')
+        parser.add_argument('--amostras', type=int, default=medicao.AMOSTRAS,
+                            help=f'Requisições medidas por URL (padrão: {medicao.AMOSTRAS})')
+        parser.add_argument('--urls', help='Mede apenas estes cenários ou nomes de URL (separados por vírgula)')
+        parser.add_argument('--saida', default='benchmark_views.json', help='Arquivo JSON do resultado')
+        parser.add_argument('--baseline', help='Resultado anterior para comparação; falha se houver regressão')
+        parser.add_argument('--comparar', metavar='RESULTADO',
+                            help='Não mede nada: compara RESULTADO (JSON já gravado) com --baseline')
+        parser.add_argument('--tolerancia', type=float, default=comparacao.TOLERANCIA,
+                            help='Piora relativa aceita em tempos e memória (padrão: 0.25 = 25%%)')
+        parser.add_argument('--atual', action='store_true',
+                            help='Mede o banco configurado, sem criar bancos por tamanho')
+        parser.add_argument('--diretorio', default=bancos.DIRETORIO,
+                            help='Onde ficam os bancos SQLite do benchmark (reaproveitados entre execuções)')
+        parser.add_argument('--recriar', action='store_true', help='Recria e repopula os bancos do benchmark')
+        parser.add_argument('--seed', type=int, default=42, help='Semente da carga dos bancos')
+
+    def handle(self, *args, **options):
+        if options['comparar']:
+            if not options['baseline']:
+                raise CommandError('--comparar exige --baseline.')
+            resultado = self.carregar(options['comparar'])
+        else:
+            if options['amostras'] < 1:
+                raise CommandError('--amostras deve ser positivo.')
+            selecionados = cenarios.selecionar(
+                [nome.strip() for nome in options['urls'].split(',')] if options['urls'] else None
+            )
+            if not selecionados:
+                raise CommandError(f'Nenhum cenário corresponde a --urls {options["urls"]}.')
+            resultado = self.medir(selecionados, options)
+            comparacao.gravar(resultado, options['saida'])
+            self.stdout.write(self.style.SUCCESS(f'\n✅ Resultado gravado em {options["saida"]}'))
+
+        if options['baseline']:
+            self.comparar(resultado, self.carregar(options['baseline']), options['tolerancia'])
+
+    def carregar(self, caminho):
+        try:
+            return comparacao.carregar(caminho)
+        except comparacao.ErroComparacao as erro:
+            raise CommandError(str(erro))
+
+    def medir(self, selecionados, options):
+        resultado = {
+            'versao': VERSAO,
+            'gerado_em': timezone.now().isoformat(),
+            'ambiente': {
+                'banco': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'plataforma': sys.platform,
+            },
+            'amostras': options['amostras'],
+            'tamanhos': {},
+        }
+
+        if options['atual']:
+            tamanhos = [('atual', None)]
+        else:
+            tamanhos = []
+            for rotulo in options['tamanhos'].split(','):
+                rotulo = rotulo.strip().lower()
+                try:
+                    carga.interpretar_escala(rotulo)
+                except ValueError as erro:
+                    raise CommandError(str(erro))
+                tamanhos.append((rotulo, rotulo))
+
+        for rotulo, escala in tamanhos:
+            if escala is None:
+                resultado['tamanhos'][rotulo] = self.medir_tamanho(rotulo, selecionados, options)
+                continue
+            self.stdout.write(f'\n📦 Preparando o banco de {rotulo} vendas...')
+            with bancos.banco(escala, options['diretorio'], options['recriar'], options['seed'], saida=self.stdout):
+                resultado['tamanhos'][rotulo] = self.medir_tamanho(rotulo, selecionados, options)
+        return resultado
+
+    def medir_tamanho(self, rotulo, selecionados, options):
+        vendas = Venda.objects.count()
+        self.stdout.write(f'\n📊 {rotulo}: {vendas:,} vendas, {len(selecionados)} cenários')
+        self.stdout.write(f'   {"cenário":<34} {"p50 ms":>9} {"p95 ms":>9} {"consultas":>9} '
+                          f'{"SQL ms":>9} {"pico KB":>9}')
+        medidas = medicao.executar(selecionados, options['amostras'], progresso=self.exibir)
+        return {'vendas': vendas, 'cenarios': medidas}
+
+    def exibir(self, cenario, medida):
+        if 'ignorado' in medida:
+            self.stdout.write(f'   {cenario.nome:<34} ⏭️  {medida["ignorado"]}')
+        elif 'erro' in medida:
+            self.stdout.write(self.style.ERROR(f'   {cenario.nome:<34} ❌ {medida["erro"]}'))
+        else:
+            linha = (f'   {cenario.nome:<34} {medida["p50_ms"]:9.2f} {medida["p95_ms"]:9.2f} '
+                     f'{medida["consultas"]:9d} {medida["sql_ms"]:9.2f} {medida["memoria_pico_kb"]:9,d}')
+            if medida['status'] != medida['esperado']:
+                linha += f'  ⚠️  HTTP {medida["status"]} (esperado {medida["esperado"]})'
+                self.stdout.write(self.style.WARNING(linha))
+            else:
+                self.stdout.write(linha)
+
+    def comparar(self, resultado, baseline, tolerancia):
+        regressoes = comparacao.comparar(resultado, baseline, tolerancia=tolerancia)
+        if not regressoes:
+            self.stdout.write(self.style.SUCCESS('✅ Nenhuma regressão em relação à baseline.'))
+            return
+        self.stdout.write(self.style.ERROR(f'\n❌ {len(regressoes)} regressão(ões) em relação à baseline:'))
+        for tamanho, nome, metrica, antes, depois in regressoes:
+            self.stdout.write(f'   [{tamanho}] {nome}: {metrica} {antes} → {depois}')
+        raise CommandError(f'{len(regressoes)} regressão(ões) de desempenho.')
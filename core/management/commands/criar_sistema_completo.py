@@ -1,5 +1,8 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from core import carga
 from core.models import (
     Categoria, Produto, Fornecedor, Cliente, FormaPagamento, 
     MovimentacaoEstoque, Venda, ItemVenda, Pagamento, 
@@ -42,8 +45,46 @@ class Command(BaseCommand):
             action='store_true',
             help='Criar pagamentos de exemplo para as vendas e contas',
         )
+        parser.add_argument(
+            '--escala',
+            help='Modo em escala: número de vendas geradas em lote (ex.: 100k, 1m), '
+                 'com produtos, clientes, pagamentos, contas e movimentações proporcionais',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semente do gerador aleatório no modo em escala (padrão: 42)',
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=carga.DIAS,
+            help=f'Dias de histórico no modo em escala (padrão: {carga.DIAS})',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=carga.TAMANHO_LOTE,
+            help=f'Vendas por INSERT no modo em escala (padrão: {carga.TAMANHO_LOTE})',
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=1,
+            help='Processos gravando dias diferentes em paralelo no modo em escala (padrão: 1)',
+        )
 
     def handle(self, *args, **options):
+        if options['escala']:
+            # Validar antes de --clear apagar qualquer coisa
+            try:
+                options['escala'] = carga.interpretar_escala(options['escala'])
+            except ValueError as erro:
+                raise CommandError(str(erro))
+            if options['dias'] < 1 or options['lote'] < 1 or options['processos'] < 1:
+                raise CommandError('--dias, --lote e --processos devem ser positivos.')
+
         if options['clear']:
             self.stdout.write(self.style.WARNING('Limpando todos os dados existentes...'))
             # Ordem de exclusão para evitar problemas de foreign key
@@ -61,6 +102,11 @@ class Command(BaseCommand):
             # Não excluir usuários para segurança
             self.stdout.write(self.style.SUCCESS('Dados existentes removidos!'))
 
+        if options['escala']:
+            self.criar_em_escala(options)
+            self.exibir_estatisticas()
+            return
+
         if not options['only_vendas']:
             self.criar_dados_base()
         
@@ -74,6 +120,9 @@ class Command(BaseCommand):
         if options['pagamentos']:
             self.criar_pagamentos_exemplo()
         
+        self.exibir_estatisticas()
+
+    def exibir_estatisticas(self):
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n🎉 Dados de exemplo criados com sucesso!\n'
@@ -91,6 +140,25 @@ class Command(BaseCommand):
             )
         )
 
+    def criar_em_escala(self, options):
+        if not options['only_vendas']:
+            self.criar_dados_base()
+
+        inicio = time.perf_counter()
+        try:
+            resultado = carga.gerar(
+                options['escala'], seed=options['seed'], dias=options['dias'], lote=options['lote'],
+                processos=options['processos'], progresso=self.stdout.write,
+            )
+        except carga.ErroCarga as erro:
+            raise CommandError(str(erro))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Carga em escala concluída em {time.perf_counter() - inicio:.1f}s: '
+            f'{resultado["vendas"]:,} vendas, {resultado["itens"]:,} itens, '
+            f'{resultado["pagamentos"]:,} pagamentos, {resultado["contas"]:,} contas a receber, '
+            f'{resultado["movimentacoes"]:,} movimentações'
+        ))
+
     def criar_dados_base(self):
         self.stdout.write('📦 Criando dados base do sistema...')
         
@@ -0,0 +1,154 @@
+import multiprocessing
+import random
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import Sum
+
+from core.estoque import EstoqueInsuficiente, aplicar_deltas
+from core.models import Categoria, MovimentacaoEstoque, Produto
+
+CATEGORIA_ESTRESSE = 'Teste de Concorrência'
+
+
+def _trabalhador(semente, produto_ids, operacoes, tentativas, usuario_id):
+    """Executa operações aleatórias de entrada/saída em um processo separado"""
+    # Cada processo precisa da sua própria conexão com o banco
+    connections.close_all()
+    aleatorio = random.Random(semente)
+    aplicado = Counter()
+    insuficientes = 0
+    bloqueios = 0
+    desistencias = 0
+
+    for _ in range(operacoes):
+        # Cada operação mexe em 1 a 3 produtos, em ordem aleatória, para
+        # exercitar o bloqueio em ordem determinística
+        escolhidos = aleatorio.sample(produto_ids, k=aleatorio.randint(1, min(3, len(produto_ids))))
+        deltas = {produto_id: aleatorio.choice([-5, -3, -2, -1, 1, 2, 4]) for produto_id in escolhidos}
+        for tentativa in range(tentativas):
+            try:
+                with transaction.atomic():
+                    aplicar_deltas(deltas)
+                    MovimentacaoEstoque.objects.bulk_create([
+                        MovimentacaoEstoque(
+                            produto_id=produto_id,
+                            tipo='entrada' if delta > 0 else 'saida',
+                            quantidade=abs(delta),
+                            observacao='Teste de concorrência',
+                            usuario_id=usuario_id,
+                        )
+                        for produto_id, delta in deltas.items()
+                    ])
+            except EstoqueInsuficiente:
+                insuficientes += 1
+            except OperationalError:
+                # "database is locked" e similares: a operação não foi aplicada
+                bloqueios += 1
+                time.sleep(aleatorio.uniform(0, 0.01 * (tentativa + 1)))
+                continue
+            else:
+                aplicado.update(deltas)
+            break
+        else:
+            desistencias += 1
+
+    connections.close_all()
+    return dict(aplicado), insuficientes, bloqueios, desistencias
+
+
+class Command(BaseCommand):
+    help = 'Teste de estresse: vários processos alterando o estoque ao mesmo tempo, conferindo o saldo final'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=8, help='Processos concorrentes (padrão: 8)')
+        parser.add_argument('--operacoes', type=int, default=200, help='Operações por processo (padrão: 200)')
+        parser.add_argument('--produtos', type=int, default=5, help='Produtos disputados (padrão: 5)')
+        parser.add_argument('--estoque-inicial', type=int, default=50, help='Estoque inicial de cada produto (padrão: 50)')
+        parser.add_argument('--tentativas', type=int, default=5,
+                            help='Tentativas por operação em caso de erro de bloqueio (padrão: 5)')
+        parser.add_argument('--seed', type=int, default=None, help='Semente do gerador aleatório')
+        parser.add_argument('--manter', action='store_true', help='Não remover os produtos de teste ao final')
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError('O teste de estresse precisa de um banco em arquivo ou servidor (não em memória).')
+
+        semente = options['seed'] if options['seed'] is not None else random.randrange(1 << 30)
+        usuario, usuario_criado = User.objects.get_or_create(username='teste_concorrencia')
+        categoria = Categoria.objects.create(nome=CATEGORIA_ESTRESSE)
+        produtos = Produto.objects.bulk_create([
+            Produto(
+                nome=f'Produto Concorrência {i}',
+                categoria=categoria,
+                codigo=f'CONC-{semente}-{i}',
+                preco_venda=1,
+                preco_custo=1,
+                estoque_atual=options['estoque_inicial'],
+            )
+            for i in range(options['produtos'])
+        ])
+        produto_ids = list(Produto.objects.filter(categoria=categoria).values_list('pk', flat=True))
+
+        try:
+            self.stdout.write(
+                f'🏁 {options["processos"]} processos x {options["operacoes"]} operações '
+                f'em {len(produtos)} produtos (seed {semente})...'
+            )
+            connections.close_all()
+            contexto = multiprocessing.get_context('fork')
+            inicio = time.perf_counter()
+            with contexto.Pool(options['processos']) as pool:
+                resultados = pool.starmap(_trabalhador, [
+                    (semente + i, produto_ids, options['operacoes'], options['tentativas'], usuario.pk)
+                    for i in range(options['processos'])
+                ])
+            duracao = time.perf_counter() - inicio
+
+            aplicado = Counter()
+            insuficientes = bloqueios = desistencias = 0
+            for deltas, recusadas, travadas, desistidas in resultados:
+                aplicado.update(deltas)
+                insuficientes += recusadas
+                bloqueios += travadas
+                desistencias += desistidas
+
+            total = options['processos'] * options['operacoes']
+            self.stdout.write(
+                f'   {total - insuficientes - desistencias} aplicadas, {insuficientes} recusadas por estoque, '
+                f'{desistencias} abandonadas após {bloqueios} erros de bloqueio '
+                f'em {duracao:.2f}s ({total / duracao:.0f} op/s)'
+            )
+
+            erros = []
+            for produto in Produto.objects.filter(pk__in=produto_ids).order_by('pk'):
+                esperado = options['estoque_inicial'] + aplicado[produto.pk]
+                movimentos = MovimentacaoEstoque.objects.filter(produto=produto)
+                entradas = movimentos.filter(tipo='entrada').aggregate(total=Sum('quantidade'))['total'] or 0
+                saidas = movimentos.filter(tipo='saida').aggregate(total=Sum('quantidade'))['total'] or 0
+                pelas_movimentacoes = options['estoque_inicial'] + entradas - saidas
+
+                if produto.estoque_atual != esperado or produto.estoque_atual != pelas_movimentacoes:
+                    erros.append(
+                        f'{produto.nome}: estoque {produto.estoque_atual}, esperado {esperado}, '
+                        f'pelas movimentações {pelas_movimentacoes}'
+                    )
+                elif produto.estoque_atual < 0:
+                    erros.append(f'{produto.nome}: estoque negativo ({produto.estoque_atual})')
+                else:
+                    self.stdout.write(f'   ✅ {produto.nome}: {produto.estoque_atual}')
+        finally:
+            if not options['manter']:
+                categoria.delete()
+                if usuario_criado:
+                    usuario.delete()
+
+        if erros:
+            for erro in erros:
+                self.stdout.write(self.style.ERROR(f'   ❌ {erro}'))
+            raise CommandError('Estoque divergente após o teste de concorrência!')
+        self.stdout.write(self.style.SUCCESS('🎉 Estoque exato após o teste de concorrência.'))
@@ -0,0 +1,48 @@
+import resource
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exportacao
+
+
+class Command(BaseCommand):
+    help = 'Exporta movimentações, vendas ou contas a receber em CSV/XLSX (para dumps agendados)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=list(exportacao.EXPORTACOES), help='O que exportar')
+        parser.add_argument('--formato', choices=list(exportacao.FORMATOS), default='csv',
+                            help='Formato do arquivo (padrão: csv)')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: nome com data/hora; "-" para stdout)')
+        parser.add_argument(
+            '--filtro', action='append', default=[], metavar='CAMPO=VALOR',
+            help='Mesmos filtros da listagem, ex.: --filtro tipo=saida --filtro data_inicio=2025-01-01',
+        )
+
+    def handle(self, *args, **options):
+        parametros = {}
+        for filtro in options['filtro']:
+            campo, separador, valor = filtro.partition('=')
+            if not separador:
+                raise CommandError(f'Filtro inválido: {filtro!r}. Use CAMPO=VALOR.')
+            parametros[campo] = valor
+
+        saida = options['saida'] or exportacao.nome_arquivo(options['tipo'], options['formato'])
+        inicio = time.perf_counter()
+        tamanho = 0
+        arquivo = sys.stdout.buffer if saida == '-' else open(saida, 'wb')
+        try:
+            for pedaco in exportacao.gerar(options['tipo'], options['formato'], parametros):
+                arquivo.write(pedaco)
+                tamanho += len(pedaco)
+        finally:
+            if arquivo is not sys.stdout.buffer:
+                arquivo.close()
+
+        if saida != '-':
+            memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {saida}: {tamanho / 1024 / 1024:.1f} MB em {time.perf_counter() - inicio:.1f}s '
+                f'(pico de memória do processo: {memoria:.0f} MB)'
+            ))
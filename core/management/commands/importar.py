@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importacao
+
+
+class Command(BaseCommand):
+    help = 'Importa (cria ou atualiza) produtos ou clientes a partir de um arquivo CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=list(importacao.IMPORTACOES), help='O que importar')
+        parser.add_argument('arquivo', help='Arquivo CSV com cabeçalho')
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE,
+                            help=f'Linhas gravadas por transação (padrão: {importacao.TAMANHO_LOTE})')
+        parser.add_argument('--simular', action='store_true', help='Apenas valida, sem gravar')
+        parser.add_argument('--max-erros', type=int, default=50, help='Linhas com erro exibidas (padrão: 50)')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+
+        inicio = time.perf_counter()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importacao.importar(options['tipo'], arquivo, lote=options['lote'],
+                                                simular=options['simular'])
+        except OSError as erro:
+            raise CommandError(f'Não foi possível abrir o arquivo: {erro}')
+        except importacao.ErroImportacao as erro:
+            raise CommandError(str(erro))
+
+        for linha, mensagem in resultado.erros[:options['max_erros']]:
+            self.stdout.write(self.style.WARNING(f'⚠️  Linha {linha}: {mensagem}'))
+        if len(resultado.erros) > options['max_erros']:
+            self.stdout.write(self.style.WARNING(
+                f'... e mais {len(resultado.erros) - options["max_erros"]} linha(s) com erro'
+            ))
+
+        acao = 'validadas (simulação)' if resultado.simulacao else 'importadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resultado.linhas:,} linha(s) {acao} em {time.perf_counter() - inicio:.1f}s: '
+            f'{resultado.criados:,} nova(s), {resultado.atualizados:,} atualizada(s), '
+            f'{len(resultado.erros):,} com erro'
+        ))
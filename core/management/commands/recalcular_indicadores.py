@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core import indicadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os indicadores do negócio (usados em /metrics) a partir dos dados gravados'
+
+    def handle(self, *args, **options):
+        for nome, valor in indicadores.recalcular().items():
+            self.stdout.write(f'   {nome}: {valor}')
+        self.stdout.write(self.style.SUCCESS('✅ Indicadores recalculados.'))
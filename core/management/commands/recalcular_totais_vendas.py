@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Abs
+
+from core.models import Venda
+
+
+class Command(BaseCommand):
+    help = 'Recalcula (ou verifica) os totais armazenados nas vendas a partir dos itens e pagamentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Apenas verifica divergências, sem alterar dados (retorna erro se houver)',
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=20,
+            help='Número máximo de vendas divergentes listadas (padrão: 20)',
+        )
+
+    def handle(self, *args, **options):
+        expressoes = Venda.expressoes_totais()
+
+        if options['verificar']:
+            calculados = {f'{campo}_calculado': expressao for campo, expressao in expressoes.items()}
+            # Diferença absoluta por campo: comparar com tolerância evita falsos
+            # positivos de arredondamento em bancos que guardam decimais como REAL
+            diferencas = {
+                f'{campo}_diferenca': Abs(F(campo) - F(f'{campo}_calculado'))
+                for campo in Venda.CAMPOS_TOTAIS
+            }
+            divergencia = Q()
+            for campo in Venda.CAMPOS_TOTAIS:
+                divergencia |= Q(**{f'{campo}_diferenca__gt': 0.005})
+
+            divergentes = (Venda.objects.annotate(**calculados).annotate(**diferencas)
+                           .filter(divergencia).order_by('pk'))
+            total = divergentes.count()
+            if not total:
+                self.stdout.write(self.style.SUCCESS('✅ Todos os totais de vendas estão consistentes.'))
+                return
+
+            for venda in divergentes[:options['limite']]:
+                detalhes = ', '.join(
+                    f'{campo}={getattr(venda, campo)} (esperado {getattr(venda, f"{campo}_calculado")})'
+                    for campo in Venda.CAMPOS_TOTAIS
+                    if getattr(venda, f'{campo}_diferenca') > 0.005
+                )
+                self.stdout.write(f'   ❌ {venda.numero_venda}: {detalhes}')
+            raise CommandError(f'{total} venda(s) com totais divergentes. Execute sem --verificar para corrigir.')
+
+        with transaction.atomic():
+            atualizadas = Venda.objects.update(**expressoes)
+        self.stdout.write(self.style.SUCCESS(f'✅ Totais recalculados para {atualizadas} venda(s).'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils.text import capfirst
+
+from core import busca
+
+
+class Command(BaseCommand):
+    help = 'Recria o índice de busca (FTS5) de produtos, clientes e fornecedores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=[model._meta.model_name for model in busca.INDICES],
+            help='Reconstruir apenas o índice deste model (padrão: todos)',
+        )
+
+    def handle(self, *args, **options):
+        for model in busca.INDICES:
+            if options['model'] and model._meta.model_name != options['model']:
+                continue
+            if connections[router.db_for_write(model)].vendor != 'sqlite':
+                raise CommandError('O índice FTS5 só existe no SQLite; nos demais bancos a busca usa icontains.')
+
+            inicio = time.perf_counter()
+            total = busca.reconstruir(model)
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {capfirst(model._meta.verbose_name_plural)}: {total:,} registro(s) indexado(s) '
+                f'em {time.perf_counter() - inicio:.1f}s'
+            ))
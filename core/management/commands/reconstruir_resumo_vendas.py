@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import resumos
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo diário de vendas (ResumoVendaDiario) a partir das vendas gravadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help='Reconstruir apenas a partir desta data (AAAA-MM-DD); padrão: todo o histórico',
+        )
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Data inválida em --desde. Use o formato AAAA-MM-DD.')
+
+        linhas = resumos.reconstruir(desde)
+        periodo = f'desde {desde:%d/%m/%Y}' if desde else 'de todo o histórico'
+        self.stdout.write(self.style.SUCCESS(f'✅ Resumo de vendas {periodo} reconstruído: {linhas} linha(s).'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import roteamento
+
+
+class Command(BaseCommand):
+    help = ('Grava o pulso de replicação no banco padrão (mede o atraso da réplica de relatórios) e, com '
+            'SQLite, copia o banco padrão para o arquivo da réplica; com --intervalo, repete até ser interrompido')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=0,
+                            help='Segundos entre as replicações (padrão: 0, uma vez só)')
+        parser.add_argument('--so-pulso', action='store_true',
+                            help='Só grava o pulso (a réplica é mantida pelo próprio banco, ex.: PostgreSQL)')
+
+    def handle(self, *args, **options):
+        if not roteamento.replica_configurada():
+            raise CommandError('Réplica de relatórios não configurada (RELATORIOS_DB_NAME).')
+        copiar = not options['so_pulso']
+        if copiar and {connections[DEFAULT_DB_ALIAS].vendor, connections[roteamento.RELATORIOS].vendor} != {'sqlite'}:
+            raise CommandError('A cópia só funciona entre bancos SQLite; com uma réplica do servidor use --so-pulso.')
+
+        intervalo = options['intervalo']
+        while True:
+            inicio = time.perf_counter()
+            roteamento.gravar_pulso()
+            if copiar:
+                roteamento.copiar_sqlite()
+            duracao = time.perf_counter() - inicio
+            self.stdout.write(f'🔁 {"Réplica atualizada" if copiar else "Pulso gravado"} em {duracao * 1000:.0f} ms')
+            if not intervalo:
+                break
+            time.sleep(max(intervalo - duracao, 0))
+        self.stdout.write(self.style.SUCCESS('✅ Replicação concluída.'))
@@ -0,0 +1,169 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import (Categoria, Cliente, ContasReceber, FormaPagamento, Fornecedor,
+                         MovimentacaoEstoque, Produto, Venda)
+
+# Views de listagem (com os filtros mais usados) e de detalhe verificadas
+LISTAS = [
+    ('dashboard', ''),
+    ('produto_list', ''),
+    ('produto_list', '?search=agua'),
+    ('movimentacao_list', ''),
+    ('movimentacao_list', '?tipo=entrada'),
+    ('movimentacao_list', '?tipo=saida&data_inicio=2025-01-01'),
+    ('fornecedor_list', ''),
+    ('cliente_list', ''),
+    ('categoria_list', ''),
+    ('forma_pagamento_list', ''),
+    ('venda_list', ''),
+    ('venda_list', '?status=finalizada'),
+    ('contas_receber_list', ''),
+    ('contas_receber_list', '?status=aberto'),
+    ('contas_receber_list', '?vencidas=sim'),
+]
+DETALHES = [
+    ('produto_detail', Produto),
+    ('movimentacao_detail', MovimentacaoEstoque),
+    ('fornecedor_detail', Fornecedor),
+    ('cliente_detail', Cliente),
+    ('categoria_detail', Categoria),
+    ('forma_pagamento_detail', FormaPagamento),
+    ('venda_detail', Venda),
+    ('conta_receber_detail', ContasReceber),
+]
+
+# Varreduras revisadas e aceitas, por view e linha do plano do SQLite. Todas são
+# leituras de página na ordem de um índice: valem só com LIMIT e sem B-tree
+# temporária, quando o SQLite para depois das linhas pedidas. Qualquer outra
+# varredura de tabela grande falha, com ou sem LIMIT; um agregado sobre a tabela
+# inteira só passa se for acrescentado aqui, com o motivo.
+VARREDURAS_PERMITIDAS = {
+    ('dashboard', 'SCAN core_movimentacaoestoque USING INDEX mov_data_idx'):
+        'movimentações recentes: as 10 últimas pelo índice de data',
+    ('movimentacao_list', 'SCAN core_movimentacaoestoque USING INDEX mov_data_idx'):
+        'primeira página da listagem pelo índice (data_movimentacao, id)',
+    ('venda_list', 'SCAN core_venda USING INDEX venda_data_idx'):
+        'primeira página da listagem pelo índice (data_venda, id)',
+    ('contas_receber_list', 'SCAN core_contasreceber USING INDEX conta_criacao_idx'):
+        'primeira página da listagem pelo índice (data_criacao, id)',
+}
+
+# Apelidos de subconsultas geradas pelo Django: FROM "core_itemvenda" U0
+APELIDO_RE = re.compile(r'"(\w+)" ([UT]\d+)\b')
+SCAN_SQLITE_RE = re.compile(r'^SCAN (\S+)(?: AS \S+)?(?: USING .*)?$')
+SCAN_POSTGRES_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = ('Executa as views de listagem e detalhe, roda EXPLAIN nas consultas geradas e falha '
+            'se alguma fizer varredura completa em tabela maior que o limite')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limite-linhas',
+            type=int,
+            default=10000,
+            help='Tabelas com menos linhas que isso são ignoradas (padrão: 10.000)',
+        )
+        parser.add_argument(
+            '--verbose-planos',
+            action='store_true',
+            help='Mostra o plano de todas as consultas, não apenas das problemáticas',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Banco {connection.vendor} não suportado (apenas SQLite e PostgreSQL).')
+
+        self.limite = options['limite_linhas']
+        self.tamanhos = {}
+        self.tabelas = set(connection.introspection.table_names())
+        problemas = []
+
+        # Sessões/login de teste não devem ficar gravados no banco
+        with transaction.atomic():
+            cliente = Client()
+            cliente.force_login(self.usuario())
+
+            for nome, url in self.urls():
+                with CaptureQueriesContext(connection) as consultas:
+                    resposta = cliente.get(url)
+                if resposta.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f'   ⚠️  {nome} ({url}): HTTP {resposta.status_code}'))
+
+                for consulta in consultas.captured_queries:
+                    sql = consulta['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plano, varreduras = self.analisar(sql, nome)
+                    if options['verbose_planos']:
+                        self.stdout.write(f'\n{nome} ({url}):\n   {sql}\n   ' + '\n   '.join(plano))
+                    for tabela in varreduras:
+                        problemas.append((nome, url, tabela, sql, plano))
+
+            transaction.set_rollback(True)
+
+        if not problemas:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Nenhuma varredura completa em tabelas com mais de {self.limite:,} linhas.'
+            ))
+            return
+
+        for nome, url, tabela, sql, plano in problemas:
+            self.stdout.write(self.style.ERROR(
+                f'\n❌ {nome} ({url}): varredura completa em {tabela} ({self.tamanhos[tabela]:,} linhas)'
+            ))
+            self.stdout.write(f'   {sql}')
+            for linha in plano:
+                self.stdout.write(f'      {linha}')
+        raise CommandError(f'{len(problemas)} consulta(s) com varredura completa de tabela.')
+
+    def usuario(self):
+        usuario = User.objects.filter(is_superuser=True).order_by('pk').first()
+        return usuario or User.objects.create_user(username='verificador_planos')
+
+    def urls(self):
+        for nome, filtros in LISTAS:
+            yield nome, reverse(nome) + filtros
+        for nome, model in DETALHES:
+            pk = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+            if pk is not None:
+                yield nome, reverse(nome, args=[pk])
+
+    def analisar(self, sql, view=None):
+        """Retorna (linhas do plano, tabelas grandes varridas por completo)"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plano = [linha[3] for linha in cursor.fetchall()]
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                plano = [linha[0] for linha in cursor.fetchall()]
+
+        apelidos = dict((apelido, tabela) for tabela, apelido in APELIDO_RE.findall(sql))
+        varreduras = []
+        if connection.vendor == 'sqlite':
+            paginada = ' LIMIT ' in sql.upper() and not any('TEMP B-TREE' in linha for linha in plano)
+            for linha in plano:
+                encontrado = SCAN_SQLITE_RE.match(linha)
+                if encontrado and not (paginada and (view, linha) in VARREDURAS_PERMITIDAS):
+                    nome = encontrado.group(1)
+                    varreduras.append(apelidos.get(nome, nome))
+        else:
+            varreduras = [apelidos.get(nome, nome) for nome in SCAN_POSTGRES_RE.findall('\n'.join(plano))]
+
+        return plano, [tabela for tabela in varreduras if tabela in self.tabelas and self.tamanho(tabela) > self.limite]
+
+    def tamanho(self, tabela):
+        if tabela not in self.tamanhos:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(tabela)}')
+                self.tamanhos[tabela] = cursor.fetchone()[0]
+        return self.tamanhos[tabela]
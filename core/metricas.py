@@ -0,0 +1,303 @@
+"""
+Métricas no formato texto do Prometheus (/metrics).
+
+- Requisições (MetricasMiddleware): histograma de latência por view,
+  histogramas do número de consultas e do tempo de SQL por requisição,
+  duração de cada consulta por banco, contagem por status (taxa de erros) e
+  exceções das views.
+- Cache: acertos e faltas por uso (registrar_cache), com a taxa de acerto.
+- Negócio: indicadores mantidos incrementalmente (core/indicadores.py) e as
+  vendas do dia do resumo diário, lidos com duas consultas pequenas por coleta.
+  As vendas registradas no dia também saem como contador (lido do banco, igual
+  em todos os workers); vendas por minuto fica com o Prometheus:
+  rate(estoque_vendas_registradas_total[5m]) * 60. O contador zera à
+  meia-noite, o que rate() trata como reinício.
+
+Cada processo acumula as suas métricas em memória. Com METRICAS_DIRETORIO
+(vários workers do gunicorn, por exemplo), cada processo grava um arquivo com
+os seus totais a cada METRICAS_INTERVALO segundos, e a coleta soma os arquivos
+de todos os processos, inclusive dos que já terminaram (contadores não podem
+voltar atrás). O diretório deve ser esvaziado ao iniciar o servidor.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from . import indicadores, roteamento
+from .models import ResumoVendaDiario
+
+BUCKETS_REQUISICAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+BUCKETS_NUMERO_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# nome: (tipo, descrição); a ordem é a da saída
+METRICAS = {
+    'estoque_requisicao_segundos': ('histogram', 'Duração das requisições por view'),
+    'estoque_requisicoes_total': ('counter', 'Requisições por view, método e status HTTP'),
+    'estoque_excecoes_total': ('counter', 'Exceções não tratadas nas views'),
+    'estoque_requisicao_consultas': ('histogram', 'Número de consultas SQL por requisição'),
+    'estoque_requisicao_sql_segundos': ('histogram', 'Tempo de SQL por requisição'),
+    'estoque_consulta_segundos': ('histogram', 'Duração de cada consulta SQL por banco'),
+    'estoque_cache_consultas_total': ('counter', 'Leituras do cache por uso e resultado (acerto/falta)'),
+    'estoque_cache_taxa_acerto': ('gauge', 'Fração das leituras do cache que acertaram'),
+    'estoque_produtos_abaixo_minimo': ('gauge', 'Produtos ativos com estoque no mínimo ou abaixo'),
+    'estoque_contas_receber_abertas': ('gauge', 'Contas a receber não quitadas'),
+    'estoque_contas_receber_saldo_reais': ('gauge', 'Saldo em aberto das contas a receber'),
+    'estoque_vendas_hoje': ('gauge', 'Vendas registradas hoje, por status'),
+    'estoque_vendas_registradas_total': ('counter', 'Vendas registradas hoje, em qualquer status (zera à meia-noite)'),
+    'estoque_relatorios_atraso_segundos': ('gauge', 'Atraso da réplica de relatórios (idade do pulso de replicação)'),
+}
+SEM_ROTA = 'sem_rota'
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+class Registro:
+    """Contadores e histogramas do processo"""
+
+    def __init__(self, diretorio=None, intervalo=5):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.contadores = {}
+        self.histogramas = {}  # chave -> [buckets, contagens por faixa (+Inf no final), soma]
+        self._trava = threading.Lock()
+        self._gravado = 0.0
+
+    def _contar(self, nome, rotulos, valor=1):
+        chave = _chave(nome, rotulos)
+        self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def _observar(self, nome, rotulos, valor, buckets):
+        chave = _chave(nome, rotulos)
+        histograma = self.histogramas.get(chave)
+        if histograma is None:
+            histograma = self.histogramas[chave] = [buckets, [0] * (len(buckets) + 1), 0.0]
+        histograma[1][bisect.bisect_left(buckets, valor)] += 1
+        histograma[2] += valor
+
+    def contar(self, nome, rotulos, valor=1):
+        with self._trava:
+            self._contar(nome, rotulos, valor)
+
+    def registrar_requisicao(self, view, metodo, status, segundos, consultas):
+        """consultas: {banco: [duração de cada consulta]}"""
+        with self._trava:
+            self._observar('estoque_requisicao_segundos', {'view': view, 'metodo': metodo}, segundos,
+                           BUCKETS_REQUISICAO)
+            self._contar('estoque_requisicoes_total', {'view': view, 'metodo': metodo, 'status': str(status)})
+            duracoes = [duracao for lista in consultas.values() for duracao in lista]
+            self._observar('estoque_requisicao_consultas', {'view': view}, len(duracoes), BUCKETS_NUMERO_CONSULTAS)
+            self._observar('estoque_requisicao_sql_segundos', {'view': view}, sum(duracoes), BUCKETS_REQUISICAO)
+            for banco, lista in consultas.items():
+                for duracao in lista:
+                    self._observar('estoque_consulta_segundos', {'banco': banco}, duracao, BUCKETS_CONSULTA)
+        if self.diretorio and time.monotonic() - self._gravado >= self.intervalo:
+            self.gravar()
+
+    def exportar(self):
+        """Totais do processo num formato serializável em JSON"""
+        with self._trava:
+            return {
+                'contadores': [[nome, dict(rotulos), valor] for (nome, rotulos), valor in self.contadores.items()],
+                'histogramas': [[nome, dict(rotulos), list(buckets), list(contagens), soma]
+                                for (nome, rotulos), (buckets, contagens, soma) in self.histogramas.items()],
+            }
+
+    def arquivo(self):
+        return os.path.join(self.diretorio, f'metricas_{os.getpid()}.json')
+
+    def gravar(self):
+        """Grava os totais do processo no diretório compartilhado (troca atômica do arquivo)"""
+        self._gravado = time.monotonic()
+        os.makedirs(self.diretorio, exist_ok=True)
+        arquivo = self.arquivo()
+        temporario = f'{arquivo}.{threading.get_ident()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as saida:
+            json.dump(self.exportar(), saida)
+        os.replace(temporario, arquivo)
+
+    def coletar(self):
+        """(contadores, histogramas) somados de todos os processos"""
+        if not self.diretorio:
+            return _somar([self.exportar()])
+        self.gravar()
+        totais = []
+        for arquivo in glob.glob(os.path.join(self.diretorio, 'metricas_*.json')):
+            try:
+                with open(arquivo, encoding='utf-8') as entrada:
+                    totais.append(json.load(entrada))
+            except (OSError, ValueError):
+                continue  # arquivo removido ou de outra versão
+        return _somar(totais)
+
+
+def _somar(totais):
+    contadores, histogramas = {}, {}
+    for total in totais:
+        for nome, rotulos, valor in total['contadores']:
+            chave = _chave(nome, rotulos)
+            contadores[chave] = contadores.get(chave, 0) + valor
+        for nome, rotulos, buckets, contagens, soma in total['histogramas']:
+            chave = _chave(nome, rotulos)
+            anterior = histogramas.get(chave)
+            if anterior is None:
+                histogramas[chave] = [tuple(buckets), list(contagens), soma]
+            elif list(anterior[0]) == list(buckets):
+                anterior[1] = [a + b for a, b in zip(anterior[1], contagens)]
+                anterior[2] += soma
+    return contadores, histogramas
+
+
+registro = Registro(getattr(settings, 'METRICAS_DIRETORIO', '') or None, getattr(settings, 'METRICAS_INTERVALO', 5))
+
+
+def registrar_cache(uso, acerto):
+    """Conta uma leitura do cache (acerto ou falta) para a taxa de acerto"""
+    registro.contar('estoque_cache_consultas_total', {'cache': uso, 'resultado': 'acerto' if acerto else 'falta'})
+
+
+class _Consultas:
+    """execute_wrapper que guarda a duração das consultas de cada banco"""
+
+    def __init__(self):
+        self.por_banco = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.por_banco.setdefault(context['connection'].alias, []).append(time.perf_counter() - inicio)
+
+
+def _view(request):
+    correspondencia = getattr(request, 'resolver_match', None)
+    return correspondencia.url_name or correspondencia.view_name if correspondencia else SEM_ROTA
+
+
+class MetricasMiddleware:
+    """Registra toda requisição nas métricas (desligado com METRICAS=False)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = _Consultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(consultas))
+            resposta = self.get_response(request)
+        registro.registrar_requisicao(_view(request), request.method, resposta.status_code,
+                                      time.perf_counter() - inicio, consultas.por_banco)
+        return resposta
+
+    def process_exception(self, request, exception):
+        registro.contar('estoque_excecoes_total', {'view': _view(request), 'excecao': type(exception).__name__})
+
+
+# ===== Indicadores do negócio =====
+
+def _negocio():
+    """[(nome, rótulos, valor)] dos indicadores do negócio"""
+    valores = indicadores.valores()
+    amostras = [
+        ('estoque_produtos_abaixo_minimo', {}, valores[indicadores.PRODUTOS_ABAIXO_MINIMO]),
+        ('estoque_contas_receber_abertas', {}, valores[indicadores.CONTAS_ABERTAS]),
+        ('estoque_contas_receber_saldo_reais', {}, valores[indicadores.SALDO_CONTAS]),
+    ]
+    hoje = timezone.localdate()
+    por_status = dict(ResumoVendaDiario.objects.filter(produto__isnull=True, data=hoje)
+                      .values_list('status').order_by().annotate(Sum('numero_vendas')))
+    amostras += [('estoque_vendas_hoje', {'status': status}, vendas) for status, vendas in sorted(por_status.items())]
+    # Mudar o status de uma venda não muda a soma: só cresce (até a meia-noite)
+    amostras.append(('estoque_vendas_registradas_total', {}, sum(por_status.values())))
+    atraso = roteamento.atraso.atual() if roteamento.replica_configurada() else None
+    if atraso is not None:
+        amostras.append(('estoque_relatorios_atraso_segundos', {}, atraso))
+    return amostras
+
+
+# ===== Formato texto =====
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ''
+    pares = []
+    for nome, valor in rotulos:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nome}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def texto(contadores, histogramas, negocio):
+    """Exposição no formato texto do Prometheus (versão 0.0.4)"""
+    por_nome = {nome: [] for nome in METRICAS}
+    for (nome, rotulos), valor in sorted(contadores.items()):
+        por_nome[nome].append(f'{nome}{_rotulos(rotulos)} {_numero(valor)}')
+
+    for (nome, rotulos), (buckets, contagens, soma) in sorted(histogramas.items()):
+        acumulado = 0
+        for limite, contagem in zip(list(buckets) + [float('inf')], contagens):
+            acumulado += contagem
+            por_nome[nome].append(f'{nome}_bucket{_rotulos(rotulos + (("le", _numero(limite)),))} {acumulado}')
+        por_nome[nome].append(f'{nome}_sum{_rotulos(rotulos)} {_numero(float(soma))}')
+        por_nome[nome].append(f'{nome}_count{_rotulos(rotulos)} {acumulado}')
+
+    leituras = {}
+    for (nome, rotulos), valor in contadores.items():
+        if nome == 'estoque_cache_consultas_total':
+            rotulos = dict(rotulos)
+            acertos, total = leituras.get(rotulos['cache'], (0, 0))
+            leituras[rotulos['cache']] = (acertos + (valor if rotulos['resultado'] == 'acerto' else 0), total + valor)
+    for uso, (acertos, total) in sorted(leituras.items()):
+        por_nome['estoque_cache_taxa_acerto'].append(
+            f'estoque_cache_taxa_acerto{_rotulos((("cache", uso),))} {_numero(acertos / total)}')
+
+    for nome, rotulos, valor in negocio:
+        por_nome[nome].append(f'{nome}{_rotulos(tuple(sorted(rotulos.items())))} {_numero(float(valor))}')
+
+    linhas = []
+    for nome, amostras in por_nome.items():
+        if amostras:
+            tipo, descricao = METRICAS[nome]
+            linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} {tipo}', *amostras]
+    return '\n'.join(linhas) + '\n'
+
+
+def _autorizado(request):
+    """Com METRICAS_TOKEN, exige 'Authorization: Bearer <token>'; sem ele, só localhost ou a equipe"""
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1') or request.user.is_staff
+
+
+def metricas(request):
+    if not _autorizado(request):
+        return HttpResponse('Acesso negado.', status=403, content_type='text/plain; charset=utf-8')
+    contadores, histogramas = registro.coletar()
+    return HttpResponse(texto(contadores, histogramas, _negocio()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
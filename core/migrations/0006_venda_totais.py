@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    ItemVenda = apps.get_model('core', 'ItemVenda')
+    Pagamento = apps.get_model('core', 'Pagamento')
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    inteiro = IntegerField()
+
+    def total(model, agregado, output_field):
+        subquery = (model.objects.filter(venda=OuterRef('pk'))
+                    .order_by().values('venda')
+                    .annotate(total=agregado).values('total'))
+        return Coalesce(Subquery(subquery, output_field=output_field), Value(0), output_field=output_field)
+
+    Venda.objects.update(
+        valor_itens=total(ItemVenda, Sum(F('quantidade') * F('preco_unitario'), output_field=decimal), decimal),
+        valor_pago=total(Pagamento, Sum('valor_pago'), decimal),
+        quantidade_itens=total(ItemVenda, Sum('quantidade'), inteiro),
+        numero_itens=total(ItemVenda, Count('id'), inteiro),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_pagamentoconta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venda',
+            name='numero_itens',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venda',
+            name='quantidade_itens',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venda',
+            name='valor_itens',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='venda',
+            name='valor_pago',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+def iniciar_sequencia(apps, schema_editor):
+    """Continua a numeração a partir do maior número VDnnnnnn existente"""
+    Venda = apps.get_model('core', 'Venda')
+    SequenciaVenda = apps.get_model('core', 'SequenciaVenda')
+    ultimo_numero = 0
+    numeros = Venda.objects.filter(numero_venda__startswith='VD').values_list('numero_venda', flat=True)
+    for numero in numeros.iterator(chunk_size=10000):
+        if numero[2:].isdigit():
+            ultimo_numero = max(ultimo_numero, int(numero[2:]))
+    if ultimo_numero:
+        SequenciaVenda.objects.create(prefixo='VD', ultimo_numero=ultimo_numero)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_venda_totais'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaVenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixo', models.CharField(max_length=20, unique=True)),
+                ('ultimo_numero', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sequência de Venda',
+                'verbose_name_plural': 'Sequências de Vendas',
+            },
+        ),
+        migrations.RunPython(iniciar_sequencia, migrations.RunPython.noop),
+    ]
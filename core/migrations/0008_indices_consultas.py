@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_sequenciavenda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(fields=['status', 'data_vencimento'], name='conta_status_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(fields=['cliente', 'status'], name='conta_cliente_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(fields=['data_criacao'], name='conta_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(condition=models.Q(('status__in', ['aberto', 'parcial'])), fields=['data_vencimento'], name='conta_aberta_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemvenda',
+            index=models.Index(fields=['produto', 'venda'], name='itemvenda_produto_venda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['produto', 'tipo'], name='mov_produto_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['tipo', 'data_movimentacao'], name='mov_tipo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_movimentacao'], name='mov_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['status', 'data_venda'], name='venda_status_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['cliente', 'status'], name='venda_cliente_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['forma_pagamento', 'status'], name='venda_forma_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_venda'], name='venda_data_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def preencher_resumo(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    ItemVenda = apps.get_model('core', 'ItemVenda')
+    ResumoVendaDiario = apps.get_model('core', 'ResumoVendaDiario')
+
+    linhas = [
+        ResumoVendaDiario(produto_id=None, quantidade=0, **linha)
+        for linha in Venda.objects.values(
+            'status', 'forma_pagamento_id', 'usuario_id', data=TruncDate('data_venda')
+        ).order_by().annotate(numero_vendas=Count('id'), valor=Sum('valor_itens'))
+    ]
+    linhas += [
+        ResumoVendaDiario(
+            data=linha['data'], status=linha['venda__status'], produto_id=linha['produto_id'],
+            forma_pagamento_id=linha['venda__forma_pagamento_id'], usuario_id=linha['venda__usuario_id'],
+            numero_vendas=0, quantidade=linha['total_quantidade'], valor=linha['total_valor'],
+        )
+        for linha in ItemVenda.objects.values(
+            'venda__status', 'venda__forma_pagamento_id', 'venda__usuario_id', 'produto_id',
+            data=TruncDate('venda__data_venda'),
+        ).order_by().annotate(total_quantidade=Sum('quantidade'),
+                             total_valor=Sum(F('quantidade') * F('preco_unitario')))
+    ]
+    ResumoVendaDiario.objects.bulk_create(linhas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVendaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('status', models.CharField(choices=[('aberta', 'Aberta'), ('finalizada', 'Finalizada'), ('paga', 'Paga'), ('parcial', 'Pago Parcial'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('numero_vendas', models.IntegerField(default=0)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('forma_pagamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.formapagamento')),
+                ('produto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.produto')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Vendas',
+                'verbose_name_plural': 'Resumos Diários de Vendas',
+                'indexes': [models.Index(fields=['status', 'data'], name='resumo_status_data_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumovendadiario',
+            constraint=models.UniqueConstraint(fields=('data', 'status', 'produto', 'forma_pagamento', 'usuario'), name='resumo_venda_diario_unico'),
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
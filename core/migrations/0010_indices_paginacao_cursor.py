@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_resumovendadiario'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contasreceber',
+            name='conta_criacao_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='mov_data_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='venda',
+            name='venda_data_idx',
+        ),
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(fields=['data_criacao', 'id'], name='conta_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_movimentacao', 'id'], name='mov_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_venda', 'id'], name='venda_data_idx'),
+        ),
+    ]
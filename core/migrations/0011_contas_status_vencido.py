@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:22
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_vencidas(apps, schema_editor):
+    ContasReceber = apps.get_model('core', 'ContasReceber')
+    ContasReceber.objects.filter(
+        status__in=['aberto', 'parcial'], data_vencimento__lt=timezone.localdate()
+    ).update(status='vencido')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contasreceber',
+            name='conta_aberta_venc_idx',
+        ),
+        migrations.AddIndex(
+            model_name='contasreceber',
+            index=models.Index(condition=models.Q(('status__in', ['aberto', 'parcial', 'vencido'])), fields=['data_vencimento'], name='conta_aberta_venc_idx'),
+        ),
+        migrations.RunPython(marcar_vencidas, migrations.RunPython.noop),
+    ]
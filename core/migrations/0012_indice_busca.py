@@ -0,0 +1,64 @@
+from django.db import OperationalError, migrations
+
+# (tabela FTS5, tabela do model, coluna do nome, coluna do código/documento)
+INDICES = [
+    ('core_busca_produto', 'core_produto', 'nome', 'codigo'),
+    ('core_busca_cliente', 'core_cliente', 'nome', 'cpf_cnpj'),
+    ('core_busca_fornecedor', 'core_fornecedor', 'nome', 'cnpj'),
+]
+
+
+def _compactar_sql(coluna):
+    # Mesma regra de core.busca.compactar()
+    for caractere in '.-/ ':
+        coluna = f"replace({coluna}, '{caractere}', '')"
+    return coluna
+
+
+def criar_indices(apps, schema_editor):
+    conexao = schema_editor.connection
+    if conexao.vendor == 'sqlite':
+        with conexao.cursor() as cursor:
+            for tabela, origem, nome, documento in INDICES:
+                try:
+                    cursor.execute(
+                        f'CREATE VIRTUAL TABLE {tabela} USING fts5('
+                        f"nome, documento, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                    )
+                except OperationalError:
+                    # SQLite compilado sem FTS5: a busca continua com icontains
+                    return
+                cursor.execute(
+                    f'INSERT INTO {tabela}(rowid, nome, documento) '
+                    f"SELECT id, {nome}, {documento} || ' ' || {_compactar_sql(documento)} FROM {origem}"
+                )
+    elif conexao.vendor == 'postgresql':
+        # icontains gera UPPER(coluna::text) LIKE UPPER(...): índice trigram sobre a mesma expressão
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for tabela, origem, nome, documento in INDICES:
+            for coluna in (nome, documento):
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {origem}_{coluna}_trgm '
+                    f'ON {origem} USING gin (UPPER(({coluna})::text) gin_trgm_ops)'
+                )
+
+
+def remover_indices(apps, schema_editor):
+    conexao = schema_editor.connection
+    for tabela, origem, nome, documento in INDICES:
+        if conexao.vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {tabela}')
+        elif conexao.vendor == 'postgresql':
+            for coluna in (nome, documento):
+                schema_editor.execute(f'DROP INDEX IF EXISTS {origem}_{coluna}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_contas_status_vencido'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
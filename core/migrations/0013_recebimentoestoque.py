@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_indice_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecebimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(help_text='Chave de idempotência do envio', max_length=64, unique=True)),
+                ('nota_fiscal', models.CharField(blank=True, max_length=50)),
+                ('observacao', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('registrado', 'Registrado'), ('estornado', 'Estornado')], default='registrado', max_length=10)),
+                ('numero_itens', models.IntegerField(default=0)),
+                ('quantidade_itens', models.IntegerField(default=0)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('data_recebimento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data_estorno', models.DateTimeField(blank=True, null=True)),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recebimentos', to='core.fornecedor')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('usuario_estorno', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recebimentos_estornados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recebimento de Estoque',
+                'verbose_name_plural': 'Recebimentos de Estoque',
+                'ordering': ['-data_recebimento'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='recebimento',
+            field=models.ForeignKey(blank=True, help_text='Recebimento em lote que gerou esta entrada', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimentacoes', to='core.recebimentoestoque'),
+        ),
+        migrations.AddIndex(
+            model_name='recebimentoestoque',
+            index=models.Index(fields=['data_recebimento', 'id'], name='receb_data_idx'),
+        ),
+    ]
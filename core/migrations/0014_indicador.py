@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recebimentoestoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Indicador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50, unique=True)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'verbose_name': 'Indicador',
+                'verbose_name_plural': 'Indicadores',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_indicador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulsoReplicacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Pulso de replicação',
+                'verbose_name_plural': 'Pulsos de replicação',
+            },
+        ),
+    ]
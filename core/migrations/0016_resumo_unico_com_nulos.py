@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:33
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+def juntar_repetidas(apps, schema_editor):
+    """Soma numa linha só as linhas com a mesma chave que o UNIQUE antigo deixava passar (NULLs)"""
+    ResumoVendaDiario = apps.get_model('core', 'ResumoVendaDiario')
+    chave = ('data', 'status', 'produto_id', 'forma_pagamento_id', 'usuario_id')
+    linhas = {}
+    nulas = models.Q(produto__isnull=True) | models.Q(forma_pagamento__isnull=True)
+    for resumo in ResumoVendaDiario.objects.filter(nulas).order_by('pk'):
+        mantida = linhas.setdefault(tuple(getattr(resumo, campo) for campo in chave), resumo)
+        if mantida is not resumo:
+            mantida.numero_vendas += resumo.numero_vendas
+            mantida.quantidade += resumo.quantidade
+            mantida.valor += resumo.valor
+            mantida.repetidas = getattr(mantida, 'repetidas', []) + [resumo.pk]
+    for mantida in linhas.values():
+        if hasattr(mantida, 'repetidas'):
+            ResumoVendaDiario.objects.filter(pk__in=mantida.repetidas).delete()
+            mantida.save(update_fields=['numero_vendas', 'quantidade', 'valor'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_pulsoreplicacao'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='resumovendadiario',
+            name='resumo_venda_diario_unico',
+        ),
+        migrations.RunPython(juntar_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='resumovendadiario',
+            constraint=models.UniqueConstraint(models.F('data'), models.F('status'), django.db.models.functions.comparison.Coalesce('produto', 0), django.db.models.functions.comparison.Coalesce('forma_pagamento', 0), models.F('usuario'), name='resumo_venda_diario_unico'),
+        ),
+    ]
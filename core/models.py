@@ -1,4 +1,10 @@
-from django.db import models
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import (Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Prefetch,
+                              Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -12,6 +18,24 @@ class Categoria(models.Model):
     class Meta:
         verbose_name_plural = "Categorias"
 
+class ProdutoQuerySet(models.QuerySet):
+    def com_valor_estoque(self):
+        """Anota valor_estoque (estoque_atual * preco_custo) calculado no banco"""
+        return self.annotate(valor_estoque=ExpressionWrapper(
+            F('estoque_atual') * F('preco_custo'), output_field=DecimalField(max_digits=14, decimal_places=2)
+        ))
+
+    def abaixo_do_minimo(self):
+        """Produtos ativos com estoque no mínimo ou abaixo dele"""
+        return self.filter(ativo=True, estoque_atual__lte=F('estoque_minimo'))
+
+    def valor_estoque_total(self):
+        """Soma do valor em estoque dos produtos, em uma única consulta"""
+        total = self.order_by().aggregate(total=Sum(F('estoque_atual') * F('preco_custo'),
+                                                     output_field=DecimalField(max_digits=14, decimal_places=2)))
+        return total['total'] or Decimal('0')
+
+
 class Produto(models.Model):
     nome = models.CharField(max_length=200)
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
@@ -24,6 +48,8 @@ class Produto(models.Model):
     ativo = models.BooleanField(default=True)
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    objects = ProdutoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nome} - {self.codigo}"
 
@@ -33,6 +59,9 @@ class Produto(models.Model):
 
     @property
     def valor_total_estoque(self):
+        # Valor anotado por Produto.objects.com_valor_estoque(), quando presente
+        if 'valor_estoque' in self.__dict__:
+            return self.valor_estoque
         return self.estoque_atual * self.preco_custo
 
 class MovimentacaoEstoque(models.Model):
@@ -56,6 +85,14 @@ class MovimentacaoEstoque(models.Model):
     observacao = models.TextField(blank=True)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     data_movimentacao = models.DateTimeField(default=timezone.now)
+    recebimento = models.ForeignKey(
+        'RecebimentoEstoque',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='movimentacoes',
+        help_text='Recebimento em lote que gerou esta entrada'
+    )
 
     def __str__(self):
         return f"{self.produto.nome} - {self.tipo} - {self.quantidade}"
@@ -69,6 +106,11 @@ class MovimentacaoEstoque(models.Model):
     class Meta:
         verbose_name_plural = "Movimentações de Estoque"
         ordering = ['-data_movimentacao']
+        indexes = [
+            models.Index(fields=['produto', 'tipo'], name='mov_produto_tipo_idx'),
+            models.Index(fields=['tipo', 'data_movimentacao'], name='mov_tipo_data_idx'),
+            models.Index(fields=['data_movimentacao', 'id'], name='mov_data_idx'),
+        ]
 
 class Fornecedor(models.Model):
     nome = models.CharField(max_length=200)
@@ -84,6 +126,46 @@ class Fornecedor(models.Model):
     class Meta:
         verbose_name_plural = "Fornecedores"
 
+
+class RecebimentoEstoque(models.Model):
+    """
+    Entrada em lote de uma entrega de fornecedor.
+
+    As movimentações de entrada do recebimento são gravadas juntas e só podem
+    ser estornadas juntas (core/estoque.py). A chave identifica o envio: repetir
+    um recebimento com a mesma chave não gera uma segunda entrada.
+    """
+    STATUS_CHOICES = [
+        ('registrado', 'Registrado'),
+        ('estornado', 'Estornado'),
+    ]
+
+    chave = models.CharField(max_length=64, unique=True, help_text='Chave de idempotência do envio')
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.PROTECT, related_name='recebimentos')
+    nota_fiscal = models.CharField(max_length=50, blank=True)
+    observacao = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='registrado')
+    # Totais guardados na gravação: continuam disponíveis depois do estorno
+    numero_itens = models.IntegerField(default=0)
+    quantidade_itens = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    data_recebimento = models.DateTimeField(default=timezone.now)
+    usuario_estorno = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                        related_name='recebimentos_estornados')
+    data_estorno = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Recebimento {self.pk} - {self.fornecedor.nome}"
+
+    class Meta:
+        verbose_name = 'Recebimento de Estoque'
+        verbose_name_plural = 'Recebimentos de Estoque'
+        ordering = ['-data_recebimento']
+        indexes = [
+            models.Index(fields=['data_recebimento', 'id'], name='receb_data_idx'),
+        ]
+
 class Cliente(models.Model):
     nome = models.CharField(max_length=200)
     cpf_cnpj = models.CharField(max_length=18)
@@ -114,6 +196,65 @@ class FormaPagamento(models.Model):
         ordering = ['nome']
 
 
+class SequenciaVenda(models.Model):
+    """Contador da numeração de vendas - um registro por prefixo (loja/dia)"""
+    prefixo = models.CharField(max_length=20, unique=True)
+    ultimo_numero = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefixo}: {self.ultimo_numero}"
+
+    @classmethod
+    def proximo_numero(cls, prefixo):
+        """Reserva atomicamente o próximo número do prefixo"""
+        conexao = connections[router.db_for_write(cls)]
+        if conexao.vendor in ('postgresql', 'sqlite') and conexao.features.can_return_columns_from_insert:
+            # Upsert com RETURNING: incrementa (ou cria) o contador em uma única ida ao banco
+            tabela = conexao.ops.quote_name(cls._meta.db_table)
+            with conexao.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {tabela} (prefixo, ultimo_numero) VALUES (%s, 1) "
+                    f"ON CONFLICT (prefixo) DO UPDATE SET ultimo_numero = {tabela}.ultimo_numero + 1 "
+                    f"RETURNING ultimo_numero",
+                    [prefixo]
+                )
+                return cursor.fetchone()[0]
+
+        with transaction.atomic(using=conexao.alias):
+            sequencia, _ = cls.objects.select_for_update().get_or_create(prefixo=prefixo)
+            cls.objects.filter(pk=sequencia.pk).update(ultimo_numero=F('ultimo_numero') + 1)
+            sequencia.refresh_from_db(fields=['ultimo_numero'])
+            return sequencia.ultimo_numero
+
+    class Meta:
+        verbose_name = 'Sequência de Venda'
+        verbose_name_plural = 'Sequências de Vendas'
+
+
+class VendaQuerySet(models.QuerySet):
+    def com_totais(self):
+        """
+        Anota total_pendente (valor_itens - valor_pago) calculado no banco,
+        permitindo filtrar/ordenar pelo saldo. Os demais totais já são colunas.
+        """
+        return self.annotate(total_pendente=ExpressionWrapper(
+            F('valor_itens') - F('valor_pago'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+
+    def com_itens_e_pagamentos(self):
+        """Itens (com produto e categoria) e pagamentos (com forma e usuário) em duas consultas fixas"""
+        return self.prefetch_related(
+            Prefetch('itens', queryset=ItemVenda.objects.select_related('produto__categoria')),
+            Prefetch('pagamentos', queryset=Pagamento.objects.select_related('forma_pagamento', 'usuario')),
+        )
+
+    def totais(self):
+        """Número de vendas e soma dos valores, em uma única consulta"""
+        totais = self.order_by().aggregate(numero_vendas=Count('id'), valor_total=Sum('valor_itens'))
+        totais['valor_total'] = totais['valor_total'] or Decimal('0')
+        return totais
+
+
 class Venda(models.Model):
     STATUS_CHOICES = [
         ('aberta', 'Aberta'),
@@ -132,15 +273,56 @@ class Venda(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aberta')
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
-    
+
+    # Totais desnormalizados - mantidos por sinais de ItemVenda e Pagamento
+    # (ver core/signals.py). Nunca devem ser gravados diretamente por save().
+    valor_itens = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    valor_pago = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    quantidade_itens = models.IntegerField(default=0, editable=False)
+    numero_itens = models.IntegerField(default=0, editable=False)
+
+    CAMPOS_TOTAIS = ('valor_itens', 'valor_pago', 'quantidade_itens', 'numero_itens')
+
+    objects = VendaQuerySet.as_manager()
+
+    @classmethod
+    def expressoes_totais(cls):
+        """Subqueries que recalculam os totais de cada venda no banco"""
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+        inteiro = IntegerField()
+
+        def total(model, agregado, output_field):
+            subquery = (model.objects.filter(venda=OuterRef('pk'))
+                        .order_by().values('venda')
+                        .annotate(total=agregado).values('total'))
+            return Coalesce(Subquery(subquery, output_field=output_field), Value(0), output_field=output_field)
+
+        return {
+            'valor_itens': total(ItemVenda, Sum(F('quantidade') * F('preco_unitario'), output_field=decimal), decimal),
+            'valor_pago': total(Pagamento, Sum('valor_pago'), decimal),
+            'quantidade_itens': total(ItemVenda, Sum('quantidade'), inteiro),
+            'numero_itens': total(ItemVenda, Count('id'), inteiro),
+        }
+
+    def recalcular_totais(self):
+        """Recalcula os totais desta venda em um único UPDATE e atualiza a instância"""
+        atualizadas = Venda.objects.filter(pk=self.pk).update(**Venda.expressoes_totais())
+        if atualizadas:
+            self.refresh_from_db(fields=Venda.CAMPOS_TOTAIS)
+            self.__dict__.pop('total_pendente', None)
+        return atualizadas
+
     @property
     def valor_total_pago(self):
         """Soma todos os pagamentos realizados"""
-        return sum(p.valor_pago for p in self.pagamentos.all()) or 0
+        return self.valor_pago
     
     @property
     def valor_pendente(self):
         """Valor que ainda falta pagar"""
+        # Valor anotado por Venda.objects.com_totais(), quando presente
+        if 'total_pendente' in self.__dict__:
+            return self.total_pendente
         return self.valor_total - self.valor_total_pago
     
     @property
@@ -174,38 +356,50 @@ class Venda(models.Model):
                 self.status = 'parcial'
                 self.save()
     
+    @staticmethod
+    def prefixo_numero(data_venda=None):
+        """(prefixo, dígitos) da numeração de uma venda feita em data_venda"""
+        prefixo = 'VD' + getattr(settings, 'VENDA_PREFIXO_LOJA', '')
+        if getattr(settings, 'VENDA_NUMERACAO', 'global') == 'diaria':
+            return prefixo + timezone.localdate(data_venda).strftime('%Y%m%d'), 4
+        return prefixo, 6
+
+    @staticmethod
+    def gerar_numero(data_venda=None):
+        """
+        Gera o próximo número de venda.
+
+        Formato: VD + prefixo da loja (VENDA_PREFIXO_LOJA) + número sequencial
+        de 6 dígitos; com VENDA_NUMERACAO='diaria' o contador reinicia a cada
+        dia e o número leva a data: VD[loja]AAAAMMDD + 4 dígitos.
+        """
+        prefixo, digitos = Venda.prefixo_numero(data_venda)
+        return f"{prefixo}{SequenciaVenda.proximo_numero(prefixo):0{digitos}d}"
+
     def save(self, *args, **kwargs):
         if not self.numero_venda:
-            # Gerar número sequencial da venda
-            # Buscar o maior número existente para evitar duplicatas
-            ultimo_registro = Venda.objects.filter(numero_venda__startswith='VD').order_by('numero_venda').last()
-            if ultimo_registro:
-                # Extrair o número da string e incrementar
-                try:
-                    ultimo_numero = int(ultimo_registro.numero_venda[2:]) + 1
-                except (ValueError, IndexError):
-                    ultimo_numero = 1
-            else:
-                ultimo_numero = 1
-            
-            # Verificar se já existe para evitar conflitos
-            while Venda.objects.filter(numero_venda=f"VD{ultimo_numero:06d}").exists():
-                ultimo_numero += 1
-                
-            self.numero_venda = f"VD{ultimo_numero:06d}"
+            self.numero_venda = Venda.gerar_numero(self.data_venda)
+
+        # Em atualizações, não sobrescrever os totais com valores possivelmente
+        # desatualizados desta instância
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_TOTAIS
+            ]
         super().save(*args, **kwargs)
     
     @property
     def valor_total(self):
-        return sum(item.valor_total for item in self.itens.all())
+        return self.valor_itens
     
     @property
     def quantidade_total_itens(self):
-        return sum(item.quantidade for item in self.itens.all())
+        return self.quantidade_itens
     
     @property
     def total_itens(self):
-        return self.itens.count()
+        return self.numero_itens
     
     @property
     def data_vencimento(self):
@@ -221,6 +415,12 @@ class Venda(models.Model):
     class Meta:
         verbose_name_plural = "Vendas"
         ordering = ['-data_venda']
+        indexes = [
+            models.Index(fields=['status', 'data_venda'], name='venda_status_data_idx'),
+            models.Index(fields=['cliente', 'status'], name='venda_cliente_status_idx'),
+            models.Index(fields=['forma_pagamento', 'status'], name='venda_forma_status_idx'),
+            models.Index(fields=['data_venda', 'id'], name='venda_data_idx'),
+        ]
 
 
 class ItemVenda(models.Model):
@@ -240,6 +440,9 @@ class ItemVenda(models.Model):
     class Meta:
         verbose_name = "Item da Venda"
         verbose_name_plural = "Itens da Venda"
+        indexes = [
+            models.Index(fields=['produto', 'venda'], name='itemvenda_produto_venda_idx'),
+        ]
 
 
 class Pagamento(models.Model):
@@ -260,6 +463,81 @@ class Pagamento(models.Model):
         return f"Pagamento {self.forma_pagamento.nome} - R$ {self.valor_pago} - Venda {self.venda.numero_venda}"
 
 
+class ResumoVendaDiario(models.Model):
+    """
+    Resumo pré-agregado das vendas por dia, status, produto, forma de pagamento
+    e usuário, mantido incrementalmente por sinais (ver core/resumos.py).
+
+    Linhas sem produto guardam os totais das vendas (número de vendas e valor);
+    as demais guardam quantidade e valor vendidos de cada produto.
+    """
+    data = models.DateField()
+    status = models.CharField(max_length=20, choices=Venda.STATUS_CHOICES)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, null=True, blank=True)
+    forma_pagamento = models.ForeignKey(FormaPagamento, on_delete=models.SET_NULL, null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    numero_vendas = models.IntegerField(default=0)
+    quantidade = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} - {self.get_status_display()} - R$ {self.valor}"
+
+    class Meta:
+        verbose_name = "Resumo Diário de Vendas"
+        verbose_name_plural = "Resumos Diários de Vendas"
+        # Índice único de expressões: no SQLite (e no PostgreSQL) NULLs são
+        # distintos num UNIQUE comum, e as linhas de total (sem produto) ou de
+        # vendas sem forma de pagamento poderiam se repetir. O INSERT ... ON
+        # CONFLICT de core/resumos.py usa estas mesmas expressões como alvo.
+        constraints = [
+            models.UniqueConstraint(
+                F('data'), F('status'), Coalesce('produto', 0), Coalesce('forma_pagamento', 0), F('usuario'),
+                name='resumo_venda_diario_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'data'], name='resumo_status_data_idx'),
+        ]
+
+
+class ContasReceberQuerySet(models.QuerySet):
+    def pendentes(self):
+        """Contas ainda não quitadas"""
+        return self.filter(status__in=ContasReceber.STATUS_PENDENTES)
+
+    def vencidas(self, hoje=None):
+        """Contas não quitadas com vencimento anterior a hoje (usa o índice parcial de vencimento)"""
+        return self.pendentes().filter(data_vencimento__lt=hoje or timezone.localdate())
+
+    def estatisticas(self, hoje=None):
+        """Saldo em aberto, saldo vencido e número de contas vencidas, em uma única consulta"""
+        saldo = ExpressionWrapper(F('valor_total') - F('valor_pago'),
+                                  output_field=DecimalField(max_digits=12, decimal_places=2))
+        vencida = Q(data_vencimento__lt=hoje or timezone.localdate())
+        zero = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+        return self.pendentes().order_by().aggregate(
+            total_em_aberto=Coalesce(Sum(saldo), zero),
+            total_vencidas=Coalesce(Sum(saldo, filter=vencida), zero),
+            count_vencidas=Count('id', filter=vencida),
+        )
+
+    def atualizar_status_vencidas(self, hoje=None):
+        """
+        Marca como 'vencido' as contas pendentes já vencidas e devolve para
+        'aberto'/'parcial' as que deixaram de estar vencidas (vencimento
+        alterado), com dois UPDATEs. Retorna (marcadas, reabertas).
+        """
+        hoje = hoje or timezone.localdate()
+        marcadas = self.filter(
+            status__in=['aberto', 'parcial'], data_vencimento__lt=hoje
+        ).update(status='vencido')
+        reabertas = self.filter(status='vencido', data_vencimento__gte=hoje).update(
+            status=Case(When(valor_pago__gt=0, then=Value('parcial')), default=Value('aberto'))
+        )
+        return marcadas, reabertas
+
+
 class ContasReceber(models.Model):
     """Controla contas a receber de clientes"""
     STATUS_CHOICES = [
@@ -268,6 +546,8 @@ class ContasReceber(models.Model):
         ('quitado', 'Quitado'),
         ('vencido', 'Vencido')
     ]
+    # 'vencido' é atribuído pelo comando atualizar_contas_vencidas
+    STATUS_PENDENTES = ['aberto', 'parcial', 'vencido']
     
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='contas_receber')
     venda = models.ForeignKey(Venda, on_delete=models.CASCADE, null=True, blank=True)
@@ -278,6 +558,8 @@ class ContasReceber(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aberto')
     observacao = models.TextField(blank=True)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    objects = ContasReceberQuerySet.as_manager()
     
     @property
     def valor_pendente(self):
@@ -291,8 +573,7 @@ class ContasReceber(models.Model):
     
     @property
     def esta_vencido(self):
-        from datetime import date
-        return self.data_vencimento < date.today() and self.status != 'quitado'
+        return self.data_vencimento < timezone.localdate() and self.status != 'quitado'
     
     def __str__(self):
         return f"Conta {self.cliente.nome} - R$ {self.valor_pendente} pendente"
@@ -301,6 +582,17 @@ class ContasReceber(models.Model):
         verbose_name = "Conta a Receber"
         verbose_name_plural = "Contas a Receber"
         ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'data_vencimento'], name='conta_status_venc_idx'),
+            models.Index(fields=['cliente', 'status'], name='conta_cliente_status_idx'),
+            models.Index(fields=['data_criacao', 'id'], name='conta_criacao_idx'),
+            # Parcial: só contas ainda não quitadas entram na busca por vencidas
+            models.Index(
+                fields=['data_vencimento'],
+                condition=Q(status__in=['aberto', 'parcial', 'vencido']),
+                name='conta_aberta_venc_idx',
+            ),
+        ]
 
 
 class PagamentoConta(models.Model):
@@ -319,3 +611,34 @@ class PagamentoConta(models.Model):
     
     def __str__(self):
         return f"Pagamento {self.forma_pagamento.nome} - R$ {self.valor_pago} - {self.conta_receber.cliente.nome}"
+
+
+class Indicador(models.Model):
+    """
+    Indicador do negócio mantido incrementalmente (ver core/indicadores.py),
+    lido pelo endpoint de métricas sem refazer as agregações do dashboard.
+    """
+    nome = models.CharField(max_length=50, unique=True)
+    valor = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.nome}: {self.valor}"
+
+    class Meta:
+        verbose_name = "Indicador"
+        verbose_name_plural = "Indicadores"
+
+
+class PulsoReplicacao(models.Model):
+    """
+    Linha única gravada no banco padrão pelo comando replicar_relatorios; a
+    idade dela na réplica é o atraso da replicação (ver core/roteamento.py).
+    """
+    momento = models.DateTimeField()
+
+    def __str__(self):
+        return f"Pulso de replicação em {self.momento:%d/%m/%Y %H:%M:%S}"
+
+    class Meta:
+        verbose_name = "Pulso de replicação"
+        verbose_name_plural = "Pulsos de replicação"
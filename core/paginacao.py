@@ -0,0 +1,157 @@
+"""
+Paginação das listagens grandes (movimentações, vendas, contas a receber).
+
+O modo padrão é por cursor (keyset): a página seguinte é buscada com
+WHERE (data, id) < (última data, último id), usando o índice de data, então o
+custo não cresce com a profundidade da página nem exige COUNT(*). O cursor é
+opaco para o usuário (base64 de um JSON).
+
+A paginação por número continua disponível com ?page=N; nesse modo, e para os
+totais mostrados nas telas, a contagem vem do cache (aproximada por até
+TEMPO_CACHE_CONTAGEM segundos) em vez de um COUNT(*) a cada requisição.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .metricas import registrar_cache
+
+POR_PAGINA = 20
+TEMPO_CACHE_CONTAGEM = 60
+
+
+def agregar_em_cache(queryset, tempo=TEMPO_CACHE_CONTAGEM, **agregados):
+    """queryset.aggregate(**agregados), guardado em cache pela consulta gerada"""
+    queryset = queryset.order_by()
+    sql = str(queryset.query)
+    assinatura = f'{queryset.model._meta.label}|{sql}|{sorted((nome, repr(expr)) for nome, expr in agregados.items())}'
+    chave = 'agregado:' + hashlib.md5(assinatura.encode()).hexdigest()
+    resultado = cache.get(chave)
+    registrar_cache('agregados', resultado is not None)
+    if resultado is None:
+        resultado = queryset.aggregate(**agregados)
+        cache.set(chave, resultado, tempo)
+    return resultado
+
+
+def contar(queryset):
+    """Número (aproximado, em cache) de registros da consulta"""
+    return agregar_em_cache(queryset, total=Count('pk'))['total']
+
+
+class PaginatorContagemEmCache(Paginator):
+    """Paginator por número de página que usa a contagem em cache"""
+
+    def __init__(self, object_list, per_page, total=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._total = total
+
+    @cached_property
+    def count(self):
+        return self._total if self._total is not None else contar(self.object_list)
+
+
+class PaginaCursor:
+    """Página de uma listagem por cursor, com a mesma interface de Page usada nos templates"""
+    por_cursor = True
+
+    def __init__(self, itens, cursor_proximo=None, cursor_anterior=None):
+        self.object_list = itens
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_next(self):
+        return self.cursor_proximo is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def codificar_cursor(valor, pk, direcao):
+    dados = json.dumps([valor.isoformat(), pk, direcao], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(valor, pk, direcao) do cursor, ou None se ausente ou inválido"""
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, pk, direcao = json.loads(dados)
+        valor = parse_datetime(valor)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if valor is None or not isinstance(pk, int) or direcao not in ('p', 'a'):
+        return None
+    return valor, pk, direcao
+
+
+def paginar(request, queryset, campo, por_pagina=POR_PAGINA, total=None):
+    """
+    Pagina queryset em ordem decrescente de (campo, id).
+
+    Com ?page=N usa a paginação por número (contagem em cache, ou o total
+    informado); caso contrário usa o cursor de ?cursor=.
+    """
+    ordenado = queryset.order_by(f'-{campo}', '-pk')
+    if request.GET.get('page'):
+        paginator = PaginatorContagemEmCache(ordenado, por_pagina, total=total)
+        return paginator.get_page(request.GET['page'])
+
+    cursor = decodificar_cursor(request.GET.get('cursor'))
+    if cursor is None:
+        itens = list(ordenado[:por_pagina + 1])
+        tem_proxima, tem_anterior = len(itens) > por_pagina, False
+        itens = itens[:por_pagina]
+    else:
+        valor, pk, direcao = cursor
+        if direcao == 'p':
+            itens = list(ordenado.filter(
+                Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'pk__lt': pk})
+            )[:por_pagina + 1])
+            tem_proxima, tem_anterior = len(itens) > por_pagina, True
+            itens = itens[:por_pagina]
+        else:
+            # Voltando: busca em ordem crescente a partir do cursor e inverte
+            itens = list(queryset.order_by(campo, 'pk').filter(
+                Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'pk__gt': pk})
+            )[:por_pagina + 1])
+            tem_proxima, tem_anterior = True, len(itens) > por_pagina
+            itens = itens[:por_pagina][::-1]
+
+    if not itens:
+        return PaginaCursor(itens)
+    primeiro, ultimo = itens[0], itens[-1]
+    return PaginaCursor(
+        itens,
+        cursor_proximo=codificar_cursor(getattr(ultimo, campo), ultimo.pk, 'p') if tem_proxima else None,
+        cursor_anterior=codificar_cursor(getattr(primeiro, campo), primeiro.pk, 'a') if tem_anterior else None,
+    )
+
+
+def parametros_sem_pagina(request):
+    """Query string atual sem page/cursor, para montar os links de paginação"""
+    parametros = request.GET.copy()
+    parametros.pop('page', None)
+    parametros.pop('cursor', None)
+    return parametros.urlencode()
@@ -0,0 +1,180 @@
+"""
+Manutenção incremental de ResumoVendaDiario.
+
+Cada venda contribui para as linhas da sua chave (dia, status, forma de
+pagamento, usuário): uma linha sem produto com o número de vendas e o valor
+total, e uma linha por produto com quantidade e valor. Os sinais em
+core/signals.py aplicam apenas as diferenças de cada alteração, com F(), na
+mesma transação da alteração. Operações que não disparam sinais (update() ou
+bulk_create() em vendas/itens) devem chamar estas funções diretamente, ou o
+resumo deve ser reconstruído com o comando reconstruir_resumo_vendas.
+"""
+from datetime import datetime
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import cache_versionado
+from .models import ItemVenda, ResumoVendaDiario, Venda
+
+CAMPOS_CHAVE = ('data_venda', 'status', 'forma_pagamento_id', 'usuario_id')
+
+
+def chave_venda(venda):
+    """Chave do resumo a partir de uma Venda (ou dict com CAMPOS_CHAVE)"""
+    if isinstance(venda, dict):
+        dados = venda
+    else:
+        dados = {campo: getattr(venda, campo) for campo in CAMPOS_CHAVE}
+    return {
+        'data': timezone.localdate(dados['data_venda']),
+        'status': dados['status'],
+        'forma_pagamento_id': dados['forma_pagamento_id'],
+        'usuario_id': dados['usuario_id'],
+    }
+
+
+def chave_gravada(venda_id):
+    """Chave atual da venda no banco (None se a venda não existe)"""
+    dados = Venda.objects.filter(pk=venda_id).values(*CAMPOS_CHAVE).first()
+    return chave_venda(dados) if dados else None
+
+
+def _somar_linhas(chave, linhas):
+    """
+    Soma [(produto_id, vendas, quantidade, valor)] nas linhas da chave com
+    INSERT ... ON CONFLICT DO UPDATE (executemany): cria ou atualiza cada linha
+    numa instrução só, sem a janela entre o UPDATE e o INSERT em que outra
+    transação criaria a mesma linha. O alvo do conflito são as expressões do
+    índice único resumo_venda_diario_unico. Retorna False se o banco não tem upsert.
+    """
+    conexao = connections[router.db_for_write(ResumoVendaDiario)]
+    if not conexao.features.supports_update_conflicts_with_target:
+        return False
+    nome = conexao.ops.quote_name
+    tabela = nome(ResumoVendaDiario._meta.db_table)
+    campo = ResumoVendaDiario._meta.get_field
+    data = campo('data').get_db_prep_save(chave['data'], conexao)
+    with conexao.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {tabela} ({nome("data")}, {nome("status")}, {nome("produto_id")}, '
+            f'{nome("forma_pagamento_id")}, {nome("usuario_id")}, {nome("numero_vendas")}, '
+            f'{nome("quantidade")}, {nome("valor")}) '
+            f'VALUES (%s, %s, %s, %s, %s, %s, %s, CAST(%s AS NUMERIC)) '
+            f'ON CONFLICT ({nome("data")}, {nome("status")}, COALESCE({nome("produto_id")}, 0), '
+            f'COALESCE({nome("forma_pagamento_id")}, 0), {nome("usuario_id")}) DO UPDATE SET '
+            f'{nome("numero_vendas")} = {tabela}.{nome("numero_vendas")} + EXCLUDED.{nome("numero_vendas")}, '
+            f'{nome("quantidade")} = {tabela}.{nome("quantidade")} + EXCLUDED.{nome("quantidade")}, '
+            f'{nome("valor")} = {tabela}.{nome("valor")} + EXCLUDED.{nome("valor")}',
+            [(data, chave['status'], produto_id, chave['forma_pagamento_id'], chave['usuario_id'], vendas,
+              quantidade, campo('valor').get_db_prep_save(valor, conexao))
+             for produto_id, vendas, quantidade, valor in linhas],
+        )
+    return True
+
+
+def acumular(chave, produto_id=None, vendas=0, quantidade=0, valor=0):
+    """Soma os deltas na linha do resumo, criando-a se ainda não existir"""
+    if not (vendas or quantidade or valor):
+        return
+    if _somar_linhas(chave, [(produto_id, vendas, quantidade, valor)]):
+        return
+    filtro = dict(chave, produto_id=produto_id)
+    atualizadas = ResumoVendaDiario.objects.filter(**filtro).update(
+        numero_vendas=F('numero_vendas') + vendas,
+        quantidade=F('quantidade') + quantidade,
+        valor=F('valor') + valor,
+    )
+    if not atualizadas:
+        ResumoVendaDiario.objects.create(**filtro, numero_vendas=vendas, quantidade=quantidade, valor=valor)
+
+
+def acumular_produtos(chave, deltas):
+    """
+    acumular() das linhas de vários produtos da mesma chave, com número fixo de
+    consultas: {produto_id: (quantidade, valor)}. Com upsert, uma instrução
+    parametrizada (executemany) para todas; sem ele, as linhas existentes são
+    atualizadas por um UPDATE parametrizado e as que faltam, criadas com bulk_create.
+    """
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    if _somar_linhas(chave, [(produto_id, 0, quantidade, valor)
+                             for produto_id, (quantidade, valor) in sorted(deltas.items())]):
+        return
+    existentes = dict(ResumoVendaDiario.objects.filter(**chave, produto_id__in=list(deltas))
+                      .values_list('produto_id', 'pk'))
+    if existentes:
+        conexao = connections[router.db_for_write(ResumoVendaDiario)]
+        nome = conexao.ops.quote_name
+        valor_campo = ResumoVendaDiario._meta.get_field('valor')
+        with conexao.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {nome(ResumoVendaDiario._meta.db_table)} '
+                f'SET {nome("quantidade")} = {nome("quantidade")} + %s, '
+                f'{nome("valor")} = {nome("valor")} + CAST(%s AS NUMERIC) WHERE {nome("id")} = %s',
+                [(quantidade, valor_campo.get_db_prep_save(valor, conexao), existentes[produto_id])
+                 for produto_id, (quantidade, valor) in deltas.items() if produto_id in existentes],
+            )
+    ResumoVendaDiario.objects.bulk_create([
+        ResumoVendaDiario(**chave, produto_id=produto_id, numero_vendas=0, quantidade=quantidade, valor=valor)
+        for produto_id, (quantidade, valor) in deltas.items() if produto_id not in existentes
+    ])
+
+
+def aplicar_venda(chave, venda_id, sinal, contar_venda=True):
+    """Soma (sinal=1) ou subtrai (sinal=-1) a contribuição completa de uma venda"""
+    itens = (ItemVenda.objects.filter(venda_id=venda_id)
+             .values('produto_id').order_by()
+             .annotate(total_quantidade=Sum('quantidade'),
+                       total_valor=Sum(F('quantidade') * F('preco_unitario'))))
+    deltas = {linha['produto_id']: (sinal * linha['total_quantidade'], sinal * linha['total_valor'])
+              for linha in itens}
+    acumular_produtos(chave, deltas)
+    valor_venda = sum(linha['total_valor'] for linha in itens)
+    acumular(chave, vendas=sinal if contar_venda else 0, valor=sinal * valor_venda)
+
+
+def aplicar_item(chave, produto_id, quantidade, preco_unitario, sinal):
+    """Soma ou subtrai um único item no resumo"""
+    valor = quantidade * preco_unitario
+    acumular(chave, produto_id, quantidade=sinal * quantidade, valor=sinal * valor)
+    acumular(chave, valor=sinal * valor)
+
+
+@transaction.atomic
+def reconstruir(desde=None):
+    """Recalcula o resumo a partir das vendas (todas, ou a partir da data informada)"""
+    resumos = ResumoVendaDiario.objects.all()
+    vendas = Venda.objects.all()
+    itens = ItemVenda.objects.all()
+    if desde:
+        inicio = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+        resumos = resumos.filter(data__gte=desde)
+        vendas = vendas.filter(data_venda__gte=inicio)
+        itens = itens.filter(venda__data_venda__gte=inicio)
+    resumos.delete()
+
+    linhas = [
+        ResumoVendaDiario(produto_id=None, quantidade=0, **linha)
+        for linha in vendas.values(
+            'status', 'forma_pagamento_id', 'usuario_id', data=TruncDate('data_venda')
+        ).order_by().annotate(numero_vendas=Count('id'), valor=Sum('valor_itens'))
+    ]
+    linhas += [
+        ResumoVendaDiario(
+            data=linha['data'], status=linha['venda__status'], produto_id=linha['produto_id'],
+            forma_pagamento_id=linha['venda__forma_pagamento_id'], usuario_id=linha['venda__usuario_id'],
+            numero_vendas=0, quantidade=linha['total_quantidade'], valor=linha['total_valor'],
+        )
+        for linha in itens.values(
+            'venda__status', 'venda__forma_pagamento_id', 'venda__usuario_id', 'produto_id',
+            data=TruncDate('venda__data_venda'),
+        ).order_by().annotate(total_quantidade=Sum('quantidade'),
+                             total_valor=Sum(F('quantidade') * F('preco_unitario')))
+    ]
+    ResumoVendaDiario.objects.bulk_create(linhas, batch_size=1000)
+    cache_versionado.invalidar(cache_versionado.VENDAS)
+    return len(linhas)
@@ -0,0 +1,212 @@
+"""
+Banco de leitura para relatórios (réplica), alias 'relatorios'.
+
+Com RELATORIOS_DB_NAME configurado, as views de relatório (dashboard,
+listagens e exportações, VIEWS_RELATORIOS) leem da réplica e as demais, que
+gravam ou precisam do dado mais recente, continuam no banco padrão. Escritas
+sempre vão para o padrão, e leituras dentro de uma transação também: a réplica
+não enxerga o que a transação ainda não gravou.
+
+- Ler a própria escrita: depois de um POST bem-sucedido, o navegador recebe o
+  cookie COOKIE_PADRAO e as próximas requisições do usuário leem do padrão até
+  a réplica alcançá-lo (RELATORIOS_ATRASO_MAXIMO segundos). Em código,
+  `with ler_do_padrao():` faz o mesmo.
+- Atraso da replicação: o comando replicar_relatorios grava um pulso
+  (PulsoReplicacao) no banco padrão; a réplica recebe o pulso junto com os
+  dados, e o atraso é a idade do pulso lido nela. Acima do máximo, ou sem
+  pulso, os relatórios voltam para o padrão até a próxima verificação.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+RELATORIOS = 'relatorios'
+COOKIE_PADRAO = 'ler_do_padrao'
+ATRASO_MAXIMO = getattr(settings, 'RELATORIOS_ATRASO_MAXIMO', 30)
+VERIFICAR_A_CADA = getattr(settings, 'RELATORIOS_VERIFICAR_A_CADA', 5)
+
+# Views só de leitura que toleram dados com alguns segundos de atraso
+VIEWS_RELATORIOS = {
+    'dashboard',
+    'produto_list',
+    'movimentacao_list',
+    'movimentacao_exportar',
+    'recebimento_list',
+    'fornecedor_list',
+    'cliente_list',
+    'categoria_list',
+    'forma_pagamento_list',
+    'venda_list',
+    'venda_exportar',
+    'contas_receber_list',
+    'contas_receber_exportar',
+}
+
+logger = logging.getLogger(__name__)
+
+_banco_leitura = ContextVar('banco_leitura', default=None)
+
+
+def replica_configurada():
+    """True se o alias de relatórios existe e aponta para outro banco (nos testes ele espelha o padrão)"""
+    if RELATORIOS not in settings.DATABASES:
+        return False
+    relatorios = connections[RELATORIOS].settings_dict
+    padrao = connections[DEFAULT_DB_ALIAS].settings_dict
+    return (relatorios['NAME'], relatorios.get('HOST')) != (padrao['NAME'], padrao.get('HOST'))
+
+
+class _Atraso:
+    """Última medição do atraso da réplica no processo"""
+
+    def __init__(self):
+        self.segundos = None
+        self.medido_em = None
+        self._trava = threading.Lock()
+
+    def atual(self):
+        agora = time.monotonic()
+        if self.medido_em is None or agora - self.medido_em >= VERIFICAR_A_CADA:
+            with self._trava:
+                if self.medido_em is None or agora - self.medido_em >= VERIFICAR_A_CADA:
+                    self.segundos = medir_atraso()
+                    self.medido_em = agora
+                    if self.segundos is None or self.segundos > ATRASO_MAXIMO:
+                        logger.warning('Réplica de relatórios atrasada (%s s); relatórios lidos do banco padrão.',
+                                       self.segundos)
+        return self.segundos
+
+    def limpar(self):
+        self.medido_em = None
+
+
+atraso = _Atraso()
+
+
+def medir_atraso():
+    """Idade, em segundos, do pulso lido na réplica; None se não houver pulso ou a réplica falhar"""
+    from .models import PulsoReplicacao
+
+    try:
+        momento = PulsoReplicacao.objects.using(RELATORIOS).values_list('momento', flat=True).first()
+    except DatabaseError as erro:
+        logger.warning('Réplica de relatórios indisponível: %s', erro)
+        return None
+    if momento is None:
+        return None
+    return max((timezone.now() - momento).total_seconds(), 0.0)
+
+
+def replica_em_dia():
+    segundos = atraso.atual()
+    return segundos is not None and segundos <= ATRASO_MAXIMO
+
+
+def gravar_pulso():
+    """Grava no banco padrão o momento atual, que a réplica recebe com os dados"""
+    from .models import PulsoReplicacao
+
+    PulsoReplicacao.objects.update_or_create(pk=1, defaults={'momento': timezone.now()})
+
+
+def copiar_sqlite():
+    """Copia o banco padrão para o arquivo da réplica (backup online do SQLite), simulando a replicação"""
+    origem = connections[DEFAULT_DB_ALIAS]
+    origem.ensure_connection()
+    destino = sqlite3.connect(connections[RELATORIOS].settings_dict['NAME'])
+    try:
+        origem.connection.backup(destino)
+    finally:
+        destino.close()
+
+
+def banco_da_view(nome_url, request=None):
+    """Alias de onde a view lê: a réplica só para relatórios, sem cookie de leitura do padrão e em dia"""
+    if nome_url not in VIEWS_RELATORIOS or not replica_configurada():
+        return DEFAULT_DB_ALIAS
+    if request is not None and request.COOKIES.get(COOKIE_PADRAO):
+        return DEFAULT_DB_ALIAS
+    return RELATORIOS if replica_em_dia() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def ler_de(alias):
+    token = _banco_leitura.set(alias)
+    try:
+        yield
+    finally:
+        _banco_leitura.reset(token)
+
+
+def ler_do_padrao():
+    """Dentro do bloco as leituras vão para o banco padrão, mesmo numa view de relatório"""
+    return ler_de(DEFAULT_DB_ALIAS)
+
+
+class RoteadorRelatorios:
+    """Leituras no banco escolhido para a requisição (ver RoteamentoMiddleware); escritas no padrão"""
+
+    def db_for_read(self, model, **hints):
+        alias = _banco_leitura.get()
+        if alias is None or alias == DEFAULT_DB_ALIAS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label != 'core':
+            # Sessão e usuário logado acabaram de ser gravados no login
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema junto com os dados
+        return db != RELATORIOS
+
+
+def _conteudo_lido_de(conteudo, alias):
+    """Gera o conteúdo de uma resposta em streaming lendo do alias (as consultas acontecem aqui)"""
+    iterador = iter(conteudo)
+    while True:
+        with ler_de(alias):
+            try:
+                parte = next(iterador)
+            except StopIteration:
+                return
+        yield parte
+
+
+class RoteamentoMiddleware:
+    """Escolhe o banco de leitura de cada requisição e marca quem acabou de gravar"""
+
+    METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _banco_leitura.set(None)
+        try:
+            resposta = self.get_response(request)
+            alias = _banco_leitura.get()
+            if alias and resposta.streaming:
+                resposta.streaming_content = _conteudo_lido_de(resposta.streaming_content, alias)
+        finally:
+            _banco_leitura.reset(token)
+
+        if request.method not in self.METODOS_LEITURA and resposta.status_code < 400 and replica_configurada():
+            resposta.set_cookie(COOKIE_PADRAO, '1', max_age=ATRASO_MAXIMO, httponly=True, samesite='Lax')
+        return resposta
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        nome_url = request.resolver_match.url_name if request.resolver_match else None
+        _banco_leitura.set(banco_da_view(nome_url, request))
@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import busca, cache_versionado, codigos, indicadores, resumos
+from .models import Cliente, ContasReceber, Fornecedor, ItemVenda, Pagamento, Produto, Venda
+
+CAMPOS_ESTOQUE_MINIMO = {'ativo', 'estoque_atual', 'estoque_minimo'}
+CAMPOS_CATALOGO = {'ativo', 'preco_venda', 'estoque_atual', 'unidade_medida'}
+CAMPOS_CODIGOS = {'ativo', 'codigo', 'nome', 'preco_venda', 'unidade_medida'}
+CAMPOS_SALDO_CONTA = {'status', 'valor_total', 'valor_pago'}
+
+_itens_suspensos = ContextVar('itens_suspensos', default=False)
+
+
+@contextmanager
+def sinais_de_item_suspensos():
+    """
+    Desliga os receptores de totais e resumo de ItemVenda enquanto o bloco
+    roda, para quem aplica essas diferenças uma vez só (vendas.atualizar_itens).
+    Só os receptores que consultam a marca são desligados; cascatas e os
+    demais receptores (versões do cache) continuam valendo.
+    """
+    marca = _itens_suspensos.set(True)
+    try:
+        yield
+    finally:
+        _itens_suspensos.reset(marca)
+
+
+def _atualizar_totais_venda(sender, instance):
+    """Recalcula os totais da venda ligada ao item/pagamento alterado"""
+    if not instance.venda_id:
+        return
+
+    # Reaproveitar a instância da venda já carregada, para que quem a está
+    # usando (views, formsets) enxergue os totais novos sem consultar de novo
+    if sender._meta.get_field('venda').is_cached(instance):
+        venda = instance.venda
+    else:
+        venda = Venda(pk=instance.venda_id)
+    venda.recalcular_totais()
+
+
+@receiver(post_save, sender=ItemVenda)
+@receiver(post_delete, sender=ItemVenda)
+@receiver(post_save, sender=Pagamento)
+@receiver(post_delete, sender=Pagamento)
+def atualizar_totais_venda(sender, instance, **kwargs):
+    if sender is ItemVenda and _itens_suspensos.get():
+        return
+    _atualizar_totais_venda(sender, instance)
+
+
+# ===== Resumo diário de vendas =====
+
+@receiver(pre_save, sender=Venda)
+def guardar_chave_resumo_venda(sender, instance, **kwargs):
+    instance._chave_resumo_anterior = None if instance._state.adding else resumos.chave_gravada(instance.pk)
+
+
+@receiver(post_save, sender=Venda)
+def atualizar_resumo_venda(sender, instance, created, **kwargs):
+    chave = resumos.chave_venda(instance)
+    anterior = getattr(instance, '_chave_resumo_anterior', None)
+    if created:
+        resumos.acumular(chave, vendas=1)
+    elif anterior and anterior != chave:
+        # Mudou dia/status/forma/usuário: mover a venda inteira de linha
+        resumos.aplicar_venda(anterior, instance.pk, -1)
+        resumos.aplicar_venda(chave, instance.pk, 1)
+
+
+@receiver(post_delete, sender=Venda)
+def remover_venda_resumo(sender, instance, **kwargs):
+    # Os itens já foram subtraídos pelos próprios sinais (são excluídos antes da venda)
+    resumos.acumular(resumos.chave_venda(instance), vendas=-1)
+
+
+@receiver(pre_save, sender=ItemVenda)
+def guardar_item_anterior(sender, instance, **kwargs):
+    instance._item_anterior = None
+    if _itens_suspensos.get():
+        return
+    if not instance._state.adding:
+        instance._item_anterior = (ItemVenda.objects.filter(pk=instance.pk)
+                                   .values('produto_id', 'quantidade', 'preco_unitario').first())
+
+
+@receiver(post_save, sender=ItemVenda)
+def atualizar_resumo_item(sender, instance, **kwargs):
+    if _itens_suspensos.get():
+        return
+    chave = resumos.chave_gravada(instance.venda_id)
+    anterior = getattr(instance, '_item_anterior', None)
+    if anterior:
+        resumos.aplicar_item(chave, anterior['produto_id'], anterior['quantidade'], anterior['preco_unitario'], -1)
+    resumos.aplicar_item(chave, instance.produto_id, instance.quantidade, instance.preco_unitario, 1)
+
+
+@receiver(post_delete, sender=ItemVenda)
+def remover_item_resumo(sender, instance, **kwargs):
+    if _itens_suspensos.get():
+        return
+    chave = resumos.chave_gravada(instance.venda_id)
+    if chave:
+        resumos.aplicar_item(chave, instance.produto_id, instance.quantidade, instance.preco_unitario, -1)
+
+
+# ===== Versões do cache (core/cache_versionado.py) =====
+
+def invalidar_cache(sender, **kwargs):
+    cache_versionado.invalidar(*cache_versionado.GRUPOS_POR_MODELO[sender])
+
+
+for _modelo in cache_versionado.GRUPOS_POR_MODELO:
+    post_save.connect(invalidar_cache, sender=_modelo, dispatch_uid=f'cache_{_modelo._meta.model_name}_save')
+    post_delete.connect(invalidar_cache, sender=_modelo, dispatch_uid=f'cache_{_modelo._meta.model_name}_delete')
+
+
+# ===== Indicadores do negócio =====
+
+def _altera(campos, update_fields):
+    return update_fields is None or bool(campos & set(update_fields))
+
+
+@receiver(pre_save, sender=Produto)
+def guardar_produto_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._abaixo_minimo_anterior = None
+    if _altera(CAMPOS_ESTOQUE_MINIMO, update_fields):
+        instance._abaixo_minimo_anterior = 0 if instance._state.adding else (
+            Produto.objects.abaixo_do_minimo().filter(pk=instance.pk).count())
+
+
+@receiver(post_save, sender=Produto)
+def atualizar_indicador_produto(sender, instance, update_fields=None, **kwargs):
+    deltas = {}
+    anterior = getattr(instance, '_abaixo_minimo_anterior', None)
+    if anterior is not None:
+        deltas[indicadores.PRODUTOS_ABAIXO_MINIMO] = indicadores.abaixo_do_minimo(instance) - anterior
+    if _altera(CAMPOS_CATALOGO, update_fields):
+        deltas[indicadores.VERSAO_CATALOGO] = 1
+    if _altera(CAMPOS_CODIGOS, update_fields):
+        deltas[indicadores.VERSAO_CODIGOS] = 1
+        codigos.invalidar()
+    indicadores.somar(deltas)
+
+
+@receiver(pre_delete, sender=Produto)
+def guardar_produto_excluido(sender, instance, **kwargs):
+    # O estoque é alterado por UPDATE (core/estoque.py): a instância pode estar desatualizada
+    instance._abaixo_minimo_anterior = Produto.objects.abaixo_do_minimo().filter(pk=instance.pk).count()
+
+
+@receiver(post_delete, sender=Produto)
+def remover_indicador_produto(sender, instance, **kwargs):
+    indicadores.somar({indicadores.PRODUTOS_ABAIXO_MINIMO: -getattr(instance, '_abaixo_minimo_anterior', 0),
+                       indicadores.VERSAO_CATALOGO: 1, indicadores.VERSAO_CODIGOS: 1})
+    codigos.invalidar()
+
+
+@receiver(pre_save, sender=ContasReceber)
+def guardar_conta_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._conta_anterior = None
+    if not _altera(CAMPOS_SALDO_CONTA, update_fields):
+        return
+    anterior = None if instance._state.adding else (
+        ContasReceber.objects.filter(pk=instance.pk).values_list('status', 'valor_total', 'valor_pago').first())
+    instance._conta_anterior = indicadores.conta_em_aberto(*anterior) if anterior else (0, 0)
+
+
+@receiver(post_save, sender=ContasReceber)
+def atualizar_indicador_conta(sender, instance, **kwargs):
+    anterior = getattr(instance, '_conta_anterior', None)
+    if anterior is None:
+        return
+    contas, saldo = indicadores.conta_em_aberto(instance.status, instance.valor_total, instance.valor_pago)
+    # As duas linhas são disputadas por todas as contas: sem diferença, nem chama somar()
+    if (contas, saldo) != tuple(anterior):
+        indicadores.somar({indicadores.CONTAS_ABERTAS: contas - anterior[0],
+                           indicadores.SALDO_CONTAS: saldo - anterior[1]})
+
+
+@receiver(post_delete, sender=ContasReceber)
+def remover_indicador_conta(sender, instance, **kwargs):
+    contas, saldo = indicadores.conta_em_aberto(instance.status, instance.valor_total, instance.valor_pago)
+    if contas or saldo:
+        indicadores.somar({indicadores.CONTAS_ABERTAS: -contas, indicadores.SALDO_CONTAS: -saldo})
+
+
+# ===== Índice de busca (FTS5) =====
+
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=Cliente)
+@receiver(post_save, sender=Fornecedor)
+def indexar_busca(sender, instance, **kwargs):
+    busca.indexar(instance)
+
+
+@receiver(post_delete, sender=Produto)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Fornecedor)
+def remover_busca(sender, instance, **kwargs):
+    busca.remover(sender, instance.pk)
+
@@ -1,6 +1,41 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from .models import Categoria, Produto, MovimentacaoEstoque
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete
+from django.urls import reverse
+from django.utils import timezone
+from estoque_agua import desempenho
+from estoque_agua.sqlite.base import DatabaseWrapper
+
+from . import busca, cache_versionado, carga, codigos, indicadores, metricas, resumos, roteamento, vendas, views
+from .benchmarks import cenarios, comparacao, medicao
+from .limites_consultas import LIMITES, LimiteConsultasExcedido, limitar_consultas, relatorio
+from .forms import PagamentoContaForm
+from .filtros import filtrar_vendas
+from .estoque import (EstoqueInsuficiente, aplicar_deltas, bloquear_produtos, definir_estoque, estornar_recebimento,
+                      registrar_recebimento)
+from .models import (Categoria, Cliente, ContasReceber, Fornecedor, Produto, MovimentacaoEstoque, FormaPagamento,
+                     Venda, ItemVenda, Pagamento, PagamentoConta, SequenciaVenda, ResumoVendaDiario,
+                     RecebimentoEstoque)
 
 class ProdutoTestCase(TestCase):
     def setUp(self):
@@ -24,3 +59,1789 @@ class ProdutoTestCase(TestCase):
         self.produto.estoque_atual = 5
         self.produto.save()
         self.assertTrue(self.produto.estoque_baixo)
+
+
+class VendaTotaisTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        self.categoria = Categoria.objects.create(nome='Água')
+        self.produto = Produto.objects.create(
+            nome='Galão 20L', categoria=self.categoria, codigo='GAL20L',
+            preco_venda=15, preco_custo=10, estoque_atual=50
+        )
+        self.forma = FormaPagamento.objects.create(nome='Dinheiro')
+        self.venda = Venda.objects.create(usuario=self.usuario)
+
+    def test_totais_acompanham_itens_e_pagamentos(self):
+        item = ItemVenda.objects.create(venda=self.venda, produto=self.produto, quantidade=3, preco_unitario=15)
+        ItemVenda.objects.create(venda=self.venda, produto=self.produto, quantidade=1, preco_unitario=Decimal('2.50'))
+        Pagamento.objects.create(venda=self.venda, forma_pagamento=self.forma, valor_pago=20, usuario=self.usuario)
+
+        self.assertEqual(self.venda.valor_total, Decimal('47.50'))
+        self.assertEqual(self.venda.quantidade_total_itens, 4)
+        self.assertEqual(self.venda.total_itens, 2)
+        self.assertEqual(self.venda.valor_pendente, Decimal('27.50'))
+
+        item.delete()
+        venda = Venda.objects.get(pk=self.venda.pk)
+        self.assertEqual(venda.valor_total, Decimal('2.50'))
+        self.assertEqual(venda.total_itens, 1)
+
+    def test_save_de_instancia_antiga_nao_sobrescreve_totais(self):
+        antiga = Venda.objects.get(pk=self.venda.pk)
+        ItemVenda.objects.create(venda=self.venda, produto=self.produto, quantidade=2, preco_unitario=15)
+
+        antiga.observacao = 'Entregar à tarde'
+        antiga.save()
+
+        venda = Venda.objects.get(pk=self.venda.pk)
+        self.assertEqual(venda.valor_total, Decimal('30.00'))
+        self.assertEqual(venda.observacao, 'Entregar à tarde')
+
+    def test_comando_recalcula_e_verifica(self):
+        ItemVenda.objects.create(venda=self.venda, produto=self.produto, quantidade=2, preco_unitario=15)
+        Venda.objects.filter(pk=self.venda.pk).update(valor_itens=0, numero_itens=0)
+
+        with self.assertRaises(CommandError):
+            call_command('recalcular_totais_vendas', '--verificar', stdout=StringIO())
+
+        call_command('recalcular_totais_vendas', stdout=StringIO())
+        call_command('recalcular_totais_vendas', '--verificar', stdout=StringIO())
+        self.assertEqual(Venda.objects.get(pk=self.venda.pk).valor_total, Decimal('30.00'))
+
+
+class EstoqueServicoTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        self.categoria = Categoria.objects.create(nome='Água')
+        self.galao = Produto.objects.create(
+            nome='Galão 20L', categoria=self.categoria, codigo='GAL20L',
+            preco_venda=15, preco_custo=10, estoque_atual=10
+        )
+        self.copo = Produto.objects.create(
+            nome='Copo 200ml', categoria=self.categoria, codigo='COPO200',
+            preco_venda=1, preco_custo=Decimal('0.50'), estoque_atual=3
+        )
+
+    def test_aplicar_deltas_e_tudo_ou_nada(self):
+        aplicar_deltas({self.galao.pk: -4, self.copo.pk: 2})
+        self.galao.refresh_from_db()
+        self.copo.refresh_from_db()
+        self.assertEqual((self.galao.estoque_atual, self.copo.estoque_atual), (6, 5))
+
+        with self.assertRaises(EstoqueInsuficiente) as contexto:
+            aplicar_deltas({self.galao.pk: -1, self.copo.pk: -6})
+        self.assertEqual(contexto.exception.produto, self.copo)
+        self.assertEqual(contexto.exception.disponivel, 5)
+
+        self.galao.refresh_from_db()
+        self.assertEqual(self.galao.estoque_atual, 6)
+
+    def test_update_unico_confere_o_estoque_no_banco(self):
+        # Produtos lidos antes de outra baixa: o WHERE do UPDATE recusa a saída e nada muda
+        produtos = bloquear_produtos([self.galao.pk, self.copo.pk])
+        Produto.objects.filter(pk=self.copo.pk).update(estoque_atual=1)
+        with self.assertRaises(EstoqueInsuficiente) as contexto:
+            aplicar_deltas({self.galao.pk: -4, self.copo.pk: -2}, produtos)
+        self.assertEqual((contexto.exception.produto, contexto.exception.disponivel), (self.copo, 1))
+        self.assertEqual(list(Produto.objects.order_by('pk').values_list('estoque_atual', flat=True)), [10, 1])
+
+    def test_venda_baixa_estoque_do_carrinho_inteiro(self):
+        self.client.force_login(self.usuario)
+        dados = {
+            'data_venda': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+            'status': 'aberta',
+            'itens-TOTAL_FORMS': '2', 'itens-INITIAL_FORMS': '0',
+            'itens-MIN_NUM_FORMS': '1', 'itens-MAX_NUM_FORMS': '1000',
+            'itens-0-produto': self.galao.pk, 'itens-0-quantidade': '6', 'itens-0-preco_unitario': '15',
+            'itens-1-produto': self.galao.pk, 'itens-1-quantidade': '6', 'itens-1-preco_unitario': '15',
+        }
+        self.client.post(reverse('venda_create'), dados)
+        self.galao.refresh_from_db()
+        self.assertEqual(self.galao.estoque_atual, 10)
+        self.assertFalse(Venda.objects.exists())
+
+        dados['itens-1-quantidade'] = '4'
+        self.client.post(reverse('venda_create'), dados)
+        self.galao.refresh_from_db()
+        self.assertEqual(self.galao.estoque_atual, 0)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(produto=self.galao, tipo='saida').count(), 2)
+
+
+class EstoqueConcorrenciaTestCase(TransactionTestCase):
+    def test_estoque_exato_com_varios_processos(self):
+        # Banco de testes em arquivo (DATABASES['default']['TEST']['NAME']): os processos o compartilham
+        if connection.vendor == 'sqlite':
+            self.assertFalse(connection.is_in_memory_db())
+        call_command('estresse_estoque', processos=4, operacoes=50, seed=42, stdout=StringIO())
+
+
+class NumeracaoVendaTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+
+    def test_numeracao_sequencial(self):
+        SequenciaVenda.objects.create(prefixo='VD', ultimo_numero=41)
+        primeira = Venda.objects.create(usuario=self.usuario)
+        segunda = Venda.objects.create(usuario=self.usuario)
+        self.assertEqual((primeira.numero_venda, segunda.numero_venda), ('VD000042', 'VD000043'))
+
+    @override_settings(VENDA_NUMERACAO='diaria', VENDA_PREFIXO_LOJA='L2')
+    def test_numeracao_diaria_por_loja(self):
+        data = timezone.make_aware(datetime(2025, 3, 9, 10, 30))
+        venda = Venda.objects.create(usuario=self.usuario, data_venda=data)
+        self.assertEqual(venda.numero_venda, 'VDL2202503090001')
+
+
+class PlanosConsultaTestCase(TestCase):
+    # Vendas, itens, contas e movimentações acima do limite; cadastros (produtos, clientes) abaixo
+    LIMITE = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username='admin', password='admin123')
+        call_command('criar_sistema_completo', escala='2000', seed=1, dias=90, stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def verificar(self, saida=None):
+        saida = saida or StringIO()
+        call_command('verificar_planos_consulta', limite_linhas=self.LIMITE, stdout=saida)
+        return saida.getvalue()
+
+    def test_views_sem_varredura_em_tabelas_grandes(self):
+        for model in (Venda, ItemVenda, ContasReceber, MovimentacaoEstoque):
+            self.assertGreater(model.objects.count(), self.LIMITE, model.__name__)
+        self.assertIn('Nenhuma varredura completa', self.verificar())
+
+    def test_regressoes_sao_apontadas(self):
+        def agregado_da_tabela(parametros):
+            return Venda.objects.aggregate(numero_vendas=Count('id'), valor_total=Sum('valor_itens'))
+
+        def limit_sem_indice(parametros):
+            # LIMIT não basta: sem índice o SQLite percorre a tabela até achar a linha
+            list(Venda.objects.filter(observacao='nenhuma').order_by()[:1])
+            return {'numero_vendas': 0, 'valor_total': 0}
+
+        for regressao in (agregado_da_tabela, limit_sem_indice):
+            saida = StringIO()
+            with self.subTest(regressao.__name__), patch.object(views, '_totais_vendas', regressao):
+                with self.assertRaises(CommandError):
+                    self.verificar(saida)
+                self.assertIn('venda_list (/vendas/): varredura completa em core_venda', saida.getvalue())
+
+
+class ResumoVendaDiarioTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        categoria = Categoria.objects.create(nome='Água')
+        self.galao = Produto.objects.create(nome='Galão 20L', categoria=categoria, codigo='GAL20L',
+                                            preco_venda=15, preco_custo=10, estoque_atual=50)
+        self.copo = Produto.objects.create(nome='Copo 200ml', categoria=categoria, codigo='COPO200',
+                                           preco_venda=1, preco_custo=Decimal('0.50'), estoque_atual=50)
+        self.forma = FormaPagamento.objects.create(nome='PIX')
+
+    def linhas(self):
+        return sorted(
+            (r.data, r.status, r.produto_id or 0, r.forma_pagamento_id or 0, r.numero_vendas, r.quantidade, r.valor)
+            for r in ResumoVendaDiario.objects.all()
+            if r.numero_vendas or r.quantidade or r.valor
+        )
+
+    def test_resumo_incremental_igual_a_reconstrucao(self):
+        venda = Venda.objects.create(usuario=self.usuario, forma_pagamento=self.forma)
+        item = ItemVenda.objects.create(venda=venda, produto=self.galao, quantidade=2, preco_unitario=15)
+        ItemVenda.objects.create(venda=venda, produto=self.copo, quantidade=10, preco_unitario=1)
+        venda.status = 'finalizada'
+        venda.save()
+
+        outra = Venda.objects.create(usuario=self.usuario, status='finalizada')
+        ItemVenda.objects.create(venda=outra, produto=self.galao, quantidade=1, preco_unitario=14)
+        item.quantidade = 3
+        item.save()
+
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('dashboard'))
+        self.assertEqual(resposta.context['total_vendas_hoje'], 2)
+        self.assertEqual(resposta.context['valor_vendas_hoje'], Decimal('69.00'))
+
+        Pagamento.objects.create(venda=venda, forma_pagamento=self.forma, valor_pago=55, usuario=self.usuario)
+        venda.atualizar_status_pagamento()
+        outra.delete()
+
+        incremental = self.linhas()
+        resumos.reconstruir()
+        self.assertEqual(incremental, self.linhas())
+        self.assertEqual(
+            ResumoVendaDiario.objects.get(produto__isnull=True, status='paga').valor, Decimal('55.00')
+        )
+
+
+    def test_linha_com_nulos_e_unica(self):
+        chave = {'data': timezone.localdate(), 'status': 'aberta', 'forma_pagamento_id': None,
+                 'usuario_id': self.usuario.pk}
+        resumos.acumular(chave, vendas=1, valor=Decimal('10.50'))
+        resumos.acumular(chave, vendas=1, valor=Decimal('2.00'))
+        resumos.acumular_produtos(chave, {self.galao.pk: (2, Decimal('30'))})
+        resumos.acumular_produtos(chave, {self.galao.pk: (1, Decimal('15')), self.copo.pk: (3, Decimal('3'))})
+
+        self.assertEqual(list(ResumoVendaDiario.objects.filter(produto__isnull=True)
+                              .values_list('numero_vendas', 'valor')), [(2, Decimal('12.50'))])
+        self.assertEqual(ResumoVendaDiario.objects.get(produto=self.galao).quantidade, 3)
+        self.assertEqual(ResumoVendaDiario.objects.count(), 3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ResumoVendaDiario.objects.create(**chave, produto=None, numero_vendas=1)
+
+class MovimentacaoListTestCase(TestCase):
+    """Totais da listagem em consulta única, sem carregar as movimentações em memória"""
+    TOTAL = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='estoquista', password='estoque123')
+        categoria = Categoria.objects.create(nome='Água')
+        cls.produto = Produto.objects.create(
+            nome='Galão 20L', categoria=categoria, codigo='GAL20L',
+            preco_venda=15, preco_custo=10, estoque_atual=0
+        )
+        tipos = ['entrada', 'saida', 'ajuste', 'saida']
+        MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto=cls.produto, tipo=tipos[i % 4], quantidade=2,
+                preco_unitario=Decimal('1.50') if i % 2 else None, usuario=cls.usuario,
+            )
+            for i in range(cls.TOTAL)
+        ], batch_size=2000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_totais_com_consultas_e_memoria_limitadas(self):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('movimentacao_list'))
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertLessEqual(len(consultas), 8)
+        # Não depende do número de linhas: carregar as 20.000 movimentações passaria disso
+        self.assertLess(pico, 5 * 1024 * 1024)
+
+        totais = resposta.context['totais_por_tipo']
+        self.assertEqual(resposta.context['total_movimentacoes'], self.TOTAL)
+        self.assertEqual(resposta.context['total_quantidade'], 2 * self.TOTAL)
+        self.assertEqual(totais['entrada'], {'quantidade': 10000, 'valor': Decimal('0'), 'count': 5000})
+        self.assertEqual(totais['saida']['valor'], Decimal('30000.00'))
+
+    def test_totais_em_cache_ate_nova_movimentacao(self):
+        url = reverse('movimentacao_list') + '?tipo=entrada'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        self.assertFalse(any('SUM(' in consulta['sql'] for consulta in consultas.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimentacaoEstoque.objects.create(produto=self.produto, tipo='entrada', quantidade=7,
+                                               usuario=self.usuario)
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.context['total_quantidade'], 10007)
+
+    def test_totais_sem_periodo_cobrem_os_ultimos_dias(self):
+        antiga = MovimentacaoEstoque.objects.create(produto=self.produto, tipo='entrada', quantidade=5,
+                                                    usuario=self.usuario)
+        dias = views.DIAS_TOTAIS_MOVIMENTACOES
+        MovimentacaoEstoque.objects.filter(pk=antiga.pk).update(
+            data_movimentacao=timezone.now() - timezone.timedelta(days=dias + 1))
+
+        resposta = self.client.get(reverse('movimentacao_list'))
+        self.assertEqual(resposta.context['total_movimentacoes'], self.TOTAL)
+        self.assertEqual(resposta.context['dias_totais'], dias)
+        self.assertContains(resposta, f'Totais dos últimos {dias} dias')
+
+        inicio = (timezone.localdate() - timezone.timedelta(days=dias + 5)).isoformat()
+        resposta = self.client.get(reverse('movimentacao_list'), {'data_inicio': inicio})
+        self.assertEqual(resposta.context['total_movimentacoes'], self.TOTAL + 1)
+        self.assertIsNone(resposta.context['dias_totais'])
+
+
+
+class PaginacaoCursorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        self.client.force_login(self.usuario)
+        agora = timezone.now()
+        # Várias vendas com a mesma data: o desempate é pelo id
+        Venda.objects.bulk_create([
+            Venda(numero_venda=f'VD{i:06d}', usuario=self.usuario,
+                  data_venda=agora - timezone.timedelta(minutes=i // 3))
+            for i in range(45)
+        ])
+        resumos.reconstruir()  # bulk_create não passa pelos sinais do resumo
+        self.esperado = list(Venda.objects.order_by('-data_venda', '-pk').values_list('pk', flat=True))
+
+    def ids(self, resposta):
+        return [venda.pk for venda in resposta.context['page_obj']]
+
+    def test_percorre_todas_as_paginas_e_volta(self):
+        url = reverse('venda_list')
+        resposta = self.client.get(url)
+        paginas = [self.ids(resposta)]
+        while resposta.context['page_obj'].has_next():
+            resposta = self.client.get(url, {'cursor': resposta.context['page_obj'].cursor_proximo})
+            paginas.append(self.ids(resposta))
+        self.assertEqual([pk for pagina in paginas for pk in pagina], self.esperado)
+        self.assertEqual([len(pagina) for pagina in paginas], [20, 20, 5])
+
+        resposta = self.client.get(url, {'cursor': resposta.context['page_obj'].cursor_anterior})
+        self.assertEqual(self.ids(resposta), paginas[1])
+        resposta = self.client.get(url, {'cursor': resposta.context['page_obj'].cursor_anterior})
+        self.assertEqual(self.ids(resposta), paginas[0])
+        self.assertFalse(resposta.context['page_obj'].has_previous())
+
+    def test_paginacao_por_numero_e_cursor_invalido(self):
+        url = reverse('venda_list')
+        resposta = self.client.get(url, {'page': 3})
+        self.assertEqual(self.ids(resposta), self.esperado[40:])
+        self.assertEqual(resposta.context['page_obj'].paginator.num_pages, 3)
+
+        resposta = self.client.get(url, {'cursor': 'nao-e-um-cursor'})
+        self.assertEqual(self.ids(resposta), self.esperado[:20])
+        self.assertEqual(resposta.context['total_vendas'], 45)
+
+    def test_totais_do_resumo_iguais_aos_das_vendas(self):
+        url = reverse('venda_list')
+        Venda.objects.filter(pk__in=self.esperado[:5]).update(status='finalizada', valor_itens=10)
+        resumos.reconstruir()
+        hoje = timezone.localdate().isoformat()
+        for filtros in ({}, {'status': 'finalizada'}, {'data_inicio': hoje, 'data_fim': hoje},
+                        {'data_inicio': 'invalida'}):
+            esperado = filtrar_vendas(Venda.objects.all(), filtros).aggregate(
+                numero=Count('id'), valor=Sum('valor_itens'))
+            with CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(url, filtros)
+            self.assertEqual(resposta.context['total_vendas'], esperado['numero'])
+            self.assertEqual(resposta.context['valor_total'], esperado['valor'] or 0)
+            self.assertFalse([consulta for consulta in consultas
+                              if 'COUNT' in consulta['sql'] and 'core_venda' in consulta['sql']])
+
+
+class ContasVencidasTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='financeiro', password='fin123')
+        self.cliente = Cliente.objects.create(nome='Maria', cpf_cnpj='123', telefone='1', endereco='Rua A')
+        hoje = timezone.localdate()
+        ontem, amanha = hoje - timezone.timedelta(days=1), hoje + timezone.timedelta(days=1)
+        self.contas = {
+            nome: ContasReceber.objects.create(
+                cliente=self.cliente, valor_total=100, valor_pago=pago, data_vencimento=vencimento,
+                status=status, usuario=self.usuario,
+            )
+            for nome, status, pago, vencimento in [
+                ('aberta_vencida', 'aberto', 0, ontem),
+                ('parcial_vencida', 'parcial', 40, ontem),
+                ('aberta_em_dia', 'aberto', 0, amanha),
+                ('quitada_vencida', 'quitado', 100, ontem),
+                ('vencido_prorrogada', 'vencido', 30, amanha),
+            ]
+        }
+
+    def test_estatisticas_no_banco(self):
+        self.assertEqual(ContasReceber.objects.estatisticas(), {
+            'total_em_aberto': Decimal('330.00'),
+            'total_vencidas': Decimal('160.00'),
+            'count_vencidas': 2,
+        })
+        self.assertEqual(
+            set(ContasReceber.objects.vencidas().values_list('pk', flat=True)),
+            {self.contas['aberta_vencida'].pk, self.contas['parcial_vencida'].pk},
+        )
+
+    def test_atualizar_status_vencidas(self):
+        saida = StringIO()
+        call_command('atualizar_contas_vencidas', stdout=saida)
+        self.assertIn('2 conta(s) marcada(s)', saida.getvalue())
+
+        status = dict(ContasReceber.objects.values_list('pk', 'status'))
+        self.assertEqual(status[self.contas['aberta_vencida'].pk], 'vencido')
+        self.assertEqual(status[self.contas['parcial_vencida'].pk], 'vencido')
+        self.assertEqual(status[self.contas['aberta_em_dia'].pk], 'aberto')
+        self.assertEqual(status[self.contas['quitada_vencida'].pk], 'quitado')
+        self.assertEqual(status[self.contas['vencido_prorrogada'].pk], 'parcial')
+        # As estatísticas não mudam com o novo status
+        self.assertEqual(ContasReceber.objects.estatisticas()['count_vencidas'], 2)
+
+    def test_listagem_filtra_vencidas_no_banco(self):
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('contas_receber_list'), {'vencidas': 'sim'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['contas']), 2)
+        self.assertEqual(resposta.context['count_vencidas'], 2)
+        self.assertLessEqual(len(consultas), 6)
+
+    def test_parciais_incluem_as_vencidas(self):
+        call_command('atualizar_contas_vencidas', stdout=StringIO())
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('contas_receber_list'))
+        self.assertEqual(
+            set(conta.pk for conta in resposta.context['contas_parciais']),
+            {self.contas['parcial_vencida'].pk, self.contas['vencido_prorrogada'].pk},
+        )
+
+
+
+class QuerySetTotaisTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_superuser(username='admin', password='admin123')
+        categoria = Categoria.objects.create(nome='Água')
+        self.galao = Produto.objects.create(nome='Galão 20L', categoria=categoria, codigo='GAL20L',
+                                            preco_venda=15, preco_custo=Decimal('7.50'), estoque_atual=4)
+        self.garrafa = Produto.objects.create(nome='Garrafa 500ml', categoria=categoria, codigo='GAR500',
+                                              preco_venda=2, preco_custo=Decimal('0.80'), estoque_atual=10)
+        forma = FormaPagamento.objects.create(nome='Dinheiro')
+        self.vendas = []
+        for pago in (0, 10, 30):
+            venda = Venda.objects.create(usuario=self.usuario, status='finalizada')
+            ItemVenda.objects.create(venda=venda, produto=self.galao, quantidade=2, preco_unitario=15)
+            if pago:
+                Pagamento.objects.create(venda=venda, forma_pagamento=forma, valor_pago=pago, usuario=self.usuario)
+            self.vendas.append(venda)
+
+    def test_valor_estoque_no_banco(self):
+        produtos = Produto.objects.com_valor_estoque().order_by('-valor_estoque')
+        self.assertEqual([p.valor_total_estoque for p in produtos], [Decimal('30.00'), Decimal('8.00')])
+        self.assertEqual(Produto.objects.valor_estoque_total(), Decimal('38.00'))
+
+    def test_totais_de_vendas_no_banco(self):
+        with self.assertNumQueries(1):
+            pendentes = [v.valor_pendente for v in Venda.objects.com_totais().order_by('-total_pendente')]
+        self.assertEqual(pendentes, [Decimal('30.00'), Decimal('20.00'), Decimal('0.00')])
+        self.assertEqual(Venda.objects.totais(), {'numero_vendas': 3, 'valor_total': Decimal('90.00')})
+        self.assertEqual(Venda.objects.none().totais()['valor_total'], 0)
+
+    def test_admin_ordena_pelos_totais(self):
+        self.client.force_login(self.usuario)
+        for url in ('admin:core_venda_changelist', 'admin:core_produto_changelist'):
+            for ordem in range(1, 9):
+                resposta = self.client.get(reverse(url), {'o': ordem})
+                self.assertEqual(resposta.status_code, 200)
+
+
+class BuscaTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='balcao', password='balcao123')
+        self.client.force_login(self.usuario)
+        self.jose = Cliente.objects.create(nome='José da Conceição', cpf_cnpj='123.456.789-00',
+                                           telefone='1', endereco='Rua A')
+        Cliente.objects.create(nome='Maria Silva', cpf_cnpj='987.654.321-00', telefone='2', endereco='Rua B')
+        categoria = Categoria.objects.create(nome='Água')
+        Produto.objects.create(nome='Água Mineral 500ml', categoria=categoria, codigo='AGU-500',
+                               preco_venda=2, preco_custo=1)
+        Fornecedor.objects.create(nome='Engarrafadora Serra Azul', cnpj='12.345.678/0001-90',
+                                  telefone='3', email='serra@example.com', endereco='Rod. 1')
+
+    def nomes(self, url, termo):
+        resposta = self.client.get(reverse(url), {'search': termo})
+        self.assertEqual(resposta.status_code, 200)
+        return sorted(obj.nome for obj in resposta.context['page_obj'])
+
+    def test_busca_por_prefixo_sem_acentos_e_documento(self):
+        self.assertTrue(busca.disponivel(Cliente))
+        self.assertEqual(self.nomes('cliente_list', 'jose conc'), ['José da Conceição'])
+        self.assertEqual(self.nomes('cliente_list', 'SIL'), ['Maria Silva'])
+        self.assertEqual(self.nomes('cliente_list', '123.456'), ['José da Conceição'])
+        self.assertEqual(self.nomes('cliente_list', '456.789'), ['José da Conceição'])
+        self.assertEqual(self.nomes('cliente_list', '9876543'), ['Maria Silva'])
+        self.assertEqual(self.nomes('produto_list', 'agua 500'), ['Água Mineral 500ml'])
+        self.assertEqual(self.nomes('produto_list', 'AGU-5'), ['Água Mineral 500ml'])
+        self.assertEqual(self.nomes('fornecedor_list', '12345678'), ['Engarrafadora Serra Azul'])
+        # Sintaxe do FTS5 digitada pelo usuário não gera erro
+        self.assertEqual(self.nomes('cliente_list', '"jose"* (conc'), ['José da Conceição'])
+
+    def test_indice_acompanha_alteracoes(self):
+        self.jose.nome = 'José Ribeiro'
+        self.jose.save()
+        self.assertEqual(self.nomes('cliente_list', 'conceicao'), [])
+        self.assertEqual(self.nomes('cliente_list', 'ribeiro'), ['José Ribeiro'])
+
+        self.jose.delete()
+        self.assertEqual(self.nomes('cliente_list', 'jose'), [])
+
+        Cliente.objects.filter(nome='Maria Silva').update(nome='Maria Souza')
+        call_command('reconstruir_indice_busca', '--model', 'cliente', stdout=StringIO())
+        self.assertEqual(self.nomes('cliente_list', 'souza'), ['Maria Souza'])
+
+
+class ExportacaoTestCase(TestCase):
+    TOTAL = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='gerente', password='gerente123')
+        categoria = Categoria.objects.create(nome='Água')
+        produto = Produto.objects.create(nome='Galão 20L', categoria=categoria, codigo='GAL20L',
+                                         preco_venda=15, preco_custo=10)
+        MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(produto=produto, tipo='saida' if i % 2 else 'entrada', quantidade=3,
+                                preco_unitario=Decimal('2.50'), usuario=cls.usuario, observacao='a;b "c"')
+            for i in range(cls.TOTAL)
+        ], batch_size=2000)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def baixar(self, url, **parametros):
+        resposta = self.client.get(url, parametros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        tracemalloc.start()
+        conteudo = BytesIO()
+        for pedaco in resposta.streaming_content:
+            conteudo.write(pedaco)
+            # Só o pedaço atual fica em memória, não o arquivo inteiro
+            tracemalloc.reset_peak()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertLess(pico, 2 * 1024 * 1024)
+        return resposta, conteudo.getvalue()
+
+    def test_csv_com_filtros(self):
+        resposta, conteudo = self.baixar(reverse('movimentacao_exportar'), formato='csv', tipo='saida')
+        self.assertIn('attachment; filename="movimentacoes_', resposta['Content-Disposition'])
+        linhas = conteudo.decode('utf-8-sig').splitlines()
+        self.assertEqual(len(linhas), 1 + self.TOTAL // 2)
+        self.assertTrue(linhas[0].startswith('Data;Produto;Código;Tipo;Quantidade'))
+        self.assertIn(';Galão 20L;GAL20L;Saída;3;2,50;7,50;;gerente;"a;b ""c"""', linhas[1])
+
+    def test_xlsx_valido(self):
+        _, conteudo = self.baixar(reverse('movimentacao_exportar'), formato='xlsx')
+        with zipfile.ZipFile(BytesIO(conteudo)) as planilha:
+            self.assertIn('xl/workbook.xml', planilha.namelist())
+            dados = planilha.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(dados.count('<row>'), 1 + self.TOTAL)
+        self.assertTrue('<c><v>2.50</v></c><c><v>7.50</v></c>' in dados)
+
+    def test_comando_e_demais_listagens(self):
+        for url in ('venda_exportar', 'contas_receber_exportar'):
+            self.baixar(reverse(url), formato='xlsx')
+        self.assertEqual(self.client.get(reverse('venda_exportar'), {'formato': 'pdf'}).status_code, 404)
+
+        saida = StringIO()
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo = os.path.join(pasta, 'entradas.csv')
+            call_command('exportar', 'movimentacoes', '--filtro', 'tipo=entrada', '--saida', arquivo, stdout=saida)
+            with open(arquivo, encoding='utf-8-sig') as csv:
+                self.assertEqual(sum(1 for _ in csv), 1 + self.TOTAL // 2)
+        self.assertIn('✅', saida.getvalue())
+
+
+
+class ImportacaoTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='cadastro', password='cadastro123')
+        self.client.force_login(self.usuario)
+        self.categoria = Categoria.objects.create(nome='Água')
+        self.galao = Produto.objects.create(nome='Galão 20L', categoria=self.categoria, codigo='GAL20L',
+                                            preco_venda=15, preco_custo=10, estoque_atual=40)
+
+    def importar(self, tipo, conteudo, codificacao='utf-8', **opcoes):
+        from .importacao import importar
+        return importar(tipo, BytesIO(conteudo.encode(codificacao)), **opcoes)
+
+    def test_upsert_de_produtos_em_lotes(self):
+        linhas = ['codigo;nome;categoria;preco_venda;preco_custo;estoque_atual']
+        linhas.append('GAL20L;Galão 20 Litros;Água;16,50;10,00;999')
+        linhas += [f'P{i:04d};Copo {i};Descartáveis;1.234,56;0,80;5' for i in range(250)]
+        linhas.append('P9999;Sem preço;Água;;1,00;0')
+        linhas.append('P9998;Preço inválido;Água;abc;1,00;0')
+
+        resultado = self.importar('produtos', '\n'.join(linhas), lote=100)
+
+        self.assertEqual((resultado.linhas, resultado.criados, resultado.atualizados), (253, 250, 1))
+        self.assertEqual([linha for linha, _ in resultado.erros], [253, 254])
+        self.assertIn('preco_venda', resultado.erros[0][1])
+        self.galao.refresh_from_db()
+        self.assertEqual(self.galao.nome, 'Galão 20 Litros')
+        self.assertEqual(self.galao.preco_venda, Decimal('16.50'))
+        # O estoque de produto existente só muda por movimentação
+        self.assertEqual(self.galao.estoque_atual, 40)
+        copo = Produto.objects.get(codigo='P0007')
+        self.assertEqual((copo.categoria.nome, copo.preco_venda, copo.estoque_atual, copo.estoque_minimo),
+                         ('Descartáveis', Decimal('1234.56'), 5, 10))
+        self.assertEqual(Categoria.objects.filter(nome='Descartáveis').count(), 1)
+        # O índice de busca recebe os registros gravados em lote
+        self.assertEqual(list(busca.filtrar(Produto.objects.all(), 'copo 249').order_by('codigo')
+                              .values_list('codigo', flat=True)), ['P0249'])
+        self.assertTrue(busca.filtrar(Produto.objects.all(), 'litros').exists())
+
+    def test_upsert_de_clientes_por_documento(self):
+        Cliente.objects.create(nome='José', cpf_cnpj='123.456.789-00', telefone='1', endereco='Rua A',
+                               email='jose@example.com')
+        conteudo = ('nome,cpf_cnpj,telefone,endereco,email,ativo\n'
+                    'José da Conceição,123.456.789-00,2,Rua São João,,não\n'
+                    'Maria,987.654.321-00,3,Rua B,maria@example.com,sim\n'
+                    'Maria Souza,987.654.321-00,3,Rua B,maria@example.com,sim\n'
+                    'Sem telefone,111.111.111-11,,Rua C,,\n'
+                    'Email ruim,222.222.222-22,4,Rua D,nao-e-email,\n')
+
+        # Simulação: valida e conta, sem gravar
+        simulacao = self.importar('clientes', conteudo, codificacao='cp1252', simular=True)
+        self.assertEqual((simulacao.criados, simulacao.atualizados, len(simulacao.erros)), (1, 1, 2))
+        self.assertEqual(Cliente.objects.count(), 1)
+
+        resultado = self.importar('clientes', conteudo, codificacao='cp1252')
+        self.assertEqual([linha for linha, _ in resultado.erros], [5, 6])
+        self.assertEqual(Cliente.objects.count(), 2)
+        jose = Cliente.objects.get(cpf_cnpj='123.456.789-00')
+        self.assertEqual((jose.nome, jose.endereco, jose.email, jose.ativo),
+                         ('José da Conceição', 'Rua São João', '', False))
+        self.assertEqual(Cliente.objects.get(cpf_cnpj='987.654.321-00').nome, 'Maria Souza')
+        self.assertTrue(busca.filtrar(Cliente.objects.all(), 'conceicao').exists())
+
+    def test_cabecalho_invalido(self):
+        from .importacao import ErroImportacao
+        with self.assertRaisesMessage(ErroImportacao, 'faltando: preco_custo'):
+            self.importar('produtos', 'codigo;nome;categoria;preco_venda;preco\nX;Y;Z;1;1\n')
+
+    def test_upload_pela_tela_e_comando(self):
+        url = reverse('produto_importar')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        arquivo = BytesIO('codigo;nome;categoria;preco_venda;preco_custo\nNOVO;Novo;Água;2;1\nX;;Água;2;1\n'
+                          .encode())
+        arquivo.name = 'produtos.csv'
+        resposta = self.client.post(url, {'arquivo': arquivo})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual((resposta.context['resultado'].criados, resposta.context['erros'][0][0]), (1, 3))
+        self.assertTrue(Produto.objects.filter(codigo='NOVO').exists())
+
+        arquivo = BytesIO(b'nome;outra\nA;B\n')
+        arquivo.name = 'clientes.csv'
+        resposta = self.client.post(reverse('cliente_importar'), {'arquivo': arquivo})
+        self.assertFormError(resposta.context['form'], 'arquivo',
+                             'Colunas inválidas (faltando: cpf_cnpj, telefone, endereco; desconhecidas: outra). '
+                             'Aceitas: cpf_cnpj, nome, telefone, endereco, email, ativo.')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as csv:
+            csv.write('cpf_cnpj;nome;telefone;endereco\n555;Ana;1;Rua E\n')
+        self.addCleanup(os.remove, csv.name)
+        saida = StringIO()
+        call_command('importar', 'clientes', csv.name, stdout=saida)
+        self.assertIn('1 nova(s)', saida.getvalue())
+        self.assertTrue(Cliente.objects.filter(cpf_cnpj='555', nome='Ana').exists())
+
+
+class RecebimentoEstoqueTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='estoquista', password='estoquista123')
+        self.client.force_login(self.usuario)
+        self.fornecedor = Fornecedor.objects.create(nome='Engarrafadora Serra Azul', cnpj='12.345.678/0001-90',
+                                                    telefone='1', email='serra@example.com', endereco='Rod. 1')
+        categoria = Categoria.objects.create(nome='Água')
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', categoria=categoria, codigo=f'P{i}',
+                                   preco_venda=10, preco_custo=5, estoque_atual=10)
+            for i in range(3)
+        ]
+
+    def estoques(self):
+        return [produto.estoque_atual for produto in Produto.objects.order_by('pk')]
+
+    def test_registra_em_lote_e_e_idempotente(self):
+        p0, p1, p2 = self.produtos
+        itens = [(p0.pk, 20, Decimal('4.50')), (p1.pk, 5, None), (p0.pk, 10, Decimal('4.50')), (p2.pk, 1, Decimal('3'))]
+        with CaptureQueriesContext(connection) as consultas:
+            recebimento, criado = registrar_recebimento('lote-1', self.fornecedor, itens, self.usuario)
+
+        self.assertTrue(criado)
+        self.assertEqual(self.estoques(), [40, 15, 11])
+        self.assertEqual((recebimento.numero_itens, recebimento.quantidade_itens, recebimento.valor_total),
+                         (4, 36, Decimal('138.00')))
+        self.assertEqual(recebimento.movimentacoes.filter(tipo='entrada').count(), 4)
+        sql = [consulta['sql'] for consulta in consultas.captured_queries]
+        # Um INSERT para todas as movimentações e um UPDATE de estoque para todos os produtos
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "core_movimentacaoestoque"')]), 1)
+        self.assertEqual(len([q for q in sql if q.startswith('UPDATE "core_produto"')]), 1)
+
+        # Reenvio com a mesma chave não duplica a entrada
+        mesmo, criado = registrar_recebimento('lote-1', self.fornecedor, itens, self.usuario)
+        self.assertEqual((mesmo.pk, criado), (recebimento.pk, False))
+        self.assertEqual(self.estoques(), [40, 15, 11])
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 4)
+
+    def test_estorno_como_unidade(self):
+        p0, p1, _ = self.produtos
+        recebimento, _ = registrar_recebimento('lote-2', self.fornecedor, [(p0.pk, 5, None), (p1.pk, 8, None)],
+                                               self.usuario)
+
+        # Parte da mercadoria já saiu: nada é estornado
+        aplicar_deltas({p1.pk: -15})
+        with self.assertRaises(EstoqueInsuficiente):
+            estornar_recebimento(recebimento.pk, self.usuario)
+        self.assertEqual(self.estoques(), [15, 3, 10])
+        self.assertEqual(recebimento.movimentacoes.count(), 2)
+
+        aplicar_deltas({p1.pk: 15})
+        recebimento, estornado = estornar_recebimento(recebimento.pk, self.usuario)
+        self.assertTrue(estornado)
+        self.assertEqual((recebimento.status, recebimento.usuario_estorno), ('estornado', self.usuario))
+        self.assertEqual(self.estoques(), [10, 10, 10])
+        # As entradas ficam no histórico, compensadas por saídas ligadas ao recebimento
+        self.assertEqual(sorted(recebimento.movimentacoes.values_list('produto_id', 'tipo', 'quantidade')),
+                         sorted([(p0.pk, 'entrada', 5), (p1.pk, 'entrada', 8), (p0.pk, 'saida', 5), (p1.pk, 'saida', 8)]))
+        self.assertEqual(recebimento.movimentacoes.filter(tipo='saida', data_movimentacao=recebimento.data_estorno)
+                         .count(), 2)
+        # Totais continuam no recebimento; estornar de novo não altera nada
+        self.assertEqual(RecebimentoEstoque.objects.get().quantidade_itens, 13)
+        self.assertFalse(estornar_recebimento(recebimento.pk, self.usuario)[1])
+        self.assertEqual(self.estoques(), [10, 10, 10])
+
+    def test_tela_e_api(self):
+        p0, p1, _ = self.produtos
+        resposta = self.client.get(reverse('recebimento_create'))
+        chave = resposta.context['form'].initial['chave']
+        dados = {
+            'fornecedor': self.fornecedor.pk, 'chave': chave, 'nota_fiscal': '123', 'observacao': '',
+            'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '0', 'form-MIN_NUM_FORMS': '1', 'form-MAX_NUM_FORMS': '1000',
+            'form-0-produto': p0.pk, 'form-0-quantidade': '12', 'form-0-preco_unitario': '4.00',
+            'form-1-produto': p1.pk, 'form-1-quantidade': '3', 'form-1-preco_unitario': '', 'form-1-DELETE': 'on',
+            'form-2-produto': '', 'form-2-quantidade': '', 'form-2-preco_unitario': '',
+        }
+        resposta = self.client.post(reverse('recebimento_create'), dados)
+        recebimento = RecebimentoEstoque.objects.get(chave=chave)
+        self.assertRedirects(resposta, reverse('recebimento_detail', args=[recebimento.pk]))
+        self.assertEqual(self.estoques(), [22, 10, 10])
+        # Duplo clique/reenvio do formulário
+        self.client.post(reverse('recebimento_create'), dados)
+        self.assertEqual(self.estoques(), [22, 10, 10])
+
+        # Uma entrada do recebimento não é excluída sozinha
+        movimentacao = recebimento.movimentacoes.get()
+        self.client.post(reverse('movimentacao_delete', args=[movimentacao.pk]))
+        self.assertTrue(MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).exists())
+
+        self.assertContains(self.client.get(reverse('recebimento_detail', args=[recebimento.pk])), 'Estornar')
+        self.client.post(reverse('recebimento_estornar', args=[recebimento.pk]))
+        self.assertEqual(self.estoques(), [10, 10, 10])
+        self.assertContains(self.client.get(reverse('recebimento_detail', args=[recebimento.pk])),
+                            '<span class="badge bg-danger">Estorno</span>', html=True)
+        # A saída do estorno também não é excluída sozinha
+        estorno = recebimento.movimentacoes.get(tipo='saida')
+        self.client.post(reverse('movimentacao_delete', args=[estorno.pk]))
+        self.assertEqual(self.estoques(), [10, 10, 10])
+        self.assertTrue(MovimentacaoEstoque.objects.filter(pk=estorno.pk).exists())
+        self.assertContains(self.client.get(reverse('recebimento_list'), {'status': 'estornado'}),
+                            'Engarrafadora Serra Azul')
+
+        url = reverse('recebimento_api')
+        corpo = {'fornecedor': self.fornecedor.pk,
+                 'itens': [{'produto': p0.pk, 'quantidade': 6, 'preco_unitario': '2.00'}, {'produto': p1.pk, 'quantidade': 4}]}
+        resposta = self.client.post(url, corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='nf-555')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual((resposta.json()['quantidade_itens'], resposta.json()['valor_total']), (10, '12.00'))
+        resposta = self.client.post(url, corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='nf-555')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.estoques(), [16, 14, 10])
+
+        corpo['itens'].append({'produto': p0.pk, 'quantidade': 0})
+        resposta = self.client.post(url, corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='nf-556')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('2', resposta.json()['erros']['itens'])
+
+        resposta = self.client.post(reverse('recebimento_estornar_api', args=[RecebimentoEstoque.objects.get(chave='nf-555').pk]))
+        self.assertEqual((resposta.status_code, resposta.json()['status']), (200, 'estornado'))
+        self.assertEqual(self.estoques(), [10, 10, 10])
+
+
+class CargaEscalaTestCase(TestCase):
+    def gerar(self, **opcoes):
+        call_command('criar_sistema_completo', stdout=StringIO(), **opcoes)
+
+    def test_invariantes_de_estoque_pagamentos_e_resumo(self):
+        self.gerar(escala='600', dias=20, lote=50)
+        self.assertEqual(Venda.objects.count(), 600)
+        self.assertEqual(ItemVenda.objects.values('venda').distinct().count(), 600)
+
+        # Estoque de cada produto gerado = entradas - saídas
+        for produto in Produto.objects.filter(codigo__startswith='CG'):
+            movimentacoes = produto.movimentacaoestoque_set
+            entradas = sum(movimentacoes.filter(tipo='entrada').values_list('quantidade', flat=True))
+            saidas = sum(movimentacoes.filter(tipo='saida').values_list('quantidade', flat=True))
+            self.assertEqual(produto.estoque_atual, entradas - saidas)
+            self.assertGreaterEqual(produto.estoque_atual, 0)
+
+        # Totais gravados iguais aos recalculados; valor pago = soma dos pagamentos
+        centavo = Decimal('0.01')
+        for venda in Venda.objects.annotate(**{f'recalculado_{campo}': expressao for campo, expressao
+                                              in Venda.expressoes_totais().items()}):
+            self.assertEqual(venda.valor_itens, venda.recalculado_valor_itens.quantize(centavo))
+            self.assertEqual(venda.valor_pago, venda.recalculado_valor_pago.quantize(centavo))
+            self.assertEqual((venda.quantidade_itens, venda.numero_itens),
+                             (venda.recalculado_quantidade_itens, venda.recalculado_numero_itens))
+            if venda.status == 'paga':
+                self.assertGreaterEqual(venda.valor_pago, venda.valor_itens)
+            elif venda.status == 'parcial':
+                self.assertTrue(0 < venda.valor_pago < venda.valor_itens)
+            else:
+                self.assertEqual(venda.valor_pago, 0)
+        for conta in ContasReceber.objects.select_related('venda'):
+            if conta.venda:
+                self.assertEqual(conta.valor_pago, conta.venda.valor_pago)
+            else:
+                self.assertEqual(conta.valor_pago, sum(conta.pagamentos_conta.values_list('valor_pago', flat=True)))
+
+        # Resumo diário igual ao reconstruído a partir das vendas
+        def linhas_resumo():
+            return sorted(map(str, ResumoVendaDiario.objects.values_list(
+                'data', 'status', 'produto', 'forma_pagamento', 'usuario', 'numero_vendas', 'quantidade', 'valor')))
+        gravado = linhas_resumo()
+        resumos.reconstruir()
+        self.assertEqual(gravado, linhas_resumo())
+
+        # Numeração reservada, vendas em ordem cronológica e índice de busca atualizado
+        self.assertEqual(SequenciaVenda.objects.get(prefixo='VD').ultimo_numero, 600)
+        datas = list(Venda.objects.order_by('pk').values_list('data_venda', flat=True))
+        self.assertEqual(datas, sorted(datas))
+        self.assertEqual(Venda.objects.create(usuario=User.objects.first()).numero_venda, 'VD000601')
+        cliente = Cliente.objects.order_by('-pk').first()
+        self.assertIn(cliente, busca.filtrar(Cliente.objects.all(), cliente.cpf_cnpj[:7]))
+
+    @override_settings(VENDA_NUMERACAO='diaria')
+    def test_numeracao_diaria_e_escala_invalida(self):
+        self.gerar(escala='90', dias=3)
+        for prefixo, ultimo in SequenciaVenda.objects.values_list('prefixo', 'ultimo_numero'):
+            numeros = Venda.objects.filter(numero_venda__startswith=prefixo).values_list('numero_venda', flat=True)
+            self.assertEqual(sorted(numeros), [f'{prefixo}{numero:04d}' for numero in range(1, ultimo + 1)])
+        self.assertEqual(SequenciaVenda.objects.count(), 3)
+
+        self.assertEqual(carga.interpretar_escala('2.5k'), 2500)
+        self.assertEqual(carga.interpretar_escala('1M'), 1_000_000)
+        with self.assertRaises(CommandError):
+            self.gerar(escala='muito', clear=True)
+        self.assertEqual(Venda.objects.count(), 90)
+
+
+class BenchmarkViewsTestCase(TestCase):
+    def test_todas_as_urls_tem_cenario(self):
+        self.assertEqual(cenarios.urls_sem_cenario(), [])
+
+    def test_cenarios_respondem_e_nao_alteram_o_banco(self):
+        call_command('criar_sistema_completo', escala='60', dias=5, stdout=StringIO())
+        usuario = User.objects.get(is_superuser=True)
+        produto = Produto.objects.order_by('pk').first()
+        registrar_recebimento('bench', Fornecedor.objects.first(), [(produto.pk, 5, None)], usuario)
+        contagens = (Venda.objects.count(), Pagamento.objects.count(), MovimentacaoEstoque.objects.count())
+
+        resultados = medicao.executar(cenarios.CENARIOS, amostras=2)
+        for nome, medida in resultados.items():
+            with self.subTest(cenario=nome):
+                self.assertNotIn('erro', medida)
+                self.assertNotIn('ignorado', medida)
+                self.assertEqual(medida['status'], medida['esperado'])
+                self.assertGreater(medida['consultas'], 0)
+                self.assertGreaterEqual(medida['p95_ms'], medida['p50_ms'])
+        self.assertEqual(
+            (Venda.objects.count(), Pagamento.objects.count(), MovimentacaoEstoque.objects.count()), contagens
+        )
+        self.assertEqual(RecebimentoEstoque.objects.get().status, 'registrado')
+
+    def test_comparacao_com_baseline(self):
+        medida = {'status': 200, 'p50_ms': 10.0, 'p95_ms': 12.0, 'consultas': 8, 'sql_ms': 2.0,
+                  'memoria_pico_kb': 300}
+        baseline = {'tamanhos': {'10k': {'cenarios': {'venda_list': medida, 'venda_detail': medida}}}}
+        atual = {'tamanhos': {
+            '10k': {'cenarios': {
+                'venda_list': {**medida, 'p50_ms': 14.0, 'p95_ms': 20.0, 'consultas': 9},
+                'venda_detail': {**medida, 'p50_ms': 30.0},
+                'novo': medida,
+            }},
+            '1m': {'cenarios': {'venda_list': medida}},
+        }}
+        self.assertEqual(comparacao.comparar(atual, baseline), [
+            ('10k', 'venda_list', 'consultas', 8, 9),
+            ('10k', 'venda_detail', 'p50_ms', 10.0, 30.0),
+        ])
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho_baseline = os.path.join(diretorio, 'baseline.json')
+            caminho_atual = os.path.join(diretorio, 'atual.json')
+            comparacao.gravar(baseline, caminho_baseline)
+            comparacao.gravar(atual, caminho_atual)
+            with self.assertRaises(CommandError):
+                call_command('benchmark_views', comparar=caminho_atual, baseline=caminho_baseline, stdout=StringIO())
+            saida = StringIO()
+            call_command('benchmark_views', comparar=caminho_baseline, baseline=caminho_baseline, stdout=saida)
+            self.assertIn('Nenhuma regressão', saida.getvalue())
+
+
+class LimiteConsultasTestCase(TestCase):
+    """Cada URL faz o mesmo número de consultas com 2 ou 6 linhas por tela, dentro do seu limite"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_superuser(username='gerente', password='gerente123')
+        self.client.force_login(self.usuario)
+        categoria = Categoria.objects.create(nome='Base')
+        for i in range(3):
+            Produto.objects.create(nome=f'Base {i}', categoria=categoria, codigo=f'BASE{i}', preco_venda=10,
+                                   preco_custo=5, estoque_atual=100)
+
+    def popular(self, n, marca):
+        """n registros de cada tipo; os mais recentes (os que os cenários abrem) têm n filhos cada"""
+        categoria = Categoria.objects.create(nome=f'Categoria {marca}')
+        fornecedor = Fornecedor.objects.create(nome=f'Fornecedor {marca}', cnpj=f'{marca}.000/0001-00',
+                                               telefone='1', email='f@example.com', endereco='Rua 1')
+        forma = FormaPagamento.objects.create(nome=f'Forma {marca}', prazo_recebimento=30)
+        cliente = Cliente.objects.create(nome=f'Cliente Silva {marca}', cpf_cnpj=f'{marca}00', telefone='1',
+                                         endereco='Rua 2')
+        produtos = [Produto.objects.create(nome=f'Agua {marca}{i}', categoria=categoria, codigo=f'{marca}{i}',
+                                           preco_venda=10, preco_custo=5, estoque_atual=100, estoque_minimo=200)
+                    for i in range(n)]
+        for _ in range(n):
+            venda = Venda.objects.create(cliente=cliente, forma_pagamento=forma, usuario=self.usuario,
+                                         status='finalizada')
+            for produto in produtos:
+                ItemVenda.objects.create(venda=venda, produto=produto, quantidade=1, preco_unitario=10)
+                MovimentacaoEstoque.objects.create(produto=produto, tipo='saida', quantidade=1, usuario=self.usuario,
+                                                   observacao=f'Venda {venda.numero_venda}')
+            conta = ContasReceber.objects.create(cliente=cliente, venda=venda, valor_total=venda.valor_itens,
+                                                 data_vencimento=timezone.localdate(), usuario=self.usuario)
+        for _ in range(n):
+            Pagamento.objects.create(venda=venda, forma_pagamento=forma, valor_pago=1, usuario=self.usuario)
+        conta = ContasReceber.objects.create(cliente=cliente, valor_total=10 * n, usuario=self.usuario,
+                                             data_vencimento=timezone.localdate())
+        for _ in range(n):
+            PagamentoConta.objects.create(conta_receber=conta, forma_pagamento=forma, valor_pago=1,
+                                          usuario=self.usuario)
+        # Requisições de gravação têm tamanho fixo (o do corpo enviado), não o do banco
+        registrar_recebimento(f'recebimento-{marca}', fornecedor, [(produto.pk, 5, None) for produto in produtos[:2]],
+                              self.usuario)
+
+    def consultas(self):
+        """{cenário: consultas executadas (sql, pilha)} de todos os cenários do benchmark"""
+        resultado = {}
+        for cenario in cenarios.CENARIOS:
+            url, dados = cenario.preparar()
+            # A primeira requisição aquece caches (content types, sessão); a segunda é contada
+            for contar in (False, True):
+                with transaction.atomic():
+                    with limitar_consultas(cenario.url_nome, None if contar else 1000) as registro:
+                        resposta = cenario.enviar(self.client, url, dados)
+                        if resposta.streaming:
+                            b''.join(resposta.streaming_content)
+                    transaction.set_rollback(True)
+            self.assertEqual(resposta.status_code, cenario.esperado, cenario.nome)
+            resultado[cenario.nome] = (cenario.url_nome, registro.consultas)
+        return resultado
+
+    def test_consultas_nao_dependem_do_volume(self):
+        self.popular(2, 'A')
+        poucos = self.consultas()
+        self.popular(6, 'B')
+        muitos = self.consultas()
+        for nome, (url_nome, consultas) in muitos.items():
+            with self.subTest(cenario=nome):
+                antes = len(poucos[nome][1])
+                self.assertEqual(len(consultas), antes, relatorio(nome, antes, consultas))
+
+    def test_gravacoes_nao_dependem_do_numero_de_linhas(self):
+        self.popular(8, 'A')
+        cliente = Cliente.objects.get(nome='Cliente Silva A')
+        forma = FormaPagamento.objects.get(nome='Forma A')
+        produtos = list(Produto.objects.filter(categoria__nome='Categoria A').order_by('pk'))
+        venda = Venda.objects.create(cliente=cliente, forma_pagamento=forma, usuario=self.usuario, status='finalizada')
+        vendas.registrar_itens(venda, [(produto.pk, 2, Decimal('10')) for produto in produtos], self.usuario)
+
+        def dados_venda(linhas):
+            dados = {'cliente': cliente.pk, 'forma_pagamento': forma.pk, 'status': 'finalizada',
+                     'data_venda': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+                     'itens-TOTAL_FORMS': str(linhas), 'itens-INITIAL_FORMS': '0',
+                     'itens-MIN_NUM_FORMS': '1', 'itens-MAX_NUM_FORMS': '1000'}
+            for indice, produto in enumerate(produtos[:linhas]):
+                dados.update({f'itens-{indice}-produto': produto.pk, f'itens-{indice}-quantidade': '1',
+                              f'itens-{indice}-preco_unitario': '10.00'})
+            return dados
+
+        def dados_checkout(linhas):
+            return {'forma_pagamento': [forma.pk] * linhas, 'valor_pagamento': ['1.00'] * linhas}
+
+        def consultas(url_nome, url, dados):
+            # A primeira requisição aquece caches; a segunda é contada, dentro do limite da URL
+            for contar in (False, True):
+                with transaction.atomic():
+                    with limitar_consultas(url_nome, None if contar else 1000) as registro:
+                        resposta = self.client.post(url, dados)
+                    transaction.set_rollback(True)
+                self.assertEqual(resposta.status_code, 302)
+            return registro
+
+        for url_nome, url, dados in [('venda_create', reverse('venda_create'), dados_venda),
+                                     ('venda_checkout', reverse('venda_checkout', args=[venda.pk]), dados_checkout)]:
+            with self.subTest(url=url_nome):
+                duas = consultas(url_nome, url, dados(2))
+                oito = consultas(url_nome, url, dados(8))
+                self.assertEqual(len(oito), len(duas), relatorio(url_nome, len(duas), oito.consultas))
+
+    def test_limites_cobrem_as_urls_e_falham_com_as_repetidas(self):
+        self.assertEqual(sorted(set(cenario.url_nome for cenario in cenarios.CENARIOS) - set(LIMITES)), [])
+        self.popular(3, 'A')
+        with self.assertRaises(LimiteConsultasExcedido) as erro:
+            with limitar_consultas('venda_detail', 2):
+                for venda in Venda.objects.all():
+                    list(venda.itens.all())
+        self.assertIn('3x SELECT', str(erro.exception))
+        self.assertIn('core/tests.py', str(erro.exception))
+
+    def test_middleware_avisa_ou_falha_conforme_a_configuracao(self):
+        self.popular(2, 'A')
+        url = reverse('venda_list')
+        with patch.dict(LIMITES, {'venda_list': 1}):
+            with override_settings(LIMITE_CONSULTAS='avisar'):
+                cliente = Client()
+                cliente.force_login(self.usuario)
+                with self.assertLogs('core.limites_consultas', level='WARNING') as logs:
+                    self.assertEqual(cliente.get(url).status_code, 200)
+            self.assertIn('venda_list', logs.output[0])
+
+            with override_settings(LIMITE_CONSULTAS='erro'):
+                cliente = Client()
+                cliente.force_login(self.usuario)
+                with self.assertRaises(LimiteConsultasExcedido):
+                    cliente.get(url)
+
+            with override_settings(LIMITE_CONSULTAS='desligado'):
+                cliente = Client()
+                cliente.force_login(self.usuario)
+                self.assertEqual(cliente.get(url).status_code, 200)
+
+
+class DesempenhoTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='gerente', password='gerente123', is_staff=True)
+        self.client.force_login(self.usuario)
+        Produto.objects.create(nome='Galão 20L', categoria=Categoria.objects.create(nome='Água'), codigo='GAL20',
+                               preco_venda=12, preco_custo=6, estoque_atual=1)
+        desempenho.janelas.limpar()
+        self.addCleanup(desempenho.janelas.limpar)
+
+    def test_requisicoes_amostradas_tem_server_timing_e_entram_na_janela(self):
+        with patch.object(desempenho.estado, 'amostragem', 1.0), patch.object(desempenho.estado, 'memoria', True):
+            resposta = self.client.get(reverse('dashboard'))
+        cabecalho = resposta['Server-Timing']
+        for metrica in ('total;dur=', 'view;dur=', 'sql;dur=', 'tpl;dur=', 'mem;desc='):
+            self.assertIn(metrica, cabecalho)
+
+        linha, = desempenho.janelas.resumo()
+        self.assertEqual(linha['nome_url'], 'dashboard')
+        self.assertEqual(linha['requisicoes'], 1)
+        self.assertIn(f'"{linha["consultas"]} consultas"', cabecalho)
+        self.assertGreater(linha['consultas'], 0)
+        self.assertGreater(linha['template_ms'], 0)
+        self.assertLessEqual(linha['template_ms'], linha['view_ms'])
+        self.assertLessEqual(linha['view_ms'], linha['p95_ms'])
+        self.assertIsNotNone(linha['memoria_kb'])
+        self.assertTrue(linha['top'])
+
+    def test_sem_amostragem_nada_e_medido(self):
+        with patch.object(desempenho.estado, 'amostragem', 0.0):
+            resposta = self.client.get(reverse('dashboard'))
+        self.assertNotIn('Server-Timing', resposta)
+        self.assertEqual(desempenho.janelas.resumo(), [])
+
+    def test_painel_so_para_equipe_e_altera_a_amostragem(self):
+        with patch.object(desempenho.estado, 'amostragem', 1.0):
+            self.client.get(reverse('produto_list'))
+            self.client.get(reverse('dashboard'))
+            resposta = self.client.get(reverse('desempenho'))
+        self.assertContains(resposta, 'produto_list')
+        self.assertContains(resposta, 'SELECT')
+
+        with patch.object(desempenho.estado, 'amostragem', 0.0), patch.object(desempenho.estado, 'memoria', False):
+            self.client.post(reverse('desempenho'), {'amostragem': '0,25', 'memoria': 'on'})
+            self.assertEqual(desempenho.estado.amostragem, 0.25)
+            self.assertTrue(desempenho.estado.memoria)
+            self.client.post(reverse('desempenho'), {'amostragem': '2'})
+            self.assertEqual(desempenho.estado.amostragem, 0.25)
+            self.client.post(reverse('desempenho'), {'amostragem': '0'})
+            self.assertEqual(desempenho.estado.amostragem, 0)
+            self.client.post(reverse('desempenho'), {'limpar': ''})
+            self.assertEqual(desempenho.janelas.resumo(), [])
+
+        caixa = User.objects.create_user(username='caixa', password='caixa123')
+        self.client.force_login(caixa)
+        self.assertEqual(self.client.get(reverse('desempenho')).status_code, 302)
+
+
+class MetricasTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='gerente', password='gerente123', is_staff=True)
+        self.client.force_login(self.usuario)
+        self.categoria = Categoria.objects.create(nome='Água')
+        self.cliente = Cliente.objects.create(nome='Maria', cpf_cnpj='111', telefone='1', endereco='Rua A')
+        cache.clear()
+        registro = metricas.Registro()
+        patcher = patch.object(metricas, 'registro', registro)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registro = registro
+
+    def produto(self, codigo, estoque, minimo=10, **campos):
+        return Produto.objects.create(nome=codigo, categoria=self.categoria, codigo=codigo, preco_venda=10,
+                                      preco_custo=5, estoque_atual=estoque, estoque_minimo=minimo, **campos)
+
+    def assertIndicadoresCorretos(self):
+        gravados = indicadores.valores()
+        for nome, calculo in indicadores.CALCULOS.items():
+            self.assertEqual(gravados[nome], calculo(), nome)
+
+    def test_requisicoes_erros_consultas_e_cache(self):
+        self.client.get(reverse('venda_list'))
+        self.client.get(reverse('venda_list'))
+        self.client.get('/nao-existe/')
+        resposta = self.client.get(reverse('metricas'))
+
+        self.assertEqual(resposta['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        texto = resposta.content.decode()
+        for linha in (
+            '# TYPE estoque_requisicao_segundos histogram',
+            'estoque_requisicao_segundos_bucket{metodo="GET",view="venda_list",le="+Inf"} 2',
+            'estoque_requisicao_segundos_count{metodo="GET",view="venda_list"} 2',
+            'estoque_requisicoes_total{metodo="GET",status="200",view="venda_list"} 2',
+            'estoque_requisicoes_total{metodo="GET",status="404",view="sem_rota"} 1',
+            'estoque_requisicao_consultas_count{view="venda_list"} 2',
+            'estoque_consulta_segundos_bucket{banco="default",le="+Inf"}',
+            'estoque_cache_consultas_total{cache="vendas:totais",resultado="acerto"}',
+            'estoque_cache_consultas_total{cache="vendas:totais",resultado="falta"}',
+            'estoque_cache_taxa_acerto{cache="vendas:totais"}',
+            'estoque_produtos_abaixo_minimo 0.0',
+        ):
+            self.assertIn(linha, texto)
+
+    def test_acesso_restrito(self):
+        caixa = User.objects.create_user(username='caixa', password='caixa123')
+        self.client.force_login(caixa)
+        self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 200)
+        with override_settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+            resposta = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo',
+                                       REMOTE_ADDR='10.0.0.5')
+            self.assertEqual(resposta.status_code, 200)
+
+    def test_indicadores_incrementais_batem_com_o_calculo(self):
+        galao = self.produto('GAL', estoque=12)
+        copo = self.produto('COPO', estoque=3)
+        self.produto('INATIVO', estoque=0, ativo=False)
+        self.assertIndicadoresCorretos()
+
+        aplicar_deltas({galao.pk: -5, copo.pk: 20})
+        self.assertIndicadoresCorretos()
+        definir_estoque(galao.pk, 50)
+        galao.refresh_from_db()
+        galao.estoque_minimo = 60
+        galao.save()
+        self.assertIndicadoresCorretos()
+        copo.delete()
+        self.assertEqual(indicadores.valores()[indicadores.PRODUTOS_ABAIXO_MINIMO], 1)
+
+        from .importacao import importar
+        importar('produtos', BytesIO('codigo;nome;categoria;preco_venda;preco_custo;estoque_atual;estoque_minimo\n'
+                                     'GAL;Galão;Água;10;5;;10\nNOVO;Novo;Água;10;5;1;5\n'.encode()))
+        self.assertIndicadoresCorretos()
+        self.assertEqual(indicadores.valores()[indicadores.PRODUTOS_ABAIXO_MINIMO], 1)
+
+        conta = ContasReceber.objects.create(cliente=self.cliente, valor_total=Decimal('100.00'),
+                                             data_vencimento=timezone.localdate(), usuario=self.usuario)
+        ContasReceber.objects.create(cliente=self.cliente, valor_total=Decimal('40.00'),
+                                     data_vencimento=timezone.localdate(), usuario=self.usuario)
+        conta.valor_pago = Decimal('30.00')
+        conta.status = 'parcial'
+        conta.save()
+        self.assertIndicadoresCorretos()
+        self.assertEqual(indicadores.valores()[indicadores.SALDO_CONTAS], Decimal('110.00'))
+        conta.observacao = 'Ligar antes'
+        with CaptureQueriesContext(connection) as consultas:
+            conta.save()
+        self.assertFalse([c for c in consultas.captured_queries if 'core_indicador' in c['sql']])
+        conta.valor_pago = Decimal('100.00')
+        conta.status = 'quitado'
+        conta.save()
+        self.cliente.delete()
+        self.assertIndicadoresCorretos()
+        self.assertEqual(indicadores.valores()[indicadores.CONTAS_ABERTAS], 0)
+
+    def test_soma_dos_processos_pelo_diretorio(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            outro = metricas.Registro(diretorio)
+            outro.arquivo = lambda: os.path.join(diretorio, 'metricas_99999.json')
+            outro.registrar_requisicao('venda_list', 'GET', 200, 0.02, {'default': [0.001, 0.002]})
+            outro.registrar_requisicao('venda_list', 'GET', 500, 0.3, {'default': [0.2]})
+            outro.gravar()
+            self.registro.diretorio = diretorio
+            self.registro.registrar_requisicao('venda_list', 'GET', 200, 0.04, {'default': [0.003]})
+
+            contadores, histogramas = self.registro.coletar()
+        self.assertEqual(contadores[metricas._chave('estoque_requisicoes_total',
+                                                     {'view': 'venda_list', 'metodo': 'GET', 'status': '200'})], 2)
+        _, contagens, soma = histogramas[metricas._chave('estoque_requisicao_segundos',
+                                                          {'view': 'venda_list', 'metodo': 'GET'})]
+        self.assertEqual(sum(contagens), 3)
+        self.assertAlmostEqual(soma, 0.36)
+        _, contagens, _ = histogramas[metricas._chave('estoque_consulta_segundos', {'banco': 'default'})]
+        self.assertEqual(sum(contagens), 4)
+
+    def test_vendas_registradas_como_contador(self):
+        usuario = self.usuario
+        Venda.objects.create(usuario=usuario, status='finalizada')
+        cancelada = Venda.objects.create(usuario=usuario, status='finalizada')
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('# TYPE estoque_vendas_registradas_total counter', texto)
+        self.assertIn('estoque_vendas_registradas_total 2.0\n', texto)
+
+        # Cancelar não diminui o contador (senão rate() veria um reinício)
+        cancelada.status = 'cancelada'
+        cancelada.save()
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('estoque_vendas_registradas_total 2.0\n', texto)
+        self.assertIn('estoque_vendas_hoje{status="cancelada"} 1.0', texto)
+
+
+class SqliteConexaoTestCase(TestCase):
+    def test_pragmas_aplicados_em_cada_conexao(self):
+        pragmas = connection.settings_dict['OPTIONS']['pragmas']
+        nova = connection.get_new_connection(connection.get_connection_params())
+        try:
+            self.assertEqual(nova.execute('PRAGMA busy_timeout').fetchone()[0], pragmas['busy_timeout'])
+            self.assertEqual(nova.execute('PRAGMA temp_store').fetchone()[0], 2)  # MEMORY
+        finally:
+            nova.close()
+
+    def test_transacao_comeca_com_o_modo_configurado(self):
+        self.assertEqual(connection.modo_transacao, 'IMMEDIATE')
+        executadas = []
+        with patch.object(connection, 'cursor') as cursor:
+            cursor.return_value.execute.side_effect = executadas.append
+            connection._start_transaction_under_autocommit()
+        self.assertEqual(executadas, ['BEGIN IMMEDIATE'])
+
+    def test_opcoes_invalidas(self):
+        configuracao = {**connection.settings_dict, 'NAME': ':memory:'}
+        outra = DatabaseWrapper({**configuracao, 'OPTIONS': {'transaction_mode': 'LAZY'}}, alias='teste_sqlite')
+        with self.assertRaises(ImproperlyConfigured):
+            outra.modo_transacao
+        outra = DatabaseWrapper({**configuracao, 'OPTIONS': {'pragmas': {'journal_mode': 'WAL; DROP TABLE x'}}},
+                                alias='teste_sqlite')
+        with self.assertRaises(ImproperlyConfigured):
+            outra.get_new_connection(outra.get_connection_params())
+        self.assertNotIn('pragmas', DatabaseWrapper({**configuracao, 'OPTIONS': {'pragmas': {}}},
+                                                    alias='teste_sqlite').get_connection_params())
+
+
+@patch.object(roteamento, 'replica_configurada', lambda: True)
+class RoteamentoRelatoriosTestCase(TestCase):
+    def setUp(self):
+        roteamento.atraso.limpar()
+        self.addCleanup(roteamento.atraso.limpar)
+
+    def test_relatorios_leem_da_replica_em_dia(self):
+        requisicao = Client().get('/').wsgi_request
+        with patch.object(roteamento, 'medir_atraso', return_value=2.0):
+            self.assertEqual(roteamento.banco_da_view('dashboard', requisicao), roteamento.RELATORIOS)
+            self.assertEqual(roteamento.banco_da_view('venda_list'), roteamento.RELATORIOS)
+            self.assertEqual(roteamento.banco_da_view('venda_create', requisicao), 'default')
+            requisicao.COOKIES[roteamento.COOKIE_PADRAO] = '1'
+            self.assertEqual(roteamento.banco_da_view('dashboard', requisicao), 'default')
+
+    def test_replica_atrasada_ou_sem_pulso_volta_ao_padrao(self):
+        for atraso in (roteamento.ATRASO_MAXIMO + 1, None):
+            roteamento.atraso.limpar()
+            with patch.object(roteamento, 'medir_atraso', return_value=atraso) as medir, \
+                    self.assertLogs('core.roteamento', 'WARNING'):
+                self.assertEqual(roteamento.banco_da_view('venda_list'), 'default')
+                self.assertEqual(roteamento.banco_da_view('venda_list'), 'default')
+            # O atraso é medido no máximo uma vez a cada RELATORIOS_VERIFICAR_A_CADA segundos
+            self.assertEqual(medir.call_count, 1)
+
+    def test_roteador(self):
+        roteador = roteamento.RoteadorRelatorios()
+        with patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(roteador.db_for_read(Produto), 'default')
+            with roteamento.ler_de(roteamento.RELATORIOS):
+                self.assertEqual(roteador.db_for_read(Produto), roteamento.RELATORIOS)
+                self.assertEqual(roteador.db_for_read(User), 'default')
+                self.assertEqual(roteador.db_for_write(Produto), 'default')
+                with roteamento.ler_do_padrao():
+                    self.assertEqual(roteador.db_for_read(Produto), 'default')
+        # Dentro de uma transação (o TestCase já abre uma) a leitura fica no padrão
+        with roteamento.ler_de(roteamento.RELATORIOS):
+            self.assertEqual(roteador.db_for_read(Produto), 'default')
+        self.assertFalse(roteador.allow_migrate(roteamento.RELATORIOS, 'core'))
+
+    def test_escrita_marca_leitura_do_padrao_e_streaming_le_da_replica(self):
+        User.objects.create_user('roteamento', password='senha')
+        cliente = Client()
+        cliente.login(username='roteamento', password='senha')
+        resposta = cliente.post(reverse('categoria_create'), {'nome': 'Gelo', 'descricao': ''})
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(resposta.cookies[roteamento.COOKIE_PADRAO]['max-age'], roteamento.ATRASO_MAXIMO)
+        self.assertNotIn(roteamento.COOKIE_PADRAO, cliente.get(reverse('categoria_list')).cookies)
+
+        lidos = []
+
+        def conteudo():
+            for parte in (b'a', b'b'):
+                lidos.append(roteamento._banco_leitura.get())
+                yield parte
+
+        self.assertEqual(list(roteamento._conteudo_lido_de(conteudo(), roteamento.RELATORIOS)), [b'a', b'b'])
+        self.assertEqual(lidos, [roteamento.RELATORIOS] * 2)
+        self.assertIsNone(roteamento._banco_leitura.get())
+
+
+class CacheVersionadoTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_sinais_e_operacoes_em_lote_trocam_a_versao(self):
+        categoria = Categoria.objects.create(nome='Galões')
+        categorias = cache_versionado.objetos(Categoria.objects.all(), cache_versionado.CATEGORIAS)
+        self.assertEqual([c.nome for c in categorias], ['Galões'])
+        with self.assertNumQueries(0):
+            cache_versionado.objetos(Categoria.objects.all(), cache_versionado.CATEGORIAS)
+        Categoria.objects.create(nome='Copos')
+        self.assertEqual(len(cache_versionado.objetos(Categoria.objects.all(), cache_versionado.CATEGORIAS)), 2)
+
+        produto = Produto.objects.create(nome='Galão 20L', categoria=categoria, codigo='G20', preco_venda=10,
+                                         preco_custo=5, estoque_atual=10)
+        versao = cache_versionado.versao(cache_versionado.PRODUTOS)
+        aplicar_deltas({produto.pk: -1})  # update(), sem sinais
+        self.assertNotEqual(cache_versionado.versao(cache_versionado.PRODUTOS), versao)
+
+    def test_formularios_montam_as_opcoes_do_cache(self):
+        FormaPagamento.objects.create(nome='Dinheiro')
+        self.assertIn('Dinheiro', str(PagamentoContaForm()['forma_pagamento']))
+        with self.assertNumQueries(0):
+            html = str(PagamentoContaForm()['forma_pagamento'])
+        self.assertIn('Selecione a forma de pagamento...', html)
+        pix = FormaPagamento.objects.create(nome='PIX')
+        self.assertIn('PIX', str(PagamentoContaForm()['forma_pagamento']))
+        # A validação do valor enviado continua no banco
+        formulario = PagamentoContaForm({'forma_pagamento': pix.pk, 'valor_pago': '10.00'})
+        self.assertTrue(formulario.is_valid())
+        pix.ativo = False
+        pix.save()
+        self.assertNotIn('PIX', str(PagamentoContaForm()['forma_pagamento']))
+
+    def test_so_um_calcula_ao_mesmo_tempo(self):
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            time.sleep(0.2)
+            return {'total': 42}
+
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(
+            cache_versionado.em_cache('teste', [cache_versionado.VENDAS], calcular))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calculos), 1)
+        self.assertEqual(resultados, [{'total': 42}] * 8)
+
+    def test_valor_anterior_enquanto_outro_calcula(self):
+        cache_versionado.em_cache('teste', [cache_versionado.VENDAS], lambda: 'antigo')
+        cache_versionado.invalidar(cache_versionado.VENDAS)
+        chave = cache_versionado.chave('teste', [cache_versionado.VENDAS])
+        cache.add(f'{chave}:calculando', 'outro processo')
+        self.assertEqual(cache_versionado.em_cache('teste', [cache_versionado.VENDAS], lambda: 'novo',
+                                                   anterior_enquanto_calcula=True), 'antigo')
+        cache.delete(f'{chave}:calculando')
+        self.assertEqual(cache_versionado.em_cache('teste', [cache_versionado.VENDAS], lambda: 'novo'), 'novo')
+
+
+class PrecosEmLoteApiTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User.objects.create_user('caixa', password='senha')
+        self.client.login(username='caixa', password='senha')
+        categoria = Categoria.objects.create(nome='Água')
+        self.produtos = [
+            Produto.objects.create(nome=f'Água {i}', categoria=categoria, codigo=f'AG{i}',
+                                   preco_venda=Decimal('2.50') * i, preco_custo=1, estoque_atual=10 * i,
+                                   unidade_medida='UN')
+            for i in range(1, 4)
+        ]
+        Produto.objects.create(nome='Inativo', categoria=categoria, codigo='INAT', preco_venda=1, preco_custo=1,
+                               ativo=False)
+        self.url = reverse('produtos_precos_api')
+
+    def test_catalogo_e_ids(self):
+        dados = self.client.get(self.url).json()
+        self.assertEqual(dados['campos'], ['id', 'preco_venda', 'estoque_atual', 'unidade_medida'])
+        self.assertEqual(dados['produtos'],
+                         [[p.pk, float(p.preco_venda), p.estoque_atual, 'UN'] for p in self.produtos])
+
+        dados = self.client.get(self.url, {'ids': f'{self.produtos[2].pk},{self.produtos[0].pk},999999'}).json()
+        self.assertEqual([linha[0] for linha in dados['produtos']], [self.produtos[0].pk, self.produtos[2].pk])
+        self.assertEqual(self.client.get(self.url, {'ids': 'a,b'}).status_code, 400)
+
+    def test_etag_pela_versao_do_catalogo(self):
+        resposta = self.client.get(self.url)
+        etag = resposta['ETag']
+        with limitar_consultas('produtos_precos_api', maximo=3):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ids = {'ids': f'{self.produtos[1].pk},{self.produtos[2].pk}'}
+        etag_ids = self.client.get(self.url, ids)['ETag']
+        versao = indicadores.versao_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_deltas({self.produtos[0].pk: -1})
+            # A versão só sobe depois do commit, fora dos bloqueios dos produtos
+            self.assertEqual(indicadores.versao_catalogo(), versao)
+        self.assertEqual(indicadores.versao_catalogo(), versao + 1)
+        resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        self.assertEqual(resposta.json()['produtos'][0][2], 9)
+        # Venda de outro produto: quem pede só alguns ids continua com 304
+        self.assertEqual(self.client.get(self.url, ids, HTTP_IF_NONE_MATCH=etag_ids).status_code, 304)
+
+        etag = resposta['ETag']
+        produto = self.produtos[1]
+        produto.preco_venda = Decimal('9.99')
+        produto.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Campos que não aparecem na API não mudam a versão
+        etag = self.client.get(self.url)['ETag']
+        produto.nome = 'Água com gás'
+        produto.save(update_fields=['nome'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_gzip(self):
+        resposta = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resposta['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(resposta.content))['produtos'][0][0], self.produtos[0].pk)
+        self.assertFalse(self.client.get(self.url).has_header('Content-Encoding'))
+
+
+class BuscaPorCodigoTestCase(TestCase):
+    def setUp(self):
+        codigos.leitor.limpar()
+        self.addCleanup(codigos.leitor.limpar)
+        User.objects.create_user('caixa', password='senha')
+        self.client.login(username='caixa', password='senha')
+        self.categoria = Categoria.objects.create(nome='Água')
+        self.produto = Produto.objects.create(nome='Água 500ml', categoria=self.categoria, codigo='7891234567890',
+                                              preco_venda=Decimal('2.50'), preco_custo=1, estoque_atual=10)
+        Produto.objects.create(nome='Inativo', categoria=self.categoria, codigo='INAT', preco_venda=1, preco_custo=1,
+                               ativo=False)
+
+    def buscar(self, codigo):
+        return self.client.get(reverse('produto_codigo_api', args=[codigo]))
+
+    def test_busca_pelo_codigo(self):
+        resposta = self.buscar('7891234567890')
+        self.assertEqual(resposta.json(), {'id': self.produto.pk, 'codigo': '7891234567890', 'nome': 'Água 500ml',
+                                           'preco_venda': 2.5, 'unidade_medida': 'UN'})
+        self.assertEqual(self.buscar('INAT').status_code, 404)
+        self.assertEqual(self.buscar('000').status_code, 404)
+        self.assertEqual(self.buscar(' 7891234567890 ').status_code, 200)
+        # Com o dicionário montado, só sessão e usuário vão ao banco
+        with limitar_consultas('produto_codigo_api', maximo=2):
+            self.assertEqual(self.buscar('7891234567890').status_code, 200)
+
+    def test_invalidado_ao_salvar_produto(self):
+        self.buscar('7891234567890')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.preco_venda = Decimal('3.00')
+            self.produto.save()
+        self.assertEqual(self.buscar('7891234567890').json()['preco_venda'], 3.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.ativo = False
+            self.produto.save(update_fields=['ativo'])
+        self.assertEqual(self.buscar('7891234567890').status_code, 404)
+
+    def test_alteracao_em_outro_processo(self):
+        versao = indicadores.versao_codigos()
+        aplicar_deltas({self.produto.pk: -1})
+        self.assertEqual(indicadores.versao_codigos(), versao)
+
+        demorado = codigos.LeitorCodigos(verificar_a_cada=60)
+        atento = codigos.LeitorCodigos(verificar_a_cada=0)
+        for leitor in (demorado, atento):
+            self.assertEqual(leitor.buscar('7891234567890').nome, 'Água 500ml')
+        # Outro processo: grava sem passar pelos sinais deste, mas sobe a versão
+        Produto.objects.filter(pk=self.produto.pk).update(nome='Água mineral 500ml')
+        indicadores.somar({indicadores.VERSAO_CODIGOS: 1})
+        self.assertEqual(demorado.buscar('7891234567890').nome, 'Água 500ml')
+        self.assertEqual(atento.buscar('7891234567890').nome, 'Água mineral 500ml')
+
+        # Código fora do dicionário: buscado pelo índice e guardado
+        Produto.objects.bulk_create([Produto(nome='Nova', categoria=self.categoria, codigo='NOVA', preco_venda=1,
+                                             preco_custo=1)])
+        self.assertEqual(demorado.buscar('NOVA').nome, 'Nova')
+        self.assertEqual(len(demorado), 2)
+        with self.assertNumQueries(0):
+            demorado.buscar('NOVA')
+
+    def test_benchmark(self):
+        saida = StringIO()
+        call_command('benchmark_codigos', produtos=20, buscas=500, consultas=20, requisicoes=5, meta=1, stdout=saida)
+        self.assertIn('dicionario', saida.getvalue())
+        self.assertFalse(Produto.objects.filter(codigo__startswith='BENCH-COD-').exists())
+
+
+class VendaEmLoteTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        self.client.force_login(self.usuario)
+        categoria = Categoria.objects.create(nome='Água')
+        self.produtos = [
+            Produto.objects.create(nome=f'Água {i}', categoria=categoria, codigo=f'AG{i}', preco_venda=5,
+                                   preco_custo=2, estoque_atual=100, estoque_minimo=95)
+            for i in range(30)
+        ]
+        self.cliente = Cliente.objects.create(nome='Atacado', cpf_cnpj='1', telefone='1', endereco='Rua 1')
+        self.forma = FormaPagamento.objects.create(nome='Boleto', prazo_recebimento=30)
+
+    def dados(self, linhas, cliente=True):
+        dados = {
+            'cliente': self.cliente.pk if cliente else '',
+            'forma_pagamento': self.forma.pk,
+            'data_venda': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+            'status': 'aberta',
+            'itens-TOTAL_FORMS': str(len(linhas)), 'itens-INITIAL_FORMS': '0',
+            'itens-MIN_NUM_FORMS': '1', 'itens-MAX_NUM_FORMS': '1000',
+        }
+        for indice, (produto, quantidade) in enumerate(linhas):
+            dados[f'itens-{indice}-produto'] = produto.pk
+            dados[f'itens-{indice}-quantidade'] = str(quantidade)
+            dados[f'itens-{indice}-preco_unitario'] = '5.00'
+        return dados
+
+    def consultas_da_venda(self, linhas):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post(reverse('venda_create'), self.dados(linhas))
+        self.assertEqual(resposta.status_code, 302)
+        return len(consultas)
+
+    def test_consultas_nao_crescem_com_o_carrinho(self):
+        self.consultas_da_venda([(self.produtos[0], 1)])  # aquece sessão e caches
+        duas = self.consultas_da_venda([(produto, 1) for produto in self.produtos[:2]])
+        trinta = self.consultas_da_venda([(produto, 1) for produto in self.produtos])
+        self.assertEqual(trinta, duas)
+
+    def test_venda_atacado_grava_tudo_em_lote(self):
+        linhas = [(produto, 2) for produto in self.produtos] + [(self.produtos[0], 3)]
+        self.client.post(reverse('venda_create'), self.dados(linhas))
+
+        venda = Venda.objects.get()
+        self.assertEqual(venda.status, 'aberta')
+        self.assertEqual((venda.numero_itens, venda.quantidade_itens, venda.valor_itens), (31, 63, Decimal('315.00')))
+        self.assertEqual(ContasReceber.objects.get(venda=venda).valor_total, Decimal('315.00'))
+        self.assertEqual(Produto.objects.get(pk=self.produtos[0].pk).estoque_atual, 95)
+        self.assertEqual(Produto.objects.get(pk=self.produtos[1].pk).estoque_atual, 98)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(tipo='saida', forma_pagamento=self.forma,
+                                                            observacao=f'Venda {venda.numero_venda}').count(), 31)
+
+        # bulk_create não passa pelos sinais: resumo e indicadores iguais aos recalculados
+        def linhas_resumo():
+            return sorted((produto or 0, *valores) for produto, *valores in ResumoVendaDiario.objects.values_list(
+                'produto_id', 'numero_vendas', 'quantidade', 'valor'))
+
+        incrementais = linhas_resumo()
+        resumos.reconstruir()
+        self.assertEqual(incrementais, linhas_resumo())
+        self.assertEqual(indicadores.valores()[indicadores.PRODUTOS_ABAIXO_MINIMO],
+                         Produto.objects.abaixo_do_minimo().count())
+
+    def test_carrinho_invalido_nao_grava_nada(self):
+        Produto.objects.filter(pk=self.produtos[1].pk).update(estoque_atual=1)
+        linhas = [(self.produtos[0], 60), (self.produtos[0], 60), (self.produtos[1], 2), (self.produtos[2], 1)]
+        resposta = self.client.post(reverse('venda_create'), self.dados(linhas, cliente=False), follow=True)
+
+        mensagens = [str(mensagem) for mensagem in resposta.context['messages']]
+        self.assertEqual(len(mensagens), 2)
+        self.assertIn('Estoque insuficiente para Água 0. Disponível: 100, solicitado: 120', mensagens)
+        self.assertFalse(Venda.objects.exists())
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+        self.assertEqual(list(Produto.objects.filter(pk__in=[p.pk for p in self.produtos[:3]])
+                              .order_by('pk').values_list('estoque_atual', flat=True)), [100, 1, 100])
+
+    def test_formulario_recusa_produto_inativo_ou_inexistente(self):
+        Produto.objects.filter(pk=self.produtos[0].pk).update(ativo=False)
+        dados = self.dados([(self.produtos[0], 1), (self.produtos[1], 1), (self.produtos[2], 1)])
+        dados['itens-2-produto'] = str(max(produto.pk for produto in self.produtos) + 1)
+        resposta = self.client.post(reverse('venda_create'), dados)
+
+        self.assertEqual(resposta.status_code, 200)
+        erros = resposta.context['formset'].errors
+        self.assertIn('produto', erros[0])
+        self.assertEqual(erros[1], {})
+        self.assertIn('produto', erros[2])
+        self.assertFalse(Venda.objects.exists())
+        self.assertFalse(ItemVenda.objects.exists())
+
+    def test_servico_recusa_produto_inativo(self):
+        venda = Venda.objects.create(usuario=self.usuario)
+        Produto.objects.filter(pk=self.produtos[0].pk).update(ativo=False)
+        with self.assertRaises(vendas.CarrinhoInvalido) as erro:
+            vendas.registrar_itens(venda, [(self.produtos[0].pk, 1, Decimal('5')),
+                                           (self.produtos[1].pk, 1, Decimal('5'))], self.usuario)
+        self.assertEqual(erro.exception.erros, ['Produto Água 0 não está disponível para venda.'])
+        self.assertFalse(ItemVenda.objects.exists())
+        self.assertEqual(Produto.objects.get(pk=self.produtos[1].pk).estoque_atual, 100)
+
+
+class VendaEdicaoTestCase(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='caixa', password='caixa123')
+        self.client.force_login(self.usuario)
+        categoria = Categoria.objects.create(nome='Água')
+        self.a, self.b, self.c = [
+            Produto.objects.create(nome=nome, categoria=categoria, codigo=nome, preco_venda=5, preco_custo=2,
+                                   estoque_atual=20)
+            for nome in ('A', 'B', 'C')
+        ]
+        self.venda = Venda.objects.create(usuario=self.usuario, status='finalizada')
+        vendas.registrar_itens(self.venda, [(self.a.pk, 5, Decimal('5')), (self.b.pk, 3, Decimal('5'))],
+                               self.usuario)
+
+    def editar(self, linhas, status='finalizada'):
+        """linhas: (item ou None, produto, quantidade, excluir)"""
+        iniciais = [linha for linha in linhas if linha[0] is not None]
+        novas = [linha for linha in linhas if linha[0] is None]
+        dados = {
+            'data_venda': timezone.localtime(self.venda.data_venda).strftime('%Y-%m-%dT%H:%M'),
+            'status': status,
+            'itens-TOTAL_FORMS': str(len(linhas)), 'itens-INITIAL_FORMS': str(len(iniciais)),
+            'itens-MIN_NUM_FORMS': '1', 'itens-MAX_NUM_FORMS': '1000',
+        }
+        for indice, (item, produto, quantidade, excluir) in enumerate(iniciais + novas):
+            prefixo = f'itens-{indice}-'
+            dados.update({prefixo + 'id': item.pk if item else '', prefixo + 'venda': self.venda.pk,
+                          prefixo + 'produto': produto.pk, prefixo + 'quantidade': str(quantidade),
+                          prefixo + 'preco_unitario': '5.00'})
+            if excluir:
+                dados[prefixo + 'DELETE'] = 'on'
+        return self.client.post(reverse('venda_edit', args=[self.venda.pk]), dados, follow=True)
+
+    def estoques(self):
+        return list(Produto.objects.filter(pk__in=[self.a.pk, self.b.pk, self.c.pk]).order_by('pk')
+                    .values_list('estoque_atual', flat=True))
+
+    def assertMovimentacoesBatemComItens(self):
+        itens = dict(self.venda.itens.values_list('produto').order_by().annotate(Sum('quantidade')))
+        self.assertEqual(vendas.saldo_movimentado(self.venda), itens)
+
+    def test_so_a_diferenca_liquida_mexe_no_estoque(self):
+        item_a, item_b = self.venda.itens.order_by('pk')
+        self.editar([(item_a, self.a, 7, False), (item_b, self.b, 3, True), (None, self.c, 2, False)])
+
+        self.assertEqual(self.estoques(), [13, 20, 18])
+        ajustes = MovimentacaoEstoque.objects.filter(observacao=vendas.observacao_ajuste(self.venda))
+        self.assertEqual(sorted(ajustes.values_list('produto_id', 'tipo', 'quantidade')),
+                         [(self.a.pk, 'saida', 2), (self.b.pk, 'entrada', 3), (self.c.pk, 'saida', 2)])
+        self.assertEqual(len(set(ajustes.values_list('data_movimentacao', flat=True))), 1)
+        self.assertMovimentacoesBatemComItens()
+
+        self.venda.refresh_from_db()
+        self.assertEqual((self.venda.numero_itens, self.venda.quantidade_itens, self.venda.valor_itens),
+                         (2, 9, Decimal('45.00')))
+        incrementais = sorted(ResumoVendaDiario.objects.filter(produto__isnull=False)
+                              .exclude(quantidade=0).values_list('produto_id', 'quantidade', 'valor'))
+        resumos.reconstruir()
+        self.assertEqual(incrementais, sorted(ResumoVendaDiario.objects.filter(produto__isnull=False)
+                                              .values_list('produto_id', 'quantidade', 'valor')))
+
+    def test_consultas_nao_dependem_do_numero_de_itens(self):
+        def consultas_da_edicao():
+            itens = list(self.venda.itens.order_by('pk'))
+            linhas = [(item, item.produto, item.quantidade + (indice == 0), False) for indice, item in enumerate(itens)]
+            with CaptureQueriesContext(connection) as consultas:
+                self.editar(linhas)
+            return len(consultas)
+
+        consultas_da_edicao()  # aquece sessão e caches
+        poucos = consultas_da_edicao()
+        self.venda = Venda.objects.create(usuario=self.usuario, status='finalizada')
+        vendas.registrar_itens(self.venda, [(produto.pk, 1, Decimal('5')) for produto in (self.a, self.b, self.c) * 4],
+                               self.usuario)
+        self.assertEqual(consultas_da_edicao(), poucos)
+
+    def test_itens_excluidos_passam_pelos_demais_receptores(self):
+        excluidos = []
+
+        def receptor(sender, instance, **kwargs):
+            excluidos.append(instance.pk)
+
+        item_a, item_b = self.venda.itens.order_by('pk')
+        post_delete.connect(receptor, sender=ItemVenda, dispatch_uid='teste_item_excluido')
+        try:
+            self.editar([(item_a, self.a, 5, False), (item_b, self.b, 3, True)])
+        finally:
+            post_delete.disconnect(dispatch_uid='teste_item_excluido', sender=ItemVenda)
+        self.assertEqual(excluidos, [item_b.pk])
+        self.venda.refresh_from_db()
+        self.assertEqual((self.venda.numero_itens, self.venda.quantidade_itens), (1, 5))
+
+        # Fora do bloco os receptores de totais voltam a valer
+        item_a.delete()
+        self.venda.refresh_from_db()
+        self.assertEqual(self.venda.numero_itens, 0)
+
+    def test_mesma_quantidade_em_outras_linhas_nao_gera_ajuste(self):
+        item_a, item_b = self.venda.itens.order_by('pk')
+        self.editar([(item_a, self.a, 2, False), (item_b, self.b, 3, False), (None, self.a, 3, False)])
+        self.assertEqual(self.estoques(), [15, 17, 20])
+        self.assertFalse(MovimentacaoEstoque.objects.filter(observacao=vendas.observacao_ajuste(self.venda)).exists())
+        self.assertEqual(self.venda.itens.count(), 3)
+
+    def test_estoque_insuficiente_nao_altera_nada(self):
+        item_a, item_b = self.venda.itens.order_by('pk')
+        resposta = self.editar([(item_a, self.a, 26, False), (item_b, self.b, 3, True)], status='aberta')
+        # Reabrir devolve os 5 de A antes da edição; a falta desfaz também o cabeçalho
+        self.assertIn('Estoque insuficiente para A. Disponível: 20, solicitado: 21',
+                      [str(mensagem) for mensagem in resposta.context['messages']])
+        self.assertEqual(self.estoques(), [15, 17, 20])
+        self.venda.refresh_from_db()
+        self.assertEqual((self.venda.status, self.venda.quantidade_itens), ('finalizada', 8))
+
+    def test_reabrir_e_finalizar_reconciliam_pelas_movimentacoes(self):
+        item_a, item_b = self.venda.itens.order_by('pk')
+        self.editar([(item_a, self.a, 5, False), (item_b, self.b, 3, False)], status='aberta')
+        self.assertEqual(self.estoques(), [20, 20, 20])
+        self.assertFalse(vendas.movimentacoes_da_venda(self.venda).exists())
+
+        self.editar([(item_a, self.a, 6, False), (item_b, self.b, 3, False)], status='aberta')
+        self.editar([(item_a, self.a, 6, False), (item_b, self.b, 3, False)], status='finalizada')
+        self.assertEqual(self.estoques(), [14, 17, 20])
+        self.assertMovimentacoesBatemComItens()
+
+        self.client.post(reverse('venda_cancel', args=[self.venda.pk]))
+        self.assertEqual(self.estoques(), [20, 20, 20])
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_cancelar_venda_nao_finalizada_devolve_estoque(self):
+        cliente = Cliente.objects.create(nome='Fiado', cpf_cnpj='2', telefone='1', endereco='Rua 1')
+        for status in ('aberta', 'parcial', 'paga'):
+            with self.subTest(status=status):
+                venda = Venda.objects.create(usuario=self.usuario, cliente=cliente, status=status)
+                vendas.registrar_itens(venda, [(self.a.pk, 7, Decimal('5')), (self.b.pk, 1, Decimal('5'))],
+                                       self.usuario)
+                self.assertEqual(self.estoques(), [8, 16, 20])
+
+                self.client.post(reverse('venda_cancel', args=[venda.pk]))
+                self.assertFalse(Venda.objects.filter(pk=venda.pk).exists())
+                self.assertEqual(self.estoques(), [15, 17, 20])
+                self.assertFalse(vendas.movimentacoes_da_venda(venda).exists())
@@ -12,18 +12,26 @@ urlpatterns = [
     # Produtos
     path('produtos/', views.produto_list, name='produto_list'),
     path('produtos/novo/', views.produto_create, name='produto_create'),
+    path('produtos/importar/', views.importar, {'tipo': 'produtos'}, name='produto_importar'),
     path('produtos/<int:pk>/', views.produto_detail, name='produto_detail'),
     path('produtos/<int:pk>/editar/', views.produto_edit, name='produto_edit'),
     path('produtos/<int:pk>/deletar/', views.produto_delete, name='produto_delete'),
 
     # Movimentações
     path('movimentacoes/', views.movimentacao_list, name='movimentacao_list'),
+    path('movimentacoes/exportar/', views.exportar, {'tipo': 'movimentacoes'}, name='movimentacao_exportar'),
     path('movimentacoes/nova/', views.movimentacao_create,
          name='movimentacao_create'),
     path('movimentacoes/<int:pk>/', views.movimentacao_detail, name='movimentacao_detail'),
     path('movimentacoes/<int:pk>/editar/', views.movimentacao_edit, name='movimentacao_edit'),
     path('movimentacoes/<int:pk>/deletar/', views.movimentacao_delete, name='movimentacao_delete'),
 
+    # Recebimentos (entrada em lote)
+    path('recebimentos/', views.recebimento_list, name='recebimento_list'),
+    path('recebimentos/novo/', views.recebimento_create, name='recebimento_create'),
+    path('recebimentos/<int:pk>/', views.recebimento_detail, name='recebimento_detail'),
+    path('recebimentos/<int:pk>/estornar/', views.recebimento_estornar, name='recebimento_estornar'),
+
     # Fornecedores
     path('fornecedores/', views.fornecedor_list, name='fornecedor_list'),
     path('fornecedores/novo/', views.fornecedor_create, name='fornecedor_create'),
@@ -34,6 +42,7 @@ urlpatterns = [
     # Clientes
     path('clientes/', views.cliente_list, name='cliente_list'),
     path('clientes/novo/', views.cliente_create, name='cliente_create'),
+    path('clientes/importar/', views.importar, {'tipo': 'clientes'}, name='cliente_importar'),
     path('clientes/<int:pk>/', views.cliente_detail, name='cliente_detail'),
     path('clientes/<int:pk>/editar/', views.cliente_edit, name='cliente_edit'),
     path('clientes/<int:pk>/deletar/', views.cliente_delete, name='cliente_delete'),
@@ -54,6 +63,7 @@ urlpatterns = [
 
     # Vendas
     path('vendas/', views.venda_list, name='venda_list'),
+    path('vendas/exportar/', views.exportar, {'tipo': 'vendas'}, name='venda_exportar'),
     path('vendas/nova/', views.venda_create, name='venda_create'),
     path('vendas/<int:pk>/', views.venda_detail, name='venda_detail'),
     path('vendas/<int:pk>/editar/', views.venda_edit, name='venda_edit'),
@@ -66,10 +76,15 @@ urlpatterns = [
     
     # Contas a Receber
     path('contas-receber/', views.contas_receber_list, name='contas_receber_list'),
+    path('contas-receber/exportar/', views.exportar, {'tipo': 'contas'}, name='contas_receber_exportar'),
     path('contas-receber/nova/', views.contas_receber_create, name='contas_receber_create'),
     path('contas-receber/<int:pk>/', views.conta_receber_detail, name='conta_receber_detail'),
     path('contas-receber/<int:pk>/pagamento/', views.conta_receber_pagamento, name='conta_receber_pagamento'),
     
     # APIs
     path('api/produto/<int:pk>/preco/', views.produto_preco_api, name='produto_preco_api'),
+    path('api/produtos/precos/', views.produtos_precos_api, name='produtos_precos_api'),
+    path('api/produtos/codigo/<str:codigo>/', views.produto_codigo_api, name='produto_codigo_api'),
+    path('api/recebimentos/', views.recebimento_api, name='recebimento_api'),
+    path('api/recebimentos/<int:pk>/estornar/', views.recebimento_estornar_api, name='recebimento_estornar_api'),
 ]
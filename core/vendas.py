@@ -0,0 +1,239 @@
+"""
+Serviço de vendas: gravação dos itens de uma venda em lote.
+
+registrar_itens() bloqueia e carrega todos os produtos do carrinho com uma
+consulta (em ordem de pk, como o serviço de estoque), valida o carrinho
+inteiro de uma vez, baixa o estoque com um único UPDATE condicional e grava
+itens e movimentações com bulk_create. Tudo numa transação: se um
+produto falhar, nada é gravado.
+
+A edição (atualizar_itens) reconcilia pela diferença: compara a quantidade
+de cada produto nos itens antigos e nos novos e só mexe no estoque dos
+produtos que mudaram, registrando a diferença numa trilha de ajuste (uma
+movimentação por produto, todas com a mesma observação e o mesmo horário).
+As movimentações da venda (observacoes_da_venda) são a conta do que ela
+tirou do estoque: finalizar uma venda baixa o que falta e reabrir ou cancelar
+devolve exatamente o que foi tirado.
+
+bulk_create/bulk_update não disparam os sinais de ItemVenda e
+MovimentacaoEstoque, então o serviço atualiza ele mesmo os totais da venda, o
+resumo diário e as versões do cache (os indicadores de produto ficam com o
+serviço de estoque). Os itens removidos na edição saem por QuerySet.delete()
+com os receptores de totais e resumo suspensos (signals.sinais_de_item_suspensos).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache_versionado, resumos
+from .estoque import EstoqueInsuficiente, aplicar_deltas, bloquear_produtos, delta_movimentacao, somar_deltas
+from .models import ItemVenda, MovimentacaoEstoque, Pagamento
+from .signals import sinais_de_item_suspensos
+
+
+class CarrinhoInvalido(Exception):
+    """Itens que não podem ser vendidos; erros traz uma mensagem por produto"""
+
+    def __init__(self, erros):
+        self.erros = erros
+        super().__init__(' '.join(erros))
+
+
+def validar_carrinho(produtos, quantidades):
+    """Mensagens de erro do carrinho {produto_id: quantidade} diante dos produtos carregados {pk: Produto}"""
+    erros = []
+    for produto_id in sorted(quantidades):
+        produto = produtos.get(produto_id)
+        if produto is None or not produto.ativo:
+            nome = produto.nome if produto else f'#{produto_id}'
+            erros.append(f'Produto {nome} não está disponível para venda.')
+        elif produto.estoque_atual < quantidades[produto_id]:
+            erros.append(str(EstoqueInsuficiente(produto, quantidades[produto_id])))
+    return erros
+
+
+@transaction.atomic
+def registrar_itens(venda, itens, usuario):
+    """
+    Grava os itens da venda já salva e baixa o estoque.
+
+    itens: lista de (produto_id, quantidade, preco_unitario); o mesmo produto
+    pode aparecer em mais de uma linha. Lança CarrinhoInvalido (sem gravar
+    nada) se algum produto está inativo ou sem estoque para o total pedido.
+    Retorna os ItemVenda criados.
+    """
+    quantidades = somar_deltas((produto_id, quantidade) for produto_id, quantidade, _ in itens)
+    produtos = bloquear_produtos(quantidades)
+    erros = validar_carrinho(produtos, quantidades)
+    if erros:
+        raise CarrinhoInvalido(erros)
+
+    try:
+        aplicar_deltas({produto_id: -quantidade for produto_id, quantidade in quantidades.items()}, produtos)
+    except EstoqueInsuficiente as erro:
+        raise CarrinhoInvalido([str(erro)]) from erro
+
+    criados = ItemVenda.objects.bulk_create([
+        ItemVenda(venda=venda, produto_id=produto_id, quantidade=quantidade, preco_unitario=preco_unitario)
+        for produto_id, quantidade, preco_unitario in itens
+    ])
+    MovimentacaoEstoque.objects.bulk_create([
+        MovimentacaoEstoque(
+            produto_id=produto_id,
+            tipo='saida',
+            quantidade=quantidade,
+            preco_unitario=preco_unitario,
+            forma_pagamento_id=venda.forma_pagamento_id,
+            observacao=observacao_venda(venda),
+            usuario=usuario,
+        )
+        for produto_id, quantidade, preco_unitario in itens
+    ])
+
+    venda.recalcular_totais()
+    resumos.aplicar_venda(resumos.chave_venda(venda), venda.pk, 1, contar_venda=False)
+    cache_versionado.invalidar(cache_versionado.VENDAS, cache_versionado.MOVIMENTACOES)
+    return criados
+
+
+@transaction.atomic
+def registrar_pagamentos(venda, pagamentos, usuario):
+    """
+    Grava os pagamentos [(forma_pagamento_id, valor)] da venda com um
+    bulk_create e recalcula os totais uma vez (os sinais de Pagamento
+    recalculariam a cada linha). Retorna os Pagamento criados.
+    """
+    criados = Pagamento.objects.bulk_create([
+        Pagamento(venda=venda, forma_pagamento_id=forma_pagamento_id, valor_pago=valor, usuario=usuario)
+        for forma_pagamento_id, valor in pagamentos
+    ])
+    venda.recalcular_totais()
+    cache_versionado.invalidar(*cache_versionado.GRUPOS_POR_MODELO[Pagamento])
+    return criados
+
+
+def observacao_venda(venda):
+    return f'Venda {venda.numero_venda}'
+
+
+def observacao_ajuste(venda):
+    return f'Venda {venda.numero_venda} - ajuste'
+
+
+def movimentacoes_da_venda(venda):
+    return MovimentacaoEstoque.objects.filter(observacao__in=[observacao_venda(venda), observacao_ajuste(venda)])
+
+
+def saldo_movimentado(venda):
+    """{produto_id: quantidade} que as movimentações da venda tiraram do estoque"""
+    return somar_deltas(
+        (produto_id, -delta_movimentacao(tipo, quantidade))
+        for produto_id, tipo, quantidade in movimentacoes_da_venda(venda).values_list('produto_id', 'tipo',
+                                                                                    'quantidade')
+    )
+
+
+@transaction.atomic
+def ajustar_estoque(venda, deltas, usuario, precos=None):
+    """
+    Aplica {produto_id: delta} ao estoque (negativo: a venda leva mais) e grava a
+    trilha de ajuste da venda, uma movimentação por produto. Valida todos os
+    produtos que saem antes de alterar qualquer um; lança CarrinhoInvalido.
+    """
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    precos = precos or {}
+    produtos = bloquear_produtos(deltas)
+    erros = validar_carrinho(produtos, {produto_id: -delta for produto_id, delta in deltas.items() if delta < 0})
+    if erros:
+        raise CarrinhoInvalido(erros)
+    try:
+        aplicar_deltas(deltas, produtos)
+    except EstoqueInsuficiente as erro:
+        raise CarrinhoInvalido([str(erro)]) from erro
+
+    agora = timezone.now()
+    MovimentacaoEstoque.objects.bulk_create([
+        MovimentacaoEstoque(
+            produto_id=produto_id,
+            tipo='entrada' if delta > 0 else 'saida',
+            quantidade=abs(delta),
+            preco_unitario=precos.get(produto_id),
+            forma_pagamento_id=venda.forma_pagamento_id,
+            observacao=observacao_ajuste(venda),
+            usuario=usuario,
+            data_movimentacao=agora,
+        )
+        for produto_id, delta in sorted(deltas.items())
+    ])
+    cache_versionado.invalidar(cache_versionado.MOVIMENTACOES)
+
+
+def baixar_pendentes(venda, usuario):
+    """Reconcilia o estoque com os itens: baixa o que os itens pedem e as movimentações ainda não tiraram"""
+    itens = list(venda.itens.values_list('produto_id', 'quantidade', 'preco_unitario'))
+    deltas = saldo_movimentado(venda)
+    for produto_id, quantidade, _ in itens:
+        deltas[produto_id] = deltas.get(produto_id, 0) - quantidade
+    ajustar_estoque(venda, deltas, usuario, {produto_id: preco for produto_id, _, preco in itens})
+
+
+@transaction.atomic
+def estornar_movimentacoes(venda):
+    """Devolve ao estoque o que as movimentações da venda tiraram e as exclui"""
+    aplicar_deltas(saldo_movimentado(venda))
+    movimentacoes_da_venda(venda).delete()
+
+
+@transaction.atomic
+def atualizar_itens(venda, linhas, excluidos, usuario):
+    """
+    Aplica a edição dos itens de uma venda reconciliando pela diferença.
+
+    linhas: (pk do item ou None se novo, produto_id, quantidade, preco_unitario)
+    dos itens que ficam; excluidos: pks dos itens removidos. O estoque e a
+    trilha de ajuste recebem só a diferença líquida de cada produto: trocar a
+    linha de lugar ou dividir a mesma quantidade em duas linhas não mexe no
+    estoque. Lança CarrinhoInvalido sem gravar nada.
+    """
+    antigos = {pk: (produto_id, quantidade, preco) for pk, produto_id, quantidade, preco in
+               venda.itens.values_list('pk', 'produto_id', 'quantidade', 'preco_unitario')}
+    excluidos = [pk for pk in excluidos if pk in antigos]
+    linhas = [linha for linha in linhas if linha[0] is None or linha[0] in antigos]
+
+    # Quantidade e valor por produto antes e depois (positivo: a venda leva mais)
+    diferencas = defaultdict(lambda: [0, Decimal('0')])
+    for produto_id, quantidade, preco in antigos.values():
+        diferencas[produto_id][0] -= quantidade
+        diferencas[produto_id][1] -= quantidade * preco
+    precos = {}
+    for _, produto_id, quantidade, preco in linhas:
+        diferencas[produto_id][0] += quantidade
+        diferencas[produto_id][1] += quantidade * preco
+        precos[produto_id] = preco
+
+    ajustar_estoque(venda, {produto_id: -quantidade for produto_id, (quantidade, _) in diferencas.items()},
+                    usuario, precos)
+
+    if excluidos:
+        # Totais e resumo são aplicados abaixo, uma vez, pela diferença
+        with sinais_de_item_suspensos():
+            ItemVenda.objects.filter(venda=venda, pk__in=excluidos).delete()
+    ItemVenda.objects.bulk_update([
+        ItemVenda(pk=pk, venda=venda, produto_id=produto_id, quantidade=quantidade, preco_unitario=preco)
+        for pk, produto_id, quantidade, preco in linhas
+        if pk is not None and antigos[pk] != (produto_id, quantidade, preco)
+    ], ['produto', 'quantidade', 'preco_unitario'])
+    ItemVenda.objects.bulk_create([
+        ItemVenda(venda=venda, produto_id=produto_id, quantidade=quantidade, preco_unitario=preco)
+        for pk, produto_id, quantidade, preco in linhas if pk is None
+    ])
+
+    chave = resumos.chave_venda(venda)
+    resumos.acumular_produtos(chave, {produto_id: tuple(diferenca) for produto_id, diferenca in diferencas.items()})
+    resumos.acumular(chave, valor=sum(valor for _, valor in diferencas.values()))
+    venda.recalcular_totais()
+    cache_versionado.invalidar(cache_versionado.VENDAS)
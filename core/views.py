@@ -1,17 +1,51 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q, F
-from django.http import JsonResponse
+from django.db.models import Sum, Count, Q, F, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
 from django.db import transaction
 from .models import (Produto, MovimentacaoEstoque, Fornecedor, Cliente, Categoria, 
-                    FormaPagamento, Venda, ItemVenda, Pagamento, ContasReceber, PagamentoConta)
+                    FormaPagamento, Venda, ItemVenda, Pagamento, ContasReceber, PagamentoConta,
+                    ResumoVendaDiario, RecebimentoEstoque)
+from . import busca, cache_versionado, codigos, exportacao, importacao, indicadores
+from .filtros import filtrar_contas, filtrar_movimentacoes, filtrar_resumo_vendas, filtrar_vendas, inicio_do_dia
+from .paginacao import agregar_em_cache, paginar, parametros_sem_pagina
+from .vendas import (CarrinhoInvalido, atualizar_itens, baixar_pendentes, estornar_movimentacoes,
+                     registrar_itens, registrar_pagamentos)
+from .estoque import (EstoqueInsuficiente, aplicar_deltas, definir_estoque, delta_movimentacao, estornar_recebimento,
+                      registrar_recebimento)
 from .forms import (ProdutoForm, MovimentacaoEstoqueForm, FornecedorForm, ClienteForm, 
                    CategoriaForm, FormaPagamentoForm, VendaForm, ItemVendaFormSet, 
-                   PagamentoForm, ContasReceberForm, PagamentoContaForm)
+                   PagamentoForm, ContasReceberForm, PagamentoContaForm, ImportacaoForm,
+                   RecebimentoEstoqueForm, ItemRecebimentoForm, ItemRecebimentoFormSet)
 from django.utils import timezone
+from django.utils.cache import parse_etags
+from django.utils.text import compress_string
 from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+import hashlib
+import json
+import re
+import uuid
+
+# Validade dos totais em cache (segundos); a versão já invalida a cada alteração
+TEMPO_CACHE_TOTAIS = 300
+# Sem período no filtro, os totais das movimentações cobrem só os últimos dias
+# (pelo índice de data), em vez de somar a tabela inteira
+DIAS_TOTAIS_MOVIMENTACOES = 30
+# O dashboard também depende do relógio (últimos 7 dias) e pode vir da réplica
+# de relatórios, que atrasa em relação à versão: validade curta
+TEMPO_CACHE_DASHBOARD = 60
+DEPENDENCIAS_DASHBOARD = [cache_versionado.PRODUTOS, cache_versionado.CATEGORIAS, cache_versionado.VENDAS,
+                          cache_versionado.MOVIMENTACOES]
+# API de preços em lote: máximo de ids por requisição e validade do corpo em
+# cache (a chave já tem a versão do catálogo)
+MAXIMO_IDS_PRECOS = 500
+TEMPO_CACHE_CATALOGO = 300
+ACEITA_GZIP = re.compile(r'\bgzip\b')
 
 def homepage(request):
     """Homepage pública da Império das Águas"""
@@ -19,8 +53,8 @@ def homepage(request):
         'title': 'Império das Águas - Água Mineral de Qualidade'
     })
 
-@login_required
-def dashboard(request):
+def _dados_dashboard(hoje):
+    """Números e listas do dashboard (guardados em cache pela view)"""
     # Estatísticas gerais
     total_produtos = Produto.objects.filter(ativo=True).count()
     produtos_estoque_baixo = Produto.objects.filter(
@@ -29,49 +63,57 @@ def dashboard(request):
     ).count()
 
     # Valor total do estoque
-    valor_total_estoque = sum([p.valor_total_estoque for p in Produto.objects.filter(ativo=True)])
-
-    # Estatísticas de vendas
-    data_limite = timezone.now() - timedelta(days=30)
-    vendas_mes = Venda.objects.filter(data_venda__gte=data_limite, status='finalizada')
-    total_vendas_mes = vendas_mes.count()
-    valor_vendas_mes = sum(v.valor_total for v in vendas_mes)
+    valor_total_estoque = Produto.objects.filter(ativo=True).valor_estoque_total()
+
+    # Estatísticas de vendas (lidas do resumo diário pré-agregado)
+    resumo_vendas = ResumoVendaDiario.objects.filter(
+        produto__isnull=True, status='finalizada', data__gt=hoje - timedelta(days=30)
+    ).aggregate(
+        total_mes=Sum('numero_vendas'),
+        valor_mes=Sum('valor'),
+        total_hoje=Sum('numero_vendas', filter=Q(data=hoje)),
+        valor_hoje=Sum('valor', filter=Q(data=hoje)),
+    )
+    total_vendas_mes = resumo_vendas['total_mes'] or 0
+    valor_vendas_mes = resumo_vendas['valor_mes'] or 0
     
     # Vendas de hoje
-    hoje = timezone.now().date()
-    vendas_hoje = Venda.objects.filter(data_venda__date=hoje, status='finalizada')
-    total_vendas_hoje = vendas_hoje.count()
-    valor_vendas_hoje = sum(v.valor_total for v in vendas_hoje)
+    total_vendas_hoje = resumo_vendas['total_hoje'] or 0
+    valor_vendas_hoje = resumo_vendas['valor_hoje'] or 0
 
     # Movimentações recentes
-    movimentacoes_recentes = MovimentacaoEstoque.objects.select_related('produto', 'usuario')[:10]
+    movimentacoes_recentes = list(MovimentacaoEstoque.objects.select_related('produto', 'usuario')[:10])
 
     # Vendas recentes
-    vendas_recentes = Venda.objects.select_related('cliente', 'usuario').filter(status='finalizada')[:5]
+    vendas_recentes = list(Venda.objects.select_related('cliente', 'usuario').filter(status='finalizada')[:5])
 
     # Produtos com estoque baixo
-    produtos_baixo_estoque = Produto.objects.filter(
+    produtos_baixo_estoque = list(Produto.objects.select_related('categoria').filter(
         ativo=True,
         estoque_atual__lte=F('estoque_minimo')
-    )[:5]
+    )[:5])
 
-    # Movimentações dos últimos 7 dias
+    # Movimentações dos últimos 7 dias, por tipo. Somas condicionais em vez de
+    # GROUP BY tipo: o agrupamento levava o SQLite a percorrer mov_tipo_data_idx
+    # inteiro; assim a consulta lê só a semana pelo índice de data
     data_limite_semana = timezone.now() - timedelta(days=7)
-    movimentacoes_semana = MovimentacaoEstoque.objects.filter(
-        data_movimentacao__gte=data_limite_semana
-    ).values('tipo').annotate(
-        total=Count('id'),
-        quantidade_total=Sum('quantidade')
+    semana = MovimentacaoEstoque.objects.filter(data_movimentacao__gte=data_limite_semana).order_by().aggregate(
+        **{f'{tipo}_total': Count('id', filter=Q(tipo=tipo)) for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES},
+        **{f'{tipo}_quantidade': Sum('quantidade', filter=Q(tipo=tipo)) for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES},
     )
+    movimentacoes_semana = [
+        {'tipo': tipo, 'total': semana[f'{tipo}_total'], 'quantidade_total': semana[f'{tipo}_quantidade']}
+        for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES if semana[f'{tipo}_total']
+    ]
 
     # Top 5 produtos mais movimentados
-    produtos_mais_movimentados = MovimentacaoEstoque.objects.filter(
+    produtos_mais_movimentados = list(MovimentacaoEstoque.objects.filter(
         data_movimentacao__gte=data_limite_semana
     ).values('produto__nome').annotate(
         total_movimentacoes=Count('id')
-    ).order_by('-total_movimentacoes')[:5]
+    ).order_by('-total_movimentacoes')[:5])
 
-    context = {
+    return {
         'total_produtos': total_produtos,
         'produtos_estoque_baixo': produtos_estoque_baixo,
         'valor_total_estoque': valor_total_estoque,
@@ -86,6 +128,13 @@ def dashboard(request):
         'produtos_mais_movimentados': produtos_mais_movimentados,
     }
 
+@login_required
+def dashboard(request):
+    hoje = timezone.localdate()
+    context = cache_versionado.em_cache(
+        'dashboard', DEPENDENCIAS_DASHBOARD, lambda: _dados_dashboard(hoje), TEMPO_CACHE_DASHBOARD,
+        partes=(hoje.isoformat(),), anterior_enquanto_calcula=True,
+    )
     return render(request, 'core/dashboard.html', context)
 
 @login_required
@@ -97,9 +146,7 @@ def produto_list(request):
     categoria_id = request.GET.get('categoria')
 
     if search:
-        produtos = produtos.filter(
-            Q(nome__icontains=search) | Q(codigo__icontains=search)
-        )
+        produtos = busca.filtrar(produtos, search)
 
     if categoria_id:
         produtos = produtos.filter(categoria_id=categoria_id)
@@ -109,7 +156,7 @@ def produto_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    categorias = Categoria.objects.all()
+    categorias = cache_versionado.objetos(Categoria.objects.all(), cache_versionado.CATEGORIAS)
 
     context = {
         'page_obj': page_obj,
@@ -197,6 +244,34 @@ def produto_delete(request, pk):
         'cancel_url': 'produto_list'
     })
 
+def _totais_movimentacoes(movimentacoes, filtros):
+    """Quantidade, valor e número de movimentações por tipo, em um único aggregate().
+
+    O resultado fica em cache por combinação de filtros; a chave inclui a
+    versão das movimentações, que muda a cada movimentação gravada/excluída.
+    """
+    def calcular():
+        valor = ExpressionWrapper(F('quantidade') * F('preco_unitario'),
+                                  output_field=DecimalField(max_digits=14, decimal_places=2))
+        agregados = {}
+        for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES:
+            filtro = Q(tipo=tipo)
+            agregados[f'{tipo}_quantidade'] = Coalesce(Sum('quantidade', filter=filtro), 0)
+            agregados[f'{tipo}_valor'] = Coalesce(Sum(valor, filter=filtro), Decimal('0'),
+                                                  output_field=DecimalField(max_digits=14, decimal_places=2))
+            agregados[f'{tipo}_count'] = Count('id', filter=filtro)
+        resultado = movimentacoes.order_by().aggregate(**agregados)
+
+        return {
+            tipo: {campo: resultado[f'{tipo}_{campo}'] for campo in ('quantidade', 'valor', 'count')}
+            for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES
+        }
+
+    return cache_versionado.em_cache(
+        'movimentacoes:totais', [cache_versionado.MOVIMENTACOES], calcular, TEMPO_CACHE_TOTAIS,
+        partes=(urlencode(sorted((nome, valor) for nome, valor in filtros.items() if valor)),),
+    )
+
 @login_required
 def movimentacao_list(request):
     movimentacoes = MovimentacaoEstoque.objects.select_related('produto', 'usuario', 'forma_pagamento').all()
@@ -207,46 +282,27 @@ def movimentacao_list(request):
     data_inicio = request.GET.get('data_inicio')
     data_fim = request.GET.get('data_fim')
 
-    if tipo:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
-
-    if produto_id:
-        movimentacoes = movimentacoes.filter(produto_id=produto_id)
-
-    if data_inicio:
-        movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=data_inicio)
-
-    if data_fim:
-        movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=data_fim)
-
-    # Calcular totais das movimentações filtradas
-    total_quantidade = sum(mov.quantidade for mov in movimentacoes)
-    total_valor = sum(mov.valor_total for mov in movimentacoes if mov.preco_unitario)
-    total_movimentacoes = movimentacoes.count()
-    
-    # Calcular totais por tipo de movimentação
-    totais_por_tipo = {
-        'entrada': {
-            'quantidade': sum(mov.quantidade for mov in movimentacoes if mov.tipo == 'entrada'),
-            'valor': sum(mov.valor_total for mov in movimentacoes if mov.tipo == 'entrada' and mov.preco_unitario),
-            'count': movimentacoes.filter(tipo='entrada').count()
-        },
-        'saida': {
-            'quantidade': sum(mov.quantidade for mov in movimentacoes if mov.tipo == 'saida'),
-            'valor': sum(mov.valor_total for mov in movimentacoes if mov.tipo == 'saida' and mov.preco_unitario),
-            'count': movimentacoes.filter(tipo='saida').count()
-        },
-        'ajuste': {
-            'quantidade': sum(mov.quantidade for mov in movimentacoes if mov.tipo == 'ajuste'),
-            'valor': sum(mov.valor_total for mov in movimentacoes if mov.tipo == 'ajuste' and mov.preco_unitario),
-            'count': movimentacoes.filter(tipo='ajuste').count()
-        }
-    }
-
-    # Paginação
-    paginator = Paginator(movimentacoes, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    movimentacoes = filtrar_movimentacoes(movimentacoes, request.GET)
+
+    # Calcular totais das movimentações filtradas (uma única consulta, em cache);
+    # sem período, só dos últimos DIAS_TOTAIS_MOVIMENTACOES dias
+    filtros = {'tipo': tipo, 'produto': produto_id, 'data_inicio': data_inicio, 'data_fim': data_fim}
+    movimentacoes_totais = movimentacoes
+    dias_totais = None
+    if not data_inicio and not data_fim:
+        dias_totais = DIAS_TOTAIS_MOVIMENTACOES
+        filtros['desde'] = timezone.localdate() - timedelta(days=dias_totais - 1)
+        movimentacoes_totais = movimentacoes.filter(data_movimentacao__gte=inicio_do_dia(filtros['desde']))
+    totais = _totais_movimentacoes(movimentacoes_totais, filtros)
+    total_quantidade = sum(t['quantidade'] for t in totais.values())
+    total_valor = sum(t['valor'] for t in totais.values())
+    total_movimentacoes = sum(t['count'] for t in totais.values())
+    totais_por_tipo = totais
+
+    # Paginação (por cursor; ?page=N para a paginação por número, que só
+    # aproveita o total quando ele cobre a listagem inteira)
+    page_obj = paginar(request, movimentacoes, 'data_movimentacao',
+                       total=None if dias_totais else total_movimentacoes)
 
     produtos = Produto.objects.filter(ativo=True)
 
@@ -261,6 +317,8 @@ def movimentacao_list(request):
         'total_valor': total_valor,
         'total_movimentacoes': total_movimentacoes,
         'totais_por_tipo': totais_por_tipo,
+        'dias_totais': dias_totais,
+        'filtros': parametros_sem_pagina(request),
     }
 
     return render(request, 'core/movimentacao_list.html', context)
@@ -303,24 +361,32 @@ def movimentacao_delete(request, pk):
     movimentacao = get_object_or_404(MovimentacaoEstoque, pk=pk)
     
     if request.method == 'POST':
+        if movimentacao.recebimento_id:
+            messages.error(request, f'Esta movimentação faz parte do recebimento {movimentacao.recebimento_id} '
+                                    f'e só é desfeita pelo estorno do recebimento inteiro.')
+            return redirect('recebimento_detail', pk=movimentacao.recebimento_id)
+
         # Reverter o efeito no estoque
-        produto = movimentacao.produto
-        if movimentacao.tipo == 'entrada':
-            produto.estoque_atual -= movimentacao.quantidade
-        elif movimentacao.tipo == 'saida':
-            produto.estoque_atual += movimentacao.quantidade
-        
-        produto.save()
-        movimentacao.delete()
+        try:
+            with transaction.atomic():
+                aplicar_deltas({
+                    movimentacao.produto_id: -delta_movimentacao(movimentacao.tipo, movimentacao.quantidade)
+                })
+                movimentacao.delete()
+        except EstoqueInsuficiente as e:
+            messages.error(request, f'Não é possível reverter esta movimentação: {e}')
+            return redirect('movimentacao_detail', pk=pk)
         messages.success(request, 'Movimentação deletada e estoque ajustado!')
         return redirect('movimentacao_list')
     
     context = {
-        'movimentacao': movimentacao,
-        'title': f'Deletar Movimentação: {movimentacao.get_tipo_display()}'
+        'object': movimentacao,
+        'title': f'Deletar Movimentação: {movimentacao.get_tipo_display()}',
+        'cancel_url': 'movimentacao_detail',
+        'cancel_id': movimentacao.pk
     }
     
-    return render(request, 'core/movimentacao_confirm_delete.html', context)
+    return render(request, 'core/confirm_delete.html', context)
 
 @login_required
 def movimentacao_create(request):
@@ -331,20 +397,18 @@ def movimentacao_create(request):
             movimentacao.usuario = request.user
 
             # Atualizar estoque do produto
-            produto = movimentacao.produto
-            if movimentacao.tipo == 'entrada':
-                produto.estoque_atual += movimentacao.quantidade
-            elif movimentacao.tipo == 'saida':
-                if produto.estoque_atual >= movimentacao.quantidade:
-                    produto.estoque_atual -= movimentacao.quantidade
-                else:
-                    messages.error(request, 'Estoque insuficiente para esta saída!')
-                    return render(request, 'core/movimentacao_form.html', {'form': form})
-            elif movimentacao.tipo == 'ajuste':
-                produto.estoque_atual = movimentacao.quantidade
-
-            produto.save()
-            movimentacao.save()
+            try:
+                with transaction.atomic():
+                    if movimentacao.tipo == 'ajuste':
+                        definir_estoque(movimentacao.produto_id, movimentacao.quantidade)
+                    else:
+                        aplicar_deltas({
+                            movimentacao.produto_id: delta_movimentacao(movimentacao.tipo, movimentacao.quantidade)
+                        })
+                    movimentacao.save()
+            except EstoqueInsuficiente:
+                messages.error(request, 'Estoque insuficiente para esta saída!')
+                return render(request, 'core/movimentacao_form.html', {'form': form})
 
             messages.success(request, 'Movimentação registrada com sucesso!')
             return redirect('movimentacao_list')
@@ -353,15 +417,163 @@ def movimentacao_create(request):
 
     return render(request, 'core/movimentacao_form.html', {'form': form})
 
+# ===== RECEBIMENTOS (ENTRADA EM LOTE) =====
+
+@login_required
+def recebimento_list(request):
+    recebimentos = RecebimentoEstoque.objects.select_related('fornecedor', 'usuario')
+
+    fornecedor_id = request.GET.get('fornecedor')
+    if fornecedor_id:
+        recebimentos = recebimentos.filter(fornecedor_id=fornecedor_id)
+    status = request.GET.get('status')
+    if status:
+        recebimentos = recebimentos.filter(status=status)
+
+    context = {
+        'page_obj': paginar(request, recebimentos, 'data_recebimento'),
+        'fornecedores': Fornecedor.objects.filter(ativo=True),
+        'fornecedor_id': fornecedor_id,
+        'status_filter': status,
+        'filtros': parametros_sem_pagina(request),
+    }
+    return render(request, 'core/recebimento_list.html', context)
+
+
+@login_required
+def recebimento_create(request):
+    """Entrada em lote de uma entrega de fornecedor"""
+    if request.method == 'POST':
+        form = RecebimentoEstoqueForm(request.POST)
+        formset = ItemRecebimentoFormSet(request.POST)
+        if form.is_valid() and formset.is_valid():
+            itens = [(item['produto'].pk, item['quantidade'], item['preco_unitario'])
+                     for item in formset.cleaned_data if item and not item.get('DELETE')]
+            recebimento, criado = registrar_recebimento(
+                form.cleaned_data['chave'], form.cleaned_data['fornecedor'], itens, request.user,
+                nota_fiscal=form.cleaned_data['nota_fiscal'], observacao=form.cleaned_data['observacao'],
+            )
+            if criado:
+                messages.success(request, f'Recebimento {recebimento.pk} registrado: '
+                                          f'{recebimento.quantidade_itens} unidade(s) em estoque.')
+            else:
+                messages.info(request, f'Este recebimento já havia sido registrado (recebimento {recebimento.pk}).')
+            return redirect('recebimento_detail', pk=recebimento.pk)
+    else:
+        form = RecebimentoEstoqueForm(initial={'chave': uuid.uuid4().hex})
+        formset = ItemRecebimentoFormSet()
+
+    return render(request, 'core/recebimento_form.html', {
+        'form': form,
+        'formset': formset,
+        'title': 'Novo Recebimento',
+    })
+
+
+@login_required
+def recebimento_detail(request, pk):
+    recebimento = get_object_or_404(
+        RecebimentoEstoque.objects.select_related('fornecedor', 'usuario', 'usuario_estorno'), pk=pk
+    )
+    movimentacoes = recebimento.movimentacoes.select_related('produto').order_by('pk')
+    return render(request, 'core/recebimento_detail.html', {
+        'recebimento': recebimento,
+        'movimentacoes': movimentacoes,
+        'title': f'Recebimento {recebimento.pk}',
+    })
+
+
+@login_required
+def recebimento_estornar(request, pk):
+    recebimento = get_object_or_404(RecebimentoEstoque, pk=pk)
+    if request.method == 'POST':
+        try:
+            recebimento, estornado = estornar_recebimento(recebimento.pk, request.user)
+        except EstoqueInsuficiente as e:
+            messages.error(request, f'Não é possível estornar o recebimento: {e}')
+        else:
+            if estornado:
+                messages.success(request, f'Recebimento {recebimento.pk} estornado e estoque ajustado!')
+            else:
+                messages.info(request, 'Este recebimento já estava estornado.')
+    return redirect('recebimento_detail', pk=pk)
+
+
+def _recebimento_json(recebimento):
+    return {
+        'id': recebimento.pk,
+        'chave': recebimento.chave,
+        'fornecedor': recebimento.fornecedor_id,
+        'nota_fiscal': recebimento.nota_fiscal,
+        'status': recebimento.status,
+        'numero_itens': recebimento.numero_itens,
+        'quantidade_itens': recebimento.quantidade_itens,
+        'valor_total': str(recebimento.valor_total),
+        'data_recebimento': recebimento.data_recebimento.isoformat(),
+    }
+
+
+@login_required
+def recebimento_api(request):
+    """
+    API de recebimento em lote (POST, JSON):
+
+        {"chave": "...", "fornecedor": 1, "nota_fiscal": "123",
+         "itens": [{"produto": 1, "quantidade": 20, "preco_unitario": "8.50"}, ...]}
+
+    A chave também pode vir no cabeçalho Idempotency-Key. Responde 201 ao
+    registrar e 200 (com o mesmo recebimento) quando a chave já foi usada.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Use POST'}, status=405)
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    if not isinstance(dados, dict) or not isinstance(dados.get('itens'), list) or not dados['itens']:
+        return JsonResponse({'error': 'Informe os itens do recebimento'}, status=400)
+
+    dados.setdefault('chave', request.headers.get('Idempotency-Key', ''))
+    form = RecebimentoEstoqueForm(dados)
+    itens = [ItemRecebimentoForm(item if isinstance(item, dict) else {}) for item in dados['itens']]
+    erros = {}
+    if not form.is_valid():
+        erros.update(form.errors.get_json_data())
+    erros_itens = {indice: item.errors.get_json_data() for indice, item in enumerate(itens) if not item.is_valid()}
+    if erros_itens:
+        erros['itens'] = erros_itens
+    if erros:
+        return JsonResponse({'error': 'Dados inválidos', 'erros': erros}, status=400)
+
+    recebimento, criado = registrar_recebimento(
+        form.cleaned_data['chave'], form.cleaned_data['fornecedor'],
+        [(item.cleaned_data['produto'].pk, item.cleaned_data['quantidade'], item.cleaned_data['preco_unitario'])
+         for item in itens],
+        request.user, nota_fiscal=form.cleaned_data['nota_fiscal'], observacao=form.cleaned_data['observacao'],
+    )
+    return JsonResponse(_recebimento_json(recebimento), status=201 if criado else 200)
+
+
+@login_required
+def recebimento_estornar_api(request, pk):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Use POST'}, status=405)
+    if not RecebimentoEstoque.objects.filter(pk=pk).exists():
+        return JsonResponse({'error': 'Recebimento não encontrado'}, status=404)
+    try:
+        recebimento, _ = estornar_recebimento(pk, request.user)
+    except EstoqueInsuficiente as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(_recebimento_json(recebimento))
+
+
 @login_required
 def fornecedor_list(request):
     fornecedores = Fornecedor.objects.filter(ativo=True)
 
     search = request.GET.get('search')
     if search:
-        fornecedores = fornecedores.filter(
-            Q(nome__icontains=search) | Q(cnpj__icontains=search)
-        )
+        fornecedores = busca.filtrar(fornecedores, search)
 
     paginator = Paginator(fornecedores, 20)
     page_number = request.GET.get('page')
@@ -445,9 +657,7 @@ def cliente_list(request):
 
     search = request.GET.get('search')
     if search:
-        clientes = clientes.filter(
-            Q(nome__icontains=search) | Q(cpf_cnpj__icontains=search)
-        )
+        clientes = busca.filtrar(clientes, search)
 
     paginator = Paginator(clientes, 20)
     page_number = request.GET.get('page')
@@ -464,8 +674,9 @@ def cliente_detail(request, pk):
     vendas = Venda.objects.filter(cliente=cliente).order_by('-data_venda')[:10]
     
     # Estatísticas do cliente
-    total_vendas = Venda.objects.filter(cliente=cliente, status='finalizada').count()
-    valor_total_compras = sum(v.valor_total for v in Venda.objects.filter(cliente=cliente, status='finalizada'))
+    totais = Venda.objects.filter(cliente=cliente, status='finalizada').totais()
+    total_vendas = totais['numero_vendas']
+    valor_total_compras = totais['valor_total']
     
     context = {
         'cliente': cliente,
@@ -521,7 +732,7 @@ def cliente_delete(request, pk):
 
 @login_required
 def categoria_list(request):
-    categorias = Categoria.objects.all()
+    categorias = Categoria.objects.annotate(numero_produtos=Count('produto'))
     return render(request, 'core/categoria_list.html', {'categorias': categorias})
 
 @login_required
@@ -530,11 +741,11 @@ def categoria_detail(request, pk):
     categoria = get_object_or_404(Categoria, pk=pk)
     
     # Produtos da categoria
-    produtos = Produto.objects.filter(categoria=categoria, ativo=True)
+    produtos = Produto.objects.filter(categoria=categoria, ativo=True).com_valor_estoque()
     total_produtos = produtos.count()
     
     # Valor total do estoque da categoria
-    valor_total_estoque = sum(p.valor_total_estoque for p in produtos)
+    valor_total_estoque = produtos.valor_estoque_total()
     
     context = {
         'categoria': categoria,
@@ -600,8 +811,9 @@ def forma_pagamento_detail(request, pk):
     
     # Vendas com esta forma de pagamento
     vendas = Venda.objects.filter(forma_pagamento=forma_pagamento).order_by('-data_venda')[:10]
-    total_vendas = Venda.objects.filter(forma_pagamento=forma_pagamento, status='finalizada').count()
-    valor_total = sum(v.valor_total for v in Venda.objects.filter(forma_pagamento=forma_pagamento, status='finalizada'))
+    totais = Venda.objects.filter(forma_pagamento=forma_pagamento, status='finalizada').totais()
+    total_vendas = totais['numero_vendas']
+    valor_total = totais['valor_total']
     
     # Movimentações com esta forma de pagamento
     movimentacoes = MovimentacaoEstoque.objects.filter(
@@ -664,10 +876,22 @@ def forma_pagamento_delete(request, pk):
 
 # ===== VIEWS DE VENDAS =====
 
+def _totais_vendas(parametros):
+    """Número e valor das vendas pelos filtros de status e período, somados no resumo diário"""
+    def calcular():
+        return filtrar_resumo_vendas(ResumoVendaDiario.objects.filter(produto__isnull=True), parametros).aggregate(
+            numero_vendas=Coalesce(Sum('numero_vendas'), 0), valor_total=Sum('valor'))
+
+    filtros = {nome: parametros.get(nome) for nome in ('status', 'data_inicio', 'data_fim')}
+    return cache_versionado.em_cache(
+        'vendas:totais', [cache_versionado.VENDAS], calcular, TEMPO_CACHE_TOTAIS,
+        partes=(urlencode(sorted((nome, valor) for nome, valor in filtros.items() if valor)),),
+    )
+
 @login_required
 def venda_list(request):
     """Lista todas as vendas"""
-    vendas = Venda.objects.select_related('cliente', 'forma_pagamento', 'usuario').prefetch_related('itens__produto')
+    vendas = Venda.objects.select_related('cliente', 'forma_pagamento', 'usuario')
     
     # Filtros
     status_filter = request.GET.get('status', '')
@@ -675,34 +899,20 @@ def venda_list(request):
     data_fim = request.GET.get('data_fim', '')
     cliente_filter = request.GET.get('cliente', '')
     
-    if status_filter:
-        vendas = vendas.filter(status=status_filter)
-    
-    if data_inicio:
-        try:
-            data_inicio_obj = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            vendas = vendas.filter(data_venda__date__gte=data_inicio_obj)
-        except ValueError:
-            pass
-    
-    if data_fim:
-        try:
-            data_fim_obj = datetime.strptime(data_fim, '%Y-%m-%d').date()
-            vendas = vendas.filter(data_venda__date__lte=data_fim_obj)
-        except ValueError:
-            pass
+    vendas = filtrar_vendas(vendas, request.GET)
     
+    # Estatísticas: sem filtro por cliente, lidas do resumo diário (linhas sem
+    # produto) e guardadas sob a versão das vendas, sem varrer as vendas; com
+    # ele, em cache por alguns segundos
     if cliente_filter:
-        vendas = vendas.filter(cliente__nome__icontains=cliente_filter)
-    
-    # Paginação
-    paginator = Paginator(vendas, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        estatisticas = agregar_em_cache(vendas, numero_vendas=Count('id'), valor_total=Sum('valor_itens'))
+    else:
+        estatisticas = _totais_vendas(request.GET)
+    total_vendas = estatisticas['numero_vendas']
+    valor_total = estatisticas['valor_total'] or 0
     
-    # Estatísticas
-    total_vendas = vendas.count()
-    valor_total = sum(v.valor_total for v in vendas)
+    # Paginação (por cursor; ?page=N para a paginação por número, com o total acima)
+    page_obj = paginar(request, vendas, 'data_venda', total=total_vendas)
     
     context = {
         'page_obj': page_obj,
@@ -714,6 +924,7 @@ def venda_list(request):
         'data_fim': data_fim,
         'cliente_filter': cliente_filter,
         'clientes': Cliente.objects.filter(ativo=True),
+        'filtros': parametros_sem_pagina(request),
     }
     
     return render(request, 'core/venda_list.html', context)
@@ -724,85 +935,51 @@ def venda_create(request):
     """Criar nova venda"""
     if request.method == 'POST':
         venda_form = VendaForm(request.POST)
-        formset = ItemVendaFormSet(request.POST)  # Inicializar formset sempre que for POST
+        formset = ItemVendaFormSet(request.POST)
         
-        if venda_form.is_valid():
-            with transaction.atomic():
-                venda = venda_form.save(commit=False)
-                venda.usuario = request.user
-                venda.save()
-                
-                formset = ItemVendaFormSet(request.POST, instance=venda)  # Reatribuir com instance
-                
-                if formset.is_valid():
-                    itens_salvos = []
-                    erro_estoque = False
-                    
-                    # Validar estoque antes de salvar
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            produto = form.cleaned_data['produto']
-                            quantidade = form.cleaned_data['quantidade']
-                            
-                            if produto.estoque_atual < quantidade:
-                                messages.error(request, f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque_atual}')
-                                erro_estoque = True
-                    
-                    if not erro_estoque:
-                        # Salvar itens e atualizar estoque
-                        for form in formset:
-                            if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                                item = form.save()
-                                itens_salvos.append(item)
-                                
-                                # Atualizar estoque
-                                produto = item.produto
-                                produto.estoque_atual -= item.quantidade
-                                produto.save()
-                                
-                                # Criar movimentação de estoque
-                                MovimentacaoEstoque.objects.create(
-                                    produto=produto,
-                                    tipo='saida',
-                                    quantidade=item.quantidade,
-                                    preco_unitario=item.preco_unitario,
-                                    forma_pagamento=venda.forma_pagamento,
-                                    observacao=f'Venda {venda.numero_venda}',
-                                    usuario=request.user
-                                )
+        if venda_form.is_valid() and formset.is_valid():
+            itens = [
+                (form.cleaned_data['produto'].pk, form.cleaned_data['quantidade'], form.cleaned_data['preco_unitario'])
+                for form in formset if form.cleaned_data and not form.cleaned_data.get('DELETE')
+            ]
+            if not itens:
+                messages.error(request, 'Adicione pelo menos um item à venda')
+            else:
+                try:
+                    with transaction.atomic():
+                        venda = venda_form.save(commit=False)
+                        venda.usuario = request.user
+                        # Com cliente a venda fica em aberto para pagamento; sem cliente é balcão, já finalizada
+                        venda.status = 'aberta' if venda.cliente_id else 'finalizada'
+                        venda.save()
                         
-                        if itens_salvos:
-                            # Se tem cliente, criar conta a receber automaticamente
-                            if venda.cliente:
-                                ContasReceber.objects.create(
-                                    cliente=venda.cliente,
-                                    venda=venda,
-                                    valor_total=venda.valor_total,
-                                    valor_pago=0,  # Inicia sem pagamento
-                                    data_vencimento=venda.data_vencimento,
-                                    status='aberto',
-                                    observacao=f'Venda {venda.numero_venda} - Aguardando pagamento',
-                                    usuario=request.user
-                                )
-                                venda.status = 'aberta'  # Venda fica em aberto para pagamento
-                                messages.success(request, f'Venda {venda.numero_venda} criada! Cliente pode pagar em "Contas a Receber". Total: R$ {venda.valor_total:.2f}')
-                            else:
-                                venda.status = 'finalizada'  # Sem cliente = venda balcão finalizada
-                                messages.success(request, f'Venda {venda.numero_venda} finalizada com sucesso! Total: R$ {venda.valor_total:.2f}')
-                            
-                            venda.save()
-                            return redirect('venda_detail', pk=venda.pk)
-                        else:
-                            venda.delete()
-                            messages.error(request, 'Adicione pelo menos um item à venda')
-                    else:
-                        # Erro de estoque - manter formset para mostrar erros
-                        venda.delete()
+                        # Produtos carregados e bloqueados de uma vez, itens e movimentações em lote
+                        registrar_itens(venda, itens, request.user)
+                        
+                        # Se tem cliente, criar conta a receber automaticamente
+                        if venda.cliente_id:
+                            ContasReceber.objects.create(
+                                cliente_id=venda.cliente_id,
+                                venda=venda,
+                                valor_total=venda.valor_total,
+                                valor_pago=0,  # Inicia sem pagamento
+                                data_vencimento=venda.data_vencimento,
+                                status='aberto',
+                                observacao=f'Venda {venda.numero_venda} - Aguardando pagamento',
+                                usuario=request.user
+                            )
+                except CarrinhoInvalido as erro:
+                    for mensagem in erro.erros:
+                        messages.error(request, mensagem)
                 else:
-                    # Formset inválido - manter formset para mostrar erros
-                    venda.delete()
-                    messages.error(request, 'Erro nos itens da venda. Verifique os dados informados.')
-        # Se venda_form não é válido, formset já foi inicializado no início
+                    if venda.cliente_id:
+                        messages.success(request, f'Venda {venda.numero_venda} criada! Cliente pode pagar em "Contas a Receber". Total: R$ {venda.valor_total:.2f}')
+                    else:
+                        messages.success(request, f'Venda {venda.numero_venda} finalizada com sucesso! Total: R$ {venda.valor_total:.2f}')
+                    return redirect('venda_detail', pk=venda.pk)
+        elif venda_form.is_valid():
+            # Formset inválido - manter formset para mostrar erros
+            messages.error(request, 'Erro nos itens da venda. Verifique os dados informados.')
     else:
         # Requisição GET - inicializar formulários vazios
         venda_form = VendaForm()
@@ -819,8 +996,7 @@ def venda_create(request):
 def venda_detail(request, pk):
     """Detalhar venda específica"""
     venda = get_object_or_404(
-        Venda.objects.select_related('cliente', 'forma_pagamento', 'usuario')
-                    .prefetch_related('itens__produto'), 
+        Venda.objects.select_related('cliente', 'forma_pagamento', 'usuario').com_itens_e_pagamentos(),
         pk=pk
     )
     
@@ -844,6 +1020,78 @@ def produto_preco_api(request, pk):
         return JsonResponse({'error': 'Produto não encontrado'}, status=404)
 
 
+@login_required
+def produtos_precos_api(request):
+    """
+    Preço, estoque e unidade de vários produtos ativos (?ids=1,2,3) ou de todo
+    o catálogo ativo, uma lista por produto na ordem de "campos".
+
+    O ETag é um hash dos produtos da resposta: com If-None-Match igual a
+    resposta é 304, e uma venda de outro produto não o muda para quem pede só
+    alguns ids. Corpo (já comprimido) e ETag ficam em cache pela versão do
+    catálogo, que muda a cada alteração de preço, estoque, unidade ou situação
+    de um produto.
+    """
+    ids = request.GET.get('ids')
+    if ids is not None:
+        try:
+            ids = sorted({int(produto_id) for produto_id in ids.split(',') if produto_id.strip()})
+        except ValueError:
+            return JsonResponse({'error': 'ids deve ser uma lista de números separados por vírgula'}, status=400)
+        if not ids or len(ids) > MAXIMO_IDS_PRECOS:
+            return JsonResponse({'error': f'Informe de 1 a {MAXIMO_IDS_PRECOS} ids'}, status=400)
+        selecao = hashlib.md5(','.join(map(str, ids)).encode()).hexdigest()[:16]
+    else:
+        selecao = 'todos'
+
+    versao = indicadores.versao_catalogo()
+
+    def montar():
+        produtos = Produto.objects.filter(ativo=True).order_by('pk')
+        if ids is not None:
+            produtos = produtos.filter(pk__in=ids)
+        linhas = [[pk, float(preco), estoque, unidade] for pk, preco, estoque, unidade in
+                  produtos.values_list('pk', 'preco_venda', 'estoque_atual', 'unidade_medida')]
+        corpo = json.dumps({
+            'versao': versao,
+            'campos': ['id', 'preco_venda', 'estoque_atual', 'unidade_medida'],
+            'produtos': linhas,
+        }, separators=(',', ':'), ensure_ascii=False).encode()
+        resumo = hashlib.md5(json.dumps(linhas, separators=(',', ':')).encode()).hexdigest()[:16]
+        return corpo, compress_string(corpo), f'"catalogo-{selecao}-{resumo}"'
+
+    corpo, comprimido, etag = cache_versionado.em_cache('catalogo', [], montar, TEMPO_CACHE_CATALOGO,
+                                                        partes=(versao, selecao))
+    cabecalhos = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'private, no-cache'}
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        resposta = HttpResponseNotModified()
+        for nome, valor in cabecalhos.items():
+            resposta[nome] = valor
+        return resposta
+
+    if ACEITA_GZIP.search(request.headers.get('Accept-Encoding', '')):
+        corpo = comprimido
+        cabecalhos['Content-Encoding'] = 'gzip'
+    resposta = HttpResponse(corpo, content_type='application/json', headers=cabecalhos)
+    resposta['Content-Length'] = len(corpo)
+    return resposta
+
+
+@login_required
+def produto_codigo_api(request, codigo):
+    """Produto ativo pelo código (leitor de código de barras), do dicionário em memória do processo"""
+    produto = codigos.buscar(codigo)
+    if produto is None:
+        return JsonResponse({'error': 'Produto não encontrado'}, status=404)
+    return JsonResponse({
+        'id': produto.id,
+        'codigo': produto.codigo,
+        'nome': produto.nome,
+        'preco_venda': float(produto.preco_venda),
+        'unidade_medida': produto.unidade_medida,
+    })
+
+
 @login_required
 def venda_edit(request, pk):
     """Editar venda existente"""
@@ -857,141 +1105,55 @@ def venda_edit(request, pk):
     if request.method == 'POST':
         status_anterior = venda.status  # Guardar o status anterior
         venda_form = VendaForm(request.POST, instance=venda)
+        formset = ItemVendaFormSet(request.POST, instance=venda)
         
-        if venda_form.is_valid():
-            with transaction.atomic():
-                venda = venda_form.save()
-                
-                # Verificar se houve mudança de status
-                if status_anterior != venda.status:
-                    if venda.status == 'finalizada' and status_anterior == 'aberta':
-                        # Venda foi finalizada - criar movimentações se necessário
-                        for item in venda.itens.all():
-                            # Verificar se já existe movimentação para este item
-                            movimentacao_existente = MovimentacaoEstoque.objects.filter(
-                                produto=item.produto,
-                                tipo='saida',
-                                quantidade=item.quantidade,
-                                observacao=f'Venda {venda.numero_venda}'
-                            ).exists()
-                            
-                            if not movimentacao_existente:
-                                MovimentacaoEstoque.objects.create(
-                                    produto=item.produto,
-                                    tipo='saida',
-                                    quantidade=item.quantidade,
-                                    preco_unitario=item.preco_unitario,
-                                    forma_pagamento=venda.forma_pagamento,
-                                    observacao=f'Venda {venda.numero_venda}',
-                                    usuario=request.user
-                                )
-                        messages.success(request, f'Venda {venda.numero_venda} finalizada com sucesso!')
-                        
-                        # Se tem cliente, criar conta a receber automaticamente
-                        if venda.cliente:
-                            conta, created = ContasReceber.objects.get_or_create(
-                                venda=venda,
-                                cliente=venda.cliente,
-                                defaults={
-                                    'valor_total': venda.valor_total,
-                                    'valor_pago': venda.valor_total_pago,
-                                    'data_vencimento': venda.data_vencimento,
-                                    'usuario': request.user
-                                }
-                            )
+        if venda_form.is_valid() and formset.is_valid():
+            linhas = [
+                (form.instance.pk, form.cleaned_data['produto'].pk, form.cleaned_data['quantidade'],
+                 form.cleaned_data['preco_unitario'])
+                for form in formset if form.cleaned_data and not form.cleaned_data.get('DELETE')
+            ]
+            excluidos = [form.instance.pk for form in formset.deleted_forms if form.instance.pk]
+            avisos = []
+            try:
+                with transaction.atomic():
+                    venda = venda_form.save()
                     
+                    # Verificar se houve mudança de status
+                    if venda.status == 'finalizada' and status_anterior == 'aberta':
+                        # Venda foi finalizada - baixar o que as movimentações ainda não tiraram do estoque
+                        baixar_pendentes(venda, request.user)
+                        avisos.append((messages.success, f'Venda {venda.numero_venda} finalizada com sucesso!'))
                     elif venda.status == 'aberta' and status_anterior == 'finalizada':
-                        # Venda foi reaberta - remover movimentações
-                        MovimentacaoEstoque.objects.filter(
-                            observacao=f'Venda {venda.numero_venda}',
-                            tipo='saida'
-                        ).delete()
-                        
-                        # Restaurar estoque
-                        for item in venda.itens.all():
-                            produto = item.produto
-                            produto.estoque_atual += item.quantidade
-                            produto.save()
-                        messages.warning(request, f'Venda {venda.numero_venda} reaberta. Estoque restaurado.')
-                
-                formset = ItemVendaFormSet(request.POST, instance=venda)
-                
-                if formset.is_valid():
-                    # Primeiro, restaurar estoque dos itens que serão removidos/modificados
-                    for form in formset.deleted_forms:
-                        if form.instance.pk:
-                            item = form.instance
-                            produto = item.produto
-                            produto.estoque_atual += item.quantidade
-                            produto.save()
-                            
-                            # Remover movimentação correspondente
-                            movimentacao = MovimentacaoEstoque.objects.filter(
-                                produto=produto,
-                                tipo='saida',
-                                quantidade=item.quantidade,
-                                observacao=f'Venda {venda.numero_venda}'
-                            ).first()
-                            if movimentacao:
-                                movimentacao.delete()
+                        # Venda foi reaberta - devolver ao estoque o que as movimentações tiraram
+                        estornar_movimentacoes(venda)
+                        avisos.append((messages.warning, f'Venda {venda.numero_venda} reaberta. Estoque restaurado.'))
                     
-                    # Processar itens modificados/novos
-                    erro_estoque = False
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            produto = form.cleaned_data['produto']
-                            quantidade_nova = form.cleaned_data['quantidade']
-                            
-                            # Se é item existente, calcular diferença
-                            if form.instance.pk:
-                                quantidade_antiga = form.instance.quantidade
-                                diferenca = quantidade_nova - quantidade_antiga
-                                
-                                if diferenca > 0 and produto.estoque_atual < diferenca:
-                                    messages.error(request, f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque_atual}')
-                                    erro_estoque = True
-                            else:
-                                # Item novo
-                                if produto.estoque_atual < quantidade_nova:
-                                    messages.error(request, f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque_atual}')
-                                    erro_estoque = True
+                    # Estoque e movimentações só pela diferença líquida de cada produto
+                    atualizar_itens(venda, linhas, excluidos, request.user)
                     
-                    if not erro_estoque:
-                        # Salvar itens e ajustar estoque
-                        for form in formset:
-                            if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                                item = form.save()
-                                produto = item.produto
-                                
-                                if form.instance.pk and form.instance.pk == item.pk:
-                                    # Item editado - ajustar apenas a diferença
-                                    if hasattr(form, '_original_quantidade'):
-                                        diferenca = item.quantidade - form._original_quantidade
-                                        produto.estoque_atual -= diferenca
-                                    else:
-                                        # Primeira vez editando, usar quantidade total
-                                        produto.estoque_atual -= item.quantidade
-                                else:
-                                    # Item novo
-                                    produto.estoque_atual -= item.quantidade
-                                    
-                                    # Criar movimentação
-                                    MovimentacaoEstoque.objects.create(
-                                        produto=produto,
-                                        tipo='saida',
-                                        quantidade=item.quantidade,
-                                        preco_unitario=item.preco_unitario,
-                                        forma_pagamento=venda.forma_pagamento,
-                                        observacao=f'Venda {venda.numero_venda}',
-                                        usuario=request.user
-                                    )
-                                
-                                produto.save()
-                        
-                        messages.success(request, f'Venda {venda.numero_venda} atualizada com sucesso!')
-                        return redirect('venda_detail', pk=venda.pk)
-                else:
-                    messages.error(request, 'Erro nos itens da venda. Verifique os dados informados.')
+                    # Se foi finalizada e tem cliente, criar conta a receber automaticamente
+                    if venda.status == 'finalizada' and status_anterior == 'aberta' and venda.cliente_id:
+                        ContasReceber.objects.get_or_create(
+                            venda=venda,
+                            cliente_id=venda.cliente_id,
+                            defaults={
+                                'valor_total': venda.valor_total,
+                                'valor_pago': venda.valor_total_pago,
+                                'data_vencimento': venda.data_vencimento,
+                                'usuario': request.user
+                            }
+                        )
+            except CarrinhoInvalido as erro:
+                for mensagem in erro.erros:
+                    messages.error(request, mensagem)
+            else:
+                for aviso, mensagem in avisos:
+                    aviso(request, mensagem)
+                messages.success(request, f'Venda {venda.numero_venda} atualizada com sucesso!')
+                return redirect('venda_detail', pk=venda.pk)
+        elif venda_form.is_valid():
+            messages.error(request, 'Erro nos itens da venda. Verifique os dados informados.')
     else:
         venda_form = VendaForm(instance=venda)
         formset = ItemVendaFormSet(instance=venda)
@@ -1011,19 +1173,9 @@ def venda_cancel(request, pk):
     
     if request.method == 'POST':
         with transaction.atomic():
-            # Se venda está finalizada, restaurar estoque
-            if venda.status == 'finalizada':
-                for item in venda.itens.all():
-                    produto = item.produto
-                    produto.estoque_atual += item.quantidade
-                    produto.save()
-                    
-                    # Remover movimentações relacionadas
-                    MovimentacaoEstoque.objects.filter(
-                        produto=produto,
-                        tipo='saida',
-                        observacao=f'Venda {venda.numero_venda}'
-                    ).delete()
+            # Em qualquer status, devolver ao estoque o que as movimentações da venda tiraram
+            # (aberta/parcial/paga também baixaram o estoque ao gravar os itens) e removê-las
+            estornar_movimentacoes(venda)
             
             numero_venda = venda.numero_venda
             venda.delete()
@@ -1104,7 +1256,7 @@ def pagamento_create(request, venda_id):
 @login_required
 def venda_checkout(request, venda_id):
     """Tela de checkout com múltiplas formas de pagamento - permite pagamentos parciais"""
-    venda = get_object_or_404(Venda, pk=venda_id)
+    venda = get_object_or_404(Venda.objects.com_itens_e_pagamentos(), pk=venda_id)
     
     # Permitir pagamentos para vendas abertas, finalizadas ou com pagamento parcial
     if venda.status not in ['aberta', 'finalizada', 'parcial']:
@@ -1136,14 +1288,9 @@ def venda_checkout(request, venda_id):
                     f'Total dos pagamentos (R$ {total_pagamentos:.2f}) não pode ser maior que o valor devido (R$ {valor_devido:.2f})')
             else:
                 with transaction.atomic():
-                    # Criar pagamentos
-                    for forma_id, valor in pagamentos_dados:
-                        Pagamento.objects.create(
-                            venda=venda,
-                            forma_pagamento_id=forma_id,
-                            valor_pago=valor,
-                            usuario=request.user
-                        )
+                    # Criar pagamentos (em lote, com os totais recalculados uma vez)
+                    registrar_pagamentos(venda, [(forma_id, Decimal(valor)) for forma_id, valor in pagamentos_dados],
+                                         request.user)
                     
                     # Atualizar status da venda
                     venda.atualizar_status_pagamento()
@@ -1179,7 +1326,8 @@ def venda_checkout(request, venda_id):
                     
                     return redirect('venda_detail', pk=venda.pk)
     
-    formas_pagamento = FormaPagamento.objects.filter(ativo=True)
+    formas_pagamento = cache_versionado.objetos(FormaPagamento.objects.filter(ativo=True),
+                                                cache_versionado.FORMAS_PAGAMENTO)
     
     return render(request, 'core/venda_checkout.html', {
         'venda': venda,
@@ -1194,42 +1342,27 @@ def contas_receber_list(request):
     contas = ContasReceber.objects.select_related('cliente', 'venda').all()
     
     # Filtros
-    cliente_id = request.GET.get('cliente')
-    status = request.GET.get('status')
-    vencidas = request.GET.get('vencidas')
+    contas = filtrar_contas(contas, request.GET)
     
-    if cliente_id:
-        contas = contas.filter(cliente_id=cliente_id)
-    if status:
-        contas = contas.filter(status=status)
-    if vencidas == 'sim':
-        contas = [c for c in contas if c.esta_vencido]
+    # Paginação (por cursor; ?page=N para a paginação por número)
+    contas_paginadas = paginar(request, contas, 'data_criacao')
     
-    # Paginação
-    paginator = Paginator(contas, 20)
-    page = request.GET.get('page')
-    contas_paginadas = paginator.get_page(page)
-    
-    # Estatísticas
-    todas_contas = ContasReceber.objects.filter(status__in=['aberto', 'parcial'])
-    total_em_aberto = sum(c.valor_pendente for c in todas_contas)
-    contas_vencidas = [c for c in todas_contas if c.esta_vencido]
-    total_vencidas = sum(c.valor_pendente for c in contas_vencidas)
-    contas_parciais = ContasReceber.objects.filter(status='parcial')
-    quitadas_mes = ContasReceber.objects.filter(
-        status='quitado',
-        data_criacao__month=timezone.now().month,
-        data_criacao__year=timezone.now().year
-    )
+    # Estatísticas (calculadas no banco)
+    estatisticas = ContasReceber.objects.estatisticas()
+    # Pelo valor pago, não pelo status: a conta parcial que vence passa a 'vencido'
+    contas_parciais = ContasReceber.objects.filter(status__in=ContasReceber.STATUS_PENDENTES, valor_pago__gt=0)
+    inicio_mes = inicio_do_dia(timezone.localdate().replace(day=1))
+    quitadas_mes = ContasReceber.objects.filter(status='quitado', data_criacao__gte=inicio_mes)
     
     context = {
         'contas': contas_paginadas,
         'clientes': Cliente.objects.all(),
-        'total_em_aberto': total_em_aberto,
-        'total_vencidas': total_vencidas,
-        'count_vencidas': len(contas_vencidas),
+        'total_em_aberto': estatisticas['total_em_aberto'],
+        'total_vencidas': estatisticas['total_vencidas'],
+        'count_vencidas': estatisticas['count_vencidas'],
         'contas_parciais': contas_parciais,
         'quitadas_mes': quitadas_mes,
+        'filtros': parametros_sem_pagina(request),
         'title': 'Contas a Receber'
     }
     
@@ -1385,3 +1518,67 @@ def pagamento_delete(request, pk):
         'cancel_url': 'venda_detail',
         'cancel_id': venda.pk
     })
+
+
+@login_required
+def exportar(request, tipo):
+    """Exporta a listagem filtrada (mesmos filtros da tela) em CSV ou XLSX, em streaming"""
+    formato = request.GET.get('formato', 'csv')
+    if tipo not in exportacao.EXPORTACOES or formato not in exportacao.FORMATOS:
+        raise Http404('Exportação não encontrada')
+
+    resposta = StreamingHttpResponse(
+        exportacao.gerar(tipo, formato, request.GET),
+        content_type=exportacao.FORMATOS[formato][0],
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="{exportacao.nome_arquivo(tipo, formato)}"'
+    return resposta
+
+
+# Cadastro da importação: (título, ícone, listagem para onde voltar)
+IMPORTACOES = {
+    'produtos': ('Importar Produtos', 'fa-box', 'produto_list'),
+    'clientes': ('Importar Clientes', 'fa-users', 'cliente_list'),
+}
+MAXIMO_ERROS_EXIBIDOS = 200
+
+
+@login_required
+def importar(request, tipo):
+    """Importação em lote de produtos/clientes a partir de um CSV"""
+    if tipo not in importacao.IMPORTACOES:
+        raise Http404('Importação não encontrada')
+    titulo, icone, listagem = IMPORTACOES[tipo]
+
+    resultado = None
+    if request.method == 'POST':
+        form = ImportacaoForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                resultado = importacao.importar(tipo, form.cleaned_data['arquivo'],
+                                                simular=form.cleaned_data['simular'])
+            except importacao.ErroImportacao as erro:
+                form.add_error('arquivo', str(erro))
+            else:
+                if resultado.simulacao:
+                    messages.info(request, f'Validação concluída: {resultado.criados} novo(s) e '
+                                           f'{resultado.atualizados} atualizado(s) seriam gravados.')
+                else:
+                    messages.success(request, f'Importação concluída: {resultado.criados} criado(s) e '
+                                              f'{resultado.atualizados} atualizado(s).')
+                if resultado.erros:
+                    messages.warning(request, f'{len(resultado.erros)} linha(s) com erro foram ignoradas.')
+    else:
+        form = ImportacaoForm()
+
+    obrigatorias, opcionais = importacao.colunas(tipo)
+    return render(request, 'core/importacao_form.html', {
+        'form': form,
+        'title': titulo,
+        'icone': icone,
+        'listagem': listagem,
+        'resultado': resultado,
+        'erros': resultado.erros[:MAXIMO_ERROS_EXIBIDOS] if resultado else [],
+        'colunas_obrigatorias': obrigatorias,
+        'colunas_opcionais': opcionais,
+    })
@@ -0,0 +1,281 @@
+"""
+Instrumentação de desempenho por requisição.
+
+DesempenhoMiddleware mede uma amostra das requisições (DESEMPENHO_AMOSTRAGEM,
+de 0 a 1; 0 desliga). Cada requisição medida recebe um cabeçalho
+Server-Timing e entra numa janela das últimas DESEMPENHO_JANELA requisições do
+seu nome de URL. A janela fica na memória do processo. As métricas são:
+
+- total: a requisição inteira, de ponta a ponta no middleware;
+- view: da chamada da view até a resposta voltar ao middleware;
+- sql: tempo e número de consultas em todos os bancos;
+- tpl: renderização de templates (inclui as consultas feitas pelo template);
+- mem: pico de memória alocada (tracemalloc, só com DESEMPENHO_MEMORIA, que
+  deixa a requisição bem mais lenta).
+
+Requisições fora da amostra só pagam um sorteio. A página /sistema/perf/
+(equipe) mostra as URLs mais lentas e suas consultas mais caras, e permite
+mudar a amostragem do processo sem reiniciar o servidor.
+"""
+import contextvars
+import functools
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import deque, namedtuple
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import user_passes_test
+from django.db import connections
+from django.shortcuts import redirect, render
+from django.template.base import Template
+
+from core.estatisticas import percentil
+
+JANELA = getattr(settings, 'DESEMPENHO_JANELA', 100)
+# Consultas guardadas por requisição (as mais demoradas) e tamanho máximo do SQL guardado
+CONSULTAS_GUARDADAS = 5
+TAMANHO_SQL = 300
+URLS_EXIBIDAS = 20
+
+Requisicao = namedtuple('Requisicao', 'quando status total_ms view_ms sql_ms consultas template_ms memoria_kb top')
+
+
+class _Estado:
+    """Configuração em vigor no processo (a página de desempenho pode alterá-la)"""
+
+    def __init__(self):
+        self.amostragem = getattr(settings, 'DESEMPENHO_AMOSTRAGEM', 0.0)
+        self.memoria = getattr(settings, 'DESEMPENHO_MEMORIA', False)
+
+
+estado = _Estado()
+
+
+class Janelas:
+    """Últimas requisições medidas de cada nome de URL"""
+
+    def __init__(self, tamanho=JANELA):
+        self.tamanho = tamanho
+        self._por_url = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, nome_url, requisicao):
+        janela = self._por_url.get(nome_url)
+        if janela is None:
+            with self._trava:
+                janela = self._por_url.setdefault(nome_url, deque(maxlen=self.tamanho))
+        janela.append(requisicao)
+
+    def limpar(self):
+        with self._trava:
+            self._por_url = {}
+
+    def resumo(self):
+        """Uma linha por URL, das mais lentas (p95 do total) para as mais rápidas"""
+        linhas = []
+        for nome_url, janela in list(self._por_url.items()):
+            requisicoes = list(janela)
+            if not requisicoes:
+                continue
+            totais = [requisicao.total_ms for requisicao in requisicoes]
+            memorias = [requisicao.memoria_kb for requisicao in requisicoes if requisicao.memoria_kb is not None]
+            linhas.append({
+                'nome_url': nome_url,
+                'requisicoes': len(requisicoes),
+                'erros': sum(1 for requisicao in requisicoes if requisicao.status >= 500),
+                'p50_ms': statistics.median(totais),
+                'p95_ms': percentil(totais, 0.95),
+                'max_ms': max(totais),
+                'view_ms': statistics.median(requisicao.view_ms for requisicao in requisicoes),
+                'sql_ms': statistics.median(requisicao.sql_ms for requisicao in requisicoes),
+                'consultas': max(requisicao.consultas for requisicao in requisicoes),
+                'template_ms': statistics.median(requisicao.template_ms for requisicao in requisicoes),
+                'memoria_kb': max(memorias) if memorias else None,
+                'top': _consultas_mais_caras(requisicoes),
+            })
+        return sorted(linhas, key=lambda linha: -linha['p95_ms'])
+
+
+def _consultas_mais_caras(requisicoes):
+    """[(sql, vezes, ms)] somando as consultas guardadas das requisições da janela"""
+    soma = {}
+    for requisicao in requisicoes:
+        for sql, vezes, ms in requisicao.top:
+            anterior_vezes, anterior_ms = soma.get(sql, (0, 0.0))
+            soma[sql] = (anterior_vezes + vezes, anterior_ms + ms)
+    mais_caras = sorted(soma.items(), key=lambda item: -item[1][1])[:CONSULTAS_GUARDADAS]
+    return [(sql, vezes, ms) for sql, (vezes, ms) in mais_caras]
+
+
+janelas = Janelas()
+
+
+class _Medicao:
+    """Métricas de uma requisição; também é o execute_wrapper das conexões"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.inicio_view = None
+        self.consultas = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.renderizando = False
+        self.por_sql = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.consultas += 1
+            self.sql += duracao
+            vezes, total = self.por_sql.get(sql, (0, 0.0))
+            self.por_sql[sql] = (vezes + 1, total + duracao)
+
+    def top(self):
+        mais_caras = sorted(self.por_sql.items(), key=lambda item: -item[1][1])[:CONSULTAS_GUARDADAS]
+        return tuple((sql[:TAMANHO_SQL], vezes, total * 1000) for sql, (vezes, total) in mais_caras)
+
+
+_medicao = contextvars.ContextVar('desempenho_medicao', default=None)
+_trava_memoria = threading.Lock()
+
+
+def _render_medido(render_original):
+    """Template.render que soma o tempo dos templates de primeiro nível à medição da requisição"""
+
+    @functools.wraps(render_original)
+    def render_medido(self, context):
+        medicao = _medicao.get()
+        if medicao is None or medicao.renderizando:
+            # Fora da amostra, ou template incluído dentro de outro já cronometrado
+            return render_original(self, context)
+        medicao.renderizando = True
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context)
+        finally:
+            medicao.template += time.perf_counter() - inicio
+            medicao.renderizando = False
+
+    render_medido.desempenho = True
+    return render_medido
+
+
+def instrumentar_templates():
+    if not getattr(Template.render, 'desempenho', False):
+        Template.render = _render_medido(Template.render)
+
+
+def _iniciar_memoria():
+    """Liga o tracemalloc se ninguém mais o estiver usando (uma requisição por vez)"""
+    with _trava_memoria:
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start()
+        return True
+
+
+def _parar_memoria():
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(pico / 1024)
+
+
+def server_timing(requisicao):
+    metricas = [
+        f'total;dur={requisicao.total_ms:.1f}',
+        f'view;dur={requisicao.view_ms:.1f}',
+        f'sql;dur={requisicao.sql_ms:.1f};desc="{requisicao.consultas} consultas"',
+        f'tpl;dur={requisicao.template_ms:.1f}',
+    ]
+    if requisicao.memoria_kb is not None:
+        metricas.append(f'mem;desc="{requisicao.memoria_kb} KB"')
+    return ', '.join(metricas)
+
+
+class DesempenhoMiddleware:
+    """Mede uma amostra das requisições; deve ser o primeiro middleware para o total incluir os demais"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrumentar_templates()
+
+    def __call__(self, request):
+        taxa = estado.amostragem
+        if taxa <= 0 or (taxa < 1 and random.random() >= taxa):
+            return self.get_response(request)
+
+        medicao = _Medicao()
+        token = _medicao.set(medicao)
+        memoria = estado.memoria and _iniciar_memoria()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medicao))
+                resposta = self.get_response(request)
+        finally:
+            memoria_kb = _parar_memoria() if memoria else None
+            _medicao.reset(token)
+        fim = time.perf_counter()
+
+        requisicao = Requisicao(
+            quando=time.time(),
+            status=resposta.status_code,
+            total_ms=(fim - medicao.inicio) * 1000,
+            view_ms=(fim - medicao.inicio_view) * 1000 if medicao.inicio_view else 0.0,
+            sql_ms=medicao.sql * 1000,
+            consultas=medicao.consultas,
+            template_ms=medicao.template * 1000,
+            memoria_kb=memoria_kb,
+            top=medicao.top(),
+        )
+        anterior = resposta.get('Server-Timing')
+        resposta['Server-Timing'] = f'{anterior}, {server_timing(requisicao)}' if anterior else server_timing(requisicao)
+        correspondencia = getattr(request, 'resolver_match', None)
+        if correspondencia and correspondencia.url_name:
+            janelas.registrar(correspondencia.url_name, requisicao)
+        return resposta
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        medicao = _medicao.get()
+        if medicao is not None:
+            medicao.inicio_view = time.perf_counter()
+
+
+def _equipe(usuario):
+    return usuario.is_active and usuario.is_staff
+
+
+@user_passes_test(_equipe)
+def painel(request):
+    if request.method == 'POST':
+        if 'limpar' in request.POST:
+            janelas.limpar()
+            messages.success(request, 'Janelas de desempenho limpas.')
+        else:
+            try:
+                taxa = float(request.POST.get('amostragem', '').replace(',', '.'))
+            except ValueError:
+                taxa = -1
+            if not 0 <= taxa <= 1:
+                messages.error(request, 'A amostragem deve ser um número entre 0 e 1.')
+            else:
+                estado.amostragem = taxa
+                estado.memoria = 'memoria' in request.POST
+                messages.success(request, f'Amostragem deste processo alterada para {taxa:.0%}.')
+        return redirect('desempenho')
+
+    linhas = janelas.resumo()
+    return render(request, 'sistema/desempenho.html', {
+        'linhas': linhas[:URLS_EXIBIDAS],
+        'total_urls': len(linhas),
+        'estado': estado,
+        'janela': janelas.tamanho,
+    })
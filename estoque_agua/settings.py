@@ -1,6 +1,8 @@
 import os
+import tempfile
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,6 +26,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'estoque_agua.desempenho.DesempenhoMiddleware',
+    'core.metricas.MetricasMiddleware',
+    'core.roteamento.RoteamentoMiddleware',
+    'core.limites_consultas.LimiteConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,13 +59,51 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'estoque_agua.wsgi.application'
 
+# SQLite com os ajustes para vários workers gravando ao mesmo tempo
+# (estoque_agua/sqlite): WAL (leituras não esperam as escritas), espera de até
+# SQLITE_BUSY_TIMEOUT ms pelo bloqueio e transações com BEGIN IMMEDIATE.
+# cache_size negativo é em KiB (-64000 = 64 MB por conexão).
+# O banco de testes também fica em arquivo (e não em memória) para que o teste
+# de concorrência do estoque rode com vários processos no mesmo banco; o
+# arquivo vai para o diretório temporário do sistema, fora do repositório.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'estoque_agua.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': config('TEST_DB_NAME',
+                                default=str(Path(tempfile.gettempdir()) / 'estoque_agua_test.sqlite3'))},
+        'OPTIONS': {
+            'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+            'pragmas': {
+                'journal_mode': config('SQLITE_JOURNAL_MODE', default='WAL'),
+                'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+                'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+                'mmap_size': config('SQLITE_MMAP_SIZE', default=134217728, cast=int),
+                'cache_size': config('SQLITE_CACHE_SIZE', default=-64000, cast=int),
+                'temp_store': config('SQLITE_TEMP_STORE', default='MEMORY'),
+            },
+        },
     }
 }
 
+# Banco de leitura para relatórios (core/roteamento.py): dashboard, listagens e
+# exportações leem dele. Mesmo backend e opções do padrão, em outro arquivo
+# (SQLite, atualizado pelo comando replicar_relatorios) ou em outro servidor
+# (réplica do PostgreSQL). Sem RELATORIOS_DB_NAME, tudo lê do padrão. Acima de
+# RELATORIOS_ATRASO_MAXIMO segundos de atraso, os relatórios voltam ao padrão.
+RELATORIOS_DB_NAME = config('RELATORIOS_DB_NAME', default='')
+if RELATORIOS_DB_NAME:
+    DATABASES['relatorios'] = {
+        **DATABASES['default'],
+        'NAME': RELATORIOS_DB_NAME,
+        'HOST': config('RELATORIOS_DB_HOST', default=''),
+        'PORT': config('RELATORIOS_DB_PORT', default=''),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.roteamento.RoteadorRelatorios']
+RELATORIOS_ATRASO_MAXIMO = config('RELATORIOS_ATRASO_MAXIMO', default=30, cast=int)
+RELATORIOS_VERIFICAR_A_CADA = config('RELATORIOS_VERIFICAR_A_CADA', default=5, cast=int)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -95,6 +139,56 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+# Numeração de vendas: 'global' (VD000001...) ou 'diaria' (VD202501310001...)
+VENDA_NUMERACAO = config('VENDA_NUMERACAO', default='global')
+# Prefixo opcional da loja/depósito incluído no número da venda (ex.: 'L1')
+VENDA_PREFIXO_LOJA = config('VENDA_PREFIXO_LOJA', default='')
+
+# Limite de consultas por view (core/limites_consultas.py) em execução:
+# 'desligado', 'avisar' (registra no log) ou 'erro' (lança exceção)
+LIMITE_CONSULTAS = config('LIMITE_CONSULTAS', default='desligado')
+
+# Instrumentação de desempenho (estoque_agua/desempenho.py, página /sistema/perf/):
+# fração das requisições medidas (0 desliga), pico de memória via tracemalloc
+# e quantas requisições recentes guardar por URL
+DESEMPENHO_AMOSTRAGEM = config('DESEMPENHO_AMOSTRAGEM', default=0.0, cast=float)
+DESEMPENHO_MEMORIA = config('DESEMPENHO_MEMORIA', default=False, cast=bool)
+DESEMPENHO_JANELA = config('DESEMPENHO_JANELA', default=100, cast=int)
+
+# Métricas Prometheus (/metrics, core/metricas.py). Com vários processos, um
+# diretório compartilhado (esvaziado ao iniciar) onde cada um grava seus totais
+# a cada METRICAS_INTERVALO segundos. Sem METRICAS_TOKEN, só localhost e a equipe
+METRICAS = config('METRICAS', default=True, cast=bool)
+METRICAS_DIRETORIO = config('METRICAS_DIRETORIO', default='')
+METRICAS_INTERVALO = config('METRICAS_INTERVALO', default=5, cast=float)
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+# Cache (core/cache_versionado.py): 'memoria' (de cada processo: com vários
+# workers, um não enxerga as invalidações do outro), 'arquivo' (CACHE_DIRETORIO,
+# compartilhado pelos processos da máquina) ou 'redis' (CACHE_URL; requer o
+# pacote redis)
+CACHE_BACKEND = config('CACHE_BACKEND', default='memoria')
+_BACKENDS_CACHE = {
+    'memoria': ('django.core.cache.backends.locmem.LocMemCache', 'estoque-agua'),
+    'arquivo': ('django.core.cache.backends.filebased.FileBasedCache',
+                config('CACHE_DIRETORIO', default=str(BASE_DIR / 'cache'))),
+    'redis': ('django.core.cache.backends.redis.RedisCache', config('CACHE_URL', default='redis://127.0.0.1:6379/1')),
+}
+if CACHE_BACKEND not in _BACKENDS_CACHE:
+    raise ImproperlyConfigured(f"CACHE_BACKEND deve ser um de: {', '.join(_BACKENDS_CACHE)}")
+CACHES = {
+    'default': {
+        'BACKEND': _BACKENDS_CACHE[CACHE_BACKEND][0],
+        'LOCATION': _BACKENDS_CACHE[CACHE_BACKEND][1],
+        'KEY_PREFIX': config('CACHE_PREFIXO', default='estoque'),
+        'TIMEOUT': 300,
+    }
+}
+
+# Busca por código dos leitores de código de barras (core/codigos.py): de quantos
+# em quantos segundos cada processo confere se outro alterou os produtos
+CODIGOS_VERIFICAR_A_CADA = config('CODIGOS_VERIFICAR_A_CADA', default=1, cast=float)
+
 # Login/Logout URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
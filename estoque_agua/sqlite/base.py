@@ -0,0 +1,47 @@
+"""
+Backend SQLite do projeto: o backend do Django com os ajustes de produção.
+
+Além das opções do módulo sqlite3, OPTIONS aceita:
+
+- 'pragmas': {nome: valor} executados em cada conexão nova (journal_mode=WAL,
+  synchronous=NORMAL, busy_timeout...);
+- 'transaction_mode': como as transações do atomic() começam: 'DEFERRED'
+  (padrão do SQLite), 'IMMEDIATE' ou 'EXCLUSIVE'.
+
+Com BEGIN DEFERRED a transação só pede o bloqueio de escrita no primeiro
+INSERT/UPDATE; se outra conexão estiver escrevendo, a promoção de leitura para
+escrita falha na hora com "database is locked", sem esperar o busy_timeout.
+Com BEGIN IMMEDIATE o bloqueio é pedido no início da transação, onde a espera
+respeita o busy_timeout. É o mesmo que 'init_command' e 'transaction_mode' do
+Django 5.1: ao atualizar, basta voltar ao ENGINE padrão.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+MODOS_TRANSACAO = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    @property
+    def modo_transacao(self):
+        modo = (self.settings_dict['OPTIONS'].get('transaction_mode') or 'DEFERRED').upper()
+        if modo not in MODOS_TRANSACAO:
+            raise ImproperlyConfigured(f'transaction_mode do SQLite deve ser um de {", ".join(MODOS_TRANSACAO)}.')
+        return modo
+
+    def get_new_connection(self, conn_params):
+        conexao = super().get_new_connection(conn_params)
+        for nome, valor in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            if not nome.isidentifier() or not str(valor).replace('-', '', 1).isalnum():
+                raise ImproperlyConfigured(f'Pragma do SQLite inválido: {nome} = {valor}')
+            conexao.execute(f'PRAGMA {nome} = {valor}')
+        return conexao
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.modo_transacao}')
@@ -3,8 +3,14 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core import metricas
+
+from . import desempenho
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('sistema/perf/', desempenho.painel, name='desempenho'),
+    path('metrics', metricas.metricas, name='metricas'),
     path('', include('core.urls')),
     path('accounts/', include('accounts.urls')),
 ]